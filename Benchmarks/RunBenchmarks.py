@@ -0,0 +1,451 @@
+"""
+Benchmark suite for FERRET.
+
+It measures the time taken by
+    - the mathematical kernels in MathsTools.py; namely, expconv,
+      integrate, the inversion of the 2D and 3D SPGR signal models and deconvolve,
+    - the SVD, FFT and Tikhonov deconvolution methods of deconvolve,
+      including the relative error of the residue functions recovered
+      from a synthetic stack of noisy tissue curves,
+    - each model in ModelFunctions.py at 30, 300 and 3000 time points,
+    - end-to-end curve fitting using ModelFunctionsHelper.CurveFit
+      on the bundled data/Preclinical_MR_Signal_3D_*.csv files,
+    - headless batch processing of a synthetic cohort generated by
+      SyntheticCohort.py, including the median relative error of each
+      fitted parameter with respect to the ground truth.
+
+Each benchmark is run several times and the minimum, median and mean
+times in seconds are saved, together with a description of the machine,
+in a JSON file so that runs can be compared.  The compare command flags
+the benchmarks that are slower than a saved baseline by more than
+a threshold and exits with a non-zero status if there are any.
+
+Usage:
+    python Benchmarks/RunBenchmarks.py run --output results.json
+    python Benchmarks/RunBenchmarks.py compare baseline.json results.json --threshold 0.1
+"""
+import argparse
+import datetime
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from scipy.linalg import toeplitz
+from scipy.optimize import fsolve
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(REPOSITORY_FOLDER, 'CoreModules'))
+sys.path.append(os.path.join(REPOSITORY_FOLDER, 'Developer', 'ModelLibrary'))
+
+import MathsTools as tools
+import ModelFunctions
+import ModelFunctionsHelper
+from BatchProcessor import BatchProcessor, LoadDataFile
+from ResultsStore import LoadResults
+import SyntheticCohort
+
+CONFIG_FILE = os.path.join(REPOSITORY_FOLDER, 'Developer', 'ModelConfiguration',
+                           'MR_SignalRatLiverModels.xml')
+DATA_FOLDER = os.path.join(REPOSITORY_FOLDER, 'data')
+DATA_FILES = ['Preclinical_MR_Signal_3D_1.csv', 'Preclinical_MR_Signal_3D_2.csv']
+BENCHMARK_MODEL = 'HF1-2CFM+3DSPGR'
+BENCHMARK_ROI = 'Liver'
+BENCHMARK_AIF = 'Spleen'
+BENCHMARK_VIF = 'Blood'
+
+TIME_POINTS = [30, 300, 3000]
+# Numbers of starting points of the multi-start curve fitting benchmarks
+MULTI_START_POINTS = [8, 32, 128]
+# Number of tissue curves deconvolved together
+DECONVOLUTION_STACK_SIZE = 256
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+DEFAULT_NUMBER_BATCH_FILES = 1000
+
+# Values of the input parameters of the models in ModelFunctions.py
+# that are not described in the XML configuration file.
+MODEL_PARAMETER_VALUES = {'Fa': 0.5, 'Ve': 0.2, 'Fp': 1.0, 'Kbh': 0.1, 'Khe': 0.2}
+MODEL_CONSTANTS = {'TR': 0.013, 'baseline': 1, 'dt': 16, 't0': 80, 'FA': 20,
+                   'r1': 5.5, 'R10a': 0.74575, 'R10v': 0.74575, 'R10t': 1.3203}
+
+
+def TimeFunction(function, repeats=5, minimumTime=0.2):
+    """Calls function repeats times, or more if the total time is
+    less than minimumTime seconds, and returns a dictionary of the
+    minimum, median and mean times of a call in seconds."""
+    times = []
+    startTime = time.perf_counter()
+    while len(times) < repeats or (time.perf_counter() - startTime < minimumTime
+                                   and len(times) < 1000):
+        callStart = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - callStart)
+    return {'min': min(times), 'median': float(np.median(times)),
+            'mean': float(np.mean(times)), 'repeats': len(times)}
+
+
+def GetMachineInfo():
+    """Returns a dictionary describing the machine,
+    the software versions and the commit benchmarked."""
+    import lmfit
+    import scipy
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=REPOSITORY_FOLDER, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'hostname': platform.node(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpuCount': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'lmfit': lmfit.__version__,
+            'commit': commit}
+
+
+def MakeSyntheticInputs(numTimePoints):
+    """Returns time points, in minutes, and normalised AIF, VIF and
+    ROI MR signals with numTimePoints points, interpolated from the
+    first bundled data file."""
+    signalData, _ = LoadDataFile(os.path.join(DATA_FOLDER, DATA_FILES[0]),
+                                 [BENCHMARK_ROI, BENCHMARK_AIF, BENCHMARK_VIF])
+    times = np.linspace(signalData['time'][0], signalData['time'][-1], numTimePoints)
+    def interpolate(name):
+        return np.interp(times, signalData['time'], signalData[name.lower()])
+    return times, interpolate(BENCHMARK_AIF), interpolate(BENCHMARK_VIF), \
+        interpolate(BENCHMARK_ROI)
+
+
+def BenchmarkKernels(results, repeats):
+    constants = MODEL_CONSTANTS
+    for numTimePoints in TIME_POINTS:
+        times, AIF, _, ROI = MakeSyntheticInputs(numTimePoints)
+        results['kernels.expconv.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: tools.expconv(2.0, times, AIF, 'benchmark'), repeats)
+        results['kernels.integrate.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: tools.integrate(AIF, times), repeats)
+        results['kernels.spgr2d_func_inv.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: tools.spgr2d_func_inv(constants['r1'], constants['FA'],
+                    constants['TR'], constants['R10t'], AIF), repeats)
+        results['kernels.spgr3d_func_inv.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: tools.spgr3d_func_inv(constants['r1'], constants['FA'],
+                    constants['TR'], constants['R10t'], AIF), repeats)
+        # Inversion of the signal models by fsolve at each time point,
+        # as was done by the models, for comparison with the vectorised
+        # solvers now used by the models.
+        results['kernels.spgr2d_inversion.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: [fsolve(tools.spgr2d_func, x0=0, args=(constants['r1'],
+                     constants['FA'], constants['TR'], constants['R10a'], 1.0, signal))
+                     for signal in AIF], repeats=1, minimumTime=0)
+        results['kernels.spgr3d_inversion.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: [fsolve(tools.spgr3d_func, x0=0, args=(constants['FA'],
+                     constants['TR'], constants['R10a'], 1.0, signal))
+                     for signal in AIF], repeats=1, minimumTime=0)
+        results['kernels.spgr2d_func_solve.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: tools.spgr2d_func_solve(constants['r1'], constants['FA'],
+                    constants['TR'], constants['R10a'], 1.0, AIF), repeats)
+        # The lookup table of the flip angle is built, or loaded from 
+        # the disk cache, by the first call
+        tools.get_spgr2d_lookup_table(constants['FA'])
+        results['kernels.spgr2d_func_solve_lut.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: tools.spgr2d_func_solve(constants['r1'], constants['FA'],
+                    constants['TR'], constants['R10a'], 1.0, AIF, 'lut'), repeats)
+        results['kernels.spgr3d_func_solve.n{}'.format(numTimePoints)] = TimeFunction(
+            lambda: tools.spgr3d_func_solve(constants['FA'], constants['TR'],
+                    constants['R10a'], 1.0, AIF), repeats)
+        if numTimePoints <= 300:
+            # The deconvolution matrix grows with the square
+            # of the number of time points
+            dt = times[1] - times[0]
+            results['kernels.deconvolve.n{}'.format(numTimePoints)] = TimeFunction(
+                lambda: tools.deconvolve(ROI, AIF, dt), repeats)
+            # Including the decomposition of the convolution matrix, 
+            # which is otherwise cached
+            def DeconvolveUncached():
+                tools.clear_deconvolution_cache()
+                return tools.deconvolve(ROI, AIF, dt)
+            results['kernels.deconvolve_uncached.n{}'.format(numTimePoints)] = \
+                TimeFunction(DeconvolveUncached, repeats)
+            # A stack of tissue curves sharing the AIF, such as the 
+            # voxels of a slice, deconvolved in one matrix product
+            ROIStack = np.tile(ROI, (DECONVOLUTION_STACK_SIZE, 1))
+            results['kernels.deconvolve_stack{}.n{}'.format(
+                DECONVOLUTION_STACK_SIZE, numTimePoints)] = TimeFunction(
+                lambda: tools.deconvolve(ROIStack, AIF, dt), repeats)
+
+
+def MakeDeconvolutionInputs(numTimePoints, numCurves, noise=0.01, seed=0):
+    """Returns the time step, an AIF, a stack of exponential residue
+    functions, one per row, and the tissue curves obtained by convolving
+    them with the AIF, with added Gaussian noise of standard deviation 
+    noise times the maximum of the tissue curves."""
+    generator = np.random.default_rng(seed)
+    times = np.linspace(0, 10, numTimePoints)
+    dt = times[1] - times[0]
+    AIF = 30*times**3*np.exp(-times/0.4)
+    residues = generator.uniform(0.5, 1.5, (numCurves, 1)) * \
+        np.exp(-generator.uniform(0.5, 3.0, (numCurves, 1))*times)
+    convolutionMatrix = toeplitz(AIF*dt, np.zeros(numTimePoints))
+    tissueCurves = residues @ convolutionMatrix.T
+    tissueCurves += generator.normal(0, noise*tissueCurves.max(), tissueCurves.shape)
+    return dt, AIF, residues, tissueCurves
+
+
+def BenchmarkDeconvolution(results, repeats):
+    """Times each deconvolution method, including the decomposition of
+    the AIF, on a stack of tissue curves and records the relative error 
+    of the residue functions it recovers."""
+    for numTimePoints in TIME_POINTS:
+        dt, AIF, residues, tissueCurves = MakeDeconvolutionInputs(
+            numTimePoints, DECONVOLUTION_STACK_SIZE)
+        for method in tools.DECONVOLUTION_METHODS:
+            if method == 'svd' and numTimePoints > 300:
+                # The SVD grows with the cube of the number of time points
+                continue
+            def Deconvolve():
+                tools.clear_deconvolution_cache()
+                return tools.deconvolve(tissueCurves, AIF, dt, method=method)
+            timing = TimeFunction(Deconvolve, repeats)
+            timing['relativeError'] = float(np.linalg.norm(Deconvolve() - residues) /
+                                            np.linalg.norm(residues))
+            results['deconvolution.{}.stack{}.n{}'.format(
+                method, DECONVOLUTION_STACK_SIZE, numTimePoints)] = timing
+
+
+def GetModelFunctions():
+    """Returns a list of the names of the model functions in
+    ModelFunctions.py, excluding the template function."""
+    return [name for name, function in inspect.getmembers(ModelFunctions, inspect.isfunction)
+            if function.__module__ == ModelFunctions.__name__
+            and name != 'modelFunctionName']
+
+
+def BenchmarkModels(results, repeats):
+    constantsString = str(MODEL_CONSTANTS)
+    for functionName in GetModelFunctions():
+        modelFunction = getattr(ModelFunctions, functionName)
+        argumentNames = list(inspect.signature(modelFunction).parameters)[1:]
+        passConstants = argumentNames and argumentNames[-1] in ('constantsString',
+                                                                 'dummyVariable')
+        parameterNames = argumentNames[:-1] if passConstants else argumentNames
+        parameterValues = [MODEL_PARAMETER_VALUES.get(name,
+                           MODEL_PARAMETER_VALUES.get(name.capitalize(), 0.1))
+                           for name in parameterNames]
+        extraArguments = [constantsString] if passConstants else []
+        for numTimePoints in TIME_POINTS:
+            times, AIF, VIF, _ = MakeSyntheticInputs(numTimePoints)
+            if 'Fa' in parameterNames:
+                xData2DArray = np.column_stack((times, AIF, VIF))
+            else:
+                xData2DArray = np.column_stack((times, AIF))
+            name = 'models.{}.n{}'.format(functionName, numTimePoints)
+            if modelFunction(xData2DArray, *parameterValues, *extraArguments) is None:
+                # The model raised an exception, which was handled and logged
+                results[name] = {'error': 'Model function returned None'}
+                continue
+            results[name] = TimeFunction(
+                lambda: modelFunction(xData2DArray, *parameterValues, *extraArguments),
+                repeats=1 if numTimePoints > 300 else repeats,
+                minimumTime=0 if numTimePoints > 300 else 0.2)
+
+
+def BenchmarkCurveFit(results, repeats):
+    objBatchProcessor = BatchProcessor(CONFIG_FILE, BENCHMARK_MODEL,
+                                       BENCHMARK_ROI, BENCHMARK_AIF)
+    for dataFile in DATA_FILES:
+        signalData, _ = LoadDataFile(os.path.join(DATA_FOLDER, dataFile),
+                                     objBatchProcessor.getRequiredColumns())
+        results['curvefit.{}.{}'.format(BENCHMARK_MODEL, dataFile)] = TimeFunction(
+            lambda: objBatchProcessor.fitSignalData(signalData), repeats, minimumTime=0)
+        # With Ve and Kbh fixed, the convolution is calculated once per fit
+        fixedParameters = [name in ('Ve', 'Kbh') for name in objBatchProcessor.parameterNames]
+        results['curvefit.{}.{}.fixed_Ve_Kbh'.format(BENCHMARK_MODEL, dataFile)] = \
+            TimeFunction(lambda: objBatchProcessor.fitSignalData(
+                signalData, fixedParameters=fixedParameters), repeats, minimumTime=0)
+        # Without partial evaluation, for comparison
+        ModelFunctionsHelper.USE_PARTIAL_EVALUATION = False
+        try:
+            results['curvefit.{}.{}.fixed_Ve_Kbh.full_evaluation'.format(
+                BENCHMARK_MODEL, dataFile)] = TimeFunction(
+                lambda: objBatchProcessor.fitSignalData(
+                    signalData, fixedParameters=fixedParameters), repeats, minimumTime=0)
+        finally:
+            ModelFunctionsHelper.USE_PARTIAL_EVALUATION = True
+        # Multi-start fitting, serially, the time should grow much
+        # more slowly than the number of starting points
+        for numStarts in MULTI_START_POINTS:
+            objBatchProcessor.setMultiStart(numStarts)
+            try:
+                results['curvefit.{}.{}.multi_start_{}'.format(
+                    BENCHMARK_MODEL, dataFile, numStarts)] = TimeFunction(
+                    lambda: objBatchProcessor.fitSignalData(signalData), 
+                    repeats, minimumTime=0)
+            finally:
+                objBatchProcessor.setMultiStart(0)
+        # Initial values from the curve atlas, built by the first repeat
+        objBatchProcessor.setCurveAtlas(True)
+        try:
+            results['curvefit.{}.{}.curve_atlas'.format(BENCHMARK_MODEL, dataFile)] = \
+                TimeFunction(lambda: objBatchProcessor.fitSignalData(signalData),
+                             repeats, minimumTime=0)
+        finally:
+            objBatchProcessor.setCurveAtlas(False)
+
+
+def CalculateFitAccuracy(resultsFileName, manifestFileName):
+    """Compares the parameter values resulting from batch processing
+    with the ground truth of the synthetic cohort.
+
+    Returns
+    -------
+    A dictionary of parameter name:median relative error pairs.
+    """
+    results = LoadResults(resultsFileName)
+    groundTruth = SyntheticCohort.LoadGroundTruth(manifestFileName)
+    relativeErrors = {}
+    for fileName, parameter, value in zip(results['file'], results['parameter'],
+                                          results['value']):
+        trueValue = groundTruth.get(str(fileName), {}).get(str(parameter))
+        if trueValue and np.isfinite(value):
+            relativeErrors.setdefault(str(parameter), []).append(
+                abs(value - trueValue)/abs(trueValue))
+    return {name: float(np.median(errors)) for name, errors in relativeErrors.items()}
+
+
+def BenchmarkBatch(results, numFiles):
+    """Generates a synthetic cohort with known parameters, processes
+    it headlessly and records the throughput and the accuracy of the
+    fitted parameters."""
+    folder = tempfile.mkdtemp(prefix='FERRET_benchmark_')
+    try:
+        dataFolder = os.path.join(folder, 'data')
+        manifestFileName = SyntheticCohort.GenerateCohort(dataFolder, numFiles,
+            BENCHMARK_MODEL.split('+')[0], manifestFileName=os.path.join(
+                folder, SyntheticCohort.MANIFEST_FILE_NAME))
+        objBatchProcessor = BatchProcessor(CONFIG_FILE, BENCHMARK_MODEL,
+                                           BENCHMARK_ROI, BENCHMARK_AIF)
+        resultsFileName = os.path.join(folder, 'BatchSummary.csv')
+        try:
+            summary = objBatchProcessor.processFolder(dataFolder, resultsFileName)
+        finally:
+            objBatchProcessor.shutdown()
+        results['batch.n{}'.format(numFiles)] = {
+            'min': summary['totalTime'], 'median': summary['totalTime'],
+            'mean': summary['totalTime'], 'repeats': 1,
+            'filesPerSecond': summary['numFiles']/summary['totalTime'],
+            'numFitted': summary['numFitted'],
+            'numberOfWorkers': summary['numberOfWorkers'],
+            'stages': {name: {'wall': wallTime, 'cpu': CPUTime}
+                       for name, wallTime, CPUTime, _, _ in
+                       summary['stageTimer'].getSummary()},
+            'medianRelativeError': CalculateFitAccuracy(resultsFileName,
+                                                        manifestFileName)}
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def RunBenchmarks(outputFileName, repeats, numBatchFiles, groups):
+    results = {}
+    benchmarkGroups = {'kernels': lambda: BenchmarkKernels(results, repeats),
+                       'models': lambda: BenchmarkModels(results, repeats),
+                       'deconvolution': lambda: BenchmarkDeconvolution(results, repeats),
+                       'curvefit': lambda: BenchmarkCurveFit(results, repeats),
+                       'batch': lambda: BenchmarkBatch(results, numBatchFiles)}
+    for group in groups:
+        print('Running {} benchmarks'.format(group))
+        benchmarkGroups[group]()
+
+    report = {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+              'machine': GetMachineInfo(),
+              'benchmarks': results}
+    with open(outputFileName, 'w') as jsonFile:
+        json.dump(report, jsonFile, indent=2)
+    for name, timing in results.items():
+        if 'error' in timing:
+            print('{:70s} {}'.format(name, timing['error']))
+        else:
+            print('{:70s} {:12.6f} s'.format(name, timing['min']))
+        for parameter, error in timing.get('medianRelativeError', {}).items():
+            print('    median relative error of {} = {:.2%}'.format(parameter, error))
+        if 'relativeError' in timing:
+            print('    relative error = {:.2%}'.format(timing['relativeError']))
+    print('Results saved in ' + outputFileName)
+
+
+def CompareBenchmarks(baselineFileName, currentFileName, threshold):
+    """Compares the minimum times of the benchmarks in two results files.
+
+    Returns
+    -------
+    A list of the names of the benchmarks that are slower in the current
+    results than in the baseline by more than the fraction threshold.
+    """
+    with open(baselineFileName) as jsonFile:
+        baseline = json.load(jsonFile)
+    with open(currentFileName) as jsonFile:
+        current = json.load(jsonFile)
+    if baseline['machine'].get('hostname') != current['machine'].get('hostname'):
+        print('Warning - the results were obtained on different machines.')
+
+    regressions = []
+    for name, currentTiming in current['benchmarks'].items():
+        baselineTiming = baseline['benchmarks'].get(name)
+        if not baselineTiming or 'min' not in baselineTiming or 'min' not in currentTiming:
+            continue
+        ratio = currentTiming['min']/baselineTiming['min']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = 'improvement'
+        print('{:70s} {:12.6f} {:12.6f} {:8.2f}x {}'.format(
+            name, baselineTiming['min'], currentTiming['min'], ratio, flag))
+    print('{} regressions over a threshold of {:.0%}'.format(len(regressions), threshold))
+    return regressions
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='FERRET benchmark suite.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    runParser = subparsers.add_parser('run', help='Runs the benchmarks.')
+    runParser.add_argument('--output', default='benchmark_results.json',
+                           help='JSON file in which the results are saved.')
+    runParser.add_argument('--repeats', type=int, default=5,
+                           help='Minimum number of times each benchmark is run.')
+    runParser.add_argument('--batch-files', type=int, default=DEFAULT_NUMBER_BATCH_FILES,
+                           help='Number of synthetic data files in the batch benchmark.')
+    runParser.add_argument('--groups', nargs='+',
+                           default=['kernels', 'deconvolution', 'models', 
+                                    'curvefit', 'batch'],
+                           choices=['kernels', 'deconvolution', 'models', 
+                                    'curvefit', 'batch'],
+                           help='Groups of benchmarks to run.')
+
+    compareParser = subparsers.add_parser('compare',
+                           help='Compares results with a saved baseline.')
+    compareParser.add_argument('baseline', help='JSON file of the baseline results.')
+    compareParser.add_argument('current', help='JSON file of the current results.')
+    compareParser.add_argument('--threshold', type=float,
+                           default=DEFAULT_REGRESSION_THRESHOLD,
+                           help='Fractional slow down flagged as a regression.')
+    arguments = parser.parse_args()
+
+    if arguments.command == 'run':
+        RunBenchmarks(arguments.output, arguments.repeats,
+                      arguments.batch_files, arguments.groups)
+    else:
+        regressions = CompareBenchmarks(arguments.baseline, arguments.current,
+                                        arguments.threshold)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,356 @@
+"""
+Generator of synthetic cohorts of time/MR signal CSV data files
+for load testing batch processing and measuring the accuracy of
+curve fitting.
+
+Each curve is generated with the forward equations of the models in
+the model library:
+    - The AIF concentration is a gamma variate bolus, arriving after
+      the baseline scans, followed by a slow washout. The VIF is the
+      AIF delayed and dispersed.
+    - The liver concentration is calculated by the High Flow Single
+      Inlet (as in HighFlowSingleInletGadoxetate3DSPGR_Rat, including
+      the correction of the spleen AIF by its extracellular volume)
+      or Dual Inlet Two Compartment Gadoxetate models.
+    - Concentrations are converted to MR signals using the 3D or 2D
+      SPGR signal equations, spgr3d_func_inv and spgr2d_func_inv in
+      MathsTools.py, with the constants in the XML configuration file.
+Gaussian noise is added and each signal is scaled by a random baseline
+signal, so the files are normalised by FERRET as real data files.
+
+The equations are evaluated for many curves at once using NumPy arrays,
+expconv_batch in MathsTools.py convolves all the curves of a chunk at
+once, and chunks of files are generated in parallel worker processes.
+
+The ground-truth parameters of every file are written in a manifest
+beside the output folder, <output folder>_GroundTruth.csv, so that the
+output folder only holds data files.
+
+Usage:
+    python Benchmarks/SyntheticCohort.py <output folder> --files 1000
+           [--model HF1-2CFM] [--sequence 3D] [--time-points 30] [--dt 57]
+           [--sampling uniform|jittered] [--noise 0.01] [--seed 0] [--workers 4]
+    python Benchmarks/SyntheticCohort.py --validate
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(REPOSITORY_FOLDER, 'CoreModules'))
+sys.path.append(os.path.join(REPOSITORY_FOLDER, 'Developer', 'ModelLibrary'))
+
+import MathsTools as tools
+from XMLReader import XMLReader
+
+CONFIG_FILE = os.path.join(REPOSITORY_FOLDER, 'Developer', 'ModelConfiguration',
+                           'MR_SignalRatLiverModels.xml')
+MANIFEST_FILE_NAME = 'GroundTruth.csv'
+ROI_COLUMN = 'Liver'
+AIF_COLUMN = 'Spleen'
+VIF_COLUMN = 'Blood'
+
+# Extracellular volume fraction of the spleen used
+# by the rat models to correct the AIF
+VE_SPLEEN = 0.43
+
+# Models whose forward equations are implemented, with their
+# parameters in the order of the model functions.
+MODEL_PARAMETERS = {'HF1-2CFM': ['Ve', 'Kbh', 'Khe'],
+                    'HF2-2CFM': ['Fa', 'Ve', 'Kbh', 'Khe']}
+
+# Ranges from which the ground-truth parameters are drawn, in the
+# units displayed on the GUI. Ve and Fa are percentages.
+DEFAULT_PARAMETER_RANGES = {'Ve': (10.0, 40.0), 'Kbh': (0.05, 0.5),
+                            'Khe': (0.5, 5.0), 'Fa': (10.0, 90.0)}
+PERCENTAGE_PARAMETERS = ['Ve', 'Fa']
+
+DEFAULT_NUMBER_TIME_POINTS = 30
+DEFAULT_TIME_STEP = 57.0 # seconds, as in the bundled data files
+DEFAULT_NUMBER_BASELINE_SCANS = 1
+DEFAULT_NOISE = 0.01
+FILES_PER_CHUNK = 500
+
+
+def GetSPGRConstants(configFile=CONFIG_FILE):
+    """Returns a dictionary of the SPGR constants, as floats,
+    defined in the XML configuration file."""
+    objXMLReader = XMLReader()
+    objXMLReader.parseConfigFile(configFile)
+    constants = {name: float(value) for name, value in
+                 eval(objXMLReader.getStringOfConstants()).items()}
+    constants.setdefault('R10v', constants['R10a'])
+    return constants
+
+
+def MakeTimeGrids(numCurves, numTimePoints, dt, sampling, randomGenerator):
+    """Returns a (numCurves, numTimePoints) array of acquisition
+    times in seconds. Uniform sampling gives every curve the same
+    grid; jittered sampling perturbs each time point by up to
+    a quarter of dt, keeping the times increasing."""
+    times = np.tile(np.arange(numTimePoints)*dt, (numCurves, 1))
+    if sampling == 'jittered':
+        jitter = randomGenerator.uniform(-0.25, 0.25, size=times.shape)*dt
+        jitter[:, 0] = 0
+        times = times + jitter
+    return times
+
+
+def MakeInputConcentrations(times, numBaselineScans, randomGenerator):
+    """Returns arrays of AIF and VIF concentrations (mM), one row
+    per curve. The AIF is a gamma variate bolus arriving after the
+    baseline scans plus a slow washout; the VIF is the AIF delayed
+    and dispersed."""
+    numCurves, numTimePoints = times.shape
+    timeStep = times[0, 1] - times[0, 0]
+    amplitude = randomGenerator.uniform(0.5, 1.5, numCurves)[:, np.newaxis]
+    arrival = (numBaselineScans - 0.5 + randomGenerator.uniform(0, 1, numCurves))*timeStep
+    width = randomGenerator.uniform(1.0, 3.0, numCurves)*timeStep
+    plateau = randomGenerator.uniform(0.1, 0.3, numCurves)[:, np.newaxis]
+    washout = randomGenerator.uniform(1.0, 4.0, numCurves)*times[0, -1]
+
+    elapsed = np.clip(times - arrival[:, np.newaxis], 0, None)
+    scaled = elapsed/width[:, np.newaxis]
+    bolus = scaled**2*np.exp(2 - scaled)/4 # peak of 1 at 2 widths after arrival
+    tail = (1 - np.exp(-scaled))*np.exp(-elapsed/washout[:, np.newaxis])
+    AIF = amplitude*(bolus + plateau*tail)
+
+    # The VIF is the AIF dispersed by an exponential residence
+    # time (in minutes) and delayed by one time step
+    dispersion = randomGenerator.uniform(0.2, 0.6, numCurves)
+    if np.all(times == times[0]):
+        VIF = tools.expconv_batch(dispersion, times[0]/60.0, AIF)
+    else:
+        # Jittered sampling, convolve each curve on its own time grid
+        VIF = np.vstack([tools.expconv_batch(dispersion[i:i+1], times[i]/60.0,
+                                             AIF[i:i+1])
+                         for i in range(numCurves)])
+    VIF = np.concatenate([np.zeros((numCurves, 1)), VIF[:, :-1]], axis=1)
+    return AIF, VIF
+
+
+def SignalFromConcentration(sequence, constants, R10, concentration):
+    """Converts concentrations to MR signals relative to the
+    precontrast signal using the SPGR signal equations."""
+    if sequence == '2D':
+        signal = tools.spgr2d_func_inv(constants['r1'], constants['FA'],
+                                       constants['TR'], R10, concentration)
+        return signal/tools.spgr2d_func_inv(constants['r1'], constants['FA'],
+                                            constants['TR'], R10, 0.0)
+    return tools.spgr3d_func_inv(constants['r1'], constants['FA'],
+                                 constants['TR'], R10, concentration)
+
+
+def LiverConcentration(modelName, times, AIF, VIF, parameters):
+    """Calculates the liver concentration, one row per curve, using
+    the forward equations of the High Flow Two Compartment Gadoxetate
+    models. parameters is a dictionary of name:array pairs in the
+    units displayed on the GUI."""
+    t = times[0]/60.0 # minutes, as in FERRET
+    Ve = parameters['Ve']/100
+    Kbh = parameters['Kbh']
+    Khe = parameters['Khe']
+    if modelName == 'HF2-2CFM':
+        Fa = parameters['Fa']/100
+        ce = Fa[:, np.newaxis]*AIF + (1 - Fa[:, np.newaxis])*VIF
+    else:
+        # As in the rat models, correct the spleen AIF for
+        # the extracellular volume of the spleen
+        ce = AIF/VE_SPLEEN
+    Th = (1 - Ve)/Kbh
+    return Ve[:, np.newaxis]*ce + \
+        (Khe*Th)[:, np.newaxis]*tools.expconv_batch(Th, t, ce)
+
+
+def GenerateCurves(numCurves, modelName='HF1-2CFM', sequence='3D',
+                   numTimePoints=DEFAULT_NUMBER_TIME_POINTS, dt=DEFAULT_TIME_STEP,
+                   sampling='uniform', noise=DEFAULT_NOISE,
+                   parameterRanges=None, constants=None,
+                   numBaselineScans=DEFAULT_NUMBER_BASELINE_SCANS, seed=0):
+    """Generates numCurves synthetic curves at once.
+
+    Returns
+    -------
+    A dictionary holding the arrays 'time' (seconds), 'roi', 'aif', 'vif'
+    (MR signals including noise and baseline scaling), 'noiseFree' (the
+    relative ROI signal without noise) and an array for each ground-truth
+    parameter, one row or element per curve.
+    """
+    if constants is None:
+        constants = GetSPGRConstants()
+    ranges = dict(DEFAULT_PARAMETER_RANGES)
+    ranges.update(parameterRanges or {})
+    randomGenerator = np.random.default_rng(seed)
+
+    # Uniform grids share the time points of the first curve as
+    # the models are evaluated on a single time grid per curve.
+    times = MakeTimeGrids(numCurves, numTimePoints, dt, sampling, randomGenerator)
+    AIF, VIF = MakeInputConcentrations(times, numBaselineScans, randomGenerator)
+    parameters = {name: randomGenerator.uniform(*ranges[name], numCurves)
+                  for name in MODEL_PARAMETERS[modelName]}
+    if sampling == 'jittered':
+        # Evaluate each curve on its own time grid
+        liver = np.vstack([LiverConcentration(modelName, times[i:i+1], AIF[i:i+1],
+                           VIF[i:i+1], {name: values[i:i+1] for name, values
+                                        in parameters.items()})
+                           for i in range(numCurves)])
+    else:
+        liver = LiverConcentration(modelName, times, AIF, VIF, parameters)
+
+    curves = {'time': times,
+              'aif': SignalFromConcentration(sequence, constants, constants['R10a'], AIF),
+              'vif': SignalFromConcentration(sequence, constants, constants['R10v'], VIF),
+              'roi': SignalFromConcentration(sequence, constants, constants['R10t'], liver)}
+    curves['noiseFree'] = curves['roi'].copy()
+    for name in ['aif', 'vif', 'roi']:
+        # Gaussian noise relative to the precontrast signal,
+        # then scale by a random baseline signal.
+        baselineSignal = randomGenerator.uniform(2.0, 8.0, numCurves)[:, np.newaxis]
+        curves[name] = baselineSignal*(curves[name] +
+                       noise*randomGenerator.standard_normal(curves[name].shape))
+    curves.update(parameters)
+    return curves
+
+
+def _GenerateChunk(folder, firstFileNumber, numFiles, modelName, sequence,
+                   numTimePoints, dt, sampling, noise, parameterRanges,
+                   constants, seed):
+    """Generates and writes the files of a chunk of the cohort.
+    Run in a worker process. Returns the manifest rows of the chunk."""
+    curves = GenerateCurves(numFiles, modelName, sequence, numTimePoints, dt,
+                            sampling, noise, parameterRanges, constants, seed=seed)
+    includeVIF = modelName == 'HF2-2CFM'
+    header = ','.join(['Time', ROI_COLUMN, AIF_COLUMN] +
+                      ([VIF_COLUMN] if includeVIF else []))
+    manifestRows = []
+    for index in range(numFiles):
+        fileName = 'Synthetic_{:06d}.csv'.format(firstFileNumber + index)
+        columns = [curves['time'][index], curves['roi'][index], curves['aif'][index]]
+        if includeVIF:
+            columns.append(curves['vif'][index])
+        np.savetxt(os.path.join(folder, fileName), np.column_stack(columns),
+                   fmt='%.6g', delimiter=',', header=header, comments='')
+        manifestRows.append([fileName, modelName, sequence, numTimePoints, noise] +
+                            [curves[name][index] for name in MODEL_PARAMETERS[modelName]])
+    return manifestRows
+
+
+def GenerateCohort(folder, numFiles, modelName='HF1-2CFM', sequence='3D',
+                   numTimePoints=DEFAULT_NUMBER_TIME_POINTS, dt=DEFAULT_TIME_STEP,
+                   sampling='uniform', noise=DEFAULT_NOISE, parameterRanges=None,
+                   seed=0, numberOfWorkers=None, manifestFileName=None):
+    """Writes numFiles synthetic CSV data files in folder and the
+    ground-truth manifest beside it, in a file named after the folder
+    and ending in MANIFEST_FILE_NAME, or at manifestFileName if given,
+    so that folder only holds data files. Chunks of files are generated
+    in parallel.
+
+    Returns
+    -------
+    The file path and name of the manifest.
+    """
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    constants = GetSPGRConstants()
+    chunkStarts = list(range(0, numFiles, FILES_PER_CHUNK))
+    seeds = np.random.SeedSequence(seed).spawn(len(chunkStarts))
+    chunkArguments = [(folder, start, min(FILES_PER_CHUNK, numFiles - start),
+                       modelName, sequence, numTimePoints, dt, sampling, noise,
+                       parameterRanges, constants, chunkSeed)
+                      for start, chunkSeed in zip(chunkStarts, seeds)]
+
+    if len(chunkArguments) > 1 and numberOfWorkers != 1:
+        with ProcessPoolExecutor(max_workers=numberOfWorkers) as executor:
+            chunks = list(executor.map(_GenerateChunk, *zip(*chunkArguments)))
+    else:
+        chunks = [_GenerateChunk(*arguments) for arguments in chunkArguments]
+
+    if manifestFileName is None:
+        manifestFileName = os.path.normpath(os.path.abspath(folder)) + \
+            '_' + MANIFEST_FILE_NAME
+    with open(manifestFileName, 'w', newline='') as csvfile:
+        writeCSV = csv.writer(csvfile, delimiter=',')
+        writeCSV.writerow(['file', 'model', 'sequence', 'time_points', 'noise'] +
+                          MODEL_PARAMETERS[modelName])
+        for rows in chunks:
+            writeCSV.writerows(rows)
+    return manifestFileName
+
+
+def LoadGroundTruth(manifestFileName):
+    """Returns a dictionary of file name:{parameter name:value}
+    pairs from a ground-truth manifest."""
+    groundTruth = {}
+    with open(manifestFileName, newline='') as csvfile:
+        readCSV = csv.DictReader(csvfile)
+        parameterNames = readCSV.fieldnames[5:]
+        for row in readCSV:
+            groundTruth[row['file']] = {name: float(row[name]) for name in parameterNames}
+    return groundTruth
+
+
+def ValidateAgainstModelLibrary(numCurves=5):
+    """Compares noise-free curves from the generator with the MR signals
+    calculated by HighFlowSingleInletGadoxetate3DSPGR_Rat in the model
+    library from the same AIF and parameters.
+
+    Returns
+    -------
+    The maximum absolute difference between the relative ROI signals.
+    """
+    import ModelFunctions
+    constants = GetSPGRConstants()
+    curves = GenerateCurves(numCurves, noise=0.0, constants=constants)
+    constantsString = str({'TR': constants['TR'], 'baseline': 1, 'FA': constants['FA'],
+                           'r1': constants['r1'], 'R10a': constants['R10a'],
+                           'R10t': constants['R10t']})
+    maxDifference = 0.0
+    for index in range(numCurves):
+        AIFSignal = curves['aif'][index]/curves['aif'][index][0]
+        xData2DArray = np.column_stack((curves['time'][index]/60.0, AIFSignal))
+        modelSignal = ModelFunctions.HighFlowSingleInletGadoxetate3DSPGR_Rat(
+            xData2DArray, curves['Ve'][index]/100, curves['Kbh'][index],
+            curves['Khe'][index], constantsString)
+        maxDifference = max(maxDifference,
+                            np.max(np.abs(modelSignal - curves['noiseFree'][index])))
+    return maxDifference
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Generates a synthetic cohort of time/MR signal CSV data files.')
+    parser.add_argument('folder', nargs='?', help='Output folder.')
+    parser.add_argument('--files', type=int, default=1000, help='Number of data files.')
+    parser.add_argument('--model', default='HF1-2CFM', choices=list(MODEL_PARAMETERS))
+    parser.add_argument('--sequence', default='3D', choices=['2D', '3D'])
+    parser.add_argument('--time-points', type=int, default=DEFAULT_NUMBER_TIME_POINTS)
+    parser.add_argument('--dt', type=float, default=DEFAULT_TIME_STEP,
+                        help='Time between acquisitions in seconds.')
+    parser.add_argument('--sampling', default='uniform', choices=['uniform', 'jittered'])
+    parser.add_argument('--noise', type=float, default=DEFAULT_NOISE,
+                        help='Standard deviation of the noise relative to the baseline signal.')
+    parser.add_argument('--range', nargs=3, action='append', default=[],
+                        metavar=('PARAMETER', 'LOW', 'HIGH'),
+                        help='Range of a ground-truth parameter.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--validate', action='store_true',
+                        help='Check the generator against the model library.')
+    arguments = parser.parse_args()
+
+    if arguments.validate:
+        print('Maximum difference from the model library = {:.3g}'
+              .format(ValidateAgainstModelLibrary()))
+    if arguments.folder:
+        startTime = time.perf_counter()
+        manifest = GenerateCohort(arguments.folder, arguments.files, arguments.model,
+            arguments.sequence, arguments.time_points, arguments.dt,
+            arguments.sampling, arguments.noise,
+            {name: (float(low), float(high)) for name, low, high in arguments.range},
+            arguments.seed, arguments.workers)
+        print('{} files written in {:.2f} s. Ground truth in {}'.format(
+            arguments.files, time.perf_counter() - startTime, manifest))
@@ -0,0 +1,240 @@
+"""
+This class module provides a staged pipeline for the batch processing
+of time-MR signal data files, so that reading the data files, curve
+fitting and writing the output files overlap instead of running
+strictly in sequence for each file.
+
+The pipeline has three stages connected by bounded queues:
+    1. reader - a pool of threads loading and normalising the data files.
+    2. fit - a pool of worker processes curve fitting the data, or the
+       main thread when no pool is supplied.
+    3. writer - a pool of threads writing the output files of each data
+       file, such as its plot data, and a single recorder thread adding
+       the results of each data file, in the order of the data files,
+       to the summary spreadsheet and results table and queuing its
+       PDF report.
+
+At most maxFilesInFlight data files are read ahead of the writer stage,
+and at most maxFilesInFlight data files wait to be written, so memory
+stays bounded however many files are processed.  When the writer stage
+falls behind, no more files are read until it catches up.
+
+The stages are supplied as functions, see BatchProcessor.processFolder:
+    readFunction(fullFilePath) returns (data, failureReason, row)
+    fitFunction(fileName, data) returns (result, row)
+    writeFunction(fileName, data, result, row)
+    recordFunction(fileName, data, result, failureReason, row)
+    isFittedFunction(result) returns True if the fit succeeded
+where row is a dictionary of stage times of the data file, in the
+format of the rows of the StageTimer class, that each stage updates.
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NUMBER_OF_READERS = 2
+DEFAULT_NUMBER_OF_WRITERS = 2
+
+
+def MergeRows(row, otherRow):
+    """Adds the stage times, nfev and iterations in otherRow, the row
+    of stage times of a data file recorded by another stage of the
+    pipeline, to row and returns row."""
+    if otherRow:
+        for clock in ('wall', 'cpu'):
+            for stageName, stageTime in otherRow[clock].items():
+                row[clock][stageName] = row[clock].get(stageName, 0.0) + stageTime
+        for key in ('nfev', 'iterations'):
+            if otherRow.get(key) is not None:
+                row[key] = otherRow[key]
+    return row
+
+
+def _ChainFuture(sourceFuture, targetFuture):
+    """Copies the result or the exception of the completed
+    sourceFuture to targetFuture."""
+    exception = sourceFuture.exception()
+    if exception is not None:
+        targetFuture.set_exception(exception)
+    else:
+        targetFuture.set_result(sourceFuture.result())
+
+
+class BatchPipeline:
+    def __init__(self, readFunction, fitFunction, writeFunction=None,
+                 recordFunction=None, fitExecutor=None,
+                 numberOfReaders=DEFAULT_NUMBER_OF_READERS,
+                 numberOfWriters=DEFAULT_NUMBER_OF_WRITERS,
+                 numberOfFitWorkers=1, maxFilesInFlight=None,
+                 isFittedFunction=None):
+        """Creates an instance of the BatchPipeline class.
+
+        Input Parameters
+        ----------------
+        readFunction, fitFunction, writeFunction, recordFunction -
+            Functions performing the stages, see above.  fitFunction
+            must be picklable if fitExecutor is supplied.
+        fitExecutor - Optional pool of worker processes, such as a
+            ProcessPoolExecutor, to which fitFunction is submitted.
+            By default, the data files are fitted in the main thread.
+        numberOfReaders, numberOfWriters - Number of threads of the
+            reader and writer stages.
+        numberOfFitWorkers - Number of worker processes of fitExecutor.
+        maxFilesInFlight - Maximum number of data files read but not
+            yet written. By default, enough to keep every worker
+            process and reader thread busy.
+        isFittedFunction - Optional function, see above, deciding whether
+            a data file is counted as fitted. By default, every data file
+            for which fitFunction returned a result.
+        """
+        self.readFunction = readFunction
+        self.fitFunction = fitFunction
+        self.writeFunction = writeFunction
+        self.recordFunction = recordFunction
+        self.fitExecutor = fitExecutor
+        self.numberOfReaders = numberOfReaders
+        self.numberOfWriters = numberOfWriters
+        if maxFilesInFlight is None:
+            maxFilesInFlight = 2*numberOfFitWorkers + numberOfReaders
+        self.maxFilesInFlight = max(1, maxFilesInFlight)
+        self.isFittedFunction = isFittedFunction
+        logger.info('In module ' + __name__ +
+                    '. Created an instance of class BatchPipeline, '
+                    'with at most {} files in flight.'.format(self.maxFilesInFlight))
+
+
+    def _submitRead(self, readExecutor, fullFilePath):
+        """Submits the reading of a data file to the reader stage and,
+        if there is a pool of worker processes, submits its curve
+        fitting to the pool as soon as it has been read, so that the
+        worker processes never wait for the main thread.
+
+        Returns
+        -------
+        A (fullFilePath, read future, fit future) tuple. The fit future
+        is None if the data files are fitted in the main thread.
+        """
+        readFuture = readExecutor.submit(self.readFunction, fullFilePath)
+        if self.fitExecutor is None:
+            return fullFilePath, readFuture, None
+
+        fitFuture = Future()
+        fileName = os.path.basename(fullFilePath)
+
+        def submitFit(completedReadFuture):
+            try:
+                data, _, _ = completedReadFuture.result()
+                if data is None:
+                    fitFuture.set_result((None, None))
+                    return
+                self.fitExecutor.submit(self.fitFunction, fileName, data) \
+                    .add_done_callback(lambda future: _ChainFuture(future, fitFuture))
+            except Exception as e:
+                if not fitFuture.done():
+                    fitFuture.set_exception(e)
+
+        readFuture.add_done_callback(submitFit)
+        return fullFilePath, readFuture, fitFuture
+
+
+    def run(self, fullFilePaths, objStageTimer=None, progressCallback=None):
+        """Processes the data files in fullFilePaths through the stages
+        of the pipeline.  Returns when every data file has been written
+        and recorded.
+
+        Input Parameters
+        ----------------
+        fullFilePaths - List of the full file paths of the data files.
+        objStageTimer - Optional object instanciated from the StageTimer
+            class, to which the row of stage times of each data file is
+            added, in the order of fullFilePaths.
+        progressCallback - Optional function called in the calling
+            thread, with the number of data files fitted so far and the
+            name of the last one, after each data file is fitted; for
+            example, to update a progress bar.
+
+        Returns
+        -------
+        The number of data files fitted. The others failed validation
+        or could not be fitted, according to isFittedFunction.
+        """
+        numFiles = 0
+        numFitted = 0
+        remainingPaths = iter(fullFilePaths)
+        filesInFlight = deque()
+        pendingWrites = deque()
+        readExecutor = ThreadPoolExecutor(self.numberOfReaders,
+                                          thread_name_prefix='BatchReader')
+        writeExecutor = ThreadPoolExecutor(self.numberOfWriters,
+                                           thread_name_prefix='BatchWriter')
+        # A single thread records the results in the order of the data files
+        recordExecutor = ThreadPoolExecutor(1, thread_name_prefix='BatchRecorder')
+        try:
+            for fullFilePath in remainingPaths:
+                filesInFlight.append(self._submitRead(readExecutor, fullFilePath))
+                if len(filesInFlight) >= self.maxFilesInFlight:
+                    break
+
+            while filesInFlight:
+                fullFilePath, readFuture, fitFuture = filesInFlight.popleft()
+                fileName = os.path.basename(fullFilePath)
+                data, failureReason, row = readFuture.result()
+                result = None
+                if data is not None:
+                    try:
+                        if fitFuture is not None:
+                            result, fitRow = fitFuture.result()
+                        else:
+                            result, fitRow = self.fitFunction(fileName, data)
+                        MergeRows(row, fitRow)
+                    except Exception as e:
+                        failureReason = 'Curve fitting failed: ' + str(e)
+                        print('BatchPipeline.run when file = ' + fileName + ': ' + str(e))
+                        logger.error('BatchPipeline.run when file = ' + fileName +
+                                     ': ' + str(e))
+
+                # Keep the reader and fit stages busy
+                for nextFullFilePath in remainingPaths:
+                    filesInFlight.append(self._submitRead(readExecutor, nextFullFilePath))
+                    break
+
+                if self.writeFunction is not None and result is not None:
+                    pendingWrites.append(writeExecutor.submit(
+                        self.writeFunction, fileName, data, result, row))
+                if self.recordFunction is not None:
+                    pendingWrites.append(recordExecutor.submit(
+                        self.recordFunction, fileName, data, result, failureReason, row))
+                numFiles += 1
+                if result is not None and (self.isFittedFunction is None or
+                                           self.isFittedFunction(result)):
+                    numFitted += 1
+                if objStageTimer is not None:
+                    objStageTimer.addRow(row)
+                    objStageTimer.endFile()
+                if progressCallback is not None:
+                    progressCallback(numFiles, fileName)
+
+                # Backpressure, wait for the writer stage to catch up
+                while len(pendingWrites) > 2*self.maxFilesInFlight:
+                    self._waitForWrite(pendingWrites.popleft())
+
+            while pendingWrites:
+                self._waitForWrite(pendingWrites.popleft())
+        finally:
+            readExecutor.shutdown(wait=True)
+            writeExecutor.shutdown(wait=True)
+            recordExecutor.shutdown(wait=True)
+        return numFitted
+
+
+    def _waitForWrite(self, future):
+        """Waits for a task of the writer stage and logs its failure."""
+        try:
+            future.result()
+        except Exception as e:
+            print('BatchPipeline - writing the output of a data file failed: ' + str(e))
+            logger.error('BatchPipeline - writing the output of a data file failed: '
+                         + str(e))
@@ -0,0 +1,1253 @@
+"""
+This class module provides the functionality for fitting a model
+to the MR signal data in one or more CSV data files without the GUI.
+
+It is the batch processing engine of FERRET.py; it loads and validates
+each data file, normalises its MR signals by the mean of the baseline
+scans, curve fits the selected model using the default parameter values
+in the XML configuration file, or values chosen by the user, as initial
+values and calculates the 95% confidence limits of the optimum parameter
+values.  The results are recorded in a long-format results table using
+the ResultsStore class and, optionally, in the Excel summary spreadsheet,
+plot data files and PDF reports of FERRET.py, see the BatchOutputs class.
+The time taken by each stage of processing each file is recorded
+using the StageTimer class.
+
+The stages run in a BatchPipeline, so that reading the data files, 
+curve fitting and writing the outputs overlap.
+
+The data files of a folder are fitted in parallel by a persistent
+pool of worker processes, owned by the BatchProcessor object and
+started when the first folder is processed.  Each worker fits whole
+data files, so the model functions themselves never start worker
+processes.  The pool uses the spawn start method, so it is safe to 
+use from the Qt GUI and from an application frozen by PyInstaller,
+provided multiprocessing.freeze_support() is called first thing 
+in the guarded main block of the application, as below.  The number
+of worker processes and of the BLAS threads of each process are set
+by the ResourceManager class from the CPU budget.
+
+It is used by the benchmark suite in the Benchmarks folder and
+may also be run from the command line:
+
+    python CoreModules/BatchProcessor.py <data folder> --config <XML file>
+           --model <short model name> --roi Liver --aif Spleen
+
+With the --delay-mode option, a delay between the arrival of the bolus 
+in the AIF and in the ROI is estimated for each data file, see
+ModelFunctionsHelper.CurveFitWithDelay, and recorded in the results
+table as the parameter Delay, in minutes.
+
+With the --multi-start option, each data file is fitted from many 
+starting points sampled within the constraints of the parameters, or
+the range of their spinboxes on the GUI if they have no constraints,
+see ModelFunctionsHelper.CurveFitMultiStart. When one data file is
+fitted at a time, the best starting points are refined in parallel
+by the pool of worker processes.
+
+With the --curve-atlas option, the initial values of each fit are 
+those of the nearest curve of an atlas of the curves predicted by the
+model on a grid of parameter values, built once for all the data files
+sharing the same AIF, see ModelFunctionsHelper.GetAtlasInitialValues.
+
+With the --warm-start option, the initial values of each fit are taken
+from the previous converged fit or the median of the converged fits, 
+see WarmStart.py.
+
+With the --watch option, it keeps watching the folder and fits each
+new or modified data file as soon as it appears, appending its results
+to the results table, see the watchFolder method.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import functools
+import multiprocessing
+import os
+import sys
+import time
+import logging
+import numpy as np
+from scipy.stats import t as studentT
+
+# When this module is not imported by FERRET.py, the model
+# library folder must be added to the Module Search Path.
+MODEL_LIBRARY_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'Developer', 'ModelLibrary')
+if MODEL_LIBRARY_FOLDER not in sys.path:
+    sys.path.append(MODEL_LIBRARY_FOLDER)
+
+import BatchPipeline
+import CurveAtlas
+import FolderWatcher as FolderWatcherModule
+from FolderWatcher import FolderWatcher
+import ModelFunctionsHelper
+import PlotDataExport
+import ReportGenerator
+import ResultsStore
+import ResourceManager as ResourceManagerModule
+from ResourceManager import ResourceManager
+import StageTimer as StageTimerModule
+from StageTimer import StageTimer
+import Tracing
+import LoggingConfig
+import MathsTools as tools
+import WarmStart as WarmStartModule
+from WarmStart import WarmStart
+from XMLReader import XMLReader
+
+logger = logging.getLogger(__name__)
+
+MIN_NUM_COLUMNS_CSV_FILE = 3
+
+# Minimum number of data files per worker process, fewer files
+# do not repay the time taken to start a worker process.
+MIN_FILES_PER_WORKER = 8
+
+# Name of the delay of the ROI curve in the results table
+DELAY_PARAMETER_NAME = 'Delay'
+
+# The BatchProcessor object of a worker process of the FitWorkerPool
+_workerBatchProcessor = None
+# The number of the batch to which the last data file fitted by a
+# worker process belonged, see _FitSignalDataInWorker
+_workerBatchNumber = None
+
+
+def ReadDataFile(fullFilePath, requiredColumns):
+    """Reads and validates a CSV file of time/MR signal data.
+    The same validation is applied as in FERRET.py:
+        -The CSV file must contain at least 3 columns of data separated by commas.
+        -The header of the first column must contain the word 'time'.
+        -The file must contain a column for each name in requiredColumns.
+
+    Input Parameters
+    ----------------
+    fullFilePath - Full file path to the CSV data file.
+    requiredColumns - List of the names of the ROI, AIF and,
+        if required, VIF columns.
+
+    Returns
+    -------
+    signalData - Dictionary of lower case column name:NumPy array pairs.
+        The time, in minutes, is stored under the key 'time'.
+        None if the file failed validation.
+    failureReason - String describing why the file failed validation,
+        otherwise an empty string.
+    """
+    try:
+        with open(fullFilePath, newline='') as csvfile:
+            headers = next(csv.reader(csvfile, delimiter=','), None)
+        if not headers or len(headers) < MIN_NUM_COLUMNS_CSV_FILE:
+            return None, "At least 3 columns of data are expected"
+
+        headers = [header.strip().lower() for header in headers]
+        failureReasons = []
+        if 'time' not in headers[0]:
+            failureReasons.append(
+                "First column must contain time data, with the word 'time' as a header")
+        failureReasons.extend(column.strip().lower() + " data missing"
+                              for column in requiredColumns
+                              if column.strip().lower() not in headers)
+        if failureReasons:
+            return None, " and ".join(failureReasons)
+
+        data = np.loadtxt(fullFilePath, delimiter=',', skiprows=1, ndmin=2)
+        signalData = {'time': data[:, 0]/60.0}
+        for columnNumber, header in enumerate(headers[1:], start=1):
+            signalData[header] = data[:, columnNumber]
+        return signalData, ""
+
+    except Exception as e:
+        print('Error in BatchProcessor.ReadDataFile when file = ' +
+              fullFilePath + ': ' + str(e))
+        logger.error('Error in BatchProcessor.ReadDataFile when file = ' +
+                     fullFilePath + ': ' + str(e))
+        return None, 'Cannot read data: ' + str(e)
+
+
+def NormaliseSignalData(signalData, numBaselineScans=1):
+    """Normalises, in place, the MR signals in signalData by
+    the mean of their baseline scans and returns signalData."""
+    for header, signals in signalData.items():
+        if header != 'time':
+            signalData[header] = signals/np.mean(signals[0:numBaselineScans])
+    return signalData
+
+
+def LoadDataFile(fullFilePath, requiredColumns, numBaselineScans=1):
+    """Loads and validates a CSV file of time/MR signal data using
+    the function ReadDataFile and normalises its MR signals by the
+    mean of the baseline scans.
+
+    Returns
+    -------
+    The signalData dictionary and failureReason string returned by
+    ReadDataFile, with the MR signals normalised.
+    """
+    signalData, failureReason = ReadDataFile(fullFilePath, requiredColumns)
+    if signalData is None:
+        return None, failureReason
+    return NormaliseSignalData(signalData, numBaselineScans), ""
+
+
+@Tracing.Traced('Calculate95ConfidenceLimits', 'fit')
+def Calculate95ConfidenceLimits(numDataPoints, optimumValues,
+                                covarianceMatrix, fixedParameters):
+    """Calculates the 95% confidence limits of the optimum
+    parameter values resulting from curve fitting.
+
+    Input Parameters
+    ----------------
+    numDataPoints - Number of data points to which the model is fitted.
+    optimumValues - List of optimum parameter values.
+    covarianceMatrix - The estimated covariance of the values of the
+        parameters allowed to vary during curve fitting.
+    fixedParameters - List of booleans, True if the value of the
+        corresponding parameter was fixed during curve fitting.
+
+    Returns
+    -------
+    A list of [value, lower, upper] lists, one for each parameter.
+    The confidence limits of fixed parameters are empty strings.
+    """
+    alpha = 0.05 # 95% confidence interval = 100*(1-alpha)
+    numFreeParams = fixedParameters.count(False)
+    numDegsOfFreedom = max(0, numDataPoints - numFreeParams)
+    # student-t value for the degrees of freedom and the confidence level
+    tval = studentT.ppf(1.0-alpha/2., numDegsOfFreedom)
+
+    if covarianceMatrix is not None and np.size(covarianceMatrix):
+        sigmas = iter(np.sqrt(np.diag(covarianceMatrix)))
+    else:
+        sigmas = iter([np.nan]*numFreeParams)
+
+    confidenceLimits = []
+    for value, isFixed in zip(optimumValues, fixedParameters):
+        if isFixed:
+            confidenceLimits.append([value, '', ''])
+        else:
+            sigma = next(sigmas)
+            confidenceLimits.append([value, value - sigma*tval, value + sigma*tval])
+    return confidenceLimits
+
+
+def IsFitted(result):
+    """Returns True if result, the dictionary returned by 
+    BatchProcessor.fitSignalData, holds the optimum parameter values,
+    False if curve fitting failed."""
+    return result is not None and result['fitStatistics']['status'] != 'Failed'
+
+
+def _InitialiseFitWorker(configFileName, modelName, ROI, AIF, VIF,
+                         initialValues, fixedParameters, delayMode, maxDelay,
+                         multiStartSettings, curveAtlasSettings, warmStartPolicy,
+                         profileFolder, workerTracing, numBLASThreads):
+    """Runs once in each worker process of the FitWorkerPool to limit
+    its BLAS threads, record its spans in the trace if tracing is 
+    enabled, see Tracing.InitialiseWorkerTracing, and create the 
+    BatchProcessor object used to fit all its data files."""
+    global _workerBatchProcessor
+    ResourceManagerModule.InitialiseWorkerProcess(numBLASThreads, workerTracing)
+    Tracing.SetProfileFolder(profileFolder)
+    _workerBatchProcessor = BatchProcessor(configFileName, modelName, ROI, AIF, VIF)
+    _workerBatchProcessor.setInitialValues(initialValues, fixedParameters)
+    _workerBatchProcessor.setDelayMode(delayMode, maxDelay)
+    _workerBatchProcessor.setMultiStart(*multiStartSettings)
+    _workerBatchProcessor.setCurveAtlas(*curveAtlasSettings)
+    _workerBatchProcessor.setWarmStart(warmStartPolicy)
+
+
+def _FitSignalDataInWorker(fileName, signalData, batchNumber=None):
+    """Curve fits the signal data of a data file of the batch numbered
+    batchNumber in a worker process. The warm start history of the 
+    worker process is reset when the first data file of a batch is 
+    fitted, so that a batch does not start from the fits of the 
+    previous batch.
+
+    Returns
+    -------
+    The result and row of stage times returned by BatchProcessor.fitData.
+    """
+    global _workerBatchNumber
+    if batchNumber != _workerBatchNumber:
+        _workerBatchProcessor.objWarmStart.reset()
+        _workerBatchNumber = batchNumber
+    return _workerBatchProcessor.fitData(fileName, signalData)
+
+
+class BatchOutputs:
+    def __init__(self, objResultsStore=None, objSpreadSheet=None,
+                 plotDataFolder=None, saveBinaryCopy=False, objPlotData=None,
+                 objReportGenerator=None, reportFolder=None, 
+                 reportTitle='', reportLogo=None, fitResultsFolder=None):
+        """Creates an instance of the BatchOutputs class that holds the
+        destinations of the output of batch processing, as in FERRET.py.
+        Each is optional.
+
+        Input Parameters
+        ----------------
+        objResultsStore - object instanciated from the ResultsStore class.
+        objSpreadSheet - object instanciated from the ExcelWriter class.
+        plotDataFolder - Folder in which the plot data of each data file
+            is saved in a CSV file called plot<data file name>.
+        saveBinaryCopy - If True, a .npz copy of each CSV file is also saved.
+        objPlotData - object instanciated from the PlotDataCollection class,
+            in which the plot data is gathered instead of CSV files.
+        objReportGenerator - object instanciated from the ReportGenerator
+            class creating the PDF report of each data file in reportFolder,
+            with the title, reportTitle, and the logo, reportLogo.
+        fitResultsFolder - Folder in which the fit results of each data file
+            are saved, so that its PDF report can be created later.
+        """
+        self.objResultsStore = objResultsStore
+        self.objSpreadSheet = objSpreadSheet
+        self.plotDataFolder = plotDataFolder
+        self.saveBinaryCopy = saveBinaryCopy
+        self.objPlotData = objPlotData
+        self.objReportGenerator = objReportGenerator
+        self.reportFolder = reportFolder
+        self.reportTitle = reportTitle
+        self.reportLogo = reportLogo
+        self.fitResultsFolder = fitResultsFolder
+
+
+class FitWorkerPool:
+    def __init__(self, numberOfWorkers, initialiserArguments):
+        """Creates an instance of the FitWorkerPool class, a persistent
+        pool of worker processes fitting whole data files. The worker 
+        processes are started when the first files are submitted and
+        are reused until the shutdown method is called.
+
+        Input Parameters
+        ----------------
+        numberOfWorkers - Maximum number of worker processes.
+        initialiserArguments - Tuple of the arguments of _InitialiseFitWorker.
+        """
+        self.numberOfWorkers = numberOfWorkers
+        self.initialiserArguments = initialiserArguments
+        self.executor = None
+        logger.info('In module ' + __name__ +
+                    '. Created an instance of class FitWorkerPool with {} workers.'
+                    .format(numberOfWorkers))
+
+
+    def getExecutor(self):
+        """Returns the pool of worker processes, starting it if required."""
+        if self.executor is None:
+            # The spawn start method gives the same behaviour on
+            # all platforms and is safe to use from the Qt GUI.
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.numberOfWorkers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_InitialiseFitWorker,
+                initargs=self.initialiserArguments)
+        return self.executor
+
+
+    def shutdown(self):
+        """Stops the worker processes."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+class BatchProcessor:
+    def __init__(self, configFile, modelName, ROI, AIF, VIF=None, cpuBudget=None):
+        """Creates an instance of the BatchProcessor class for
+        fitting the model modelName, described in the XML configuration
+        file configFile, to the ROI MR signal data.
+
+        Input Parameters
+        ----------------
+        configFile - Path to an XML configuration file or an object
+            instanciated from the XMLReader class.
+        modelName - Short name of the model.
+        ROI, AIF - Names of the ROI and AIF columns in the data files.
+        VIF - Name of the VIF column, required by dual inlet models.
+        cpuBudget - Optional number of cores used to fit data files,
+            see ResourceManager.GetCPUBudget.
+        """
+        if isinstance(configFile, XMLReader):
+            self.objXMLReader = configFile
+        else:
+            self.objXMLReader = XMLReader()
+            self.objXMLReader.parseConfigFile(configFile)
+
+        self.modelName = modelName
+        # Names of the curves in plots and reports, as entered
+        self.curveNames = {'roi': ROI.strip(), 'aif': AIF.strip(),
+                           'vif': VIF.strip() if VIF else None}
+        self.ROI = ROI.strip().lower()
+        self.AIF = AIF.strip().lower()
+        self.VIF = VIF.strip().lower() if VIF else None
+        self.objFitWorkerPool = None
+        self.cpuBudget = ResourceManagerModule.GetCPUBudget(cpuBudget)
+        self.initialValues = None
+        self.fixedParameters = None
+        self.delayMode = 'none'
+        self.maxDelay = None
+        # Multi-start fitting, see setMultiStart
+        self.numStarts = 0
+        self.numRefinements = ModelFunctionsHelper.DEFAULT_NUMBER_OF_REFINEMENTS
+        self.sampling = 'sobol'
+        # Fixed, so that the results of a data file are reproducible
+        self.seed = 0
+        # Initial values from the curve atlas, see setCurveAtlas
+        self.useCurveAtlas = False
+        self.atlasPointsPerParameter = CurveAtlas.DEFAULT_POINTS_PER_PARAMETER
+        # Initial values of each data file of a batch, see setWarmStart
+        self.objWarmStart = WarmStart()
+        # Incremented for each batch, see processFiles
+        self.batchNumber = 0
+        # Executor on which the starting points are refined, while
+        # data files are fitted one at a time, see processFiles
+        self.refinementExecutor = None
+
+        self.moduleName = self.objXMLReader.getModuleName(modelName)
+        self.functionName = self.objXMLReader.getFunctionName(modelName)
+        self.inletType = self.objXMLReader.getModelInletType(modelName)
+        self.constantsString = self.objXMLReader.getStringOfConstants()
+        self.numBaselineScans = self.objXMLReader.getNumBaselineScans()
+        self.longModelName = self.objXMLReader.getLongModelName(modelName)
+        self.yAxisLabel = self.objXMLReader.getYAxisLabel()
+
+        # Cache the description of the parameters, so that the
+        # XML tree is not searched for every data file.
+        self.parameterNames = []
+        self.parameterLabels = []
+        self.isPercentage = []
+        self.defaultValues = []
+        self.lowerConstraints = []
+        self.upperConstraints = []
+        self.minDisplayValues = []
+        self.maxDisplayValues = []
+        for paramNumber in range(1, self.objXMLReader.getNumberOfParameters(modelName) + 1):
+            isPercentage, parameterLabel = self.objXMLReader.getParameterLabel(
+                modelName, paramNumber)
+            self.parameterLabels.append(parameterLabel)
+            self.parameterNames.append(
+                self.objXMLReader.getParameterShortName(modelName, paramNumber))
+            self.isPercentage.append(bool(isPercentage))
+            self.defaultValues.append(
+                self.objXMLReader.getParameterDefault(modelName, paramNumber))
+            self.lowerConstraints.append(
+                self.objXMLReader.getLowerParameterConstraint(modelName, paramNumber))
+            self.upperConstraints.append(
+                self.objXMLReader.getUpperParameterConstraint(modelName, paramNumber))
+            self.minDisplayValues.append(
+                self.objXMLReader.getMinParameterDisplayValue(modelName, paramNumber))
+            self.maxDisplayValues.append(
+                self.objXMLReader.getMaxParameterDisplayValue(modelName, paramNumber))
+        logger.info('In module ' + __name__ +
+                    '. Created an instance of class BatchProcessor for model ' + modelName)
+
+
+    def getRequiredColumns(self):
+        """Returns the names of the columns each data file must contain."""
+        if self.inletType == 'dual':
+            return [self.ROI, self.AIF, self.VIF]
+        return [self.ROI, self.AIF]
+
+
+    def getParameterList(self, initialValues=None, fixedParameters=None):
+        """Returns a list of (name, value, vary, min, max, expr, brute_step)
+        tuples, one for each parameter, as required by lmfit curve fitting.
+
+        Input Parameters
+        ----------------
+        initialValues - Optional list of initial values, in the units
+            displayed on the GUI. By default, the parameter default values
+            in the XML configuration file are used.
+        fixedParameters - Optional list of booleans, True if the value
+            of the corresponding parameter is fixed during curve fitting.
+        """
+        if initialValues is None:
+            initialValues = self.defaultValues
+        if fixedParameters is None:
+            fixedParameters = [False]*len(self.parameterNames)
+        paramList = []
+        for name, value, isPercentage, lower, upper, isFixed in zip(
+                self.parameterNames, initialValues, self.isPercentage,
+                self.lowerConstraints, self.upperConstraints, fixedParameters):
+            if isPercentage:
+                value = value/100
+            paramList.append((name, value, not isFixed, lower, upper, None, None))
+        return paramList
+
+
+    def getSearchBounds(self):
+        """Returns a dictionary of parameter short name:(lower, upper) 
+        pairs, in the units of the model functions, within which the 
+        starting points of multi-start fitting are sampled: the 
+        constraints of the parameter, else the range of its spinbox. 
+        Percentages are sampled from 0 if they have no lower constraint."""
+        bounds = {}
+        for name, isPercentage, lower, upper, minDisplay, maxDisplay in zip(
+                self.parameterNames, self.isPercentage, self.lowerConstraints,
+                self.upperConstraints, self.minDisplayValues, self.maxDisplayValues):
+            if lower is None:
+                lower = 0.0 if isPercentage else minDisplay
+            if upper is None:
+                upper = maxDisplay
+            if isPercentage:
+                lower = lower/100 if lower is not None else None
+                upper = upper/100 if upper is not None else None
+            bounds[name] = (lower, upper)
+        return bounds
+
+
+    def fitSignalData(self, signalData, initialValues=None, fixedParameters=None):
+        """Fits the model to the ROI MR signal data in signalData.
+
+        Input Parameters
+        ----------------
+        signalData - Dictionary returned by the function LoadDataFile.
+        initialValues, fixedParameters - See getParameterList.
+
+        Returns
+        -------
+        A dictionary holding:
+            parameters - Dictionary of parameter short name:[value, lower, upper]
+                pairs in the units displayed on the GUI.
+            fitStatistics - Dictionary of statistics returned by
+                ModelFunctionsHelper.CurveFit and the status of the fit.
+            modelCurve - Array of MR signals predicted by the model using
+                the optimum parameter values.
+            covariance - The estimated covariance of the values of the
+                parameters allowed to vary, in the order of parameterNames
+                and in the units of the model functions, or None.
+        """
+        if fixedParameters is None:
+            fixedParameters = [False]*len(self.parameterNames)
+        paramList = self.getParameterList(initialValues, fixedParameters)
+        times = signalData['time']
+        AIFSignals = signalData[self.AIF]
+        VIFSignals = signalData[self.VIF] if self.inletType == 'dual' else []
+        ROISignals = signalData[self.ROI]
+        if self.useCurveAtlas:
+            paramList = ModelFunctionsHelper.GetAtlasInitialValues(
+                self.functionName, self.moduleName, paramList, times,
+                AIFSignals, VIFSignals, ROISignals, self.inletType,
+                self.constantsString, self.getSearchBounds(),
+                self.atlasPointsPerParameter)
+
+        if self.numStarts > 0:
+            fitResult = ModelFunctionsHelper.CurveFitMultiStart(
+                self.functionName, self.moduleName, paramList, times,
+                AIFSignals, VIFSignals, ROISignals, self.inletType,
+                self.constantsString, self.numStarts, self.numRefinements,
+                self.sampling, self.seed, self.getSearchBounds(),
+                self.refinementExecutor, self.delayMode,
+                ModelFunctionsHelper.GetCandidateDelays(times, self.maxDelay))
+        elif self.delayMode == 'none':
+            fitResult = ModelFunctionsHelper.CurveFit(
+                self.functionName, self.moduleName, paramList, times,
+                AIFSignals, VIFSignals, ROISignals, self.inletType,
+                self.constantsString)
+        else:
+            fitResult = ModelFunctionsHelper.CurveFitWithDelay(
+                self.functionName, self.moduleName, paramList, times,
+                AIFSignals, VIFSignals, ROISignals, self.inletType,
+                self.constantsString, self.delayMode,
+                ModelFunctionsHelper.GetCandidateDelays(times, self.maxDelay))
+        if fitResult is None:
+            return {'parameters': {}, 'fitStatistics': {'status': 'Failed'},
+                    'modelCurve': None, 'covariance': None}
+
+        optimumParamsDict, covarianceMatrix, fitStatistics = fitResult
+        fitStatistics['status'] = 'OK' if fitStatistics['success'] \
+            else 'Not converged - ' + str(fitStatistics['message'])
+        optimumValues = list(optimumParamsDict.values())
+
+        delay = fitStatistics.get('delay')
+        if delay:
+            # The model curve is predicted from the delayed input functions
+            AIFSignals = tools.shift_curves(times, AIFSignals, delay)[0]
+            if self.inletType == 'dual':
+                VIFSignals = tools.shift_curves(times, VIFSignals, delay)[0]
+        modelCurve = ModelFunctionsHelper.ModelSelector(
+            self.functionName, self.moduleName, self.inletType, times,
+            AIFSignals, optimumValues, self.constantsString, VIFSignals)
+
+        confidenceLimits = Calculate95ConfidenceLimits(
+            len(ROISignals), optimumValues, covarianceMatrix, fixedParameters)
+        parameters = {}
+        for name, isPercentage, (value, lower, upper) in zip(
+                self.parameterNames, self.isPercentage, confidenceLimits):
+            if isPercentage:
+                # Convert decimal fractions to a percentage as on the GUI
+                value = value*100.0
+                if lower != '':
+                    lower, upper = lower*100.0, upper*100.0
+            parameters[name] = [value, lower, upper]
+        if delay is not None:
+            parameters[DELAY_PARAMETER_NAME] = [delay, '', '']
+
+        return {'parameters': parameters, 'fitStatistics': fitStatistics,
+                'modelCurve': modelCurve, 'covariance': covarianceMatrix}
+
+
+    def setInitialValues(self, initialValues=None, fixedParameters=None):
+        """Sets the initial values of the parameters and whether each
+        is fixed during the curve fitting of every data file processed
+        by processFolder. See getParameterList."""
+        self.initialValues = initialValues
+        self.fixedParameters = fixedParameters
+        self.objWarmStart.reset()
+
+
+    def setWarmStart(self, policy='none'):
+        """Sets the policy, one of WarmStart.WARM_START_POLICIES, by which
+        the initial values of the fit of each data file processed by 
+        processFolder are chosen from the earlier fits, see WarmStart.py."""
+        if policy != self.objWarmStart.policy:
+            self.objWarmStart = WarmStart(policy)
+
+
+    def setDelayMode(self, delayMode='none', maxDelay=None):
+        """Sets how the delay of the ROI curve relative to the input
+        functions is estimated during the curve fitting of every data
+        file; delayMode is one of ModelFunctionsHelper.DELAY_MODES and 
+        maxDelay the largest delay considered, in minutes. By default, 
+        see ModelFunctionsHelper.GetCandidateDelays."""
+        if delayMode not in ModelFunctionsHelper.DELAY_MODES:
+            raise ValueError('Unknown delay mode ' + str(delayMode))
+        self.delayMode = delayMode
+        self.maxDelay = maxDelay
+
+
+    def setMultiStart(self, numStarts=0, 
+                      numRefinements=ModelFunctionsHelper.DEFAULT_NUMBER_OF_REFINEMENTS,
+                      sampling='sobol', seed=0):
+        """Sets the multi-start fitting of every data file: numStarts
+        starting points are sampled by the sampling method, one of 
+        ModelFunctionsHelper.SAMPLING_METHODS, with the random seed, seed,
+        and the best numRefinements are refined. If numStarts is 0, each
+        data file is fitted once from the initial values. See 
+        ModelFunctionsHelper.CurveFitMultiStart."""
+        if sampling not in ModelFunctionsHelper.SAMPLING_METHODS:
+            raise ValueError('Unknown sampling method ' + str(sampling))
+        self.numStarts = numStarts
+        self.numRefinements = numRefinements
+        self.sampling = sampling
+        self.seed = seed
+
+
+    def setCurveAtlas(self, useCurveAtlas=False, 
+                      pointsPerParameter=CurveAtlas.DEFAULT_POINTS_PER_PARAMETER):
+        """Sets whether the initial values of the parameters allowed to
+        vary are chosen, for every data file, from the nearest curve of
+        the curve atlas of the model, with pointsPerParameter grid points 
+        per parameter. See ModelFunctionsHelper.GetAtlasInitialValues."""
+        self.useCurveAtlas = useCurveAtlas
+        self.atlasPointsPerParameter = pointsPerParameter
+
+
+    def readFile(self, fullFilePath):
+        """Loads, validates and normalises a data file in the reader
+        stage of the batch pipeline.
+
+        Returns
+        -------
+        The signalData dictionary, or None if the file failed validation,
+        the reason for the failure and a new row of stage times for the
+        data file holding the times of the load and normalise stages.
+        """
+        row = StageTimerModule.NewRow(os.path.basename(fullFilePath))
+        with StageTimerModule.TimeRowStage(row, 'load'):
+            signalData, failureReason = ReadDataFile(
+                fullFilePath, self.getRequiredColumns())
+        if signalData is not None:
+            with StageTimerModule.TimeRowStage(row, 'normalise'):
+                NormaliseSignalData(signalData, self.numBaselineScans)
+        return signalData, failureReason, row
+
+
+    def fitSignalDataWithWarmStart(self, signalData):
+        """Fits the model to the signal data of a data file of a batch, 
+        as fitSignalData, from the initial values chosen by the warm
+        start policy, see setWarmStart. If a warm-started fit does not
+        converge, the data is fitted again from the initial values set 
+        by setInitialValues, and the function evaluations and iterations
+        of both fits are recorded. The fit statistics record whether the
+        fit was warm-started (warmStart)."""
+        warmValues = self.objWarmStart.getInitialValues(
+            self.initialValues if self.initialValues is not None else self.defaultValues,
+            self.fixedParameters)
+        if warmValues is None:
+            result = self.fitSignalData(signalData, self.initialValues, self.fixedParameters)
+            result['fitStatistics']['warmStart'] = 'none'
+        else:
+            result = self.fitSignalData(signalData, warmValues, self.fixedParameters)
+            result['fitStatistics']['warmStart'] = self.objWarmStart.policy
+            if result['fitStatistics']['status'] != 'OK':
+                logger.info('BatchProcessor - warm-started fit not converged, '
+                            'fitting from the initial values.')
+                warmFitStatistics = result['fitStatistics']
+                result = self.fitSignalData(signalData, self.initialValues, 
+                                            self.fixedParameters)
+                fitStatistics = result['fitStatistics']
+                for key in ('nfev', 'iterations'):
+                    if key in warmFitStatistics or key in fitStatistics:
+                        fitStatistics[key] = warmFitStatistics.get(key, 0) + \
+                            fitStatistics.get(key, 0)
+                fitStatistics['warmStart'] = 'fallback'
+        isConverged = result['fitStatistics']['status'] == 'OK'
+        self.objWarmStart.recordFit(
+            [result['parameters'][name][0] for name in self.parameterNames] 
+            if isConverged else [], isConverged)
+        return result
+
+
+    def fitData(self, fileName, signalData):
+        """Curve fits the signal data of the data file, fileName, using
+        the initial values set by setInitialValues, or chosen by the warm 
+        start policy, in the fit stage of the batch pipeline.
+
+        Returns
+        -------
+        The dictionary returned by fitSignalData and a row of stage
+        times holding the times of the curve_fit and lmfit stages and
+        the number of function evaluations and iterations.
+        """
+        objStageTimer = StageTimer()
+        objStageTimer.startFile(fileName)
+        try:
+            with objStageTimer.stage('curve_fit'):
+                # Under cProfile if a profile folder is set
+                result = Tracing.ProfileCall(fileName, self.fitSignalDataWithWarmStart,
+                                             signalData)
+            objStageTimer.recordFitStatistics(result['fitStatistics'])
+        finally:
+            objStageTimer.endFile()
+        return result, objStageTimer.getLastRow()
+
+
+    def fitFile(self, fullFilePath, objStageTimer):
+        """Loads, validates and curve fits a single data file,
+        recording the time taken by each stage in objStageTimer.
+
+        Returns
+        -------
+        The dictionary returned by fitSignalData, or None if the
+        file failed validation, and the reason for the failure.
+        """
+        fileName = os.path.basename(fullFilePath)
+        objStageTimer.startFile(fileName)
+        try:
+            with objStageTimer.stage('load'):
+                signalData, failureReason = ReadDataFile(
+                    fullFilePath, self.getRequiredColumns())
+            if signalData is None:
+                return None, failureReason
+
+            with objStageTimer.stage('normalise'):
+                NormaliseSignalData(signalData, self.numBaselineScans)
+            with objStageTimer.stage('curve_fit'):
+                # Under cProfile if a profile folder is set
+                result = Tracing.ProfileCall(fileName, self.fitSignalDataWithWarmStart,
+                                             signalData)
+            objStageTimer.recordFitStatistics(result['fitStatistics'])
+            return result, ""
+        finally:
+            objStageTimer.endFile()
+
+
+    def getPlotCurves(self, signalData, result):
+        """Returns the times and the list of (label, array of values, 
+        format string) tuples of the curves plotted for a data file, 
+        as returned by the function GetPlotCurves in FERRET.py."""
+        curves = [(self.curveNames['aif'], signalData[self.AIF], 'r.-')]
+        if self.inletType == 'dual':
+            curves.append((self.curveNames['vif'], signalData[self.VIF], 'k.-'))
+        if result is not None and result['modelCurve'] is not None:
+            curves.append((self.modelName + ' model',
+                           np.asarray(result['modelCurve'], dtype=np.float64), 'g--'))
+        curves.append((self.curveNames['roi'], signalData[self.ROI], 'b.-'))
+        return signalData['time'], curves
+
+
+    def getPlotDataColumns(self, signalData, result):
+        """Returns the columns of the plot data of a data file as a 
+        dictionary of role:(name, values) pairs, as returned by the 
+        function GetPlotDataColumns in FERRET.py."""
+        columns = {'time': ('Time (min)', signalData['time']),
+                   'roi': (self.curveNames['roi'], signalData[self.ROI]),
+                   'aif': (self.curveNames['aif'], signalData[self.AIF])}
+        if self.inletType == 'dual':
+            columns['vif'] = (self.curveNames['vif'], signalData[self.VIF])
+        if result is not None and result['modelCurve'] is not None:
+            columns['model'] = (self.modelName + ' model',
+                                np.asarray(result['modelCurve'], dtype=np.float64))
+        return columns
+
+
+    def getParameterDictionary(self, result):
+        """Returns a dictionary of parameter label:[value, lower, upper]
+        pairs for the report and summary spreadsheet of a data file, as 
+        built by the function BuildParameterDictionary in FERRET.py.
+        If curve fitting failed, the initial values are returned 
+        without confidence limits."""
+        parameterDictionary = {}
+        initialValues = self.initialValues or self.defaultValues
+        for label, name, initialValue in zip(self.parameterLabels,
+                                             self.parameterNames, initialValues):
+            if result is not None and name in result['parameters']:
+                parameterDictionary[label] = list(result['parameters'][name])
+            else:
+                parameterDictionary[label] = [round(initialValue, 2), 'N/A', 'N/A']
+        return parameterDictionary
+
+
+    def writeFileOutputs(self, fileName, signalData, result, row, objOutputs):
+        """Writes the output files of a fitted data file in the writer
+        stage of the batch pipeline; namely, its plot data CSV file or 
+        its fit results, if required by objOutputs, a BatchOutputs object."""
+        stem = os.path.splitext(fileName)[0]
+        if objOutputs.fitResultsFolder:
+            with StageTimerModule.TimeRowStage(row, 'save_fit_results'):
+                times, curves = self.getPlotCurves(signalData, result)
+                ReportGenerator.SaveFitResults(
+                    os.path.join(objOutputs.fitResultsFolder,
+                                 stem + ReportGenerator.FIT_RESULTS_EXTENSION),
+                    fileName, self.longModelName, times, curves,
+                    self.yAxisLabel, self.getParameterDictionary(result))
+        elif objOutputs.plotDataFolder and objOutputs.objPlotData is None:
+            with StageTimerModule.TimeRowStage(row, 'csv_export'):
+                columns = self.getPlotDataColumns(signalData, result)
+                PlotDataExport.SavePlotData(
+                    os.path.join(objOutputs.plotDataFolder, 'plot' + fileName),
+                    [name for name, _ in columns.values()],
+                    [values for _, values in columns.values()],
+                    objOutputs.saveBinaryCopy)
+
+
+    def recordResult(self, fileName, signalData, result, failureReason,
+                     row, objOutputs):
+        """Records the result of a data file, in the order of the data 
+        files, in the results table and summary spreadsheet of objOutputs, 
+        a BatchOutputs object, adds its plot data to the collection of 
+        plot data and queues the creation of its PDF report, if required."""
+        if signalData is None:
+            with StageTimerModule.TimeRowStage(row, 'summary'):
+                if objOutputs.objSpreadSheet is not None:
+                    objOutputs.objSpreadSheet.recordSkippedFiles(fileName, failureReason)
+                if objOutputs.objResultsStore is not None:
+                    objOutputs.objResultsStore.recordSkippedFiles(fileName, failureReason)
+            return
+
+        parameterDictionary = self.getParameterDictionary(result)
+        if objOutputs.objReportGenerator is not None and not objOutputs.fitResultsFolder:
+            with StageTimerModule.TimeRowStage(row, 'pdf_report'):
+                times, curves = self.getPlotCurves(signalData, result)
+                objOutputs.objReportGenerator.submitReport(
+                    os.path.join(objOutputs.reportFolder,
+                                 os.path.splitext(fileName)[0] + '.pdf'),
+                    objOutputs.reportTitle, objOutputs.reportLogo, fileName,
+                    self.longModelName, times, curves, self.yAxisLabel,
+                    parameterDictionary)
+        if objOutputs.objPlotData is not None and not objOutputs.fitResultsFolder:
+            with StageTimerModule.TimeRowStage(row, 'csv_export'):
+                objOutputs.objPlotData.addCurves(
+                    fileName, self.getPlotDataColumns(signalData, result))
+
+        with StageTimerModule.TimeRowStage(row, 'summary'):
+            fitStatistics = result['fitStatistics'] if result is not None \
+                else {'status': 'Failed - ' + failureReason}
+            if objOutputs.objSpreadSheet is not None:
+                for label, (value, lower, upper) in parameterDictionary.items():
+                    objOutputs.objSpreadSheet.recordParameterValues(
+                        fileName, self.modelName, "'" + label + "'",
+                        str(round(value, 3)), lower, upper)
+            if objOutputs.objResultsStore is not None:
+                # All the rows of this fit share its time, to tell them 
+                # apart from those of a later fit of the same file
+                fittedAt = ResultsStore.GetTimestamp()
+                if result is None or not result['parameters']:
+                    # Curve fitting failed, record a row for this file
+                    objOutputs.objResultsStore.recordParameterValues(
+                        fileName, self.modelName, '', None, None, None,
+                        status=fitStatistics['status'], fittedAt=fittedAt)
+                else:
+                    for name, (value, lower, upper) in result['parameters'].items():
+                        objOutputs.objResultsStore.recordParameterValues(
+                            fileName, self.modelName, name, value, lower, upper,
+                            fitStatistics.get('nfev'), fitStatistics.get('fitTime'),
+                            fitStatistics['status'], fittedAt)
+
+
+    def processFile(self, fullFilePath, objResultsStore=None, objStageTimer=None):
+        """Loads, validates and curve fits a single data file in this
+        process and records the results in objResultsStore, if supplied.
+        If objStageTimer is supplied, the time taken by each stage
+        is recorded in it.
+
+        Returns
+        -------
+        The dictionary returned by fitSignalData, or None if the
+        file failed validation, and the reason for the failure.
+        """
+        if objStageTimer is None:
+            objStageTimer = StageTimer()
+        fileName = os.path.basename(fullFilePath)
+        signalData, failureReason, row = self.readFile(fullFilePath)
+        result = None
+        if signalData is not None:
+            result, fitRow = self.fitData(fileName, signalData)
+            BatchPipeline.MergeRows(row, fitRow)
+        self.recordResult(fileName, signalData, result, failureReason, row,
+                          BatchOutputs(objResultsStore))
+        objStageTimer.addRow(row)
+        objStageTimer.endFile()
+        return result, failureReason
+
+
+    def getFitWorkerPool(self, objResourceManager):
+        """Returns the persistent pool of worker processes fitting data
+        files, creating it if required or if the number of workers, 
+        the BLAS threads set by objResourceManager, the initial values 
+        of the parameters, the delay mode, the multi-start, the curve
+        atlas or the warm start settings have changed. Its worker 
+        processes are started on first use."""
+        initialiserArguments = (self.objXMLReader.fullFilePath, self.modelName,
+            self.curveNames['roi'], self.curveNames['aif'], self.curveNames['vif'],
+            self.initialValues, self.fixedParameters, self.delayMode, self.maxDelay,
+            (self.numStarts, self.numRefinements, self.sampling, self.seed),
+            (self.useCurveAtlas, self.atlasPointsPerParameter),
+            self.objWarmStart.policy,
+            Tracing.GetProfileFolder(), Tracing.GetWorkerTracing(),
+            objResourceManager.fitBLASThreads)
+        if self.objFitWorkerPool is not None and (
+           self.objFitWorkerPool.numberOfWorkers != objResourceManager.numberOfFitWorkers
+           or self.objFitWorkerPool.initialiserArguments != initialiserArguments):
+            self.shutdown()
+        if self.objFitWorkerPool is None:
+            self.objFitWorkerPool = FitWorkerPool(objResourceManager.numberOfFitWorkers,
+                                                  initialiserArguments)
+        return self.objFitWorkerPool
+
+
+    def shutdown(self):
+        """Stops the worker processes of the pool fitting data files, if any."""
+        if self.objFitWorkerPool is not None:
+            self.objFitWorkerPool.shutdown()
+            self.objFitWorkerPool = None
+
+
+    def processFiles(self, fullFilePaths, objOutputs, objStageTimer,
+                     progressCallback=None, withReports=False, numberOfWorkers=None):
+        """Curve fits the data files in fullFilePaths through the stages
+        of a BatchPipeline: reader threads load the data files, the 
+        worker processes of the FitWorkerPool, or this process, fit them 
+        and writer threads write their outputs and record their results
+        in objOutputs, a BatchOutputs object. The time taken by each
+        stage is recorded in objStageTimer. See processFolder for the
+        other input parameters. The warm start history, in this process
+        and in the worker processes, is reset at the start of the batch.
+
+        Returns
+        -------
+        The number of data files fitted, excluding those that failed 
+        validation or curve fitting, and the number of worker processes
+        used.
+        """
+        if numberOfWorkers is None:
+            numberOfWorkers = ResourceManager(self.cpuBudget, withReports)\
+                .numberOfFitWorkers
+        numberOfWorkers = max(1, min(numberOfWorkers,
+                                     len(fullFilePaths)//MIN_FILES_PER_WORKER))
+        # Share the CPU budget between the actual number of workers
+        objResourceManager = ResourceManager(self.cpuBudget, withReports,
+                                             numberOfFitWorkers=numberOfWorkers)
+        self.batchNumber += 1
+        self.objWarmStart.reset()
+        if numberOfWorkers > 1:
+            fitExecutor = self.getFitWorkerPool(objResourceManager).getExecutor()
+            fitFunction = functools.partial(_FitSignalDataInWorker,
+                                            batchNumber=self.batchNumber)
+        else:
+            fitExecutor = None
+            fitFunction = self.fitData
+            numberOfRefinementWorkers = min(self.numRefinements + 1,
+                ResourceManager(self.cpuBudget, withReports).numberOfFitWorkers)
+            if self.numStarts > 0 and numberOfRefinementWorkers > 1:
+                # The data files are fitted one at a time, so refine
+                # the starting points of each in the worker processes
+                objResourceManager = ResourceManager(self.cpuBudget, withReports,
+                    numberOfFitWorkers=numberOfRefinementWorkers)
+                self.refinementExecutor = \
+                    self.getFitWorkerPool(objResourceManager).getExecutor()
+        objResourceManager.logConfiguration()
+        objBatchPipeline = BatchPipeline.BatchPipeline(
+            self.readFile, fitFunction,
+            lambda *args: self.writeFileOutputs(*args, objOutputs),
+            lambda *args: self.recordResult(*args, objOutputs),
+            fitExecutor, numberOfFitWorkers=numberOfWorkers,
+            isFittedFunction=IsFitted)
+        try:
+            with ResourceManagerModule.LimitBLASThreads(
+                    objResourceManager.getMainBLASThreads(
+                        fitExecutor is None and self.refinementExecutor is None)):
+                numFitted = objBatchPipeline.run(fullFilePaths, objStageTimer,
+                                                 progressCallback)
+        finally:
+            self.refinementExecutor = None
+        return numFitted, numberOfWorkers
+
+
+    def processFolder(self, folder, resultsFileName=None, numberOfWorkers=None,
+                      objOutputs=None, objStageTimer=None, progressCallback=None,
+                      withReports=False):
+        """Curve fits every CSV data file in folder, see processFiles.
+        The results table and the stage times of an earlier batch, if 
+        saved in folder, are not data files and are not fitted.
+
+        Input Parameters
+        ----------------
+        folder - Folder containing the CSV data files.
+        resultsFileName - Optional file path and name of the results
+            table. Its extension determines the file format.
+        numberOfWorkers - Maximum number of worker processes fitting the 
+            data files in parallel, by default set by the ResourceManager
+            class from the CPU budget. It is limited so that each worker
+            has at least MIN_FILES_PER_WORKER files. If 1, the files are
+            fitted in this process.
+            The stage times of each file are those measured in the
+            worker process, so, in parallel, their sum exceeds the 
+            wall time of the batch.
+        objOutputs - Optional BatchOutputs object holding the other
+            outputs of batch processing, such as the PDF reports.
+        objStageTimer - Optional StageTimer object in which the time 
+            taken by each stage is recorded.
+        progressCallback - Optional function called, in this thread, 
+            with the number of data files fitted so far and the name 
+            of the last one.
+        withReports - True if PDF reports are created by worker processes
+            in parallel, so that the CPU budget is shared with them.
+
+        Returns
+        -------
+        A dictionary summarising the batch: the number of files,
+        the number fitted and the number skipped, because they failed
+        validation or curve fitting, the total time in seconds, the
+        number of worker processes used and the StageTimer object
+        holding the time taken by each stage.
+        If resultsFileName is given, the time taken by each stage 
+        for each file is saved alongside it in a CSV file whose name 
+        ends in StageTimer.TIMINGS_FILE_SUFFIX.
+        """
+        startTime = time.perf_counter()
+        if objOutputs is None:
+            objOutputs = BatchOutputs()
+        if resultsFileName:
+            objOutputs.objResultsStore = ResultsStore.ResultsStore(resultsFileName)
+        excludedFiles = set()
+        if objOutputs.objResultsStore is not None:
+            # The results and stage times of an earlier batch, saved
+            # in the data folder, are not data files
+            stem = os.path.splitext(objOutputs.objResultsStore.fullFilePath)[0]
+            timingsFileName = stem + StageTimerModule.TIMINGS_FILE_SUFFIX
+            excludedFiles = {os.path.abspath(objOutputs.objResultsStore.fullFilePath),
+                             os.path.abspath(timingsFileName)}
+        if objStageTimer is None:
+            objStageTimer = StageTimer()
+
+        csvDataFiles = sorted(file for file in os.listdir(folder)
+                              if file.lower().endswith('.csv') and
+                              os.path.abspath(os.path.join(folder, file))
+                              not in excludedFiles)
+        fullFilePaths = [os.path.join(folder, file) for file in csvDataFiles]
+        numFitted, numberOfWorkers = self.processFiles(fullFilePaths, objOutputs,
+            objStageTimer, progressCallback, withReports, numberOfWorkers)
+
+        if resultsFileName:
+            with objStageTimer.batchStage('save_results'):
+                objOutputs.objResultsStore.saveResults()
+            objStageTimer.saveTimings(timingsFileName)
+        totalTime = time.perf_counter() - startTime
+        logger.info('BatchProcessor.processFolder - {} files in {:.2f} s'
+                    .format(len(csvDataFiles), totalTime))
+        return {'numFiles': len(csvDataFiles),
+                'numFitted': numFitted,
+                'numSkipped': len(csvDataFiles) - numFitted,
+                'totalTime': totalTime,
+                'numberOfWorkers': numberOfWorkers,
+                'stageTimer': objStageTimer}
+
+
+    def watchFolder(self, folder, resultsFileName, numberOfWorkers=None,
+                    pollInterval=FolderWatcherModule.DEFAULT_POLL_INTERVAL,
+                    settleTime=FolderWatcherModule.DEFAULT_SETTLE_TIME,
+                    fitExistingFiles=True, stopEvent=None, batchCallback=None,
+                    usePolling=False):
+        """Watches folder and curve fits each CSV data file as soon as
+        it appears or is modified, appending its results to the results
+        table, until stopEvent is set or the user presses Ctrl+C. Data
+        files already fitted, in this or an earlier session, are not
+        fitted again unless they are modified, see the FolderWatcher class.
+
+        Input Parameters
+        ----------------
+        folder - Folder containing the CSV data files.
+        resultsFileName - File path and name of the results table, to 
+            which the results are appended. The fitted data files are
+            recorded alongside it in a JSON file whose name ends in 
+            FolderWatcher.STATE_FILE_SUFFIX and the time taken by each
+            stage in a CSV file whose name ends in TIMINGS_FILE_SUFFIX.
+        numberOfWorkers - Maximum number of worker processes, see 
+            processFolder. Worker processes are only used when many data
+            files change at once, such as when the watch starts.
+        pollInterval, settleTime - See the FolderWatcher class.
+        fitExistingFiles - If False, the data files already in folder
+            when the watch starts are not fitted.
+        stopEvent - Optional threading.Event that stops the watch when set.
+        batchCallback - Optional function called with the list of the
+            full file paths of the data files in each batch and the number
+            fitted, after their results have been appended.
+        usePolling - If True, the folder is polled even if inotify is available.
+
+        Returns
+        -------
+        A dictionary summarising the session: the number of files,
+        the number fitted and skipped, the total time in seconds and
+        the StageTimer object holding the time taken by each stage.
+        """
+        startTime = time.perf_counter()
+        objResultsStore = ResultsStore.ResultsStore(resultsFileName)
+        stem = os.path.splitext(objResultsStore.fullFilePath)[0]
+        timingsFileName = stem + StageTimerModule.TIMINGS_FILE_SUFFIX
+        objFolderWatcher = FolderWatcher(folder, 
+            stem + FolderWatcherModule.STATE_FILE_SUFFIX,
+            pollInterval=pollInterval, settleTime=settleTime,
+            excludedFiles=[objResultsStore.fullFilePath, timingsFileName],
+            usePolling=usePolling)
+        if not fitExistingFiles:
+            objFolderWatcher.markProcessed(objFolderWatcher.getChangedFiles())
+        objOutputs = BatchOutputs(objResultsStore)
+        objStageTimer = StageTimer()
+        numFiles = 0
+        numFitted = 0
+        try:
+            while stopEvent is None or not stopEvent.is_set():
+                changedFiles = objFolderWatcher.getChangedFiles()
+                if changedFiles:
+                    batchFitted, _ = self.processFiles(changedFiles, objOutputs,
+                        objStageTimer, numberOfWorkers=numberOfWorkers)
+                    with objStageTimer.batchStage('save_results'):
+                        objResultsStore.appendResults()
+                    objFolderWatcher.markProcessed(changedFiles)
+                    objStageTimer.saveTimings(timingsFileName)
+                    numFiles += len(changedFiles)
+                    numFitted += batchFitted
+                    logger.info('BatchProcessor.watchFolder - {} of {} changed files fitted'
+                                .format(batchFitted, len(changedFiles)))
+                    if batchCallback is not None:
+                        batchCallback(changedFiles, batchFitted)
+                objFolderWatcher.waitForChanges(stopEvent)
+        finally:
+            objFolderWatcher.close()
+            # Results recorded before an interruption
+            objResultsStore.appendResults()
+        return {'numFiles': numFiles,
+                'numFitted': numFitted,
+                'numSkipped': numFiles - numFitted,
+                'totalTime': time.perf_counter() - startTime,
+                'stageTimer': objStageTimer}
+
+
+if __name__ == '__main__':
+    # Required by the worker processes of an application frozen by PyInstaller
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(
+        description='Fits a model to all the CSV data files in a folder.')
+    parser.add_argument('folder', help='Folder containing the CSV data files.')
+    parser.add_argument('--config', required=True, help='XML configuration file.')
+    parser.add_argument('--model', required=True, help='Short name of the model.')
+    parser.add_argument('--roi', required=True, help='Name of the ROI column.')
+    parser.add_argument('--aif', required=True, help='Name of the AIF column.')
+    parser.add_argument('--vif', help='Name of the VIF column.')
+    parser.add_argument('--results', help='File path and name of the results table.')
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes fitting the data files. ' +
+                        'By default, set from the CPU budget.')
+    parser.add_argument('--cpu-budget', type=int,
+                        help='Number of cores used. By default, the value of ' +
+                        ResourceManagerModule.CPU_BUDGET_ENVIRONMENT_VARIABLE +
+                        ' or all the available cores.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep watching the folder, fitting new and modified ' +
+                        'data files as they appear and appending their results.')
+    parser.add_argument('--poll-interval', type=float,
+                        default=FolderWatcherModule.DEFAULT_POLL_INTERVAL,
+                        help='Maximum time in seconds between two scans of a watched folder.')
+    parser.add_argument('--skip-existing', action='store_true',
+                        help='Do not fit the data files already in a watched folder.')
+    parser.add_argument('--delay-mode', choices=ModelFunctionsHelper.DELAY_MODES,
+                        default='none',
+                        help='How the delay of the ROI curve relative to the AIF ' +
+                        'is estimated, see ModelFunctionsHelper.CurveFitWithDelay.')
+    parser.add_argument('--max-delay', type=float,
+                        help='Largest delay considered in minutes. By default, ' +
+                        '{} time steps.'.format(
+                            ModelFunctionsHelper.DEFAULT_MAX_DELAY_TIME_STEPS))
+    parser.add_argument('--multi-start', type=int, default=0, metavar='K',
+                        help='Number of starting points screened for each data file, ' +
+                        'see ModelFunctionsHelper.CurveFitMultiStart. By default, ' +
+                        'each data file is fitted once from the initial values.')
+    parser.add_argument('--refinements', type=int,
+                        default=ModelFunctionsHelper.DEFAULT_NUMBER_OF_REFINEMENTS,
+                        help='Number of the best starting points refined.')
+    parser.add_argument('--sampling', choices=ModelFunctionsHelper.SAMPLING_METHODS,
+                        default='sobol', help='Sampling of the starting points.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed of the sampling.')
+    parser.add_argument('--curve-atlas', action='store_true',
+                        help='Choose the initial values of each fit from the nearest ' +
+                        'curve of an atlas of the curves predicted by the model.')
+    parser.add_argument('--atlas-points', type=int,
+                        default=CurveAtlas.DEFAULT_POINTS_PER_PARAMETER,
+                        help='Number of grid points of the curve atlas per parameter.')
+    parser.add_argument('--warm-start', choices=WarmStartModule.WARM_START_POLICIES,
+                        default='none',
+                        help='Take the initial values of each fit from the previous ' +
+                        'converged fit or the median of the converged fits.')
+    parser.add_argument('--trace', help='File path and name of a Chrome trace JSON file.')
+    parser.add_argument('--profile-folder', 
+                        help='Folder in which to save a cProfile .prof file per data file.')
+    LoggingConfig.AddLoggingArguments(parser)
+    arguments = parser.parse_args()
+    resultsFileName = arguments.results or os.path.join(arguments.folder,
+        'BatchSummary' + ResultsStore.GetDefaultFileExtension())
+    # The log file is saved alongside the results table
+    LoggingConfig.ConfigureLoggingFromArguments(arguments, 'BatchProcessor.log',
+        os.path.dirname(os.path.abspath(resultsFileName)))
+    Tracing.ConfigureTracing(arguments.trace, arguments.profile_folder)
+
+    objBatchProcessor = BatchProcessor(arguments.config, arguments.model,
+                                       arguments.roi, arguments.aif, arguments.vif,
+                                       arguments.cpu_budget)
+    objBatchProcessor.setDelayMode(arguments.delay_mode, arguments.max_delay)
+    objBatchProcessor.setMultiStart(arguments.multi_start, arguments.refinements,
+                                    arguments.sampling, arguments.seed)
+    objBatchProcessor.setCurveAtlas(arguments.curve_atlas, arguments.atlas_points)
+    objBatchProcessor.setWarmStart(arguments.warm_start)
+    if arguments.watch:
+        print('Watching ' + arguments.folder + ', press Ctrl+C to stop.')
+        try:
+            summary = objBatchProcessor.watchFolder(arguments.folder, resultsFileName,
+                arguments.workers, arguments.poll_interval,
+                fitExistingFiles=not arguments.skip_existing,
+                batchCallback=lambda fullFilePaths, numFitted: print(
+                    '{} of {} new or modified files fitted'.format(
+                        numFitted, len(fullFilePaths))))
+        except KeyboardInterrupt:
+            summary = None
+        objBatchProcessor.shutdown()
+        sys.exit(0)
+    summary = objBatchProcessor.processFolder(arguments.folder, resultsFileName,
+                                              arguments.workers)
+    objBatchProcessor.shutdown()
+    print('{numFitted} of {numFiles} files fitted in {totalTime:.2f} s'.format(**summary))
+    print(summary['stageTimer'].formatSummary())
@@ -0,0 +1,116 @@
+"""
+This class module provides the curve atlas of a model, used to choose
+the initial values of the parameters before a curve fit, see
+ModelFunctionsHelper.GetAtlasInitialValues.
+
+A curve atlas holds the MR signal curves predicted by a model at every
+point of a dense grid of parameter values, for one time grid, AIF (and
+VIF), set of constants and values of the fixed parameters.  The curves
+are calculated in one batched evaluation of the model.  To find the
+curve of the atlas nearest to an observed ROI curve, the curves are
+centred on their mean curve and projected onto their leading principal
+components, where a KD-tree finds the nearest few.  The nearest of
+these in the sum of squared residuals, as minimised by curve fitting,
+is chosen.  Starting curve fitting from its parameter values reduces
+the number of iterations and the risk of a poor local minimum.
+
+Atlases are kept in a cache, see GetCurveAtlas, so that an atlas is
+built once and reused for every data file sharing the same AIF and
+time grid.  Each worker process of BatchProcessor has its own cache.
+
+Usage:
+    objCurveAtlas = GetCurveAtlas(key, lambda: CurveAtlas(parameterNames,
+                                  parameterValues, curves))
+    parameterValues, sumOfSquares = objCurveAtlas.findNearest(concROI)
+"""
+from collections import OrderedDict
+import threading
+import logging
+import numpy as np
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+# Number of grid points per parameter allowed to vary
+DEFAULT_POINTS_PER_PARAMETER = 12
+# Number of principal components of the curves indexed by the KD-tree
+DEFAULT_NUMBER_OF_COMPONENTS = 8
+# Number of nearest curves in the principal components compared
+# with the observed curve over all the time points
+DEFAULT_NUMBER_OF_NEIGHBOURS = 8
+# Maximum number of curve atlases kept in the cache
+CURVE_ATLAS_CACHE_SIZE = 16
+
+_curveAtlasCache = OrderedDict()
+_curveAtlasCacheLock = threading.Lock()
+
+
+class CurveAtlas:
+    def __init__(self, parameterNames, parameterValues, curves,
+                 numComponents=DEFAULT_NUMBER_OF_COMPONENTS):
+        """Creates an instance of the CurveAtlas class indexing the
+        predicted curves of a model.
+
+        Input Parameters
+        ----------------
+        parameterNames - List of the names of the parameters of the grid.
+        parameterValues - 2D array of the parameter values, one row per
+            grid point and one column per name in parameterNames.
+        curves - 2D array of the curves predicted by the model, one row
+            per grid point. Rows holding values that are not finite,
+            where the model could not be evaluated, are discarded.
+        numComponents - Number of principal components indexed.
+        """
+        curves = np.asarray(curves, dtype=np.float64)
+        isValid = np.all(np.isfinite(curves), axis=1)
+        if not isValid.any():
+            raise ValueError('None of the curves of the atlas could be calculated')
+        self.parameterNames = list(parameterNames)
+        self.parameterValues = np.asarray(parameterValues, dtype=np.float64)[isValid]
+        self.curves = curves[isValid]
+        self.meanCurve = self.curves.mean(axis=0)
+        centredCurves = self.curves - self.meanCurve
+        # The rows of Vt are the principal components of the curves
+        _, _, Vt = np.linalg.svd(centredCurves, full_matrices=False)
+        self.components = Vt[:numComponents].T
+        self.objKDTree = cKDTree(centredCurves @ self.components)
+        logger.info('In module ' + __name__ + '. Created an instance of class ' +
+                    'CurveAtlas of {} curves.'.format(len(self.curves)))
+
+
+    def findNearest(self, curve, numNeighbours=DEFAULT_NUMBER_OF_NEIGHBOURS):
+        """Returns the dictionary of parameter name:value pairs of the
+        curve of the atlas nearest to curve, an observed curve on the
+        same time grid, and their sum of squared residuals."""
+        curve = np.asarray(curve, dtype=np.float64)
+        _, indices = self.objKDTree.query((curve - self.meanCurve) @ self.components,
+                                          k=min(numNeighbours, len(self.curves)))
+        indices = np.atleast_1d(indices)
+        sumsOfSquares = np.sum((self.curves[indices] - curve)**2, axis=1)
+        nearest = int(np.argmin(sumsOfSquares))
+        return (dict(zip(self.parameterNames,
+                         self.parameterValues[indices[nearest]].tolist())),
+                float(sumsOfSquares[nearest]))
+
+
+def GetCurveAtlas(key, buildAtlas):
+    """Returns the CurveAtlas stored in the cache under key, a hashable
+    description of the model, data and grid, calling buildAtlas() to
+    create it if it is not in the cache."""
+    with _curveAtlasCacheLock:
+        objCurveAtlas = _curveAtlasCache.get(key)
+        if objCurveAtlas is not None:
+            _curveAtlasCache.move_to_end(key)
+            return objCurveAtlas
+    objCurveAtlas = buildAtlas()
+    with _curveAtlasCacheLock:
+        _curveAtlasCache[key] = objCurveAtlas
+        while len(_curveAtlasCache) > CURVE_ATLAS_CACHE_SIZE:
+            _curveAtlasCache.popitem(last=False)
+    return objCurveAtlas
+
+
+def ClearCurveAtlasCache():
+    """Discards the cached curve atlases."""
+    with _curveAtlasCacheLock:
+        _curveAtlasCache.clear()
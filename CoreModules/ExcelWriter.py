@@ -9,6 +9,7 @@ This is done using the openpyxl Python package.
 from openpyxl import Workbook
 from openpyxl.drawing.image import Image
 import logging
+import Tracing
 
 logger = logging.getLogger(__name__)
 
@@ -149,10 +150,42 @@ class ExcelWriter:
                          + paramName + str(e)) 
 
 
+    def recordStageTimings(self, objStageTimer):
+        """At the end of batch processing, records the time taken by
+        each stage of processing each data file, together with the 
+        number of function evaluations and iterations made during 
+        curve fitting, in a worksheet called 'Stage timings'. 
+        An aggregate breakdown of the time taken by each stage of 
+        the batch is recorded in a worksheet called 'Timing summary'.
+        
+        Input Parameters
+        ----------------
+        objStageTimer - object instanciated from the StageTimer class.
+        """
+        try:
+            thisWS = self.wb.create_sheet("Stage timings")
+            thisWS.append(objStageTimer.getColumnNames())
+            for row in objStageTimer.getRows():
+                thisWS.append(row)
+
+            thisWS = self.wb.create_sheet("Timing summary")
+            thisWS.append(["Stage", "Wall time (s)", "CPU time (s)", 
+                           "Mean wall time per file (s)", "% of batch wall time"])
+            for row in objStageTimer.getSummary():
+                thisWS.append(list(row))
+                    
+            logger.info('In module ' + __name__ 
+                    + '.recordStageTimings.')
+        except Exception as e:
+            print('ExcelWriter.recordStageTimings: ' + str(e)) 
+            logger.error('ExcelWriter.recordStageTimings: ' + str(e)) 
+
+
     def saveSpreadSheet(self): 
         """ Saves the workbook as an Excel spreadsheet at fullFilePath"""
         try:
-            self.wb.save(self.fullFilePath)
+            with Tracing.Span('saveSpreadSheet', 'write', file=self.fullFilePath):
+                self.wb.save(self.fullFilePath)
             logger.info('In module ' + __name__ 
                     + '. saveSpreadSheet.')
         except Exception as e:
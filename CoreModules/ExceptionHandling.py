@@ -15,7 +15,13 @@ def modelFunctionInfoLogger():
     of every model function.  It logs the module name.function name
     combination and the input parameters and their values passed
     into this function.
+
+    As model functions are called many times during curve fitting, 
+    this is logged at the DEBUG level and the call stack is only 
+    inspected when that level is enabled.
     """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     try: 
         #  the call stack to get the name, host module
         # and input arguments of the function
@@ -30,8 +36,8 @@ def modelFunctionInfoLogger():
             # their values.
             if i != "xData2DArray":
                 argStr += " %s = %s" % (i, values[i])
-        logger.info('Function ' + modName + '.' + funcName +
-            ' called with input parameters: ' + argStr)
+        logger.debug('Function %s.%s called with input parameters: %s',
+                     modName, funcName, argStr)
     except Exception as e:
         print('Error - ' + modName + '.modelFunctionInfoLogger ' + str(e))
         logger.error('Error -'  + modName + '.modelFunctionInfoLogger ' + str(e))
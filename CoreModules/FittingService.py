@@ -0,0 +1,650 @@
+"""
+This class module provides a small HTTP service, running on this
+computer only, that curve fits the models of FERRET to time-MR signal
+data sent by other tools, such as scripts and notebooks, without
+launching the GUI.
+
+The XML configuration file is parsed, and the model functions imported,
+once when the service starts, rather than for every fit.  Requests
+arriving at the same time are grouped into batches, which are fitted
+by a pool of worker processes, one batch of requests for each worker,
+or by the service itself when there is one worker.
+
+Endpoints:
+    POST /fit - Curve fits the data in the body of the request, either
+        a JSON object, a JSON list of objects or, with the content type
+        application/x-npz, a NumPy .npz file. Each holds
+            model - Short name of the model.
+            time - Times in seconds, as in the CSV data files.
+            roi, aif - MR signals of the ROI and AIF.
+            vif - MR signals of the VIF, required by dual inlet models.
+            initialValues - Optional list of initial parameter values,
+                or dictionary of parameter short name:value pairs, in
+                the units displayed on the GUI.
+            fixedParameters - Optional list of booleans, or list of the
+                short names of the parameters, fixed during curve fitting.
+            normalise - Optional, by default true. If true, the MR signals
+                are normalised by the mean of their baseline scans.
+        The response holds, for each fit, the optimum parameter values
+        and their 95% confidence limits, the covariance of the parameters
+        allowed to vary, the time in minutes, the ROI and model curves
+        and the fit statistics.  With an Accept header of
+        application/x-npz, the response to a single fit is a .npz file.
+    GET /health - Status of the service and the names of its models.
+    GET /metrics - Counts of requests and fits, batch sizes and latency.
+
+The service listens on the loopback interface only.  It may be run
+from the command line:
+
+    python CoreModules/FittingService.py --config <XML file> --port 8765
+"""
+import argparse
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import importlib
+import io
+import ipaddress
+import json
+import multiprocessing
+import queue
+import threading
+import time
+import logging
+import numpy as np
+
+import BatchProcessor as BatchProcessorModule
+from BatchProcessor import BatchProcessor
+import ResourceManager as ResourceManagerModule
+from ResourceManager import ResourceManager
+import Tracing
+import LoggingConfig
+from XMLReader import XMLReader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Maximum number of requests fitted in a batch
+DEFAULT_MAX_BATCH_SIZE = 32
+# Time in seconds to wait for more requests before fitting a batch
+DEFAULT_BATCH_WINDOW = 0.005
+# Maximum time in seconds a request waits for its fit
+DEFAULT_REQUEST_TIMEOUT = 300.0
+# Maximum size in bytes of the body of a request
+MAX_REQUEST_SIZE = 64*1024*1024
+# Number of recent requests whose latency is reported by /metrics
+NUM_LATENCY_SAMPLES = 1000
+JSON_CONTENT_TYPE = 'application/json'
+NPZ_CONTENT_TYPE = 'application/x-npz'
+
+# The model registry of a worker process of the service
+_workerModelRegistry = None
+
+
+class FitRequestError(Exception):
+    """Raised when the payload of a fit request is not valid."""
+
+
+def CreateModelRegistry(objXMLReader):
+    """Returns a dictionary of model short name:BatchProcessor pairs,
+    one for each model in the XML configuration file read by objXMLReader,
+    and imports the module of each model function. The columns of the
+    BatchProcessor objects are named roi, aif and vif."""
+    modelRegistry = {}
+    for modelName in objXMLReader.getListModelShortNames()[1:]:
+        objBatchProcessor = BatchProcessor(objXMLReader, modelName, 'roi', 'aif', 'vif')
+        importlib.import_module(objBatchProcessor.moduleName)
+        modelRegistry[modelName] = objBatchProcessor
+    return modelRegistry
+
+
+def ParseFitRequest(payload, modelRegistry):
+    """Validates the payload of a fit request, a dictionary, and converts
+    it into the arguments of BatchProcessor.fitSignalData.
+
+    Returns
+    -------
+    The model short name, the signalData dictionary, the list of initial
+    values or None and the list of fixed parameters or None.
+    """
+    modelName = str(payload.get('model', ''))
+    if modelName not in modelRegistry:
+        raise FitRequestError('Unknown model ' + repr(modelName))
+    objBatchProcessor = modelRegistry[modelName]
+
+    requiredColumns = ['time', 'roi', 'aif']
+    if objBatchProcessor.inletType == 'dual':
+        requiredColumns.append('vif')
+    signalData = {}
+    for column in requiredColumns:
+        if payload.get(column) is None:
+            raise FitRequestError(column + ' data missing')
+        signalData[column] = np.asarray(payload[column], dtype=np.float64).ravel()
+    numTimePoints = len(signalData['time'])
+    if numTimePoints < 2 or any(len(values) != numTimePoints
+                                for values in signalData.values()):
+        raise FitRequestError(', '.join(requiredColumns[:-1]) + ' and ' +
+                              requiredColumns[-1] + ' must have the same length')
+    # Times in seconds, as in the data files, but fitted in minutes
+    signalData['time'] = signalData['time']/60.0
+    if payload.get('normalise', True):
+        BatchProcessorModule.NormaliseSignalData(signalData,
+                                                 objBatchProcessor.numBaselineScans)
+
+    parameterNames = objBatchProcessor.parameterNames
+    initialValues = payload.get('initialValues')
+    if isinstance(initialValues, dict):
+        unknownNames = set(initialValues) - set(parameterNames)
+        if unknownNames:
+            raise FitRequestError('Unknown parameters ' + ', '.join(sorted(unknownNames)))
+        initialValues = [float(initialValues.get(name, defaultValue))
+                         for name, defaultValue in zip(parameterNames,
+                                                       objBatchProcessor.defaultValues)]
+    elif initialValues is not None:
+        initialValues = [float(value) for value in np.ravel(initialValues)]
+        if len(initialValues) != len(parameterNames):
+            raise FitRequestError('{} initial values expected'.format(len(parameterNames)))
+
+    fixedParameters = payload.get('fixedParameters')
+    if fixedParameters is not None:
+        fixedParameters = list(np.ravel(fixedParameters))
+        if all(isinstance(value, str) for value in fixedParameters):
+            fixedParameters = [name in fixedParameters for name in parameterNames]
+        else:
+            fixedParameters = [bool(value) for value in fixedParameters]
+        if len(fixedParameters) != len(parameterNames):
+            raise FitRequestError('{} fixed parameters expected'.format(len(parameterNames)))
+    return modelName, signalData, initialValues, fixedParameters
+
+
+def FitRequests(modelRegistry, fitRequests):
+    """Curve fits a batch of fit requests, a list of the tuples returned
+    by ParseFitRequest, using the models of modelRegistry.
+
+    Returns
+    -------
+    A list of (result, error message) tuples, in the order of fitRequests,
+    where result is the response to the request as a dictionary.
+    """
+    responses = []
+    for modelName, signalData, initialValues, fixedParameters in fitRequests:
+        objBatchProcessor = modelRegistry[modelName]
+        try:
+            result = objBatchProcessor.fitSignalData(signalData, initialValues,
+                                                     fixedParameters)
+            responses.append((BuildFitResponse(objBatchProcessor, signalData,
+                                               result, fixedParameters), None))
+        except Exception as e:
+            logger.error('FittingService.FitRequests when model = ' + modelName +
+                         ': ' + str(e))
+            responses.append((None, 'Curve fitting failed: ' + str(e)))
+    return responses
+
+
+def BuildFitResponse(objBatchProcessor, signalData, result, fixedParameters):
+    """Returns the response to a fit request as a dictionary."""
+    parameterNames = objBatchProcessor.parameterNames
+    if fixedParameters is None:
+        fixedParameters = [False]*len(parameterNames)
+    parameters = {name: {'value': value, 'lower': lower, 'upper': upper}
+                  for name, (value, lower, upper) in result['parameters'].items()}
+    return {'model': objBatchProcessor.modelName,
+            'parameters': parameters,
+            'bestValues': {name: parameter['value']
+                           for name, parameter in parameters.items()},
+            'covarianceParameters': [name for name, isFixed
+                                     in zip(parameterNames, fixedParameters)
+                                     if not isFixed],
+            'covariance': result['covariance'],
+            'curves': {'time': signalData['time'],
+                       'roi': signalData['roi'],
+                       'model': result['modelCurve']},
+            'fitStatistics': result['fitStatistics']}
+
+
+def _InitialiseServiceWorker(configFileName, numBLASThreads, workerTracing):
+    """Runs once in each worker process of the service to limit
+    its BLAS threads, record its spans in the trace if tracing is
+    enabled and create its model registry."""
+    global _workerModelRegistry
+    ResourceManagerModule.InitialiseWorkerProcess(numBLASThreads, workerTracing)
+    objXMLReader = XMLReader()
+    objXMLReader.parseConfigFile(configFileName)
+    _workerModelRegistry = CreateModelRegistry(objXMLReader)
+
+
+def _FitRequestsInWorker(fitRequests):
+    """Curve fits a batch of fit requests in a worker process."""
+    return FitRequests(_workerModelRegistry, fitRequests)
+
+
+def _StartServiceWorker():
+    """Does nothing. Submitted to each worker process when the
+    service starts, so that the first requests do not wait for the
+    worker processes to start and import the model functions."""
+    return None
+
+
+def _toJSONValue(value):
+    """Converts value, which may hold NumPy arrays, into a value that
+    can be saved in a JSON document. NaN and infinity become null."""
+    if isinstance(value, dict):
+        return {str(key): _toJSONValue(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_toJSONValue(item) for item in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def _toNPZ(response):
+    """Converts the response to a single fit into the bytes of a .npz
+    file holding its curves, best values and covariance as arrays and
+    the whole response as a JSON string under the name 'response'."""
+    buffer = io.BytesIO()
+    arrays = {name: np.asarray(values, dtype=np.float64)
+              for name, values in response['curves'].items() if values is not None}
+    arrays['bestValues'] = np.array(list(response['bestValues'].values()),
+                                    dtype=np.float64)
+    if response['covariance'] is not None:
+        arrays['covariance'] = np.asarray(response['covariance'], dtype=np.float64)
+    np.savez(buffer, response=np.array(json.dumps(_toJSONValue(response))), **arrays)
+    return buffer.getvalue()
+
+
+def _readNPZPayload(body):
+    """Returns the payload of a fit request sent as a .npz file."""
+    payload = {}
+    with np.load(io.BytesIO(body), allow_pickle=False) as npzFile:
+        for name in npzFile.files:
+            array = npzFile[name]
+            payload[name] = array.item() if array.ndim == 0 else array
+    return payload
+
+
+class _FitRequestHandler(BaseHTTPRequestHandler):
+    """Handles the HTTP requests of the FittingService whose
+    object is the objFittingService attribute of the server."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug('FittingService - ' + format, *args)
+
+
+    def _sendResponse(self, statusCode, body, contentType=JSON_CONTENT_TYPE):
+        if contentType == JSON_CONTENT_TYPE:
+            body = json.dumps(_toJSONValue(body)).encode('utf-8')
+        self.send_response(statusCode)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def do_GET(self):
+        objFittingService = self.server.objFittingService
+        if self.path == '/health':
+            self._sendResponse(200, objFittingService.getHealth())
+        elif self.path == '/metrics':
+            self._sendResponse(200, objFittingService.getMetrics())
+        else:
+            self._sendResponse(404, {'error': 'Unknown endpoint ' + self.path})
+
+
+    def do_POST(self):
+        objFittingService = self.server.objFittingService
+        if self.path != '/fit':
+            self._sendResponse(404, {'error': 'Unknown endpoint ' + self.path})
+            return
+        try:
+            contentLength = int(self.headers.get('Content-Length', 0))
+            if contentLength > MAX_REQUEST_SIZE:
+                raise FitRequestError('Request larger than {} bytes'
+                                      .format(MAX_REQUEST_SIZE))
+            body = self.rfile.read(contentLength)
+            if NPZ_CONTENT_TYPE in self.headers.get('Content-Type', ''):
+                payload = _readNPZPayload(body)
+            else:
+                payload = json.loads(body)
+        except Exception as e:
+            self._sendResponse(400, {'error': 'Invalid request: ' + str(e)})
+            return
+
+        isBatch = isinstance(payload, list)
+        responses = objFittingService.fit(payload if isBatch else [payload])
+        if isBatch:
+            self._sendResponse(200, responses)
+            return
+        response = responses[0]
+        if 'error' in response:
+            self._sendResponse(response.pop('statusCode', 500), response)
+        elif NPZ_CONTENT_TYPE in self.headers.get('Accept', ''):
+            self._sendResponse(200, _toNPZ(response), NPZ_CONTENT_TYPE)
+        else:
+            self._sendResponse(200, response)
+
+
+class FittingService:
+    def __init__(self, configFile, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 numberOfWorkers=None, maxBatchSize=DEFAULT_MAX_BATCH_SIZE,
+                 batchWindow=DEFAULT_BATCH_WINDOW, cpuBudget=None):
+        """Creates an instance of the FittingService class, parsing the
+        XML configuration file and creating the model registry.
+
+        Input Parameters
+        ----------------
+        configFile - Path to the XML configuration file.
+        host - Loopback address on which the service listens.
+        port - Port on which the service listens; 0 picks a free port.
+        numberOfWorkers - Number of worker processes fitting batches of
+            requests, by default set by the ResourceManager class from
+            the CPU budget. If 1, the requests are fitted by the service.
+        maxBatchSize - Maximum number of requests fitted in a batch.
+        batchWindow - Time in seconds the service waits for more
+            requests before fitting a batch.
+        cpuBudget - Optional number of cores, see ResourceManager.GetCPUBudget.
+        """
+        if host != 'localhost' and not ipaddress.ip_address(host).is_loopback:
+            raise ValueError('The fitting service only listens on the loopback ' +
+                             'interface, not ' + host)
+        self.configFileName = configFile
+        self.objXMLReader = XMLReader()
+        self.objXMLReader.parseConfigFile(configFile)
+        self.modelRegistry = CreateModelRegistry(self.objXMLReader)
+        self.host = host
+        self.port = port
+        self.maxBatchSize = max(1, maxBatchSize)
+        self.batchWindow = batchWindow
+        self.objResourceManager = ResourceManager(cpuBudget,
+                                                  numberOfFitWorkers=numberOfWorkers)
+        self.numberOfWorkers = self.objResourceManager.numberOfFitWorkers
+        self.executor = None
+        self.server = None
+        self.serverThread = None
+        self.dispatcherThread = None
+        self.requestQueue = queue.Queue()
+        self.isRunning = False
+        self.startTime = time.time()
+        self.metricsLock = threading.Lock()
+        self.metrics = {'requests': 0, 'fits': 0, 'failedFits': 0,
+                        'invalidRequests': 0, 'batches': 0, 'maxBatchSize': 0}
+        self.latencies = deque(maxlen=NUM_LATENCY_SAMPLES)
+        logger.info('In module ' + __name__ + '. Created an instance of class ' +
+                    'FittingService with {} models.'.format(len(self.modelRegistry)))
+
+
+    def start(self):
+        """Starts the worker processes, the thread grouping requests
+        into batches and the HTTP server, in a background thread.
+
+        Returns
+        -------
+        The URL of the service.
+        """
+        if self.numberOfWorkers > 1:
+            _, (numBLASThreads, workerTracing) = \
+                self.objResourceManager.getFitWorkerInitialiser()
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.numberOfWorkers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_InitialiseServiceWorker,
+                initargs=(self.objXMLReader.fullFilePath, numBLASThreads,
+                          workerTracing))
+            for future in [self.executor.submit(_StartServiceWorker)
+                           for _ in range(self.numberOfWorkers)]:
+                future.result()
+        self.isRunning = True
+        self.dispatcherThread = threading.Thread(target=self._dispatchRequests,
+                                                 name='FittingServiceDispatcher',
+                                                 daemon=True)
+        self.dispatcherThread.start()
+        self.server = ThreadingHTTPServer((self.host, self.port), _FitRequestHandler)
+        self.server.daemon_threads = True
+        self.server.objFittingService = self
+        self.port = self.server.server_address[1]
+        self.serverThread = threading.Thread(target=self.server.serve_forever,
+                                             name='FittingServiceServer', daemon=True)
+        self.serverThread.start()
+        url = 'http://{}:{}'.format(self.host, self.port)
+        logger.info('FittingService - listening on ' + url +
+                    ' with {} workers'.format(self.numberOfWorkers))
+        return url
+
+
+    def shutdown(self):
+        """Stops the HTTP server, the dispatcher thread and the
+        worker processes."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.isRunning = False
+        if self.dispatcherThread is not None:
+            self.requestQueue.put(None)
+            self.dispatcherThread.join()
+            self.dispatcherThread = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+    def fit(self, payloads):
+        """Curve fits the fit requests in the list, payloads, together
+        with any other requests received at the same time, and waits
+        for their results.
+
+        Returns
+        -------
+        A list of dictionaries, in the order of payloads, holding either
+        the response to each request or its error message under the key
+        'error' and the HTTP status code under the key 'statusCode'.
+        """
+        startTime = time.perf_counter()
+        futures = []
+        for payload in payloads:
+            future = Future()
+            try:
+                if not self.isRunning:
+                    future.set_result((None, 'The fitting service is stopped', 503))
+                    futures.append(future)
+                    continue
+                if not isinstance(payload, dict):
+                    raise FitRequestError('A fit request must be a JSON object')
+                self.requestQueue.put((ParseFitRequest(payload, self.modelRegistry),
+                                       future))
+            except Exception as e:
+                future.set_result((None, str(e), 400))
+            futures.append(future)
+
+        responses = []
+        for future in futures:
+            try:
+                result, errorMessage, *statusCode = future.result(DEFAULT_REQUEST_TIMEOUT)
+            except Exception as e:
+                result, errorMessage, statusCode = None, 'Request failed: ' + str(e), [500]
+            if result is not None:
+                responses.append(result)
+            else:
+                responses.append({'error': errorMessage,
+                                  'statusCode': statusCode[0] if statusCode else 500})
+
+        with self.metricsLock:
+            self.metrics['requests'] += len(payloads)
+            self.metrics['invalidRequests'] += sum(
+                1 for response in responses if response.get('statusCode') == 400)
+            self.latencies.append(time.perf_counter() - startTime)
+        return responses
+
+
+    def _getNextBatch(self):
+        """Waits for a fit request and returns it together with the
+        requests received within batchWindow seconds of it, up to
+        maxBatchSize requests. Returns None when the service stops."""
+        firstRequest = self.requestQueue.get()
+        if firstRequest is None:
+            return None
+        batch = [firstRequest]
+        deadline = time.perf_counter() + self.batchWindow
+        while len(batch) < self.maxBatchSize:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self.requestQueue.get(timeout=max(0.0, timeout)) \
+                    if timeout > 0 else self.requestQueue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Let the loop see the stop request after this batch
+                self.requestQueue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+
+    def _dispatchRequests(self):
+        """Runs in the dispatcher thread; fits the requests in batches,
+        in the worker processes, one share of the batch each, or in
+        this thread if there is no pool of worker processes.  Once the
+        service has stopped, the requests still queued fail at once."""
+        while True:
+            batch = self._getNextBatch()
+            if batch is None:
+                break
+            if not self.isRunning:
+                self._completeRequests(batch, [(None, 'The fitting service is stopped')]
+                                       *len(batch))
+                continue
+            with self.metricsLock:
+                self.metrics['batches'] += 1
+                self.metrics['maxBatchSize'] = max(self.metrics['maxBatchSize'], len(batch))
+            with Tracing.Span('FitBatch', 'service', batchSize=len(batch)):
+                if self.executor is None:
+                    self._completeRequests(batch, FitRequests(
+                        self.modelRegistry, [fitRequest for fitRequest, _ in batch]))
+                else:
+                    numberOfShares = min(self.numberOfWorkers, len(batch))
+                    for share in range(numberOfShares):
+                        requests = batch[share::numberOfShares]
+                        try:
+                            self.executor.submit(_FitRequestsInWorker,
+                                                 [fitRequest for fitRequest, _ in requests])\
+                                .add_done_callback(lambda future, requests=requests:
+                                                   self._completeFuture(requests, future))
+                        except Exception as e:
+                            print('Error in function FittingService._dispatchRequests: ' +
+                                  str(e))
+                            logger.error('Error in function FittingService._dispatchRequests: ' +
+                                         str(e))
+                            self._stopOnBrokenPool()
+                            self._completeRequests(requests, [(None, 'Curve fitting failed: ' +
+                                                               str(e))]*len(requests))
+
+
+    def _completeFuture(self, requests, future):
+        """Completes the requests fitted by a worker process."""
+        exception = future.exception()
+        if exception is not None:
+            logger.error('FittingService - worker process failed: ' + str(exception))
+            if isinstance(exception, BrokenProcessPool):
+                self._stopOnBrokenPool()
+            self._completeRequests(requests, [(None, 'Curve fitting failed: ' +
+                                               str(exception))]*len(requests))
+        else:
+            self._completeRequests(requests, future.result())
+
+
+    def _stopOnBrokenPool(self):
+        """Marks the service as stopped when its pool of worker processes
+        can no longer fit requests, so that /health reports it and new
+        requests fail at once instead of waiting for their timeout."""
+        if self.isRunning:
+            logger.error('FittingService - the pool of worker processes is broken; ' +
+                         'the service has stopped fitting requests')
+        self.isRunning = False
+
+
+    def _completeRequests(self, requests, responses):
+        """Sets the results of the futures of requests to responses."""
+        with self.metricsLock:
+            self.metrics['fits'] += len(responses)
+            self.metrics['failedFits'] += sum(1 for result, _ in responses
+                                              if result is None)
+        for (_, future), (result, errorMessage) in zip(requests, responses):
+            future.set_result((result, errorMessage))
+
+
+    def getHealth(self):
+        """Returns the status of the service as a dictionary."""
+        return {'status': 'ok' if self.isRunning else 'stopped',
+                'configFile': self.configFileName,
+                'models': list(self.modelRegistry),
+                'numberOfWorkers': self.numberOfWorkers,
+                'uptime': time.time() - self.startTime}
+
+
+    def getMetrics(self):
+        """Returns the counts of requests and fits, the batch sizes and
+        the latency of recent requests, in seconds, as a dictionary."""
+        with self.metricsLock:
+            metrics = dict(self.metrics)
+            latencies = np.array(self.latencies)
+        metrics['meanBatchSize'] = metrics['fits']/metrics['batches'] \
+            if metrics['batches'] else 0.0
+        metrics['queueLength'] = self.requestQueue.qsize()
+        metrics['numberOfWorkers'] = self.numberOfWorkers
+        metrics['uptime'] = time.time() - self.startTime
+        if len(latencies):
+            metrics['latency'] = {'mean': float(np.mean(latencies)),
+                                  'p50': float(np.percentile(latencies, 50)),
+                                  'p95': float(np.percentile(latencies, 95)),
+                                  'max': float(np.max(latencies))}
+        return metrics
+
+
+if __name__ == '__main__':
+    # Required by the worker processes of an application frozen by PyInstaller
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(
+        description='Runs a local HTTP service that curve fits FERRET models.')
+    parser.add_argument('--config', required=True, help='XML configuration file.')
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help='Loopback address on which the service listens.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help='Port on which the service listens.')
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes. ' +
+                        'By default, set from the CPU budget.')
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help='Maximum number of requests fitted in a batch.')
+    parser.add_argument('--batch-window', type=float, default=DEFAULT_BATCH_WINDOW,
+                        help='Time in seconds to wait for more requests ' +
+                        'before fitting a batch.')
+    parser.add_argument('--cpu-budget', type=int,
+                        help='Number of cores used. By default, the value of ' +
+                        ResourceManagerModule.CPU_BUDGET_ENVIRONMENT_VARIABLE +
+                        ' or all the available cores.')
+    parser.add_argument('--trace', help='File path and name of a Chrome trace JSON file.')
+    LoggingConfig.AddLoggingArguments(parser)
+    arguments = parser.parse_args()
+    # The service has no results, its log file is saved in the user log folder
+    LoggingConfig.ConfigureLoggingFromArguments(arguments, 'FittingService.log')
+    Tracing.ConfigureTracing(arguments.trace)
+
+    objFittingService = FittingService(arguments.config, arguments.host, arguments.port,
+                                       arguments.workers, arguments.max_batch_size,
+                                       arguments.batch_window, arguments.cpu_budget)
+    print('FERRET fitting service listening on ' + objFittingService.start() +
+          ', press Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    objFittingService.shutdown()
@@ -0,0 +1,240 @@
+"""
+This class module provides the functionality for watching a folder
+of time-MR signal data files, so that new scans exported to the folder
+during the day are fitted as soon as they appear, see the watchFolder
+method of the BatchProcessor class.
+
+On Linux, the folder is watched with inotify, so that the watcher
+sleeps until a file in the folder is written, moved in or deleted.
+On other platforms, or if inotify is not available, the folder is
+polled every pollInterval seconds.  In both cases, the files that
+need fitting are found by comparing the size and modification time
+of each data file with those recorded when it was last fitted, so no
+change is missed if an inotify event is lost.
+
+A data file is only reported once its size and modification time
+have not changed for settleTime seconds, so that a file still being
+copied from the scanner is not read before it is complete.
+
+The size and modification time of the fitted data files are saved
+in a small JSON state file, so that data files fitted before the
+watcher was restarted are not fitted again.
+
+Usage:
+    objFolderWatcher = FolderWatcher(folder, stateFileName)
+    while True:
+        for fullFilePath in objFolderWatcher.getChangedFiles():
+            ...
+        objFolderWatcher.markProcessed(fullFilePaths)
+        objFolderWatcher.waitForChanges()
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import sys
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_SETTLE_TIME = 1.0
+STATE_FILE_SUFFIX = '_watch.json'
+
+# inotify events that signal that a file in the folder may have changed
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+INOTIFY_EVENT_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def _CreateInotifyWatch(folder):
+    """Returns the file descriptor of an inotify instance watching
+    folder, or None if inotify is not available on this platform."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        fileDescriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fileDescriptor < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(fileDescriptor, os.fsencode(folder),
+                                  INOTIFY_EVENT_MASK) < 0:
+            errorNumber = ctypes.get_errno()
+            os.close(fileDescriptor)
+            raise OSError(errorNumber, 'inotify_add_watch failed')
+        return fileDescriptor
+    except (OSError, AttributeError) as e:
+        logger.info('FolderWatcher - inotify not available, polling instead: ' + str(e))
+        return None
+
+
+class FolderWatcher:
+    def __init__(self, folder, stateFileName=None, extension='.csv',
+                 pollInterval=DEFAULT_POLL_INTERVAL,
+                 settleTime=DEFAULT_SETTLE_TIME, excludedFiles=None,
+                 usePolling=False):
+        """Creates an instance of the FolderWatcher class that reports
+        the new and modified data files in folder.
+
+        Input Parameters
+        ----------------
+        folder - Folder containing the data files.
+        stateFileName - Optional file path and name of the JSON file in
+            which the size and modification time of the fitted data files
+            are saved between sessions.
+        extension - Extension of the data files, case insensitive.
+        pollInterval - Maximum time in seconds between two scans of the folder.
+        settleTime - Time in seconds for which the size and modification
+            time of a data file must not change before it is reported.
+        excludedFiles - Optional list of the full file paths of files in
+            folder that are not data files, such as the results table.
+        usePolling - If True, the folder is polled even if inotify is available.
+        """
+        self.folder = folder
+        self.stateFileName = stateFileName
+        self.extension = extension.lower()
+        self.pollInterval = pollInterval
+        self.settleTime = settleTime
+        self.excludedFiles = {os.path.abspath(fileName)
+                              for fileName in (excludedFiles or [])}
+        # File name:[size, modification time in ns] of the fitted data files
+        self.processedFiles = self._loadState()
+        # Signatures of the data files found by the last scan
+        self.scannedFiles = {}
+        # True if the last scan found data files still being written
+        self.hasUnsettledFiles = False
+        self.inotifyFileDescriptor = None if usePolling else _CreateInotifyWatch(folder)
+        logger.info('In module ' + __name__ + '. Created an instance of class ' +
+                    'FolderWatcher watching ' + folder + ' using ' +
+                    ('inotify.' if self.inotifyFileDescriptor is not None else 'polling.'))
+
+
+    def _loadState(self):
+        """Returns the dictionary of the fitted data files saved in the
+        state file, or an empty dictionary if there is none."""
+        if not self.stateFileName or not os.path.exists(self.stateFileName):
+            return {}
+        try:
+            with open(self.stateFileName) as jsonFile:
+                return json.load(jsonFile)
+        except Exception as e:
+            print('FolderWatcher._loadState: ' + str(e))
+            logger.error('FolderWatcher._loadState: ' + str(e))
+            return {}
+
+
+    def _saveState(self):
+        """Saves the dictionary of the fitted data files in the state file."""
+        if not self.stateFileName:
+            return
+        try:
+            temporaryFileName = self.stateFileName + '.tmp'
+            with open(temporaryFileName, 'w') as jsonFile:
+                json.dump(self.processedFiles, jsonFile)
+            os.replace(temporaryFileName, self.stateFileName)
+        except Exception as e:
+            print('FolderWatcher._saveState: ' + str(e))
+            logger.error('FolderWatcher._saveState: ' + str(e))
+
+
+    def _scanFolder(self):
+        """Returns a dictionary of file name:[size, modification time
+        in ns] pairs of the data files in the folder."""
+        signatures = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(self.extension) or \
+                    os.path.abspath(entry.path) in self.excludedFiles:
+                    continue
+                try:
+                    if entry.is_file():
+                        fileStatus = entry.stat()
+                        signatures[entry.name] = [fileStatus.st_size,
+                                                  fileStatus.st_mtime_ns]
+                except OSError:
+                    # The file was deleted during the scan
+                    continue
+        return signatures
+
+
+    def getChangedFiles(self):
+        """Returns the sorted list of the full file paths of the data
+        files that are new, or have been modified, since they were last
+        fitted and have not changed for settleTime seconds."""
+        changedFiles = []
+        latestModificationTime = time.time_ns() - int(self.settleTime*1e9)
+        self.scannedFiles = self._scanFolder()
+        self.hasUnsettledFiles = False
+        for fileName, signature in sorted(self.scannedFiles.items()):
+            if self.processedFiles.get(fileName) == signature:
+                continue
+            if signature[1] > latestModificationTime:
+                # Still being written, reported by a later scan
+                self.hasUnsettledFiles = True
+                continue
+            changedFiles.append(os.path.join(self.folder, fileName))
+        return changedFiles
+
+
+    def markProcessed(self, fullFilePaths):
+        """Records that the data files in fullFilePaths, returned by
+        getChangedFiles, have been fitted, so they are not reported
+        again unless they change. The size and modification time found
+        by the scan are recorded, so that a data file modified while it
+        was being fitted is reported again."""
+        for fullFilePath in fullFilePaths:
+            fileName = os.path.basename(fullFilePath)
+            signature = self.scannedFiles.get(fileName)
+            if signature is not None:
+                self.processedFiles[fileName] = signature
+        self._saveState()
+
+
+    def waitForChanges(self, stopEvent=None):
+        """Waits until a file in the folder changes, or for at most
+        pollInterval seconds, or settleTime seconds if the last scan
+        found data files still being written. Returns early if
+        stopEvent, a threading.Event, is set."""
+        waitTime = self.pollInterval
+        if self.hasUnsettledFiles:
+            waitTime = min(waitTime, self.settleTime)
+        if self.inotifyFileDescriptor is None:
+            if stopEvent is not None:
+                stopEvent.wait(waitTime)
+            else:
+                time.sleep(waitTime)
+            return
+
+        timeout = waitTime
+        # Wake up regularly to check stopEvent
+        if stopEvent is not None:
+            timeout = min(timeout, 0.5)
+        deadline = time.perf_counter() + waitTime
+        while True:
+            readable, _, _ = select.select([self.inotifyFileDescriptor], [], [], timeout)
+            if readable:
+                # Drain the events, the folder is scanned anyway
+                try:
+                    while os.read(self.inotifyFileDescriptor, 65536):
+                        pass
+                except BlockingIOError:
+                    pass
+                # Let the writer of the file finish before scanning
+                time.sleep(min(self.settleTime, waitTime))
+                return
+            if (stopEvent is not None and stopEvent.is_set()) or \
+                time.perf_counter() >= deadline:
+                return
+
+
+    def close(self):
+        """Stops watching the folder."""
+        if self.inotifyFileDescriptor is not None:
+            os.close(self.inotifyFileDescriptor)
+            self.inotifyFileDescriptor = None
@@ -0,0 +1,202 @@
+"""
+This module configures logging for FERRET and its command line tools.
+
+Log records are passed by a QueueHandler to a queue, from which a
+QueueListener, running in its own thread, writes them to a size-based
+rotating log file.  So, the thread doing the curve fitting never waits
+for the log file to be written.
+
+The level of the root logger and of individual modules can be set,
+in increasing order of precedence, by
+    - the optional configuration file FERRET_Logging.ini; e.g.,
+        [logging]
+        level = INFO
+        file = TRISTAN.log
+        max_bytes = 10485760
+        backup_count = 5
+        [levels]
+        ModelFunctions = WARNING
+        MathsTools = ERROR
+    - the environment variables FERRET_LOG_LEVEL and FERRET_LOG_LEVELS,
+      the latter holding module=level pairs separated by commas; e.g.,
+      FERRET_LOG_LEVELS=ModelFunctions=WARNING,MathsTools=ERROR
+    - the --log-level, --log-module-level and --log-file options of
+      the command line tools, added by AddLoggingArguments.
+
+Unless the --log-file option is given, the command line tools save
+their log file alongside their results or, if they have none, in the
+user log folder, FERRET_LOG_FOLDER or by default DEFAULT_USER_LOG_FOLDER,
+rather than in the current directory.
+
+Messages in frequently called functions should be logged at the DEBUG
+level with %-style arguments, logger.debug('nfev = %s', nfev), so that
+no string is built when the level is disabled.
+"""
+import atexit
+import configparser
+import logging
+import logging.handlers
+import os
+import queue
+
+DEFAULT_LOG_FILE_NAME = 'TRISTAN.log'
+DEFAULT_LOG_LEVEL = 'INFO'
+DEFAULT_MAX_BYTES = 10*1024*1024
+DEFAULT_BACKUP_COUNT = 5
+LOG_FORMAT = "%(levelname)s %(asctime)s - %(name)s - %(message)s"
+CONFIG_FILE_NAME = 'FERRET_Logging.ini'
+LEVEL_ENVIRONMENT_VARIABLE = 'FERRET_LOG_LEVEL'
+MODULE_LEVELS_ENVIRONMENT_VARIABLE = 'FERRET_LOG_LEVELS'
+LOG_FOLDER_ENVIRONMENT_VARIABLE = 'FERRET_LOG_FOLDER'
+# Folder of the log files of the command line tools, see GetUserLogFolder
+DEFAULT_USER_LOG_FOLDER = os.path.join(os.path.expanduser('~'), '.ferret', 'logs')
+
+_queueListener = None
+
+
+def ParseModuleLevels(moduleLevelsString):
+    """Returns a dictionary of module name:level name pairs from
+    a string of module=level pairs separated by commas."""
+    moduleLevels = {}
+    for pair in (moduleLevelsString or '').split(','):
+        if '=' in pair:
+            moduleName, levelName = pair.split('=', 1)
+            moduleLevels[moduleName.strip()] = levelName.strip().upper()
+    return moduleLevels
+
+
+def ReadLoggingConfigFile(configFileName):
+    """Returns a dictionary of the logging settings in the
+    configuration file, configFileName, if it exists."""
+    settings = {}
+    if not configFileName or not os.path.exists(configFileName):
+        return settings
+    configParser = configparser.ConfigParser()
+    # Preserve the case of module names
+    configParser.optionxform = str
+    configParser.read(configFileName)
+    if configParser.has_section('logging'):
+        section = configParser['logging']
+        if 'level' in section:
+            settings['level'] = section['level'].strip().upper()
+        if 'file' in section:
+            settings['logFileName'] = section['file'].strip()
+        if 'max_bytes' in section:
+            settings['maxBytes'] = section.getint('max_bytes')
+        if 'backup_count' in section:
+            settings['backupCount'] = section.getint('backup_count')
+    if configParser.has_section('levels'):
+        settings['moduleLevels'] = {moduleName: levelName.strip().upper()
+            for moduleName, levelName in configParser['levels'].items()}
+    return settings
+
+
+def ConfigureLogging(logFileName=None, level=None, moduleLevels=None,
+                     maxBytes=None, backupCount=None,
+                     configFileName=CONFIG_FILE_NAME, logFormat=LOG_FORMAT,
+                     newLogFile=True):
+    """Configures the root logger to write log records, through a queue
+    and a listener thread, to a size-based rotating log file.
+
+    Input Parameters
+    ----------------
+    logFileName - file path and name of the log file.
+    level - Name of the level of the root logger; e.g., 'INFO'.
+    moduleLevels - Dictionary of module name:level name pairs.
+    maxBytes - Size in bytes at which the log file is rotated.
+    backupCount - Number of rotated log files kept.
+    configFileName - Optional configuration file, see above.
+    logFormat - Format of the log records.
+    newLogFile - If True, any log file of a previous session is
+        overwritten, otherwise records are appended to it.
+
+    Settings that are not given are read from the environment variables,
+    then the configuration file, otherwise the defaults are used.
+
+    Returns
+    -------
+    The QueueListener writing the log file.
+    """
+    global _queueListener
+    settings = {'logFileName': DEFAULT_LOG_FILE_NAME, 'level': DEFAULT_LOG_LEVEL,
+                'maxBytes': DEFAULT_MAX_BYTES, 'backupCount': DEFAULT_BACKUP_COUNT,
+                'moduleLevels': {}}
+    settings.update(ReadLoggingConfigFile(configFileName))
+    if os.environ.get(LEVEL_ENVIRONMENT_VARIABLE):
+        settings['level'] = os.environ[LEVEL_ENVIRONMENT_VARIABLE].strip().upper()
+    settings['moduleLevels'].update(ParseModuleLevels(
+        os.environ.get(MODULE_LEVELS_ENVIRONMENT_VARIABLE)))
+    settings['moduleLevels'].update(moduleLevels or {})
+    for name, value in [('logFileName', logFileName), ('level', level),
+                        ('maxBytes', maxBytes), ('backupCount', backupCount)]:
+        if value is not None:
+            settings[name] = value
+
+    StopLogging()
+    fileHandler = logging.handlers.RotatingFileHandler(
+        settings['logFileName'], mode='w' if newLogFile else 'a',
+        maxBytes=settings['maxBytes'], backupCount=settings['backupCount'])
+    fileHandler.setFormatter(logging.Formatter(logFormat))
+
+    logQueue = queue.SimpleQueue()
+    rootLogger = logging.getLogger()
+    for handler in rootLogger.handlers[:]:
+        rootLogger.removeHandler(handler)
+    rootLogger.addHandler(logging.handlers.QueueHandler(logQueue))
+    rootLogger.setLevel(str(settings['level']).upper())
+    for moduleName, levelName in settings['moduleLevels'].items():
+        logging.getLogger(moduleName).setLevel(levelName)
+
+    _queueListener = logging.handlers.QueueListener(logQueue, fileHandler,
+                                                    respect_handler_level=True)
+    _queueListener.start()
+    atexit.register(StopLogging)
+    return _queueListener
+
+
+def StopLogging():
+    """Writes the log records remaining in the queue to the log
+    file and stops the listener thread."""
+    global _queueListener
+    if _queueListener is not None:
+        _queueListener.stop()
+        for handler in _queueListener.handlers:
+            handler.close()
+        _queueListener = None
+
+
+def AddLoggingArguments(parser):
+    """Adds the logging options to the argparse parser of a
+    command line tool."""
+    parser.add_argument('--log-file', help='File path and name of the log file.')
+    parser.add_argument('--log-level', help='Level of the root logger; e.g., WARNING.')
+    parser.add_argument('--log-module-level', action='append', default=[],
+                        metavar='MODULE=LEVEL',
+                        help='Level of the logger of a module; e.g., MathsTools=ERROR.')
+
+
+def GetUserLogFolder():
+    """Returns the folder in which the command line tools save their log
+    files, the value of the environment variable FERRET_LOG_FOLDER or
+    DEFAULT_USER_LOG_FOLDER, creating it if required."""
+    logFolder = os.environ.get(LOG_FOLDER_ENVIRONMENT_VARIABLE) or DEFAULT_USER_LOG_FOLDER
+    os.makedirs(logFolder, exist_ok=True)
+    return logFolder
+
+
+def ConfigureLoggingFromArguments(arguments, defaultLogFileName=None, logFolder=None):
+    """Configures logging using the options added by AddLoggingArguments.
+    Unless the --log-file option is given, the log file, named 
+    defaultLogFileName, is saved in logFolder, for example the folder 
+    of the results of the command line tool, or by default in the user
+    log folder, see GetUserLogFolder."""
+    logFileName = arguments.log_file
+    if logFileName is None and defaultLogFileName:
+        if logFolder:
+            os.makedirs(logFolder, exist_ok=True)
+        else:
+            logFolder = GetUserLogFolder()
+        logFileName = os.path.join(logFolder, defaultLogFileName)
+    return ConfigureLogging(logFileName,
+                            arguments.log_level,
+                            ParseModuleLevels(','.join(arguments.log_module_level)))
@@ -8,16 +8,22 @@ Created on Wed Mar 14 12:08:02 2018
 """
 
 # Import libraries
+from collections import OrderedDict
+import os
+import tempfile
+import threading
 import numpy as np
+from scipy.linalg import toeplitz
 import sys
 import logging
+import Tracing
 
 #Create logger
 logger = logging.getLogger(__name__)
 
 ####################### Signal model helper functions ##################################
 def spgr2d_func(x, *spgr_params):
-    logger.info(" Tools.spgr2d_func called")
+    logger.debug(" Tools.spgr2d_func called")
     try:
         r1, FA, TR, R10, S_baseline, S = spgr_params
         E0 = np.exp(-TR*R10/2)
@@ -47,8 +53,9 @@ def spgr2d_func(x, *spgr_params):
         logger.error('Tools.spgr2d_func has error: {} '.format(str(e)))
 
 
+@Tracing.Traced(category='MathsTools')
 def spgr2d_func_inv(r1, FA, TR, R10, conc):
-    logger.info("Tools.spgr2d_func_inv called")
+    logger.debug("Tools.spgr2d_func_inv called")
     try:
         c = np.cos(FA*np.pi/180)
         E0 = np.exp(-TR*R10/2)
@@ -82,8 +89,9 @@ def spgr3d_func(x, FA, TR, R10, S0, S):
         print('Tools.spgr3d_func has error: {} '.format(str(e)))
         logger.error('Tools.spgr3d_func has error: {} '.format(str(e)))
 
+@Tracing.Traced(category='MathsTools')
 def spgr3d_func_inv(r1, FA, TR, R10t, conc):
-    logger.info("Tools.spgr3d_func_inv called")
+    logger.debug("Tools.spgr3d_func_inv called")
     try:
         c = np.cos(FA*np.pi/180)
         E0 = np.exp(-TR*R10t)
@@ -98,6 +106,227 @@ def spgr3d_func_inv(r1, FA, TR, R10t, conc):
         print('Tools.spgr3d_func_inv has error: {} '.format(str(e)))
         logger.error('Tools.spgr3d_func_inv has error: {} '.format(str(e)))
 
+#####################################
+# Solve the SPGR signal models for all the time points at once.
+# They replace calls to fsolve, one per time point, dispatched with
+# joblib Parallel inside the model functions on every evaluation.
+
+# Number of bisection steps taken by spgr2d_func_solve, enough to 
+# reach the precision of a double in the interval (0, 1)
+SPGR2D_BISECTION_STEPS = 60
+
+@Tracing.Traced(category='MathsTools')
+def spgr3d_func_solve(FA, TR, R10, S0, S):
+    """Returns the array x of the roots of spgr3d_func(x, FA, TR, R10, S0, S) 
+    for an array of signals S, as fsolve would for each signal in turn.
+    The 3D SPGR signal model is inverted analytically."""
+    logger.debug("Tools.spgr3d_func_solve called")
+    try:
+        c = np.cos(FA*np.pi/180)
+        E0 = np.exp(-TR*R10)
+        ratio = np.asarray(S, dtype=np.float64)*(1-E0)/(S0*(1-c*E0))
+        # E1 must lie in (0, 1], so the signals are clipped to 
+        # the range of the model.
+        ratio = np.clip(ratio, 0.0, 1.0 - 1e-12)
+        E1 = (1-ratio)/(1-c*ratio)
+        return -np.log(E1)/TR
+    except Exception as e:
+        print('Tools.spgr3d_func_solve has error: {} '.format(str(e)))
+        logger.error('Tools.spgr3d_func_solve has error: {} '.format(str(e)))
+
+
+def _spgr2d_relative_signal(k0, c):
+    """Returns the 2D SPGR signal relative to S0 as a function of
+    k0 = exp(-TR*R1/4), where c is the cosine of the flip angle."""
+    E = k0*k0
+    return (1-k0)*(1 + (c**2)*k0*(1+k0)*(1+E*c)/(1-(c**3)*E*E))
+
+def _spgr2d_bisection(c, target):
+    """Returns k0 in (0, 1] such that the relative signal equals each
+    value of the array target, found by bisection for all at once."""
+    lower = np.zeros_like(target)
+    upper = np.ones_like(target)
+    for _ in range(SPGR2D_BISECTION_STEPS):
+        middle = 0.5*(lower + upper)
+        isAbove = _spgr2d_relative_signal(middle, c) > target
+        lower = np.where(isAbove, middle, lower)
+        upper = np.where(isAbove, upper, middle)
+    return np.clip(0.5*(lower + upper), 1e-300, 1.0)
+
+@Tracing.Traced(category='MathsTools')
+def spgr2d_func_solve(r1, FA, TR, R10, S_baseline, S, method=None):
+    """Returns the array x of the roots of 
+    spgr2d_func(x, r1, FA, TR, R10, S_baseline, S) for an array of 
+    signals S, as fsolve would for each signal in turn.
+    The signal is a decreasing function of k0 = exp(-TR*(R10 + r1*x)/4) 
+    in (0, 1), so k0 is found by bisection for all signals at once or,
+    if method is 'lut', by interpolation in the SPGR2DLookupTable of 
+    the flip angle. By default, method is SPGR2D_SOLVE_METHOD."""
+    logger.debug("Tools.spgr2d_func_solve called")
+    try:
+        c = np.cos(FA*np.pi/180)
+        E0 = np.exp(-TR*R10/2)
+        # Derive the actual S0 from the baseline signal
+        S0 = S_baseline/_spgr2d_relative_signal(np.sqrt(E0), c)
+        target = np.asarray(S, dtype=np.float64)/S0
+        if (method or SPGR2D_SOLVE_METHOD) == 'lut':
+            u = get_spgr2d_lookup_table(FA).solve(target)
+            return (4*u - TR*R10)/(TR*r1)
+        k0 = _spgr2d_bisection(c, target)
+        return -2*(2*np.log(k0) + TR*R10/2)/(TR*r1)
+    except Exception as e:
+        print('Tools.spgr2d_func_solve has error: {} '.format(str(e)))
+        logger.error('Tools.spgr2d_func_solve has error: {} '.format(str(e)))
+
+#####################################
+# Lookup table inversion of the 2D SPGR signal model, for very
+# large numbers of signals such as voxel-wise or cohort-scale
+# processing.
+#
+# The relative signal depends on the acquisition constants only
+# through the flip angle, as a function of u = TR*R1/4, so a table
+# of log(u) against the log of the relative signal is built once 
+# for each flip angle; TR, R10, r1 and the baseline signal are 
+# applied analytically.  The table is monotone, so signals are 
+# inverted by linear interpolation.  Its accuracy is checked, when
+# it is built, against the bisection solver at the midpoints between
+# its nodes, and its size is doubled until the relative error in u
+# is below SPGR2D_LUT_TOLERANCE.  Signals outside the range of the 
+# table are inverted by bisection.
+#
+# The tables are cached in memory and saved in the folder given by 
+# the environment variable FERRET_LUT_CACHE_FOLDER, by default
+# FERRET/lut in the user's cache folder, so later sessions and 
+# worker processes load them instead of building them.
+#
+# The environment variable FERRET_SPGR2D_SOLVER sets the default 
+# method of spgr2d_func_solve, used by the model functions, to 
+# 'bisection' or 'lut'.
+
+SPGR2D_SOLVE_METHOD = os.environ.get('FERRET_SPGR2D_SOLVER', 'bisection')
+SPGR2D_LUT_SIZE = 16384
+SPGR2D_LUT_MAX_SIZE = 1048576
+# Maximum relative error in u = TR*R1/4
+SPGR2D_LUT_TOLERANCE = 1e-6
+# Range of u covered by the tables
+SPGR2D_LUT_U_RANGE = (1e-7, 5.0)
+# Changed when the format or construction of the tables changes
+SPGR2D_LUT_VERSION = 1
+LUT_CACHE_ENVIRONMENT_VARIABLE = 'FERRET_LUT_CACHE_FOLDER'
+
+_spgr2d_lookup_tables = {}
+_spgr2d_lookup_tables_lock = threading.Lock()
+
+def get_lut_cache_folder():
+    """Returns the folder in which lookup tables are saved."""
+    folder = os.environ.get(LUT_CACHE_ENVIRONMENT_VARIABLE)
+    if not folder:
+        folder = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                              os.path.join(os.path.expanduser('~'), '.cache'),
+                              'FERRET', 'lut')
+    return folder
+
+class SPGR2DLookupTable:
+    """Table of log(u), u = TR*R1/4, against the log of the 2D SPGR 
+    signal relative to S0, for the flip angle FA in degrees."""
+    def __init__(self, FA, size=SPGR2D_LUT_SIZE):
+        self.FA = float(FA)
+        self.c = np.cos(self.FA*np.pi/180)
+        while True:
+            self.build(size)
+            if self.max_relative_error <= SPGR2D_LUT_TOLERANCE or \
+                size >= SPGR2D_LUT_MAX_SIZE:
+                break
+            size *= 2
+        if self.max_relative_error > SPGR2D_LUT_TOLERANCE:
+            logger.warning('Tools.SPGR2DLookupTable - relative error {:.2e} for FA={} '
+                           'exceeds the tolerance'.format(self.max_relative_error, FA))
+
+    def build(self, size):
+        log_u = np.linspace(np.log(SPGR2D_LUT_U_RANGE[0]),
+                            np.log(SPGR2D_LUT_U_RANGE[1]), size)
+        log_signal = np.log(_spgr2d_relative_signal(np.exp(-np.exp(log_u)), self.c))
+        # The signal saturates at large u, keep the monotone part
+        increasing = np.concatenate(([True], np.diff(log_signal) > 0))
+        end = np.argmin(increasing) if not np.all(increasing) else size
+        self.log_u = log_u[:end]
+        self.log_signal = log_signal[:end]
+        self.max_relative_error = self.check_error()
+
+    def check_error(self):
+        """Returns the maximum relative error in u at the midpoints
+        between the nodes, compared with the bisection solver."""
+        log_signal = np.log(_spgr2d_relative_signal(
+            np.exp(-np.exp(0.5*(self.log_u[1:] + self.log_u[:-1]))), self.c))
+        exact_u = -np.log(_spgr2d_bisection(self.c, np.exp(log_signal)))
+        table_u = np.exp(np.interp(log_signal, self.log_signal, self.log_u))
+        return float(np.max(np.abs(table_u/exact_u - 1)))
+
+    def solve(self, target):
+        """Returns u = TR*R1/4 for each relative signal in target."""
+        target = np.asarray(target, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_target = np.log(target)
+        u = np.exp(np.interp(log_target, self.log_signal, self.log_u))
+        outside = ~((log_target >= self.log_signal[0]) & 
+                    (log_target <= self.log_signal[-1]))
+        if np.any(outside):
+            u[outside] = -np.log(_spgr2d_bisection(self.c, target[outside]))
+        return u
+
+    def save(self, fullFilePath):
+        # A temporary file unique to this call, so that processes
+        # building the same table at once do not write to the same file
+        fileDescriptor, temporaryFilePath = tempfile.mkstemp(
+            suffix='.npz', dir=os.path.dirname(fullFilePath) or '.')
+        try:
+            with os.fdopen(fileDescriptor, 'wb') as npzFile:
+                np.savez(npzFile, FA=self.FA, log_u=self.log_u,
+                         log_signal=self.log_signal,
+                         max_relative_error=self.max_relative_error)
+            os.replace(temporaryFilePath, fullFilePath)
+        except BaseException:
+            if os.path.exists(temporaryFilePath):
+                os.remove(temporaryFilePath)
+            raise
+
+    @classmethod
+    def load(cls, fullFilePath):
+        table = cls.__new__(cls)
+        with np.load(fullFilePath) as npzFile:
+            table.FA = float(npzFile['FA'])
+            table.log_u = npzFile['log_u']
+            table.log_signal = npzFile['log_signal']
+            table.max_relative_error = float(npzFile['max_relative_error'])
+        table.c = np.cos(table.FA*np.pi/180)
+        return table
+
+def get_spgr2d_lookup_table(FA):
+    """Returns the SPGR2DLookupTable of the flip angle FA from the
+    memory cache, or the disk cache, or builds it."""
+    key = float(FA)
+    table = _spgr2d_lookup_tables.get(key)
+    if table is not None:
+        return table
+    with _spgr2d_lookup_tables_lock:
+        table = _spgr2d_lookup_tables.get(key)
+        if table is not None:
+            return table
+        fullFilePath = os.path.join(get_lut_cache_folder(),
+            'spgr2d_v{}_FA{!r}.npz'.format(SPGR2D_LUT_VERSION, key))
+        try:
+            table = SPGR2DLookupTable.load(fullFilePath)
+        except Exception:
+            # Not cached on disk yet, or unreadable
+            table = SPGR2DLookupTable(key)
+            try:
+                os.makedirs(os.path.dirname(fullFilePath), exist_ok=True)
+                table.save(fullFilePath)
+            except OSError as e:
+                logger.warning('Tools.get_spgr2d_lookup_table - table not saved: ' + str(e))
+        _spgr2d_lookup_tables[key] = table
+        return table
+
 #####################################
 # Shifts array to the right by n elements 
 # and inserts n zeros at the beginning of the array
@@ -108,11 +337,53 @@ def arr_shift(A,n):
     A_new = A_shifted[0:len(A)]
     return(A_new)
 
+#####################################
+# Delays the curve a, sampled at the times t, by each of the
+# delays in the 1D array delays and returns a 2D array with one
+# delayed curve per row; for example, a bank of AIFs for the
+# estimation of the bolus arrival delay of a tissue curve.
+#
+# The curve is linearly interpolated, so delays need not be
+# multiples of the time step and the time points need not be
+# evenly spaced. Unlike arr_shift, which inserts zeros, the
+# first value of the curve, the precontrast baseline of an MR
+# signal, is held before the first time point.
+
+def shift_curves(t, a, delays):
+    t = np.asarray(t, dtype=np.float64)
+    a = np.asarray(a, dtype=np.float64)
+    delays = np.atleast_1d(np.asarray(delays, dtype=np.float64))
+    shiftedTimes = t[np.newaxis,:] - delays[:,np.newaxis]
+    return np.interp(shiftedTimes.ravel(), t, a).reshape(shiftedTimes.shape)
+
+#####################################
+# Returns the index of the row of bank, a 2D array of delayed
+# input curves returned by shift_curves, whose upslope is most
+# correlated with the upslope of the tissue curve c.
+#
+# The correlation of the time derivatives of the curves is used
+# as the correlation of the curves themselves peaks later, by
+# about the transit time of the tissue. All the delays are
+# compared in one matrix-vector product.
+
+def estimate_delay_index(bank, c):
+    bankSlopes = np.diff(np.atleast_2d(bank), axis=1)
+    bankSlopes = bankSlopes - bankSlopes.mean(axis=1, keepdims=True)
+    slopes = np.diff(np.asarray(c, dtype=np.float64))
+    slopes = slopes - slopes.mean()
+    norms = np.linalg.norm(bankSlopes, axis=1)*np.linalg.norm(slopes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlations = (bankSlopes @ slopes)/norms
+    if not np.any(np.isfinite(correlations)):
+        return 0
+    return int(np.nanargmax(correlations))
+
 #####################################
 # Performs convolution of (1/T)exp(-t/T) with a 
     
+@Tracing.Traced(category='MathsTools')
 def expconv(T, t, a, modelName):
-    logger.info("Tools.expconv called for model: " + modelName)
+    logger.debug("Tools.expconv called for model: %s", modelName)
     try:
         if T==0:
             return(a)
@@ -142,45 +413,243 @@ def expconv(T, t, a, modelName):
         print('Tools.expconv called for model {} with error: {} '.format(modelName, str(e)))
         logger.error('Tools.expconv called for model {} with error: {} '.format(modelName, str(e)))
 
+#####################################
+# Performs the same convolution as expconv for a stack of 
+# curves, one per row of the 2D array a, each with its own 
+# time constant in the 1D array T. The loop is over time points,
+# so it is vectorized over curves.
+
+@Tracing.Traced(category='MathsTools')
+def expconv_batch(T, t, a):
+    try:
+        a = np.atleast_2d(np.asarray(a, dtype=np.float64))
+        T = np.broadcast_to(np.asarray(T, dtype=np.float64), (a.shape[0],))
+        n = len(t)
+        f = np.zeros(a.shape)
+
+        # Avoid division by zero, curves with T==0 are returned unchanged
+        isZero = T==0
+        safeT = np.where(isZero, 1.0, T)
+        x = (t[1:n-1] - t[0:n-2])[np.newaxis,:]/safeT[:,np.newaxis]
+        da = (a[:,1:n-1] - a[:,0:n-2])/x
+
+        E = np.exp(-x)
+        E0 = 1-E
+        E1 = x-E0
+
+        add = a[:,0:n-2]*E0 + da*E1
+
+        for i in range(0,n-2):
+            f[:,i+1] = E[:,i]*f[:,i] + add[:,i]
+
+        f[:,n-1] = f[:,n-2]
+        f[isZero] = a[isZero]
+        return (f)
+
+    except Exception as e:
+        print('Tools.expconv_batch has error: {} '.format(str(e)))
+        logger.error('Tools.expconv_batch has error: {} '.format(str(e)))
+
 #####################################
 # Performs deconvolution of C and ca_time where 
 # ca_time = ca times dt
+#
+# The operator of an AIF is calculated once and cached, so that 
+# deconvolving several tissue curves with the same AIF, dt 
+# and cutoff, for example every ROI of a data file or every
+# voxel of a slice, costs one decomposition.
+#
+# Three deconvolution methods are available, selected by name:
+#   'svd' - Truncated SVD pseudo-inverse of the convolution matrix.
+#       O(n^3) to build and O(n^2) memory, the reference method.
+#   'fft' - Block-circulant deconvolution. The AIF is zero padded
+#       to twice its length, so that its circulant matrix performs
+#       the same convolution as the convolution matrix, and the 
+#       frequencies where the magnitude of its FFT, which are the 
+#       singular values of the circulant matrix, are below the
+#       cutoff are discarded.  O(n log n) per curve.
+#   'tikhonov' - Tikhonov regularised deconvolution using the 
+#       diagonalisation of the same block-circulant matrix by the
+#       FFT.  If no cutoff is given, the regularisation parameter
+#       of each curve is selected at the corner of its L-curve, for
+#       all the curves of a stack at once.  O(n log n) per curve.
 
-def deconvolve(C,ca,dt):
-    # Build matrix from given AIF
-    ca_time = ca*dt
-    A = np.zeros(shape=(len(ca),len(ca)))
-    for i in np.arange(0,len(ca)):
-        A[:,i] = arr_shift(ca_time,i)
-    
-    # SVD of A
-    U,S,Vt = np.linalg.svd(A,full_matrices=True)
-    
-    #Inverse of A
-    cutoff = 0.01
-    S[S<cutoff*np.max(S)]=0
-    nz = S!=0
-    S[nz]=1/S[nz]
-    
-    invA = np.matmul(np.transpose(Vt),np.matmul(np.diag(S),np.transpose(U)))
-    
-    # Solution
-    X = np.matmul(invA,C)
-    
-    return(X) 
+# Singular values smaller than DECONVOLUTION_CUTOFF times the
+# largest singular value are discarded
+DECONVOLUTION_CUTOFF = 0.01
+# Maximum number of deconvolution operators kept in the cache
+DECONVOLUTION_CACHE_SIZE = 32
+# Regularisation parameters, relative to the largest singular
+# value, searched for the corner of the L-curve
+TIKHONOV_LAMBDAS = np.logspace(-4, 0, 41)
+
+_deconvolution_cache = OrderedDict()
+_deconvolution_cache_lock = threading.Lock()
+
+class DeconvolutionOperator:
+    """Truncated SVD pseudo-inverse of the convolution matrix of
+    the AIF, ca, sampled every dt."""
+    def __init__(self, ca, dt, cutoff=DECONVOLUTION_CUTOFF):
+        # Lower triangular Toeplitz matrix, column i holds
+        # ca_time shifted to the right by i elements
+        ca_time = np.asarray(ca, dtype=np.float64)*dt
+        A = toeplitz(ca_time, np.zeros(len(ca_time)))
+
+        U,S,Vt = np.linalg.svd(A,full_matrices=False)
+        
+        # Keep the singular values above the cutoff
+        rank = int(np.count_nonzero(S >= cutoff*np.max(S)))
+        self.rank = rank
+        self.invA = np.matmul(Vt[:rank].T/S[:rank], U[:,:rank].T)
+        self.invA.setflags(write=False)
+
+    def apply(self, C):
+        """Deconvolves a tissue curve, or a 2D stack of tissue 
+        curves with one curve per row, in one matrix product."""
+        C = np.asarray(C, dtype=np.float64)
+        if C.ndim == 1:
+            return np.matmul(self.invA, C)
+        return np.matmul(C, self.invA.T)
+
+class FFTDeconvolutionOperator:
+    """Block-circulant FFT deconvolution by the AIF, ca, sampled
+    every dt, with a cutoff on the magnitude of its frequencies."""
+    def __init__(self, ca, dt, cutoff=DECONVOLUTION_CUTOFF):
+        ca_time = np.asarray(ca, dtype=np.float64)*dt
+        self.n = len(ca_time)
+        # Zero padding makes the circular convolution linear
+        self.n_fft = 2*self.n
+        H = np.fft.rfft(ca_time, self.n_fft)
+        magnitude = np.abs(H)
+        keep = magnitude >= cutoff*np.max(magnitude)
+        self.rank = int(np.count_nonzero(keep))
+        self.inverse_filter = np.zeros_like(H)
+        self.inverse_filter[keep] = 1/H[keep]
+
+    def apply(self, C):
+        """Deconvolves a tissue curve, or a 2D stack of tissue 
+        curves with one curve per row."""
+        Cf = np.fft.rfft(np.asarray(C, dtype=np.float64), self.n_fft, axis=-1)
+        return np.fft.irfft(Cf*self.inverse_filter, self.n_fft, axis=-1)[..., :self.n]
+
+class TikhonovDeconvolutionOperator:
+    """Tikhonov regularised deconvolution by the AIF, ca, sampled
+    every dt, using the FFT of its block-circulant matrix. lambda_ 
+    is the regularisation parameter relative to the largest singular
+    value; if None, it is selected for each curve by the L-curve."""
+    def __init__(self, ca, dt, lambda_=None):
+        ca_time = np.asarray(ca, dtype=np.float64)*dt
+        self.n = len(ca_time)
+        self.n_fft = 2*self.n
+        self.H = np.fft.rfft(ca_time, self.n_fft)
+        self.H2 = np.abs(self.H)**2
+        self.lambda_ = lambda_
+        # Weights of the terms of the rfft in Parseval's theorem
+        self.weights = np.full(len(self.H), 2.0)
+        self.weights[0] = 1.0
+        if self.n_fft % 2 == 0:
+            self.weights[-1] = 1.0
+        self.lambdas = TIKHONOV_LAMBDAS*np.sqrt(np.max(self.H2))
+
+    def select_lambdas(self, Cf):
+        """Returns the regularisation parameter at the corner, the point
+        of maximum curvature, of the L-curve of each row of Cf, the FFTs
+        of a 2D stack of tissue curves."""
+        power = self.weights*np.abs(Cf)**2
+        log_residual = np.empty((len(Cf), len(self.lambdas)))
+        log_solution = np.empty((len(Cf), len(self.lambdas)))
+        for i, lambda_ in enumerate(self.lambdas):
+            denominator = (self.H2 + lambda_**2)**2
+            residual = power @ (lambda_**4/denominator)
+            solution = power @ (self.H2/denominator)
+            log_residual[:,i] = 0.5*np.log(np.maximum(residual, np.finfo(float).tiny))
+            log_solution[:,i] = 0.5*np.log(np.maximum(solution, np.finfo(float).tiny))
+        # Curvature of the L-curve, with respect to log lambda
+        x = np.log(self.lambdas)
+        d_rho = np.gradient(log_residual, x, axis=1)
+        d_eta = np.gradient(log_solution, x, axis=1)
+        d2_rho = np.gradient(d_rho, x, axis=1)
+        d2_eta = np.gradient(d_eta, x, axis=1)
+        curvature = (d_rho*d2_eta - d2_rho*d_eta) / \
+            np.maximum((d_rho**2 + d_eta**2)**1.5, np.finfo(float).tiny)
+        return self.lambdas[np.argmax(curvature[:,1:-1], axis=1) + 1]
+
+    def apply(self, C):
+        """Deconvolves a tissue curve, or a 2D stack of tissue 
+        curves with one curve per row."""
+        C = np.asarray(C, dtype=np.float64)
+        Cf = np.fft.rfft(np.atleast_2d(C), self.n_fft, axis=-1)
+        if self.lambda_ is None:
+            lambdas = self.select_lambdas(Cf)[:,np.newaxis]
+        else:
+            lambdas = self.lambda_*np.sqrt(np.max(self.H2))
+        Xf = Cf*np.conj(self.H)/(self.H2 + lambdas**2)
+        X = np.fft.irfft(Xf, self.n_fft, axis=-1)[:, :self.n]
+        return X[0] if C.ndim == 1 else X
+
+DECONVOLUTION_METHODS = {'svd': DeconvolutionOperator,
+                         'fft': FFTDeconvolutionOperator,
+                         'tikhonov': TikhonovDeconvolutionOperator}
+
+def get_deconvolution_operator(ca, dt, cutoff=None, method='svd'):
+    """Returns the operator of the deconvolution method, method, for
+    (ca, dt, cutoff), creating it if it is not in the cache. By default,
+    cutoff is DECONVOLUTION_CUTOFF, or the L-curve for 'tikhonov'."""
+    if method not in DECONVOLUTION_METHODS:
+        raise ValueError('Unknown deconvolution method {}, expected one of {}'
+                         .format(method, ', '.join(DECONVOLUTION_METHODS)))
+    if cutoff is None and method != 'tikhonov':
+        cutoff = DECONVOLUTION_CUTOFF
+    ca = np.ascontiguousarray(ca, dtype=np.float64)
+    key = (method, ca.tobytes(), float(dt), 
+           None if cutoff is None else float(cutoff))
+    with _deconvolution_cache_lock:
+        operator = _deconvolution_cache.get(key)
+        if operator is not None:
+            _deconvolution_cache.move_to_end(key)
+            return operator
+    operator = DECONVOLUTION_METHODS[method](ca, dt, cutoff)
+    with _deconvolution_cache_lock:
+        _deconvolution_cache[key] = operator
+        while len(_deconvolution_cache) > DECONVOLUTION_CACHE_SIZE:
+            _deconvolution_cache.popitem(last=False)
+    return operator
+
+def clear_deconvolution_cache():
+    """Discards the cached deconvolution operators."""
+    with _deconvolution_cache_lock:
+        _deconvolution_cache.clear()
+
+@Tracing.Traced(category='MathsTools')
+def deconvolve(C,ca,dt,cutoff=None,method='svd'):
+    # C may be a tissue curve or a 2D stack of tissue curves,
+    # one per row. method is 'svd', 'fft' or 'tikhonov'.
+    return get_deconvolution_operator(ca, dt, cutoff, method).apply(C)
    
 #####################################
-# Performs discrete integration of ca  
-# time t
-    
-def integrate(ca,t):
-    
-    f = np.zeros(len(ca))
-    dt = t[1]-[0]
-    f[0] = 0
-    for n in np.arange(1,len(t)):
-        f[n] = dt*ca[n]+f[n-1]
+# Performs cumulative integration of ca, a curve or a 2D stack
+# of curves with one curve per row, over the time points t,
+# which need not be evenly spaced. The integral at t[0] is 0.
+#   'trapezoidal' - trapezoidal rule, exact for piecewise linear
+#       curves as assumed by expconv, so that Th*expconv(Th,t,ca)
+#       tends to integrate(ca,t) as Th tends to infinity.
+#   'rectangular' - right rectangle rule, f[n] = f[n-1] + dt*ca[n].
 
+INTEGRATION_METHODS = ('trapezoidal', 'rectangular')
+    
+@Tracing.Traced(category='MathsTools')
+def integrate(ca,t,method='trapezoidal'):
+    ca = np.asarray(ca, dtype=np.float64)
+    dt = np.diff(np.asarray(t, dtype=np.float64), axis=-1)
+    if method == 'trapezoidal':
+        increments = dt*(ca[...,1:] + ca[...,:-1])/2
+    elif method == 'rectangular':
+        increments = dt*ca[...,1:]
+    else:
+        raise ValueError('Unknown integration method {}, expected one of {}'
+                         .format(method, ', '.join(INTEGRATION_METHODS)))
+    f = np.zeros(np.broadcast(ca, np.asarray(t)).shape)
+    np.cumsum(increments, axis=-1, out=f[...,1:])
     return(f)
 
 #####################################
@@ -204,6 +673,7 @@ def spgress(FA, TR, S0, R1):
 # equilibrium signal (S0), precontrast longitudinal
 # relaxation rate (R10 in Hz)
    
+@Tracing.Traced(category='MathsTools')
 def spgress_inv(S, FA, TR, S0, R10):
     E = np.exp(-TR*R10)
     c = np.cos(np.array(FA)*np.pi/180)
@@ -0,0 +1,587 @@
+"""
+This class module provides the comparison of the models of an XML
+configuration file on a folder of time-MR signal data files, in a
+single pass over the data files, instead of one batch per model.
+
+Every model of the configuration file compatible with the selected
+curves, that is every single inlet model and, if a VIF is selected,
+every dual inlet model, is fitted to each data file by a BatchProcessor
+object.  Each data file is read and normalised once and its signal data
+shared by the fits of all the models.  The fits of the models to the
+data files are run in parallel by a pool of worker processes, each
+holding a BatchProcessor object per model.  The data files pass
+through the stages of a BatchPipeline, so that reading the data files,
+fitting the models and recording the comparison overlap.
+
+The fits are compared using the sum of squared residuals, chi-square,
+of the n data points of the ROI and the number k of parameters allowed
+to vary:
+    reduced chi-square = chi-square/(n - k)
+    AIC = n ln(chi-square/n) + 2k
+    BIC = n ln(chi-square/n) + k ln(n)
+For each data file, the differences between the AIC and BIC of each
+model and the smallest AIC and BIC of the data file, and the Akaike
+weight of each model, are calculated.  The comparison table has one
+row per data file and model.  The summary of the cohort has one row per
+model, holding the number of data files it fitted and, over the common
+data files fitted by every model, so that the models are compared on
+the same data, the sums and means of its AIC and BIC, the number of
+data files for which it has the smallest AIC and BIC and the median of
+its reduced chi-square.
+
+It may be run from the command line:
+
+    python CoreModules/ModelComparison.py <data folder> --config <XML file>
+           --roi Liver --aif Spleen
+
+Usage:
+    objModelComparison = ModelComparison(configFile, 'Liver', 'Spleen')
+    summary = objModelComparison.processFolder(folder, comparisonFileName)
+    objModelComparison.shutdown()
+"""
+import argparse
+from concurrent.futures import Future, ProcessPoolExecutor
+import csv
+import multiprocessing
+import os
+import threading
+import time
+import logging
+import numpy as np
+
+import BatchPipeline
+from BatchProcessor import BatchProcessor, LoadDataFile
+import ResultsStore
+import ResourceManager as ResourceManagerModule
+from ResourceManager import ResourceManager
+import StageTimer as StageTimerModule
+import Tracing
+import LoggingConfig
+from XMLReader import XMLReader, FIRST_ITEM_MODEL_LIST, NO_MODELS_DEFINED_IN_CONFIG_FILE
+
+logger = logging.getLogger(__name__)
+
+COMPARISON_COLUMNS = ['file', 'model', 'inlet_type', 'n', 'k', 'chisqr',
+                      'reduced_chisqr', 'aic', 'bic', 'delta_aic', 'delta_bic',
+                      'aic_weight', 'nfev', 'fit_time', 'status']
+SUMMARY_COLUMNS = ['model', 'inlet_type', 'num_fitted', 'num_common',
+                   'sum_aic', 'sum_bic', 'mean_aic', 'mean_bic',
+                   'num_best_aic', 'num_best_bic', 'median_reduced_chisqr']
+SUMMARY_FILE_SUFFIX = '_summary.csv'
+
+# The ModelComparison object of a worker process of the pool
+_workerModelComparison = None
+
+
+def CalculateInformationCriteria(chisqr, numDataPoints, numParameters):
+    """Returns a dictionary of the reduced chi-square (reduced_chisqr),
+    the Akaike (aic) and Bayesian (bic) information criteria of a fit
+    with the sum of squared residuals, chisqr, of numDataPoints data
+    points and numParameters parameters allowed to vary. The values
+    are NaN if they cannot be calculated."""
+    criteria = {'reduced_chisqr': np.nan, 'aic': np.nan, 'bic': np.nan}
+    if chisqr is None or not np.isfinite(chisqr) or numDataPoints < 1:
+        return criteria
+    if numDataPoints > numParameters:
+        criteria['reduced_chisqr'] = chisqr/(numDataPoints - numParameters)
+    # A perfect fit, the log-likelihood is unbounded
+    logLikelihoodTerm = numDataPoints*np.log(max(chisqr, np.finfo(float).tiny)
+                                             /numDataPoints)
+    criteria['aic'] = logLikelihoodTerm + 2*numParameters
+    criteria['bic'] = logLikelihoodTerm + numParameters*np.log(numDataPoints)
+    return criteria
+
+
+def GetCompatibleModels(objXMLReader, withVIF=False):
+    """Returns the list of the short names of the models in the
+    configuration file read by objXMLReader that can be fitted to
+    the selected curves: the single inlet models and, if withVIF is
+    True, the dual inlet models."""
+    modelNames = []
+    for modelName in objXMLReader.getListModelShortNames() or []:
+        if modelName in (FIRST_ITEM_MODEL_LIST, NO_MODELS_DEFINED_IN_CONFIG_FILE):
+            continue
+        inletType = objXMLReader.getModelInletType(modelName)
+        if inletType == 'single' or (inletType == 'dual' and withVIF):
+            modelNames.append(modelName)
+    return modelNames
+
+
+def _InitialiseComparisonWorker(configFileName, ROI, AIF, VIF, modelNames,
+                                profileFolder, workerTracing, numBLASThreads):
+    """Runs once in each worker process of the pool to limit its BLAS
+    threads, record its spans in the trace if tracing is enabled and
+    create the ModelComparison object holding the BatchProcessor 
+    objects of the models."""
+    global _workerModelComparison
+    ResourceManagerModule.InitialiseWorkerProcess(numBLASThreads, workerTracing)
+    Tracing.SetProfileFolder(profileFolder)
+    _workerModelComparison = ModelComparison(configFileName, ROI, AIF, VIF, modelNames)
+
+
+def _FitModelInWorker(modelName, signalData):
+    """Fits the model, modelName, to the signal data of a data file in
+    a worker process. Returns the dictionary returned by
+    ModelComparison.fitModel."""
+    return _workerModelComparison.fitModel(modelName, signalData)
+
+
+def _LogFailedFit(fileName, modelName, e):
+    """Prints and logs the exception, e, raised by the fit of the
+    model, modelName, to the data file, fileName."""
+    print('ModelComparison when file = ' + fileName +
+          ' and model = ' + modelName + ': ' + str(e))
+    logger.error('ModelComparison when file = ' + fileName +
+                 ' and model = ' + modelName + ': ' + str(e))
+
+
+class ModelFitExecutor:
+    def __init__(self, executor, modelNames):
+        """Creates an instance of the ModelFitExecutor class, the fit
+        stage of the BatchPipeline of a model comparison. The fit of a 
+        data file is submitted to the pool of worker processes, executor,
+        as one fit per model in modelNames, so that the models are fitted
+        in parallel.
+        """
+        self.executor = executor
+        self.modelNames = modelNames
+
+
+    def submit(self, fitFunction, fileName, signalData):
+        """Submits the fit of each model to the signal data of the data
+        file, fileName, to the pool of worker processes, in place of 
+        fitFunction, ModelComparison.fitModels, which fits the models one
+        after the other.
+
+        Returns
+        -------
+        A Future whose result, once every model has been fitted, is the
+        value returned by ModelComparison.fitModels.
+        """
+        fileFuture = Future()
+        modelFutures = {modelName: self.executor.submit(_FitModelInWorker,
+                                                        modelName, signalData)
+                        for modelName in self.modelNames}
+        remainingFits = [len(modelFutures)]
+        lock = threading.Lock()
+
+        def collectFits(_):
+            with lock:
+                remainingFits[0] -= 1
+                if remainingFits[0] > 0:
+                    return
+            fileFits = {}
+            for modelName, modelFuture in modelFutures.items():
+                try:
+                    fileFits[modelName] = modelFuture.result()
+                except Exception as e:
+                    _LogFailedFit(fileName, modelName, e)
+                    fileFits[modelName] = None
+            fileFuture.set_result((fileFits, None))
+
+        for modelFuture in modelFutures.values():
+            modelFuture.add_done_callback(collectFits)
+        return fileFuture
+
+
+class ModelComparison:
+    def __init__(self, configFile, ROI, AIF, VIF=None, modelNames=None,
+                 cpuBudget=None):
+        """Creates an instance of the ModelComparison class for fitting
+        the models of the XML configuration file, configFile, to the ROI
+        MR signal data of each data file.
+
+        Input Parameters
+        ----------------
+        configFile - Path to an XML configuration file or an object
+            instanciated from the XMLReader class.
+        ROI, AIF - Names of the ROI and AIF columns in the data files.
+        VIF - Name of the VIF column, required by dual inlet models.
+        modelNames - Optional list of the short names of the models
+            compared. By default, those returned by GetCompatibleModels.
+        cpuBudget - Optional number of cores used to fit the models,
+            see ResourceManager.GetCPUBudget.
+        """
+        if isinstance(configFile, XMLReader):
+            self.objXMLReader = configFile
+        else:
+            self.objXMLReader = XMLReader()
+            self.objXMLReader.parseConfigFile(configFile)
+        self.curveNames = {'roi': ROI, 'aif': AIF, 'vif': VIF}
+        if modelNames is None:
+            modelNames = GetCompatibleModels(self.objXMLReader, bool(VIF))
+        if not modelNames:
+            raise ValueError('No model of the configuration file can be fitted '
+                             'to the selected curves')
+        self.modelNames = list(modelNames)
+        self.cpuBudget = ResourceManagerModule.GetCPUBudget(cpuBudget)
+        self.executor = None
+        self.executorArguments = None
+        # The data files are read and normalised once for all the models
+        self.batchProcessors = {}
+        requiredColumns = []
+        for modelName in self.modelNames:
+            objBatchProcessor = BatchProcessor(self.objXMLReader, modelName, ROI, AIF,
+                VIF if self.objXMLReader.getModelInletType(modelName) == 'dual' else None)
+            self.batchProcessors[modelName] = objBatchProcessor
+            requiredColumns += [column for column in objBatchProcessor.getRequiredColumns()
+                                if column not in requiredColumns]
+        self.requiredColumns = requiredColumns
+        self.numBaselineScans = self.objXMLReader.getNumBaselineScans()
+        logger.info('In module ' + __name__ + '. Created an instance of class ' +
+                    'ModelComparison of models ' + ', '.join(self.modelNames))
+
+
+    def readFile(self, fullFilePath):
+        """Returns the normalised signal data of a data file, shared by
+        the fits of all the models, the reason it failed validation, see
+        BatchProcessor.LoadDataFile, and a new row of stage times, in the
+        reader stage of the BatchPipeline."""
+        signalData, failureReason = LoadDataFile(fullFilePath, self.requiredColumns,
+                                                 self.numBaselineScans)
+        return signalData, failureReason, \
+            StageTimerModule.NewRow(os.path.basename(fullFilePath))
+
+
+    def fitModel(self, modelName, signalData):
+        """Fits the model, modelName, to the signal data of a data file.
+
+        Returns
+        -------
+        A dictionary holding the parameters (parameters) and fit
+        statistics (fitStatistics) returned by BatchProcessor.fitSignalData,
+        the number of data points (n), the number of parameters allowed
+        to vary (k), the sum of squared residuals (chisqr) and the
+        criteria returned by CalculateInformationCriteria.
+        """
+        objBatchProcessor = self.batchProcessors[modelName]
+        fixedParameters = objBatchProcessor.fixedParameters or \
+            [False]*len(objBatchProcessor.parameterNames)
+        result = objBatchProcessor.fitSignalData(
+            signalData, objBatchProcessor.initialValues, fixedParameters)
+        fitStatistics = result['fitStatistics']
+        numDataPoints = len(signalData[objBatchProcessor.ROI])
+        numParameters = sum(1 for isFixed in fixedParameters if not isFixed)
+        chisqr = fitStatistics.get('chisqr', np.nan)
+        fit = {'parameters': result['parameters'], 'fitStatistics': fitStatistics,
+               'n': numDataPoints, 'k': numParameters, 'chisqr': chisqr}
+        fit.update(CalculateInformationCriteria(chisqr, numDataPoints, numParameters))
+        return fit
+
+
+    def fitModels(self, fileName, signalData):
+        """Fits every model, one after the other, to the signal data of
+        the data file, fileName, in the fit stage of the BatchPipeline.
+
+        Returns
+        -------
+        The dictionary of model name:fit pairs, where fit is returned
+        by fitModel, or None if the fit raised an exception, and None
+        in place of a row of stage times.
+        """
+        fileFits = {}
+        for modelName in self.modelNames:
+            try:
+                fileFits[modelName] = self.fitModel(modelName, signalData)
+            except Exception as e:
+                _LogFailedFit(fileName, modelName, e)
+                fileFits[modelName] = None
+        return fileFits, None
+
+
+    def getExecutor(self, numberOfWorkers, numBLASThreads):
+        """Returns the pool of worker processes fitting the models,
+        starting it if required, or restarting it if the number of
+        workers, their BLAS threads or the tracing have changed."""
+        executorArguments = (numberOfWorkers, numBLASThreads,
+                             Tracing.GetWorkerTracing())
+        if self.executor is not None and self.executorArguments != executorArguments:
+            self.shutdown()
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=numberOfWorkers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_InitialiseComparisonWorker,
+                initargs=(self.objXMLReader.fullFilePath, self.curveNames['roi'],
+                          self.curveNames['aif'], self.curveNames['vif'],
+                          self.modelNames, Tracing.GetProfileFolder(),
+                          executorArguments[2], numBLASThreads))
+            self.executorArguments = executorArguments
+        return self.executor
+
+
+    def shutdown(self):
+        """Stops the worker processes, if any."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            self.executorArguments = None
+
+
+    def compareFiles(self, fullFilePaths, numberOfWorkers=None, progressCallback=None):
+        """Fits every model to each data file in fullFilePaths and
+        compares the fits.
+
+        Input Parameters
+        ----------------
+        fullFilePaths - List of the full file paths of the data files.
+        numberOfWorkers - Maximum number of worker processes fitting the
+            models in parallel, by default set by the ResourceManager
+            class from the CPU budget. If 1, the models are fitted in
+            this process.
+        progressCallback - Optional function called with the number of
+            data files compared so far and the name of the last one.
+
+        Returns
+        -------
+        The list of the rows of the comparison table, dictionaries with
+        the keys in COMPARISON_COLUMNS, in the order of the data files
+        and models, and the dictionary of data file name:{model name:
+        fit} pairs, where fit is returned by fitModel, or None for a data
+        file that failed validation.
+        """
+        objResourceManager = ResourceManager(self.cpuBudget)
+        if numberOfWorkers is None:
+            numberOfWorkers = objResourceManager.numberOfFitWorkers
+        numberOfWorkers = max(1, min(numberOfWorkers,
+                                     len(fullFilePaths)*len(self.modelNames)))
+        executor = None
+        if numberOfWorkers > 1:
+            objResourceManager = ResourceManager(self.cpuBudget,
+                                                 numberOfFitWorkers=numberOfWorkers)
+            executor = self.getExecutor(numberOfWorkers, objResourceManager.fitBLASThreads)
+
+        rows = []
+        fits = {}
+
+        def recordComparison(fileName, signalData, fileFits, failureReason, row):
+            if signalData is None:
+                fits[fileName] = None
+                rows.append(dict({column: '' for column in COMPARISON_COLUMNS},
+                                 file=fileName, status='Skipped - ' + failureReason))
+            else:
+                fits[fileName] = fileFits
+                rows.extend(self.getComparisonRows(fileName, fileFits))
+
+        objBatchPipeline = BatchPipeline.BatchPipeline(
+            self.readFile, self.fitModels, recordFunction=recordComparison,
+            fitExecutor=ModelFitExecutor(executor, self.modelNames)
+            if executor is not None else None,
+            numberOfFitWorkers=numberOfWorkers)
+        with ResourceManagerModule.LimitBLASThreads(
+                objResourceManager.getMainBLASThreads(executor is None)):
+            objBatchPipeline.run(fullFilePaths, progressCallback=progressCallback)
+        return rows, fits
+
+
+    def getComparisonRows(self, fileName, fileFits):
+        """Returns the rows of the comparison table of a data file from
+        the dictionary of model name:fit pairs, fileFits, where fit is
+        returned by fitModel or is None if the fit raised an exception."""
+        rows = []
+        for modelName in self.modelNames:
+            fit = fileFits.get(modelName)
+            row = {column: '' for column in COMPARISON_COLUMNS}
+            row.update(file=fileName, model=modelName,
+                       inlet_type=self.batchProcessors[modelName].inletType)
+            if fit is None:
+                row['status'] = 'Failed'
+            else:
+                row.update({column: fit[column] for column in
+                            ('n', 'k', 'chisqr', 'reduced_chisqr', 'aic', 'bic')})
+                row.update(nfev=fit['fitStatistics'].get('nfev', ''),
+                           fit_time=fit['fitStatistics'].get('fitTime', ''),
+                           status=fit['fitStatistics']['status'])
+            rows.append(row)
+
+        for criterion in ('aic', 'bic'):
+            values = np.array([row[criterion] if row[criterion] != '' else np.nan
+                               for row in rows], dtype=np.float64)
+            if np.isfinite(values).any():
+                deltas = values - np.nanmin(values)
+                for row, delta in zip(rows, deltas):
+                    row['delta_' + criterion] = delta
+                if criterion == 'aic':
+                    with np.errstate(invalid='ignore'):
+                        weights = np.exp(-deltas/2)
+                        weights /= np.nansum(weights)
+                    for row, weight in zip(rows, weights):
+                        row['aic_weight'] = weight
+        return rows
+
+
+    def summariseComparison(self, rows):
+        """Returns the rows of the summary of the cohort, dictionaries
+        with the keys in SUMMARY_COLUMNS, one per model, from the rows
+        of the comparison table. The models are compared over the common
+        data files, those fitted by every model (num_common)."""
+        def isFitted(row):
+            return row['aic'] != '' and np.isfinite(row['aic'])
+
+        fittedModels = {}
+        for row in rows:
+            if row['model'] and isFitted(row):
+                fittedModels.setdefault(row['file'], set()).add(row['model'])
+        commonFiles = {fileName for fileName, modelNames in fittedModels.items()
+                       if len(modelNames) == len(self.modelNames)}
+
+        summaryRows = []
+        for modelName in self.modelNames:
+            modelRows = [row for row in rows if row['model'] == modelName and isFitted(row)]
+            commonRows = [row for row in modelRows if row['file'] in commonFiles]
+            reducedChisqrs = [row['reduced_chisqr'] for row in commonRows
+                              if np.isfinite(row['reduced_chisqr'])]
+            sumAIC = sum(row['aic'] for row in commonRows)
+            sumBIC = sum(row['bic'] for row in commonRows)
+            summaryRows.append({
+                'model': modelName,
+                'inlet_type': self.batchProcessors[modelName].inletType,
+                'num_fitted': len(modelRows),
+                'num_common': len(commonRows),
+                'sum_aic': sumAIC,
+                'sum_bic': sumBIC,
+                'mean_aic': sumAIC/len(commonRows) if commonRows else np.nan,
+                'mean_bic': sumBIC/len(commonRows) if commonRows else np.nan,
+                'num_best_aic': sum(1 for row in commonRows if row['delta_aic'] == 0),
+                'num_best_bic': sum(1 for row in commonRows if row['delta_bic'] == 0),
+                'median_reduced_chisqr': float(np.median(reducedChisqrs))
+                    if reducedChisqrs else np.nan})
+        return summaryRows
+
+
+    def processFolder(self, folder, comparisonFileName=None, resultsFileName=None,
+                      numberOfWorkers=None, progressCallback=None):
+        """Compares the models on every CSV data file in folder, see
+        compareFiles.
+
+        Input Parameters
+        ----------------
+        folder - Folder containing the CSV data files.
+        comparisonFileName - Optional file path and name of the CSV
+            comparison table. The summary of the cohort is saved
+            alongside it in a CSV file whose name ends in
+            SUMMARY_FILE_SUFFIX.
+        resultsFileName - Optional file path and name of the results
+            table of the optimum parameter values of every model, see
+            ResultsStore.py.
+        numberOfWorkers, progressCallback - See compareFiles.
+
+        Returns
+        -------
+        A dictionary holding the number of data files (numFiles), the
+        rows of the comparison table (comparison) and of the summary
+        (summary) and the total time in seconds (totalTime).
+        """
+        startTime = time.perf_counter()
+        objResultsStore = ResultsStore.ResultsStore(resultsFileName) \
+            if resultsFileName else None
+        excludedFiles = {os.path.abspath(fileName) for fileName in
+                         (comparisonFileName, objResultsStore and
+                          objResultsStore.fullFilePath) if fileName}
+        if comparisonFileName:
+            excludedFiles.add(os.path.abspath(
+                os.path.splitext(comparisonFileName)[0] + SUMMARY_FILE_SUFFIX))
+        fullFilePaths = [os.path.join(folder, file)
+                         for file in sorted(os.listdir(folder))
+                         if file.lower().endswith('.csv') and
+                         os.path.abspath(os.path.join(folder, file)) not in excludedFiles]
+        rows, fits = self.compareFiles(fullFilePaths, numberOfWorkers, progressCallback)
+        summaryRows = self.summariseComparison(rows)
+
+        if comparisonFileName:
+            self.saveTable(comparisonFileName, COMPARISON_COLUMNS, rows)
+            self.saveTable(os.path.splitext(comparisonFileName)[0] + SUMMARY_FILE_SUFFIX,
+                           SUMMARY_COLUMNS, summaryRows)
+        if objResultsStore is not None:
+            for fileName, fileFits in fits.items():
+                if fileFits is None:
+                    continue
+                for modelName, fit in fileFits.items():
+                    fittedAt = ResultsStore.GetTimestamp()
+                    if fit is None or not fit['parameters']:
+                        objResultsStore.recordParameterValues(fileName, modelName, '',
+                            None, None, None, status='Failed' if fit is None
+                            else fit['fitStatistics']['status'], fittedAt=fittedAt)
+                        continue
+                    for name, (value, lower, upper) in fit['parameters'].items():
+                        objResultsStore.recordParameterValues(fileName, modelName,
+                            name, value, lower, upper, fit['fitStatistics'].get('nfev'),
+                            fit['fitStatistics'].get('fitTime'),
+                            fit['fitStatistics']['status'], fittedAt)
+            objResultsStore.saveResults()
+        totalTime = time.perf_counter() - startTime
+        logger.info('ModelComparison.processFolder - {} files, {} models in {:.2f} s'
+                    .format(len(fullFilePaths), len(self.modelNames), totalTime))
+        return {'numFiles': len(fullFilePaths), 'comparison': rows,
+                'summary': summaryRows, 'totalTime': totalTime}
+
+
+    def saveTable(self, fullFilePath, columnNames, rows):
+        """Saves the rows, dictionaries with the keys in columnNames,
+        in a CSV file."""
+        try:
+            with open(fullFilePath, 'w', newline='') as csvFile:
+                writer = csv.DictWriter(csvFile, fieldnames=columnNames)
+                writer.writeheader()
+                writer.writerows(rows)
+        except Exception as e:
+            print('ModelComparison.saveTable: ' + str(e))
+            logger.error('ModelComparison.saveTable: ' + str(e))
+
+
+def FormatSummary(summaryRows):
+    """Returns the summary of the cohort as a table of text."""
+    lines = ['{:<30} {:>8} {:>8} {:>12} {:>12} {:>9} {:>9}'.format(
+        'Model', 'Fitted', 'Common', 'Mean AIC', 'Mean BIC', 'Best AIC', 'Best BIC')]
+    for row in summaryRows:
+        lines.append('{model:<30} {num_fitted:>8} {num_common:>8} {mean_aic:>12.2f} '
+                     '{mean_bic:>12.2f} {num_best_aic:>9} {num_best_bic:>9}'.format(**row))
+    lines.append('The means and the numbers of best fits are over the common ' +
+                 'data files, fitted by every model.')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    # Required by the worker processes of an application frozen by PyInstaller
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(
+        description='Fits every compatible model to all the CSV data files ' +
+                    'in a folder and compares them.')
+    parser.add_argument('folder', help='Folder containing the CSV data files.')
+    parser.add_argument('--config', required=True, help='XML configuration file.')
+    parser.add_argument('--roi', required=True, help='Name of the ROI column.')
+    parser.add_argument('--aif', required=True, help='Name of the AIF column.')
+    parser.add_argument('--vif', help='Name of the VIF column. Dual inlet ' +
+                        'models are only compared if it is given.')
+    parser.add_argument('--models', nargs='+', help='Short names of the models ' +
+                        'compared. By default, all the compatible models.')
+    parser.add_argument('--comparison', help='File path and name of the CSV ' +
+                        'comparison table. By default, ModelComparison.csv in the folder.')
+    parser.add_argument('--results', help='File path and name of the results table ' +
+                        'of the parameter values of every model.')
+    parser.add_argument('--workers', type=int,
+                        help='Number of worker processes fitting the models. ' +
+                        'By default, set from the CPU budget.')
+    parser.add_argument('--cpu-budget', type=int,
+                        help='Number of cores used. By default, the value of ' +
+                        ResourceManagerModule.CPU_BUDGET_ENVIRONMENT_VARIABLE +
+                        ' or all the available cores.')
+    parser.add_argument('--trace', help='File path and name of a Chrome trace JSON file.')
+    LoggingConfig.AddLoggingArguments(parser)
+    arguments = parser.parse_args()
+    comparisonFileName = arguments.comparison or os.path.join(arguments.folder,
+                                                              'ModelComparison.csv')
+    # The log file is saved alongside the comparison table
+    LoggingConfig.ConfigureLoggingFromArguments(arguments, 'ModelComparison.log',
+        os.path.dirname(os.path.abspath(comparisonFileName)))
+    Tracing.ConfigureTracing(arguments.trace)
+
+    objModelComparison = ModelComparison(arguments.config, arguments.roi, arguments.aif,
+                                         arguments.vif, arguments.models,
+                                         arguments.cpu_budget)
+    summary = objModelComparison.processFolder(arguments.folder, comparisonFileName,
+                                               arguments.results, arguments.workers)
+    objModelComparison.shutdown()
+    print('{} files compared with {} models in {:.2f} s'.format(
+        summary['numFiles'], len(objModelComparison.modelNames), summary['totalTime']))
+    print(FormatSummary(summary['summary']))
@@ -10,6 +10,25 @@ The function, CurveFit calls the Model function imported from
 the lmfit Python package to fit any of the models in ModelFunctions.py
 to actual concentration/time data.  
 
+Model functions with a staged definition in the dictionary STAGED_MODELS
+of their module are partially evaluated during curve fitting, so that
+the intermediates that do not depend on the parameters allowed to vary, 
+such as the conversion of the AIF to concentrations, are calculated 
+once per fit, see PartialEvaluation.py.
+
+The function, CurveFitWithDelay, fits a model allowing for a delay
+between the arrival of the bolus in the AIF (and VIF) and in the ROI,
+see DelayedInputBank.
+
+The function, CurveFitMultiStart, fits a model from many starting points,
+to avoid the poor local minima reached from a poor initial guess. The
+starting points are screened at once, by a batched evaluation of the
+staged model, and only the best few are refined with lmfit.
+
+The function, GetAtlasInitialValues, chooses the initial values of a
+fit from the nearest curve of a precomputed atlas of the curves 
+predicted by the model on a grid of parameter values, see CurveAtlas.py.
+
 Initially curve fitting was done using scipy.optimize.curve_fit but
 lmfit was found to be more suitable. The code pertaining to the scipy
 implementation has been commented out.
@@ -20,6 +39,12 @@ from lmfit import Parameters, Model
 import numpy as np
 import logging
 import importlib
+import inspect
+import time
+from scipy.stats import qmc
+import Tracing
+import MathsTools as tools
+import CurveAtlas
 #Although a dynamic import of ModelFunctions is done in the 2 functions in this module
 #an import has to be done here, so that Model Functions is included when a compiled
 #version of this program is created using Pyinstaller.
@@ -28,6 +53,29 @@ import ModelFunctions
 
 logger = logging.getLogger(__name__)
 
+# Modes of estimating the delay of the ROI curve, see CurveFitWithDelay
+DELAY_MODES = ['none', 'xcorr', 'fit']
+# By default, delays of up to DEFAULT_MAX_DELAY_TIME_STEPS time steps
+# are considered, in steps of 1/DELAY_STEPS_PER_TIME_STEP of a time step
+DEFAULT_MAX_DELAY_TIME_STEPS = 2
+DELAY_STEPS_PER_TIME_STEP = 4
+# Name of the extra parameter of the fit delay mode
+DELAY_PARAMETER = 'delay'
+# If False, model functions are always evaluated in full during curve
+# fitting; for example, to measure the benefit of partial evaluation.
+USE_PARTIAL_EVALUATION = True
+# Sampling of the starting points of CurveFitMultiStart, by a scrambled
+# Sobol sequence or a Latin hypercube
+SAMPLING_METHODS = ['sobol', 'lhs']
+DEFAULT_NUMBER_OF_STARTS = 32
+DEFAULT_NUMBER_OF_REFINEMENTS = 4
+# Parameters whose search range spans at least this ratio are sampled
+# uniformly in the logarithm of their value
+LOG_SAMPLING_RATIO = 100.0
+# Parameters without bounds are searched from their initial value
+# divided by this factor to their initial value multiplied by it
+UNBOUNDED_SEARCH_FACTOR = 10.0
+
 def ModelSelector(functionName: str, 
                   moduleName: str,
                   inletType:str,
@@ -71,7 +119,7 @@ def ModelSelector(functionName: str,
         ------
         Returns a list of MR signals calculated using the selected model at the times in the array time.
         """
-    logger.info("In ModelFunctionsHelper.ModelSelector. Called with model {} and parameters {}".format(functionName, parameterArray))
+    logger.debug("In ModelFunctionsHelper.ModelSelector. Called with model %s and parameters %s", functionName, parameterArray)
     try:
         if inletType == 'single':
             timeInputConcs2DArray = np.column_stack((times, AIFConcentration))
@@ -81,13 +129,129 @@ def ModelSelector(functionName: str,
         modelFunctions = importlib.import_module(moduleName, package=None)
         modelFunction=getattr(modelFunctions, functionName)
         
-        return modelFunction(timeInputConcs2DArray, *parameterArray, constantsString)
+        with Tracing.Span('ModelSelector', 'model', model=functionName):
+            return modelFunction(timeInputConcs2DArray, *parameterArray, constantsString)
 
     except Exception as e:
         logger.error('Error in ModelFunctionsHelper.ModelSelector: ' + str(e))
         print('ModelFunctionsHelper.ModelSelector: ' + str(e))  
 
 
+def GetNumberOfIterations(result) -> int:
+    """Returns the number of iterations made by the minimizer during
+    curve fitting. lmfit only reports the iterations (nit) of some 
+    methods. For its default method, leastsq, each iteration of 
+    MINPACK's Levenberg-Marquardt algorithm makes one function 
+    evaluation per varying parameter, to estimate the Jacobian by 
+    forward differences, and one for its trial step, so the number
+    of iterations is estimated from the number of function evaluations."""
+    numIterations = getattr(result, 'nit', None)
+    if numIterations is None:
+        numIterations = (result.nfev - 1)//(result.nvarys + 1)
+    return int(numIterations)
+
+
+def GetStagedModel(modelFunctions, functionName: str):
+    """Returns the StagedModel of the model function, functionName, 
+    declared in the STAGED_MODELS dictionary of the module, 
+    modelFunctions, or None."""
+    if not USE_PARTIAL_EVALUATION:
+        return None
+    return getattr(modelFunctions, 'STAGED_MODELS', {}).get(functionName)
+
+
+def MakePartialModelFunction(stagedModel, modelFunction, paramList, 
+                             timeInputConcs2DArray, constantsString):
+    """Returns a function, with the same arguments as modelFunction,
+    that evaluates the PartialModel of stagedModel specialised for the
+    data, timeInputConcs2DArray, the constants and the parameters fixed
+    in paramList, a list of lmfit parameter tuples. It may only be 
+    called with this data, constants and fixed parameter values, as
+    during a single fit."""
+    fixedValues = {name: value for name, value, vary, *_ in paramList if not vary}
+    objPartialModel = stagedModel.specialise(timeInputConcs2DArray,
+                                             constantsString, fixedValues)
+
+    def partialModelFunction(xData2DArray, constantsString, **parameterValues):
+        try:
+            return objPartialModel.evaluate(parameterValues)
+        except Exception as e:
+            print('ModelFunctionsHelper.partialModelFunction: ' + str(e))
+            logger.error('ModelFunctionsHelper.partialModelFunction: ' + str(e))
+
+    partialModelFunction.__signature__ = inspect.signature(modelFunction)
+    return partialModelFunction
+
+
+def FitModelFunction(modelFunction, functionName: str, paramList, 
+                     timeInputConcs2DArray, concROI, constantsString,
+                     stagedModel=None):
+    """This function fits the model function, modelFunction, to the
+    ROI MR signal data, concROI, using lmfit. It is called by CurveFit 
+    and CurveFitWithDelay, which handle its exceptions.
+
+    Input Parameters
+    ----------------
+        modelFunction - Function taking the arguments xData2DArray, the
+            model parameters and constantsString, as the functions in
+            ModelFunctions.py.
+
+        functionName - The name of the model function, for tracing.
+
+        timeInputConcs2DArray - Time and input function 1D arrays 
+            stacked into one 2D array.
+
+        paramList, concROI, constantsString - See CurveFit.
+
+        stagedModel - Optional StagedModel of modelFunction, see 
+            GetStagedModel. If supplied, the model is partially 
+            evaluated for the parameters fixed in paramList.
+
+        Returns
+        ------
+        See CurveFit.
+    """
+    if stagedModel is not None:
+        modelFunction = MakePartialModelFunction(stagedModel, modelFunction,
+            paramList, timeInputConcs2DArray, constantsString)
+    if Tracing.IsTracingEnabled():
+        # Record a span for each evaluation of the model
+        modelFunction = Tracing.Traced(functionName, 'model')(modelFunction)
+
+    params = Parameters()
+    params.add_many(*paramList)
+    #Uncomment the statement below to check parameters 
+    #loaded ok into the Parameter object
+    #print(params.pretty_print())
+
+    objModel = Model(modelFunction, \
+        independent_vars=['xData2DArray', 'constantsString'])
+    #print(objModel.param_names, objModel.independent_vars)
+
+    with Tracing.Span('CurveFit', 'fit', model=functionName):
+        startTime = time.perf_counter()
+        startCPUTime = time.process_time()
+        result = objModel.fit(data=concROI, 
+                              params=params, 
+                              xData2DArray=timeInputConcs2DArray, 
+                              constantsString=constantsString)
+        fitTime = time.perf_counter() - startTime
+        fitCPUTime = time.process_time() - startCPUTime
+
+        fitStatistics = {'nfev': result.nfev, 
+                         'iterations': GetNumberOfIterations(result),
+                         'chisqr': result.chisqr,
+                         'fitTime': fitTime,
+                         'fitCPUTime': fitCPUTime,
+                         'success': result.success,
+                         'message': result.message}
+        Tracing.SetSpanArguments(nfev=result.nfev, 
+                                 iterations=fitStatistics['iterations'],
+                                 success=result.success)
+       
+    return result.best_values, result.covar, fitStatistics
+
+
 def CurveFit(functionName: str, 
              moduleName: str,
              paramList, 
@@ -139,11 +303,15 @@ def CurveFit(functionName: str,
                 that achieve the best curve fit.
         result.covar - The estimated covariance of the values in optimumParams.
             Used to calculate 95% confidence limits.
+        fitStatistics - A dictionary of statistics describing the fit;
+            namely, the number of function evaluations (nfev), 
+            the number of iterations (iterations), the sum of squared
+            residuals of the fit (chisqr), the fit wall clock and
+            CPU times in seconds (fitTime and fitCPUTime), whether lmfit 
+            reported success (success) and lmfit's message (message).
     """
     try:
-        logger.info(
-            'Function ModelFunctionsHelper.CurveFit called with function name={} & parameters = {}'
-            .format(functionName, paramList) )
+        logger.debug('Function ModelFunctionsHelper.CurveFit called with function name=%s & parameters = %s', functionName, paramList)
         
         if inletType == 'dual':
             timeInputConcs2DArray = np.column_stack((times, AIFConcs, VIFConcs))
@@ -152,23 +320,9 @@ def CurveFit(functionName: str,
 
         modelFunctions = importlib.import_module(moduleName, package=None)
         modelFunction=getattr(modelFunctions, functionName)
-
-        params = Parameters()
-        params.add_many(*paramList)
-        #Uncomment the statement below to check parameters 
-        #loaded ok into the Parameter object
-        #print(params.pretty_print())
-
-        objModel = Model(modelFunction, \
-            independent_vars=['xData2DArray', 'constantsString'])
-        #print(objModel.param_names, objModel.independent_vars)
-
-        result = objModel.fit(data=concROI, 
-                              params=params, 
-                              xData2DArray=timeInputConcs2DArray, 
-                              constantsString=constantsString)
-       
-        return result.best_values, result.covar
+        return FitModelFunction(modelFunction, functionName, paramList,
+                                timeInputConcs2DArray, concROI, constantsString,
+                                GetStagedModel(modelFunctions, functionName))
             
     except ValueError as ve:
         print ('ModelFunctionsHelper.CurveFit Value Error: ' + str(ve))
@@ -177,6 +331,527 @@ def CurveFit(functionName: str,
     except Exception as e:
         print('Error in ModelFunctionsHelper.CurveFit: ' + str(e))   
 
+def GetCandidateDelays(times, maxDelay=None):
+    """Returns the array of candidate delays, from 0 to maxDelay 
+    in the units of times. By default, maxDelay is 
+    DEFAULT_MAX_DELAY_TIME_STEPS times the median time step."""
+    timeStep = float(np.median(np.diff(times)))
+    if maxDelay is None:
+        maxDelay = DEFAULT_MAX_DELAY_TIME_STEPS*timeStep
+    numDelays = int(round(maxDelay/timeStep*DELAY_STEPS_PER_TIME_STEP)) + 1
+    return np.linspace(0.0, maxDelay, max(numDelays, 1))
+
+
+class DelayedInputBank:
+    def __init__(self, times, AIFConcs, VIFConcs, inletType, delays):
+        """Creates an instance of the DelayedInputBank class holding 
+        the AIF and, for dual inlet models, VIF delayed by each of the 
+        candidate delays. It is built once per data file, so the 
+        input curves are not interpolated in time again for each 
+        delay tried during curve fitting.
+
+        Input Parameters
+        ----------------
+        times - NumPy Array of time values.
+        AIFConcs, VIFConcs - NumPy Arrays of the MR signals of the
+            Arterial and Venous Input Functions. VIFConcs is only
+            used if inletType is 'dual'.
+        inletType - 'single' or 'dual'.
+        delays - Increasing 1D array of candidate delays in the units 
+            of times.
+        """
+        self.times = np.asarray(times, dtype=np.float64)
+        self.delays = np.atleast_1d(np.asarray(delays, dtype=np.float64))
+        self.inletType = inletType
+        self.AIFBank = tools.shift_curves(self.times, AIFConcs, self.delays)
+        if inletType == 'dual':
+            self.VIFBank = tools.shift_curves(self.times, VIFConcs, self.delays)
+        else:
+            self.VIFBank = None
+
+
+    def estimateDelay(self, concROI) -> float:
+        """Returns the candidate delay at which the upslope of the AIF 
+        best correlates with that of the ROI curve, concROI."""
+        return float(self.delays[tools.estimate_delay_index(self.AIFBank, concROI)])
+
+
+    def getInputs(self, delay):
+        """Returns the time and input function 1D arrays, delayed by
+        delay, stacked into one 2D array as expected by the model 
+        functions. Between two candidate delays, the delayed curves
+        of the bank are linearly interpolated."""
+        position = np.interp(delay, self.delays, np.arange(len(self.delays)))
+        index = min(int(position), len(self.delays) - 2) if len(self.delays) > 1 else 0
+        weight = position - index
+        columns = [self.times]
+        for bank in (self.AIFBank, self.VIFBank):
+            if bank is not None:
+                columns.append(bank[index] if weight == 0 else
+                               (1 - weight)*bank[index] + weight*bank[index + 1])
+        return np.column_stack(columns)
+
+
+    def makeDelayedModelFunction(self, modelFunction):
+        """Returns a function taking the same arguments as modelFunction,
+        a function in ModelFunctions.py, and the extra parameter delay,
+        that evaluates modelFunction with the input functions delayed by
+        delay, so that lmfit fits the delay with the model parameters."""
+        def delayedModelFunction(xData2DArray, delay=0.0, **arguments):
+            return modelFunction(self.getInputs(delay), **arguments)
+
+        signature = inspect.signature(modelFunction)
+        parameters = [parameter for parameter in signature.parameters.values()
+                      if parameter.name != 'constantsString']
+        parameters.append(inspect.Parameter(DELAY_PARAMETER,
+                          inspect.Parameter.POSITIONAL_OR_KEYWORD))
+        parameters.append(signature.parameters['constantsString'])
+        delayedModelFunction.__signature__ = signature.replace(parameters=parameters)
+        return delayedModelFunction
+
+
+def CurveFitWithDelay(functionName: str, 
+                      moduleName: str,
+                      paramList, 
+                      times,
+                      AIFConcs, 
+                      VIFConcs, 
+                      concROI, 
+                      inletType, 
+                      constantsString,
+                      delayMode='fit',
+                      delays=None):
+    """This function fits a model, as the function CurveFit, allowing 
+    for a delay between the arrival of the bolus in the input 
+    functions and in the ROI.  The input functions are delayed by
+    each candidate delay once, in a DelayedInputBank, and the delay
+    is found according to delayMode:
+        'none' - No delay, as CurveFit.
+        'xcorr' - The candidate delay at which the upslopes of the AIF
+            and ROI curves are best correlated is chosen before the 
+            model is fitted. The correlations of all the candidate 
+            delays are calculated in one matrix-vector product.
+        'fit' - The delay is fitted with the model parameters, as an
+            extra parameter bounded by the candidate delays and starting
+            from the xcorr estimate. At each evaluation of the model, 
+            the delayed input functions are interpolated between the
+            two nearest delayed curves of the bank.
+    Either way, the model is fitted once, not once per candidate delay.
+
+    Input Parameters
+    ----------------
+        functionName, moduleName, paramList, times, AIFConcs, VIFConcs, 
+        concROI, inletType, constantsString - See CurveFit.
+
+        delayMode - One of DELAY_MODES.
+
+        delays - Optional increasing 1D array of candidate delays in 
+            the units of times. By default, those returned by 
+            GetCandidateDelays.
+
+        Returns
+        ------
+        The optimum parameter values, their covariance and the fit 
+        statistics returned by CurveFit. The fit statistics also hold 
+        the delay (delay) and, in the fit mode, its standard error 
+        (delayError), if it could be estimated.  The delay is not 
+        included in the optimum parameter values and covariance.
+        None if curve fitting failed.
+    """
+    try:
+        logger.debug('Function ModelFunctionsHelper.CurveFitWithDelay called with '
+                     'function name=%s & delay mode=%s', functionName, delayMode)
+        if delayMode not in DELAY_MODES:
+            raise ValueError('Unknown delay mode ' + str(delayMode))
+        if delayMode == 'none':
+            fitResult = CurveFit(functionName, moduleName, paramList, times,
+                AIFConcs, VIFConcs, concROI, inletType, constantsString)
+            if fitResult is not None:
+                fitResult[2]['delay'] = 0.0
+            return fitResult
+
+        if delays is None:
+            delays = GetCandidateDelays(times)
+        objInputBank = DelayedInputBank(times, AIFConcs, VIFConcs, inletType, delays)
+        delay = objInputBank.estimateDelay(concROI)
+        modelFunctions = importlib.import_module(moduleName, package=None)
+        modelFunction = getattr(modelFunctions, functionName)
+
+        if delayMode == 'xcorr':
+            optimumParamsDict, covarianceMatrix, fitStatistics = FitModelFunction(
+                modelFunction, functionName, paramList, objInputBank.getInputs(delay),
+                concROI, constantsString, GetStagedModel(modelFunctions, functionName))
+            fitStatistics['delay'] = delay
+            return optimumParamsDict, covarianceMatrix, fitStatistics
+
+        delayParamList = list(paramList) + [(DELAY_PARAMETER, delay, True, 
+            float(objInputBank.delays[0]), float(objInputBank.delays[-1]), None, None)]
+        optimumParamsDict, covarianceMatrix, fitStatistics = FitModelFunction(
+            objInputBank.makeDelayedModelFunction(modelFunction), functionName, 
+            delayParamList, objInputBank.getInputs(0.0), concROI, constantsString)
+        fitStatistics['delay'] = float(optimumParamsDict.pop(DELAY_PARAMETER))
+        if covarianceMatrix is not None:
+            # The delay is the last parameter allowed to vary
+            fitStatistics['delayError'] = float(np.sqrt(covarianceMatrix[-1, -1]))
+            covarianceMatrix = covarianceMatrix[:-1, :-1]
+        return optimumParamsDict, covarianceMatrix, fitStatistics
+
+    except ValueError as ve:
+        print ('ModelFunctionsHelper.CurveFitWithDelay Value Error: ' + str(ve))
+        logger.error('ModelFunctionsHelper.CurveFitWithDelay Value Error: ' + str(ve))
+    except Exception as e:
+        print('Error in ModelFunctionsHelper.CurveFitWithDelay: ' + str(e))
+        logger.error('Error in ModelFunctionsHelper.CurveFitWithDelay: ' + str(e))
+
+
+def GetSearchBounds(paramList, bounds=None):
+    """Returns the list of the (lower, upper) limits within which the
+    starting points of each parameter in paramList, a list of lmfit
+    parameter tuples, are sampled: its limits in the optional dictionary
+    of parameter name:(lower, upper) pairs, bounds, else its lmfit 
+    bounds, else UNBOUNDED_SEARCH_FACTOR either side of its initial value."""
+    searchBounds = []
+    for name, value, vary, lower, upper, *_ in paramList:
+        lower, upper = (bounds or {}).get(name, (lower, upper))
+        if value > 0:
+            defaultLower, defaultUpper = value/UNBOUNDED_SEARCH_FACTOR, value*UNBOUNDED_SEARCH_FACTOR
+        elif value < 0:
+            defaultLower, defaultUpper = value*UNBOUNDED_SEARCH_FACTOR, value/UNBOUNDED_SEARCH_FACTOR
+        else:
+            defaultLower, defaultUpper = 0.0, 1.0
+        if lower is None or not np.isfinite(lower):
+            lower = defaultLower
+        if upper is None or not np.isfinite(upper):
+            upper = defaultUpper
+        searchBounds.append((float(lower), float(upper)))
+    return searchBounds
+
+
+def _ScaleToSearchBounds(paramList, unitPoints, bounds=None):
+    """Returns a 2D array of points, one per row, with a column for each 
+    parameter in paramList, a list of lmfit parameter tuples. The values
+    of the parameters allowed to vary are mapped from the columns of
+    unitPoints, in [0, 1], to the limits returned by GetSearchBounds, 
+    logarithmically if they span LOG_SAMPLING_RATIO. The fixed 
+    parameters keep their value."""
+    points = np.tile(np.array([param[1] for param in paramList], 
+                              dtype=np.float64), (len(unitPoints), 1))
+    varying = [index for index, param in enumerate(paramList) if param[2]]
+    searchBounds = GetSearchBounds(paramList, bounds)
+    for column, index in enumerate(varying):
+        lower, upper = searchBounds[index]
+        if lower > 0 and upper >= lower*LOG_SAMPLING_RATIO:
+            points[:, index] = lower*(upper/lower)**unitPoints[:, column]
+        else:
+            points[:, index] = lower + (upper - lower)*unitPoints[:, column]
+    return points
+
+
+def SampleStartingPoints(paramList, numStarts, sampling='sobol', seed=None,
+                         bounds=None):
+    """Returns a 2D array of numStarts starting points, one per row, 
+    with a column for each parameter in paramList, a list of lmfit 
+    parameter tuples. The parameters allowed to vary are sampled within 
+    the limits returned by GetSearchBounds, using the sampling method, 
+    one of SAMPLING_METHODS, with the random seed, seed. The fixed 
+    parameters keep their value."""
+    if sampling not in SAMPLING_METHODS:
+        raise ValueError('Unknown sampling method ' + str(sampling))
+    numVarying = sum(1 for param in paramList if param[2])
+    if not numVarying or numStarts < 1:
+        return _ScaleToSearchBounds(paramList, np.zeros((max(numStarts, 0), 0)))
+
+    if sampling == 'sobol':
+        # Sobol points are balanced in blocks of a power of 2
+        objSampler = qmc.Sobol(d=numVarying, scramble=True, seed=seed)
+        unitPoints = objSampler.random_base2(int(np.ceil(np.log2(numStarts))))[:numStarts]
+    else:
+        objSampler = qmc.LatinHypercube(d=numVarying, seed=seed)
+        unitPoints = objSampler.random(numStarts)
+    return _ScaleToSearchBounds(paramList, unitPoints, bounds)
+
+
+def MakeParameterGrid(paramList, pointsPerParameter, bounds=None):
+    """Returns a 2D array of the points of a regular grid, one per row,
+    with a column for each parameter in paramList, a list of lmfit 
+    parameter tuples. Each parameter allowed to vary takes 
+    pointsPerParameter values, at the centres of equal intervals of
+    its limits returned by GetSearchBounds, or of their logarithm.
+    The fixed parameters keep their value."""
+    numVarying = sum(1 for param in paramList if param[2])
+    unitValues = (np.arange(pointsPerParameter) + 0.5)/pointsPerParameter
+    unitPoints = np.stack([axis.ravel() for axis in np.meshgrid(
+        *[unitValues]*numVarying, indexing='ij')], axis=-1) \
+        if numVarying else np.zeros((1, 0))
+    return _ScaleToSearchBounds(paramList, unitPoints, bounds)
+
+
+def EvaluateModelBatch(modelFunction, stagedModel, paramList, parameterPoints,
+                       timeInputConcs2DArray, constantsString):
+    """Returns a 2D array of the MR signals predicted by the model at each
+    point, a row of parameterPoints in the order of paramList, one row per
+    point. A row is NaN where the model could not be evaluated. 
+    If stagedModel, the StagedModel of modelFunction or None, can be
+    evaluated in batch, the model is evaluated at every point in one 
+    call; otherwise, at one point at a time."""
+    names = [param[0] for param in paramList]
+    with np.errstate(all='ignore'):
+        if stagedModel is not None:
+            fixedValues = {name: value for name, value, vary, *_ in paramList if not vary}
+            objPartialModel = stagedModel.specialise(timeInputConcs2DArray,
+                                                     constantsString, fixedValues)
+            if objPartialModel.canEvaluateBatch() and len(fixedValues) < len(names):
+                return np.array(objPartialModel.evaluateBatch(
+                    {name: parameterPoints[:, index] for index, name in enumerate(names)
+                     if name not in fixedValues}), dtype=np.float64)
+
+        curves = np.full((len(parameterPoints), len(timeInputConcs2DArray)), np.nan)
+        for index, parameterPoint in enumerate(parameterPoints):
+            try:
+                curves[index] = modelFunction(timeInputConcs2DArray, 
+                                              constantsString=constantsString,
+                                              **dict(zip(names, parameterPoint)))
+            except Exception:
+                # The model function failed at this point
+                continue
+    return curves
+
+
+def ScreenStartingPoints(modelFunction, stagedModel, paramList, startingPoints,
+                         timeInputConcs2DArray, concROI, constantsString):
+    """Returns the 1D array of the sums of squared residuals between
+    the ROI MR signal data, concROI, and the model evaluated at each 
+    starting point, a row of startingPoints in the order of paramList,
+    see EvaluateModelBatch. The sum is infinite where the model could
+    not be evaluated."""
+    curves = EvaluateModelBatch(modelFunction, stagedModel, paramList, 
+        startingPoints, timeInputConcs2DArray, constantsString)
+    with np.errstate(all='ignore'):
+        sumsOfSquares = np.sum((curves - np.asarray(concROI, dtype=np.float64))**2, axis=1)
+    return np.where(np.isfinite(sumsOfSquares), sumsOfSquares, np.inf)
+
+
+def GetAtlasInitialValues(functionName: str, 
+                          moduleName: str,
+                          paramList, 
+                          times,
+                          AIFConcs, 
+                          VIFConcs, 
+                          concROI, 
+                          inletType, 
+                          constantsString,
+                          bounds=None,
+                          pointsPerParameter=CurveAtlas.DEFAULT_POINTS_PER_PARAMETER):
+    """Returns a copy of paramList in which the initial values of the
+    parameters allowed to vary are those of the curve of the CurveAtlas
+    of the model nearest to the ROI MR signal data, concROI, unless the
+    initial values in paramList already predict a nearer curve. 
+
+    The atlas holds the curves predicted at the points of the grid 
+    returned by MakeParameterGrid, calculated in one batched evaluation
+    of the model. It is built on first use and reused for every data 
+    file with the same times, input functions, constants and fixed
+    parameters, see CurveAtlas.GetCurveAtlas.
+
+    Input Parameters
+    ----------------
+        functionName, moduleName, paramList, times, AIFConcs, VIFConcs, 
+        concROI, inletType, constantsString - See CurveFit.
+
+        bounds - See GetSearchBounds.
+
+        pointsPerParameter - Number of grid points per parameter 
+            allowed to vary.
+
+        Returns
+        ------
+        The list of lmfit parameter tuples, or paramList if no parameter
+        varies or the atlas could not be built.
+    """
+    try:
+        if not any(param[2] for param in paramList):
+            return paramList
+        if inletType == 'dual':
+            timeInputConcs2DArray = np.column_stack((times, AIFConcs, VIFConcs))
+        else:
+            timeInputConcs2DArray = np.column_stack((times, AIFConcs))
+        timeInputConcs2DArray = np.ascontiguousarray(timeInputConcs2DArray, dtype=np.float64)
+        modelFunctions = importlib.import_module(moduleName, package=None)
+        modelFunction = getattr(modelFunctions, functionName)
+        stagedModel = GetStagedModel(modelFunctions, functionName)
+
+        def BuildAtlas():
+            parameterPoints = MakeParameterGrid(paramList, pointsPerParameter, bounds)
+            with Tracing.Span('BuildCurveAtlas', 'fit', model=functionName,
+                              numberOfCurves=len(parameterPoints)):
+                curves = EvaluateModelBatch(modelFunction, stagedModel, paramList,
+                    parameterPoints, timeInputConcs2DArray, constantsString)
+                return CurveAtlas.CurveAtlas([param[0] for param in paramList],
+                                             parameterPoints, curves)
+
+        key = (moduleName, functionName, timeInputConcs2DArray.shape, 
+               timeInputConcs2DArray.tobytes(), constantsString,
+               tuple((param[0], param[2], None if param[2] else float(param[1])) 
+                     for param in paramList),
+               tuple(GetSearchBounds(paramList, bounds)), pointsPerParameter)
+        objCurveAtlas = CurveAtlas.GetCurveAtlas(key, BuildAtlas)
+        atlasValues, atlasSumOfSquares = objCurveAtlas.findNearest(concROI)
+        initialSumOfSquares = ScreenStartingPoints(modelFunction, stagedModel, 
+            paramList, np.array([[param[1] for param in paramList]], dtype=np.float64),
+            timeInputConcs2DArray, concROI, constantsString)[0]
+        logger.debug('ModelFunctionsHelper.GetAtlasInitialValues - atlas values %s, '
+                     'sum of squares %s, initial values %s', atlasValues, 
+                     atlasSumOfSquares, initialSumOfSquares)
+        if initialSumOfSquares <= atlasSumOfSquares:
+            return paramList
+        return [(param[0], atlasValues[param[0]]) + tuple(param[2:]) if param[2] 
+                else param for param in paramList]
+
+    except Exception as e:
+        print('Error in ModelFunctionsHelper.GetAtlasInitialValues: ' + str(e))
+        logger.error('Error in ModelFunctionsHelper.GetAtlasInitialValues: ' + str(e))
+        return paramList
+
+
+def CurveFitMultiStart(functionName: str, 
+                       moduleName: str,
+                       paramList, 
+                       times,
+                       AIFConcs, 
+                       VIFConcs, 
+                       concROI, 
+                       inletType, 
+                       constantsString,
+                       numStarts=DEFAULT_NUMBER_OF_STARTS,
+                       numRefinements=DEFAULT_NUMBER_OF_REFINEMENTS,
+                       sampling='sobol',
+                       seed=None,
+                       bounds=None,
+                       executor=None,
+                       delayMode='none',
+                       delays=None):
+    """This function fits a model, as the function CurveFit, from 
+    many starting points, to escape the poor local minimum that may
+    be reached from the initial parameter values in paramList:
+        1. numStarts starting points are sampled within the search 
+           limits of the parameters allowed to vary, see 
+           SampleStartingPoints.
+        2. The model is evaluated at all the starting points, in one
+           batched evaluation if the model function has a staged
+           definition, see ScreenStartingPoints.
+        3. The numRefinements best starting points, and the initial
+           values, are refined by CurveFit, in parallel if executor 
+           is supplied.
+    The fit with the smallest sum of squared residuals is returned. 
+    As most starting points are only screened, the time taken grows
+    much more slowly than numStarts.
+
+    Input Parameters
+    ----------------
+        functionName, moduleName, paramList, times, AIFConcs, VIFConcs, 
+        concROI, inletType, constantsString - See CurveFit.
+
+        numStarts - Number of starting points screened.
+
+        numRefinements - Number of the best starting points refined.
+
+        sampling, seed, bounds - See SampleStartingPoints.
+
+        executor - Optional concurrent.futures executor, such as a pool
+            of worker processes, on which the refinements are run.
+
+        delayMode, delays - See CurveFitWithDelay. The starting points 
+            are screened with the input functions delayed by the delay 
+            estimated by cross-correlation.
+
+        Returns
+        ------
+        The optimum parameter values, their covariance and the fit 
+        statistics of the best fit, as CurveFit. The numbers of function
+        evaluations and iterations are summed over the refinements and 
+        the fit wall clock and CPU times, of this process, are those of
+        the whole search. The
+        fit statistics also hold the number of starting points screened
+        (numberOfStarts) and refined (numberOfRefinements) and the 
+        time taken by the screening (screenTime).
+        None if curve fitting failed.
+    """
+    try:
+        logger.debug('Function ModelFunctionsHelper.CurveFitMultiStart called with '
+                     'function name=%s & %s starting points', functionName, numStarts)
+        if delayMode not in DELAY_MODES:
+            raise ValueError('Unknown delay mode ' + str(delayMode))
+        if delayMode == 'none':
+            fitFunction, extraArguments = CurveFit, ()
+        else:
+            if delays is None:
+                delays = GetCandidateDelays(times)
+            fitFunction, extraArguments = CurveFitWithDelay, (delayMode, delays)
+        startTime = time.perf_counter()
+        startCPUTime = time.process_time()
+
+        with Tracing.Span('ScreenStartingPoints', 'fit', model=functionName,
+                          numberOfStarts=numStarts):
+            if delayMode == 'none':
+                if inletType == 'dual':
+                    timeInputConcs2DArray = np.column_stack((times, AIFConcs, VIFConcs))
+                else:
+                    timeInputConcs2DArray = np.column_stack((times, AIFConcs))
+            else:
+                objInputBank = DelayedInputBank(times, AIFConcs, VIFConcs, inletType, delays)
+                timeInputConcs2DArray = objInputBank.getInputs(
+                    objInputBank.estimateDelay(concROI))
+            modelFunctions = importlib.import_module(moduleName, package=None)
+            startingPoints = SampleStartingPoints(paramList, numStarts, sampling, 
+                                                  seed, bounds)
+            sumsOfSquares = ScreenStartingPoints(getattr(modelFunctions, functionName),
+                GetStagedModel(modelFunctions, functionName), paramList, 
+                startingPoints, timeInputConcs2DArray, concROI, constantsString)
+        screenTime = time.perf_counter() - startTime
+
+        # The initial values are always refined, so that the fit is
+        # never worse than that of CurveFit
+        bestStartingPoints = startingPoints[np.argsort(sumsOfSquares, kind='stable')]
+        bestStartingPoints = bestStartingPoints[:min(numRefinements, 
+                                                     np.isfinite(sumsOfSquares).sum())]
+        candidateParamLists = [list(paramList)] + [
+            [(param[0], float(value)) + tuple(param[2:]) 
+             for param, value in zip(paramList, startingPoint)]
+            for startingPoint in bestStartingPoints]
+        arguments = [(functionName, moduleName, candidateParamList, times, AIFConcs, 
+                      VIFConcs, concROI, inletType, constantsString) + extraArguments
+                     for candidateParamList in candidateParamLists]
+        if executor is not None:
+            futures = [executor.submit(fitFunction, *fitArguments) 
+                       for fitArguments in arguments]
+            fitResults = [future.result() for future in futures]
+        else:
+            fitResults = [fitFunction(*fitArguments) for fitArguments in arguments]
+        fitResults = [fitResult for fitResult in fitResults if fitResult is not None]
+        if not fitResults:
+            return None
+
+        optimumParamsDict, covarianceMatrix, fitStatistics = min(fitResults,
+            key=lambda fitResult: fitResult[2]['chisqr'] 
+                if np.isfinite(fitResult[2]['chisqr']) else np.inf)
+        fitStatistics = dict(fitStatistics)
+        for key in ('nfev', 'iterations'):
+            fitStatistics[key] = sum(fitResult[2][key] for fitResult in fitResults)
+        fitStatistics['fitTime'] = time.perf_counter() - startTime
+        fitStatistics['fitCPUTime'] = time.process_time() - startCPUTime
+        fitStatistics['screenTime'] = screenTime
+        fitStatistics['numberOfStarts'] = numStarts
+        fitStatistics['numberOfRefinements'] = len(fitResults)
+        return optimumParamsDict, covarianceMatrix, fitStatistics
+
+    except ValueError as ve:
+        print ('ModelFunctionsHelper.CurveFitMultiStart Value Error: ' + str(ve))
+        logger.error('ModelFunctionsHelper.CurveFitMultiStart Value Error: ' + str(ve))
+    except Exception as e:
+        print('Error in ModelFunctionsHelper.CurveFitMultiStart: ' + str(e))
+        logger.error('Error in ModelFunctionsHelper.CurveFitMultiStart: ' + str(e))
+
+
 #def CurveFit_SciPy(functionName: str, times, AIFConcs, VIFConcs, concROI, 
 #             paramArray, inletType):
 #    """This function calls the curve_fit function imported from scipy.optimize 
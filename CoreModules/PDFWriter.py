@@ -4,14 +4,27 @@ In addition to a table of model parameter data, this report
 contains an image of the concentration/time plot 
 at the time the CreateAndSavePDFReport method was called.
 
+The CohortReport class gathers the reports of all the data files
+of a batch in a single PDF file, one page per data file, followed
+by an index page linking to each of them.
+
 This is done using the functionality in the FPDF library.
 """
 import datetime
+import io
+import os
+import tempfile
+import fpdf
 from fpdf import FPDF
 import logging
+import Tracing
 
 logger = logging.getLogger(__name__)
 
+# Version 1 of FPDF can only read images from a file, 
+# whereas its successor, fpdf2, can also read them from memory.
+FPDF_READS_IMAGES_FROM_MEMORY = not fpdf.__version__.startswith('1.')
+
 # header and footer methods in FPDF render the page header and footer.
 # They are automatically called by add_page and close 
 #  should not be directly by the application.  
@@ -52,7 +65,80 @@ class PDF(FPDF):
         currentDateTime = str(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         self.cell(0, 10, currentDateTime, 0, 0, 'R')
 
-    def CreateAndSavePDFReport(self, fileName, dataFileName, modelName, imageName, 
+    def AddPlotImage(self, image, w, h):
+        """Adds an image of the time/concentration plot to the 
+        current page at the current position.
+
+        Input Parameters
+        ----------------
+        image - Either the name of a PNG file or the contents
+            of a PNG file held in memory as bytes.
+        w, h - Width and height of the image on the page.
+        """
+        if not isinstance(image, (bytes, bytearray)):
+            self.image(image, x = None, y = None, w = w, h = h, type = '', link = '')
+        elif FPDF_READS_IMAGES_FROM_MEMORY:
+            self.image(io.BytesIO(image), x = None, y = None, w = w, h = h)
+        else:
+            # Version 1 of FPDF needs a file, so write the image to a 
+            # uniquely named temporary file so that concurrent reports 
+            # cannot overwrite each other's image.
+            fileDescriptor, tempFileName = tempfile.mkstemp(suffix='.png')
+            try:
+                with os.fdopen(fileDescriptor, 'wb') as tempFile:
+                    tempFile.write(image)
+                self.image(tempFileName, x = None, y = None, w = w, h = h, type = 'png', link = '')
+            finally:
+                os.remove(tempFileName)
+
+    def AddReportPage(self, dataFileName, modelName, image, parameterDictionary):
+        """Adds a page to the report holding the name of the model, 
+        the name of the data file, a table of the model input parameters 
+        and an image of the concentration/time plot. See the method
+        CreateAndSavePDFReport for a description of the input parameters.
+        """
+        self.add_page() #First Page in Portrait format, A4
+        self.set_font('Arial', 'BU', 12)
+        self.write(5, modelName + ' model.\n')
+        self.set_font('Arial', '', 10)
+        self.write(5, 'Data file name = ' + dataFileName + '\n\n')
+
+        # Effective page width, or just effectivePageWidth
+        effectivePageWidth = self.w - 2*self.l_margin
+        # Set column width to 1/7 of effective page width to distribute content 
+        # evenly across table and page
+        col_width = effectivePageWidth/6
+        # Text height is the same as current font size
+        textHeight = self.font_size
+        # Parameter Table - Header Row
+        self.cell(col_width*3,textHeight, 'Parameter', border=1)
+        self.cell(col_width,textHeight, 'Value', border=1)
+        self.cell(col_width*2,textHeight, '95% confidence interval', border=1)
+        self.ln(textHeight)
+
+        # Parameter Table - Rows of parameter data
+        for paramName, paramList in parameterDictionary.items():
+            # print('paramName = {}, value={}, lower={}, upper={}'.format(paramName, 
+            #        paramList[0], paramList[1], paramList[2]))
+            #Create a row in the table
+            self.cell(col_width*3,textHeight*2, paramName.replace('\n', ''), border=1)
+            self.cell(col_width,textHeight*2, str(paramList[0]), border=1)
+            
+            if paramList[1] == '' and paramList[2] == '':
+                confidenceStr = '(fixed)'
+            else:
+                confidenceStr = '[{}     {}]'.format(paramList[1], paramList[2])
+            
+            self.cell(col_width*2,textHeight*2, confidenceStr, border=1)
+            self.ln(textHeight*2)    
+
+        self.write(10, '\n') #line break
+
+        # Add an image of the plot to the report
+        self.AddPlotImage(image, w = 170, h = 130)
+
+    @Tracing.Traced('CreateAndSavePDFReport', 'write')
+    def CreateAndSavePDFReport(self, fileName, dataFileName, modelName, image, 
                                parameterDictionary):
         """Creates and saves a copy of a curve fitting report.
         It includes the name of the file containing the data 
@@ -68,8 +154,8 @@ class PDF(FPDF):
             containing the time/concentration data that 
             has been analysed.
         modelName - Name of the model used to curve fit the time/concentration data.
-        imageName - Name of the PNG file holding an image of the plot of time/concentration
-            data on the GUI.
+        image - Name of the PNG file holding an image of the plot of time/concentration
+            data or the contents of such a PNG file held in memory as bytes.
         parameterDictionary - A dictionary of parameter names (keys) linked to a 3 element list
             containing the parameter value, its lower 95% confidence limit and upper 95%
             confidence limit.
@@ -88,48 +174,10 @@ class PDF(FPDF):
         """
         try:
             logger.info('Function PDFWriter.CreateAndSavePDFReport called with filename={}, \
-            dataFileName={}, modelName={} & imageName={}.' \
-             .format(fileName, dataFileName, modelName, imageName))
+            dataFileName={} & modelName={}.' \
+             .format(fileName, dataFileName, modelName))
             
-            self.add_page() #First Page in Portrait format, A4
-            self.set_font('Arial', 'BU', 12)
-            self.write(5, modelName + ' model.\n')
-            self.set_font('Arial', '', 10)
-            self.write(5, 'Data file name = ' + dataFileName + '\n\n')
-
-            # Effective page width, or just effectivePageWidth
-            effectivePageWidth = self.w - 2*self.l_margin
-            # Set column width to 1/7 of effective page width to distribute content 
-            # evenly across table and page
-            col_width = effectivePageWidth/6
-            # Text height is the same as current font size
-            textHeight = self.font_size
-            # Parameter Table - Header Row
-            self.cell(col_width*3,textHeight, 'Parameter', border=1)
-            self.cell(col_width,textHeight, 'Value', border=1)
-            self.cell(col_width*2,textHeight, '95% confidence interval', border=1)
-            self.ln(textHeight)
-
-            # Parameter Table - Rows of parameter data
-            for paramName, paramList in parameterDictionary.items():
-                # print('paramName = {}, value={}, lower={}, upper={}'.format(paramName, 
-                #        paramList[0], paramList[1], paramList[2]))
-                #Create a row in the table
-                self.cell(col_width*3,textHeight*2, paramName.replace('\n', ''), border=1)
-                self.cell(col_width,textHeight*2, str(paramList[0]), border=1)
-                
-                if paramList[1] == '' and paramList[2] == '':
-                    confidenceStr = '(fixed)'
-                else:
-                    confidenceStr = '[{}     {}]'.format(paramList[1], paramList[2])
-                
-                self.cell(col_width*2,textHeight*2, confidenceStr, border=1)
-                self.ln(textHeight*2)    
-
-            self.write(10, '\n') #line break
-
-            # Add an image of the plot to the report
-            self.image(imageName, x = None, y = None, w = 170, h = 130, type = '', link = '') 
+            self.AddReportPage(dataFileName, modelName, image, parameterDictionary)
             # Save report PDF
             self.output(fileName, 'F')  
         except Exception as e:
@@ -137,3 +185,61 @@ class PDF(FPDF):
             logger.error('PDFWriter.CreateAndSavePDFReport: ' + str(e)) 
             self.output(fileName, 'F')  #Save PDF
 
+
+
+class CohortReport(PDF):
+    def __init__(self, title, logo):
+        """Creates a single PDF report for a cohort of data files.
+        The report of each data file is appended as a new page by 
+        the AddReport method as its results become available. 
+        As FPDF stores an image only once however many times it is 
+        placed, the logo and fonts are embedded once in the file."""
+        super().__init__(title, logo)
+        # List of (data file name, model name, page number, link) 
+        # tuples used to build the index
+        self.contents = []
+
+    def AddReport(self, dataFileName, modelName, image, parameterDictionary):
+        """Appends the report of a data file to the cohort report.
+        See the method CreateAndSavePDFReport for a description
+        of the input parameters."""
+        try:
+            # The report starts on the next page, and may run over
+            # several pages, so the index links to its first page
+            firstPageNumber = self.page_no() + 1
+            self.AddReportPage(dataFileName, modelName, image, parameterDictionary)
+            link = self.add_link()
+            self.set_link(link, y=0, page=firstPageNumber)
+            self.contents.append((dataFileName, modelName, firstPageNumber, link))
+        except Exception as e:
+            print('PDFWriter.CohortReport.AddReport: ' + str(e)) 
+            logger.error('PDFWriter.CohortReport.AddReport: ' + str(e)) 
+
+    def AddIndex(self):
+        """Adds, at the end of the report, an index of the data files 
+        with the number of the page holding their report. Each entry
+        is linked to that page."""
+        self.add_page()
+        self.set_font('Arial', 'BU', 12)
+        self.write(5, 'Index of {} data files.\n\n'.format(len(self.contents)))
+        self.set_font('Arial', '', 10)
+        effectivePageWidth = self.w - 2*self.l_margin
+        textHeight = self.font_size * 1.5
+        for dataFileName, modelName, pageNumber, link in self.contents:
+            self.cell(effectivePageWidth*0.6, textHeight, dataFileName, link=link)
+            self.cell(effectivePageWidth*0.3, textHeight, modelName, link=link)
+            self.cell(effectivePageWidth*0.1, textHeight, str(pageNumber), 
+                      align='R', link=link)
+            self.ln(textHeight)
+
+    @Tracing.Traced('SaveCohortReport', 'write')
+    def SaveReport(self, fileName):
+        """Adds the index and saves the cohort report in fileName."""
+        try:
+            logger.info('Function PDFWriter.CohortReport.SaveReport called with ' +
+                        'filename={} and {} reports.'.format(fileName, len(self.contents)))
+            self.AddIndex()
+            self.output(fileName, 'F')
+        except Exception as e:
+            print('PDFWriter.CohortReport.SaveReport: ' + str(e)) 
+            logger.error('PDFWriter.CohortReport.SaveReport: ' + str(e)) 
@@ -0,0 +1,187 @@
+"""
+This class module provides the partial evaluation of model functions,
+so that, during curve fitting, the intermediate quantities of a model
+that do not depend on the parameters allowed to vary are calculated
+once per fit instead of at every evaluation of the model.
+
+A model function in the model library may declare its intermediates
+in a StagedModel, added to the dictionary STAGED_MODELS of its module
+under the name of the model function:
+    - prepare(xData2DArray, constantsString) returns a dictionary of the
+      intermediates that only depend on the data and constants; for
+      example, the conversion of the AIF MR signals to concentrations.
+    - Each Stage calculates one intermediate from its inputs, the names
+      of parameters, of intermediates returned by prepare or of earlier
+      stages. The last stage calculates the MR signals predicted by the
+      model.
+From the inputs of the stages, the StagedModel works out the parameters
+on which each intermediate depends. For a fit in which some parameters
+are fixed, its specialise method returns a PartialModel, in which the
+intermediates depending only on fixed parameters have been calculated,
+that evaluates the remaining stages. See ModelFunctionsHelper.CurveFit.
+
+A Stage may also declare a batchFunction, which calculates the
+intermediate for many sets of parameter values at once, the values of
+each parameter being passed as a column array. If every remaining stage
+has one, the evaluateBatch method of the PartialModel evaluates the model
+for all the sets in one call, returning one row per set; for example,
+to screen the starting points of ModelFunctionsHelper.CurveFitMultiStart.
+
+Usage:
+    objStagedModel = StagedModel(['Ve', 'Kbh', 'Khe'], Prepare, [
+        Stage('Th', ['Ve', 'Kbh'], lambda Ve, Kbh: (1-Ve)/Kbh),
+        ...])
+    objPartialModel = objStagedModel.specialise(xData2DArray, constantsString,
+                                                {'Kbh': 0.1})
+    signal = objPartialModel.evaluate({'Ve': 0.2, 'Khe': 1.0})
+    signals = objPartialModel.evaluateBatch({'Ve': VeArray, 'Khe': KheArray})
+"""
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    def __init__(self, name, inputs, function, batchFunction=None):
+        """Creates an instance of the Stage class, the calculation of
+        the intermediate, name, of a StagedModel.
+
+        Input Parameters
+        ----------------
+        name - Name of the intermediate.
+        inputs - List of the names of the parameters and intermediates
+            passed, in order, to function.
+        function - Function returning the value of the intermediate.
+        batchFunction - Optional function taking the same inputs, with
+            each parameter a column array of K values, and returning the
+            K values of the intermediate, one row per value.
+        """
+        self.name = name
+        self.inputs = list(inputs)
+        self.function = function
+        self.batchFunction = batchFunction
+
+
+    def evaluate(self, values):
+        """Returns the value of the intermediate calculated from the
+        dictionary of name:value pairs, values."""
+        return self.function(*[values[inputName] for inputName in self.inputs])
+
+
+    def evaluateBatch(self, values):
+        """Returns the values of the intermediate calculated by
+        batchFunction from the dictionary of name:value pairs, values."""
+        return self.batchFunction(*[values[inputName] for inputName in self.inputs])
+
+
+class StagedModel:
+    def __init__(self, parameterNames, prepare, stages):
+        """Creates an instance of the StagedModel class describing how
+        a model function calculates its intermediates.
+
+        Input Parameters
+        ----------------
+        parameterNames - List of the names of the model parameters, as
+            in the model function.
+        prepare - Function of xData2DArray and constantsString returning
+            a dictionary of the intermediates that do not depend on any
+            parameter.
+        stages - List of Stage objects in the order of their calculation.
+            The last stage returns the output of the model function.
+        """
+        self.parameterNames = list(parameterNames)
+        self.prepare = prepare
+        self.stages = list(stages)
+        # Parameters on which each stage depends,
+        # directly or through earlier stages
+        self.dependencies = {}
+        for stage in self.stages:
+            dependencies = set()
+            for inputName in stage.inputs:
+                if inputName in self.parameterNames:
+                    dependencies.add(inputName)
+                else:
+                    dependencies.update(self.dependencies.get(inputName, ()))
+            self.dependencies[stage.name] = frozenset(dependencies)
+
+
+    def evaluate(self, xData2DArray, parameterValues, constantsString):
+        """Evaluates every stage of the model for the dictionary of
+        parameter name:value pairs, parameterValues, and returns the
+        output of the model function."""
+        return self.specialise(xData2DArray, constantsString, {}).evaluate(
+            parameterValues)
+
+
+    def specialise(self, xData2DArray, constantsString, fixedValues):
+        """Returns a PartialModel evaluating the model for the data,
+        xData2DArray, and constants, constantsString, with the parameters
+        in the dictionary of name:value pairs, fixedValues, fixed.
+        The intermediates depending only on the data, constants and
+        fixed parameters are calculated here, once."""
+        values = dict(self.prepare(xData2DArray, constantsString))
+        values.update(fixedValues)
+        fixedNames = set(fixedValues)
+        remainingStages = []
+        for stage in self.stages:
+            if not self.dependencies[stage.name] <= fixedNames:
+                remainingStages.append(stage)
+            else:
+                values[stage.name] = stage.evaluate(values)
+        logger.debug('StagedModel.specialise - %s of %s stages precomputed',
+                     len(self.stages) - len(remainingStages), len(self.stages))
+        return PartialModel(values, remainingStages, self.stages[-1].name)
+
+
+class PartialModel:
+    def __init__(self, precomputedValues, stages, outputName):
+        """Creates an instance of the PartialModel class, returned by
+        StagedModel.specialise, that evaluates the stages of a model
+        not calculated in advance.
+
+        Input Parameters
+        ----------------
+        precomputedValues - Dictionary of the values of the fixed
+            parameters and of the intermediates calculated in advance.
+        stages - List of the Stage objects still to be evaluated.
+        outputName - Name of the intermediate returned by the model.
+        """
+        self.precomputedValues = precomputedValues
+        self.stages = stages
+        self.outputName = outputName
+
+
+    def evaluate(self, parameterValues):
+        """Returns the output of the model for the dictionary of
+        parameter name:value pairs, parameterValues, which must hold
+        the parameters that are not fixed. The values of the fixed
+        parameters, if supplied, are ignored."""
+        if not self.stages:
+            return self.precomputedValues[self.outputName]
+        values = dict(parameterValues)
+        values.update(self.precomputedValues)
+        for stage in self.stages:
+            values[stage.name] = stage.evaluate(values)
+        return values[self.outputName]
+
+
+    def canEvaluateBatch(self):
+        """Returns True if every stage still to be evaluated has a
+        batchFunction, so that evaluateBatch can be called."""
+        return all(stage.batchFunction is not None for stage in self.stages)
+
+
+    def evaluateBatch(self, parameterArrays):
+        """Returns a 2D array of the outputs of the model, one row for
+        each set of parameter values in the dictionary of parameter 
+        name:1D array pairs, parameterArrays, which must hold the 
+        parameters that are not fixed. Requires canEvaluateBatch()."""
+        numberOfSets = len(next(iter(parameterArrays.values())))
+        values = {name: np.asarray(array, dtype=np.float64).reshape(-1, 1)
+                  for name, array in parameterArrays.items()}
+        values.update(self.precomputedValues)
+        for stage in self.stages:
+            values[stage.name] = stage.evaluateBatch(values)
+        output = np.asarray(values[self.outputName])
+        return np.broadcast_to(output, (numberOfSets, output.shape[-1]))
@@ -0,0 +1,159 @@
+"""
+This module contains functions for the bulk export of the
+time/MR signal data plotted on the graph, including the curve
+predicted by the model.
+
+The columns of plot data are held in NumPy arrays and written
+to a CSV file in a single call, optionally with a compressed
+binary copy in a NumPy .npz file alongside it.
+
+During batch processing, the class PlotDataCollection gathers
+the curves of every data file into a single long-format, columnar
+file instead of one small CSV file per data file.  It is saved in
+Parquet format when the pyarrow package is installed, otherwise
+in a compressed NumPy .npz file.
+"""
+import os
+import logging
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Columns of the consolidated plot data file, after the data_file
+# column holding the name of the data file of each row. The names
+# of the ROI, AIF and VIF of each data file are held in the roi_name,
+# aif_name and vif_name columns. The vif column is NaN for single
+# inlet models.
+CURVE_ROLES = ['time', 'roi', 'aif', 'vif', 'model']
+NAME_COLUMNS = ['roi_name', 'aif_name', 'vif_name']
+CONSOLIDATED_FILE_NAME = 'AllPlotData'
+
+
+def GetConsolidatedFileExtension() -> str:
+    """Returns the file extension of the preferred format of the
+    consolidated plot data file. Parquet is preferred when pyarrow
+    is available, otherwise a compressed NumPy .npz file is used."""
+    if pa is not None:
+        return '.parquet'
+    else:
+        return '.npz'
+
+
+def SavePlotData(csvFileName, columnNames, columns, saveBinaryCopy=False):
+    """Saves columns of plot data in a CSV file in a single call.
+
+    Input Parameters
+    ----------------
+    csvFileName - file path and name of the CSV file.
+        An existing file is overwritten.
+    columnNames - List of column headers.
+    columns - List of sequences of equal length, one for each column.
+    saveBinaryCopy - If True, the columns are also saved in a
+        compressed NumPy .npz file with the same name as the CSV file.
+    """
+    data = np.column_stack([np.asarray(column, dtype=np.float64)
+                            for column in columns])
+    np.savetxt(csvFileName, data, fmt='%.10g', delimiter=',',
+               header=','.join(columnNames), comments='')
+    if saveBinaryCopy:
+        np.savez_compressed(os.path.splitext(csvFileName)[0] + '.npz',
+                            columnNames=np.array(columnNames, dtype=str),
+                            data=data)
+
+
+def LoadPlotData(fileName):
+    """Loads plot data saved by SavePlotData from either its CSV file
+    or its .npz copy.
+
+    Returns
+    -------
+    A tuple of the list of column names and a 2D array holding
+    one column for each column of plot data.
+    """
+    if fileName.lower().endswith('.npz'):
+        with np.load(fileName) as plotData:
+            return [str(name) for name in plotData['columnNames']], plotData['data']
+    with open(fileName) as csvfile:
+        columnNames = csvfile.readline().rstrip('\n').split(',')
+    return columnNames, np.loadtxt(fileName, delimiter=',', skiprows=1, ndmin=2)
+
+
+class PlotDataCollection:
+    def __init__(self):
+        """Creates an instance of the PlotDataCollection class that
+        holds, in memory, the curves of the data files of a batch
+        until saveConsolidatedFile is called."""
+        self.fileNames = []
+        self.curveNames = {name: [] for name in NAME_COLUMNS}
+        self.curves = {role: [] for role in CURVE_ROLES}
+        logger.info('In module ' + __name__
+                    + '. Created an instance of class PlotDataCollection.')
+
+
+    def addCurves(self, fileName, curves):
+        """Adds the curves of a data file to the collection.
+
+        Input Parameters
+        ----------------
+        fileName - Name of the data file.
+        curves - Dictionary of role:(name, values) pairs, where role
+            is one of time, roi, aif, vif and model.
+        """
+        try:
+            numPoints = len(curves['time'][1])
+            self.fileNames.append(np.full(numPoints, str(fileName), dtype=object))
+            for role in CURVE_ROLES:
+                if role in curves:
+                    curveName, values = curves[role]
+                    self.curves[role].append(np.asarray(values, dtype=np.float64))
+                else:
+                    curveName = ''
+                    self.curves[role].append(np.full(numPoints, np.nan))
+                if role + '_name' in self.curveNames:
+                    self.curveNames[role + '_name'].append(
+                        np.full(numPoints, str(curveName), dtype=object))
+        except Exception as e:
+            print('PlotDataCollection.addCurves when file = ' + str(fileName) + ': ' + str(e))
+            logger.error('PlotDataCollection.addCurves when file = ' + str(fileName) + ': ' + str(e))
+
+
+    def getColumns(self):
+        """Returns the consolidated plot data as a
+        dictionary of column name:NumPy array pairs."""
+        columns = {'data_file': np.concatenate(self.fileNames)
+                   if self.fileNames else np.array([], dtype=object)}
+        for name, values in self.curveNames.items():
+            columns[name] = np.concatenate(values) if values else np.array([], dtype=object)
+        for role, values in self.curves.items():
+            columns[role] = np.concatenate(values) if values else np.array([])
+        return columns
+
+
+    def saveConsolidatedFile(self, fullFilePath):
+        """Saves the consolidated plot data at fullFilePath, either
+        in Parquet format or, for any other extension, in a compressed
+        NumPy .npz file."""
+        try:
+            columns = self.getColumns()
+            if fullFilePath.lower().endswith('.parquet') and pa is not None:
+                pq.write_table(pa.table({name: pa.array(values)
+                                         for name, values in columns.items()}),
+                               fullFilePath)
+            else:
+                # Text columns are saved as fixed width strings,
+                # so the file can be loaded without pickle.
+                np.savez_compressed(fullFilePath,
+                    **{name: values.astype(str) if values.dtype == object else values
+                       for name, values in columns.items()})
+            logger.info('In module ' + __name__ + '. saveConsolidatedFile. {} files saved in {}'
+                        .format(len(self.fileNames), fullFilePath))
+        except Exception as e:
+            print('PlotDataCollection.saveConsolidatedFile: ' + str(e))
+            logger.error('PlotDataCollection.saveConsolidatedFile: ' + str(e))
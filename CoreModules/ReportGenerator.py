@@ -0,0 +1,468 @@
+"""This module contains functions for the creation of PDF reports
+of model fitting sessions without reference to the GUI.
+
+The time/MR signal plot is rendered on a headless matplotlib
+figure using the Agg backend into a PNG image held in memory,
+which is passed directly to the PDF writer.  So, no image file is
+written to disk and several reports may be created at the same time.
+
+The class ReportGenerator creates reports in a pool of worker
+processes, so that during batch processing the reports are
+produced in parallel with curve fitting.  Optionally, instead of
+one PDF file per data file, the worker processes only render the
+plot images and the pages are appended to a single cohort report,
+see the CohortReport class in PDFWriter.py, as the images arrive.
+
+Alternatively, batch processing may only save the results of
+curve fitting and the plotted curves of each data file in a
+NumPy .npz file using SaveFitResults.  Reports are then created
+later from these files, either on demand for selected files or for
+a whole folder in a separate post-processing stage, by the function
+CreateReportsFromFitResults.  This stage may also be run from the
+command line:
+
+    python ReportGenerator.py <folder of fit results> [--workers N] [--cohort]
+"""
+import argparse
+from collections import deque
+import glob
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import numpy as np
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from PDFWriter import PDF, CohortReport
+from PlotDataExport import SavePlotData
+import ResourceManager as ResourceManagerModule
+import Tracing
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of worker processes creating PDF reports
+DEFAULT_NUMBER_OF_WORKERS = max(1, min(ResourceManagerModule.MAX_REPORT_WORKERS,
+                                       ResourceManagerModule.GetCPUBudget() - 1))
+
+# Size of the plot image, its ratio matches the 170x130 mm space
+# allocated to it in the PDF report.
+PLOT_FIGURE_SIZE = (8.5, 6.5)
+PLOT_DPI = 150
+
+# Name of the sub-folder of the data folder where the
+# fit results of deferred batch processing are saved.
+FIT_RESULTS_FOLDER = 'FitResults'
+FIT_RESULTS_EXTENSION = '.npz'
+
+# Name of the single PDF file holding the reports of a cohort
+COHORT_REPORT_FILE_NAME = 'CohortReport.pdf'
+
+
+def RenderPlotImage(times, curves, yAxisLabel, dpi=PLOT_DPI):
+    """Draws the time/MR signal curves on a headless matplotlib
+    figure and returns it as a PNG image held in memory.
+
+    Input Parameters
+    ----------------
+    times - Array of time points, in minutes, common to all curves.
+    curves - List of (label, values, format string) tuples, one for
+        each curve, drawn in the same order and style as on the GUI.
+    yAxisLabel - Label of the y axis.
+    dpi - Resolution of the image.
+
+    Returns
+    -------
+    The contents of a PNG file as bytes.
+    """
+    figure = Figure(figsize=PLOT_FIGURE_SIZE, dpi=dpi)
+    FigureCanvasAgg(figure)
+    objSubPlot = figure.add_subplot(111)
+    objSubPlot.tick_params(axis='both', which='major', labelsize=12)
+    objSubPlot.set_xlabel('Time (mins)', fontsize=14)
+    objSubPlot.set_ylabel(yAxisLabel, fontsize=14)
+    objSubPlot.set_title('Time Curves', fontsize=20, pad=25)
+    objSubPlot.grid()
+
+    for label, values, formatString in curves:
+        objSubPlot.plot(times, values, formatString, label=label)
+
+    chartBox = objSubPlot.get_position()
+    objSubPlot.set_position([chartBox.x0*1.1, chartBox.y0,
+                             chartBox.width*0.9, chartBox.height])
+    objSubPlot.legend(loc='upper center', bbox_to_anchor=(0.9, 1.0),
+                      shadow=True, ncol=1, fontsize='large')
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', dpi=dpi)
+    return buffer.getvalue()
+
+
+def CreatePDFReport(reportFileName, title, logo, dataFileName,
+                    longModelName, times, curves, yAxisLabel,
+                    parameterDictionary):
+    """Renders the time/MR signal plot in memory and creates
+    and saves a PDF report of model fitting.  Run in a
+    worker process by the ReportGenerator class.
+
+    Input Parameters
+    ----------------
+    reportFileName - file path and name of the PDF report.
+    title - Title printed in the header of every page.
+    logo - Path to the image file of the logo printed in the header.
+    dataFileName - Name of the CSV file containing the MR signal data.
+    longModelName - Full name of the model used for curve fitting.
+    times, curves, yAxisLabel - Data to plot, see RenderPlotImage.
+    parameterDictionary - A dictionary of parameter names (keys) linked
+        to a 3 element list containing the parameter value, its lower
+        95% confidence limit and upper 95% confidence limit.
+
+    Returns
+    -------
+    A tuple of reportFileName and an error message, which is an empty
+    string if the report was created successfully.
+    """
+    try:
+        image = RenderPlotImage(times, curves, yAxisLabel)
+        pdf = PDF(title, logo)
+        pdf.CreateAndSavePDFReport(reportFileName, dataFileName,
+                                   longModelName, image, parameterDictionary)
+        return reportFileName, ''
+    except Exception as e:
+        print('Error in ReportGenerator.CreatePDFReport: ' + str(e))
+        logger.error('Error in ReportGenerator.CreatePDFReport: ' + str(e))
+        return reportFileName, str(e)
+
+
+def RenderReportPage(reportFileName, title, logo, dataFileName,
+                     longModelName, times, curves, yAxisLabel,
+                     parameterDictionary):
+    """Renders the time/MR signal plot of a page of a cohort report.
+    Run in a worker process by the ReportGenerator class. The input
+    parameters are those of the function CreatePDFReport.
+
+    Returns
+    -------
+    A tuple of dataFileName, longModelName, the plot image as PNG
+    bytes and parameterDictionary, as required by the method
+    CohortReport.AddReport.
+    """
+    image = RenderPlotImage(times, curves, yAxisLabel)
+    return dataFileName, longModelName, image, parameterDictionary
+
+
+def SaveFitResults(fitResultsFileName, dataFileName, longModelName,
+                   times, curves, yAxisLabel, parameterDictionary):
+    """Saves the results of curve fitting a data file together with
+    the plotted curves in a NumPy .npz file, so that its PDF report
+    and plot data CSV file can be created later.
+
+    Input Parameters
+    ----------------
+    fitResultsFileName - file path and name of the .npz file.
+    The other parameters are those of the function CreatePDFReport.
+    """
+    try:
+        labels = [label for label, _, _ in curves]
+        formatStrings = [formatString for _, _, formatString in curves]
+        values = np.array([np.asarray(curveValues, dtype=np.float64)
+                           for _, curveValues, _ in curves])
+        parameterNames = list(parameterDictionary.keys())
+        # Values and confidence limits are stored as strings, as
+        # the confidence limits of a fixed parameter are blank.
+        parameterValues = np.array([[str(item) for item in paramList]
+                                    for paramList in parameterDictionary.values()],
+                                   dtype=str).reshape(len(parameterNames), -1)
+        np.savez_compressed(fitResultsFileName,
+                            dataFileName=np.array(dataFileName),
+                            longModelName=np.array(longModelName),
+                            yAxisLabel=np.array(yAxisLabel),
+                            times=np.asarray(times, dtype=np.float64),
+                            curveLabels=np.array(labels, dtype=str),
+                            curveFormats=np.array(formatStrings, dtype=str),
+                            curveValues=values,
+                            parameterNames=np.array(parameterNames, dtype=str),
+                            parameterValues=parameterValues)
+        logger.info('ReportGenerator.SaveFitResults - saved ' + fitResultsFileName)
+    except Exception as e:
+        print('Error in ReportGenerator.SaveFitResults: ' + str(e))
+        logger.error('Error in ReportGenerator.SaveFitResults: ' + str(e))
+
+
+def LoadFitResults(fitResultsFileName):
+    """Loads a .npz file saved by the function SaveFitResults.
+
+    Returns
+    -------
+    A tuple of dataFileName, longModelName, times, curves, yAxisLabel
+    and parameterDictionary, as passed to SaveFitResults.
+    """
+    with np.load(fitResultsFileName) as fitResults:
+        curves = [(str(label), values, str(formatString))
+                  for label, values, formatString in
+                  zip(fitResults['curveLabels'], fitResults['curveValues'],
+                      fitResults['curveFormats'])]
+        parameterDictionary = {str(name): [str(item) for item in paramList]
+                               for name, paramList in
+                               zip(fitResults['parameterNames'],
+                                   fitResults['parameterValues'])}
+        return (str(fitResults['dataFileName']),
+                str(fitResults['longModelName']),
+                fitResults['times'], curves,
+                str(fitResults['yAxisLabel']), parameterDictionary)
+
+
+def SavePlotDataCSV(csvFileName, times, curves):
+    """Saves the time points and the plotted curves in a CSV file
+    with one column per curve."""
+    SavePlotData(csvFileName, ['Time (min)'] + [label for label, _, _ in curves],
+                 [times] + [values for _, values, _ in curves])
+
+
+def CreateReportFromFitResults(fitResultsFileName, reportFolder, title, logo,
+                               csvPlotDataFolder=None):
+    """Creates the PDF report, and optionally the plot data CSV file,
+    of a data file from its fit results saved by SaveFitResults.
+    Run in a worker process by the function CreateReportsFromFitResults.
+
+    Input Parameters
+    ----------------
+    fitResultsFileName - file path and name of the .npz file.
+    reportFolder - Folder in which the PDF report is saved.
+    title, logo - See CreatePDFReport.
+    csvPlotDataFolder - Optional folder in which the plot data is saved.
+
+    Returns
+    -------
+    A tuple of the name of the report and an error message, which is
+    an empty string if the report was created successfully.
+    """
+    baseName = os.path.splitext(os.path.basename(fitResultsFileName))[0]
+    reportFileName = os.path.join(reportFolder, baseName + '.pdf')
+    try:
+        (dataFileName, longModelName, times, curves,
+         yAxisLabel, parameterDictionary) = LoadFitResults(fitResultsFileName)
+        if csvPlotDataFolder:
+            SavePlotDataCSV(os.path.join(csvPlotDataFolder, 'plot' + dataFileName),
+                            times, curves)
+        return CreatePDFReport(reportFileName, title, logo, dataFileName,
+                               longModelName, times, curves, yAxisLabel,
+                               parameterDictionary)
+    except Exception as e:
+        print('Error in ReportGenerator.CreateReportFromFitResults: ' + str(e))
+        logger.error('Error in ReportGenerator.CreateReportFromFitResults: ' + str(e))
+        return reportFileName, str(e)
+
+
+def RenderReportPageFromFitResults(fitResultsFileName, csvPlotDataFolder=None):
+    """Renders the page of a cohort report of a data file from its fit
+    results saved by SaveFitResults and optionally saves its plot data
+    CSV file. Run in a worker process by CreateReportsFromFitResults.
+
+    Returns
+    -------
+    See the function RenderReportPage.
+    """
+    (dataFileName, longModelName, times, curves,
+     yAxisLabel, parameterDictionary) = LoadFitResults(fitResultsFileName)
+    if csvPlotDataFolder:
+        SavePlotDataCSV(os.path.join(csvPlotDataFolder, 'plot' + dataFileName),
+                        times, curves)
+    image = RenderPlotImage(times, curves, yAxisLabel)
+    return dataFileName, longModelName, image, parameterDictionary
+
+
+def CreateReportsFromFitResults(fitResultsFileNames, reportFolder, title, logo,
+                                csvPlotDataFolder=None,
+                                numberOfWorkers=DEFAULT_NUMBER_OF_WORKERS,
+                                cohortReport=False):
+    """Creates, in parallel, the PDF reports of the data files whose
+    fit results are stored in the list of .npz files fitResultsFileNames.
+    If cohortReport is True, the reports are pages of a single PDF file
+    called CohortReport.pdf in reportFolder.
+
+    Returns
+    -------
+    A list of (reportFileName, error message) tuples
+    for the reports that could not be created.
+    """
+    if not os.path.exists(reportFolder):
+        os.makedirs(reportFolder)
+    if csvPlotDataFolder and not os.path.exists(csvPlotDataFolder):
+        os.makedirs(csvPlotDataFolder)
+
+    if cohortReport:
+        objReportGenerator = ReportGenerator(numberOfWorkers,
+            os.path.join(reportFolder, COHORT_REPORT_FILE_NAME))
+        for fitResultsFileName in fitResultsFileNames:
+            objReportGenerator.submitCohortPage(title, logo,
+                RenderReportPageFromFitResults, fitResultsFileName,
+                csvPlotDataFolder)
+    else:
+        objReportGenerator = ReportGenerator(numberOfWorkers)
+        for fitResultsFileName in fitResultsFileNames:
+            objReportGenerator.submitTask(CreateReportFromFitResults,
+                                          fitResultsFileName, reportFolder,
+                                          title, logo, csvPlotDataFolder)
+    return objReportGenerator.shutdown()
+
+
+class ReportGenerator:
+    def __init__(self, numberOfWorkers=DEFAULT_NUMBER_OF_WORKERS,
+                 cohortReportFileName=None):
+        """Creates an instance of the ReportGenerator class.
+        The pool of worker processes is started when the first
+        report is submitted.
+
+        Input Parameters
+        ----------------
+        numberOfWorkers - Maximum number of worker processes.
+        cohortReportFileName - Optional file path and name of a single
+            PDF file holding the reports of all the data files.
+            By default, each report is saved in its own PDF file.
+        """
+        self.numberOfWorkers = numberOfWorkers
+        self.executor = None
+        self.futures = []
+        self.cohortReportFileName = cohortReportFileName
+        self.cohortReport = None
+        # Pages of the cohort report, in the order they were submitted,
+        # whose plot images are being rendered by the worker processes.
+        self.pendingPages = deque()
+        self.failedPages = []
+        logger.info('In module ' + __name__ +
+                    '. Created an instance of class ReportGenerator.')
+
+
+    def submitReport(self, *args):
+        """Queues the creation of a PDF report in the worker pool
+        and returns immediately. The arguments are those of the
+        function CreatePDFReport. If a cohort report is being created, 
+        the report is added to it as a new page."""
+        if self.cohortReportFileName:
+            _, title, logo = args[:3]
+            return self.submitCohortPage(title, logo, RenderReportPage, *args)
+        return self.submitTask(CreatePDFReport, *args)
+
+
+    def submitCohortPage(self, title, logo, function, *args):
+        """Queues the rendering of a page of the cohort report by 
+        function, which returns the arguments of CohortReport.AddReport, 
+        in the worker pool. Pages whose rendering is complete are 
+        appended to the cohort report in the order they were submitted."""
+        if self.cohortReport is None:
+            self.cohortReport = CohortReport(title, logo)
+        future = self._getExecutor().submit(function, *args)
+        self.pendingPages.append((str(args[0]), future))
+        self.appendCompletedPages()
+        return future
+
+
+    def appendCompletedPages(self, wait=False):
+        """Appends the rendered pages at the front of the queue of pending
+        pages to the cohort report. If wait is True, waits until all the
+        pages have been rendered."""
+        while self.pendingPages and (wait or self.pendingPages[0][1].done()):
+            pageName, future = self.pendingPages.popleft()
+            try:
+                self.cohortReport.AddReport(*future.result())
+            except Exception as e:
+                self.failedPages.append((pageName, str(e)))
+                logger.error('ReportGenerator - page {} not added to the cohort report: {}'
+                             .format(pageName, str(e)))
+
+
+    def submitTask(self, function, *args):
+        """Queues a call of function, which returns a tuple of
+        report name and error message, in the worker pool."""
+        future = self._getExecutor().submit(function, *args)
+        self.futures.append((args[0], future))
+        return future
+
+
+    def _getExecutor(self):
+        """Returns the pool of worker processes, starting it if required."""
+        if self.executor is None:
+            # The spawn start method gives the same behaviour on
+            # all platforms and is safe to use from the Qt GUI.
+            # Rendering does not benefit from BLAS threads, so each 
+            # worker is limited to one to leave the cores to curve fitting.
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.numberOfWorkers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=ResourceManagerModule.InitialiseWorkerProcess,
+                initargs=(1, Tracing.GetWorkerTracing()))
+        return self.executor
+
+
+    def waitForReports(self):
+        """Waits until all the submitted reports have been created.
+
+        Returns
+        -------
+        A list of (reportFileName, error message) tuples
+        for the reports that could not be created.
+        """
+        self.appendCompletedPages(wait=True)
+        failedReports = self.failedPages
+        self.failedPages = []
+        for reportFileName, future in self.futures:
+            try:
+                _, errorMessage = future.result()
+            except Exception as e:
+                errorMessage = str(e)
+            if errorMessage:
+                failedReports.append((reportFileName, errorMessage))
+                logger.error('ReportGenerator - report {} not created: {}'
+                             .format(reportFileName, errorMessage))
+        self.futures.clear()
+        return failedReports
+
+
+    def shutdown(self):
+        """Waits for any outstanding reports, saves the cohort 
+        report, if any, and stops the worker processes."""
+        failedReports = self.waitForReports()
+        if self.cohortReport is not None:
+            self.cohortReport.SaveReport(self.cohortReportFileName)
+            self.cohortReport = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        return failedReports
+
+
+if __name__ == '__main__':
+    # Post-processing stage creating the reports of
+    # a deferred batch from its saved fit results.
+    import LoggingConfig
+    parser = argparse.ArgumentParser(
+        description='Creates the PDF reports of a batch from its saved fit results.')
+    parser.add_argument('fitResultsFolder',
+        help='Folder containing the fit results (.npz) files.')
+    parser.add_argument('--workers', type=int, default=DEFAULT_NUMBER_OF_WORKERS,
+        help='Number of worker processes.')
+    parser.add_argument('--title',
+        default='FERRET - Model-fitting of dynamic contrast-enhanced MRI',
+        help='Title printed in the header of the reports.')
+    parser.add_argument('--cohort', action='store_true',
+        help='Save all the reports in a single PDF file, ' + COHORT_REPORT_FILE_NAME)
+    parser.add_argument('--logo', default=os.path.join('images', 'FERRET_LOGO.png'),
+        help='Image file of the logo printed in the header of the reports.')
+    LoggingConfig.AddLoggingArguments(parser)
+    arguments = parser.parse_args()
+    dataFolder = os.path.dirname(os.path.abspath(arguments.fitResultsFolder))
+    # The log file is saved alongside the reports
+    LoggingConfig.ConfigureLoggingFromArguments(arguments, 'ReportGenerator.log',
+                                                os.path.join(dataFolder, 'PDFReports'))
+    fileNames = sorted(glob.glob(os.path.join(arguments.fitResultsFolder,
+                                              '*' + FIT_RESULTS_EXTENSION)))
+    failures = CreateReportsFromFitResults(fileNames,
+                     os.path.join(dataFolder, 'PDFReports'),
+                     arguments.title, arguments.logo,
+                     os.path.join(dataFolder, 'CSVPlotDataFiles'),
+                     arguments.workers, arguments.cohort)
+    print('{} reports created, {} failed.'.format(len(fileNames) - len(failures),
+                                                   len(failures)))
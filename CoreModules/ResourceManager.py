@@ -0,0 +1,202 @@
+"""
+This class module provides the functionality for sharing the CPU
+cores of the computer between the processes and threads of batch
+processing, so that they do not oversubscribe the cores.
+
+Without it, each worker process fitting data files and each worker
+process creating PDF reports would start as many BLAS threads, used
+by NumPy and SciPy for example in the singular value decomposition
+and matrix products of MathsTools.deconvolve, as there are cores.
+On a computer with many cores, parallel batch processing would then
+be slower than serial batch processing.
+
+A total CPU budget, by default the number of cores available to this
+process, is divided between
+    - the main process, which loads the data files and records results,
+    - the pool of worker processes creating PDF reports, if any,
+    - the pool of worker processes fitting data files,
+and the number of BLAS threads of each process is limited, using the
+threadpoolctl package, so that the total number of busy threads does
+not exceed the budget.
+
+The CPU budget may be set by the environment variable FERRET_CPU_BUDGET,
+for example on a shared compute node, or by the --cpu-budget option of
+BatchProcessor.py.
+
+Usage:
+    objResourceManager = ResourceManager(withReports=True)
+    objResourceManager.logConfiguration()
+    with LimitBLASThreads(objResourceManager.mainBLASThreads):
+        ...
+"""
+import contextlib
+import os
+import logging
+
+import Tracing
+
+try:
+    from threadpoolctl import threadpool_info, threadpool_limits
+except ImportError:
+    threadpool_info = None
+    threadpool_limits = None
+
+logger = logging.getLogger(__name__)
+
+CPU_BUDGET_ENVIRONMENT_VARIABLE = 'FERRET_CPU_BUDGET'
+# Maximum number of worker processes creating PDF reports
+MAX_REPORT_WORKERS = 4
+# Environment variables read by the BLAS and OpenMP libraries when
+# they are loaded, used when threadpoolctl is not installed.
+BLAS_ENVIRONMENT_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                              'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                              'VECLIB_MAXIMUM_THREADS']
+
+
+def GetAvailableCPUs() -> int:
+    """Returns the number of cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on Windows and macOS
+        return os.cpu_count() or 1
+
+
+def GetCPUBudget(cpuBudget=None) -> int:
+    """Returns the total number of cores batch processing may use;
+    cpuBudget, if given, otherwise the value of the environment
+    variable FERRET_CPU_BUDGET, otherwise the number of available cores."""
+    if cpuBudget is None:
+        try:
+            cpuBudget = int(os.environ.get(CPU_BUDGET_ENVIRONMENT_VARIABLE, 0))
+        except ValueError:
+            logger.error('ResourceManager.GetCPUBudget - invalid value of ' +
+                         CPU_BUDGET_ENVIRONMENT_VARIABLE + ' ignored.')
+            cpuBudget = 0
+    if cpuBudget < 1:
+        cpuBudget = GetAvailableCPUs()
+    return int(cpuBudget)
+
+
+def LimitBLASThreads(numThreads):
+    """Limits the number of threads of the BLAS and OpenMP libraries
+    loaded by this process to numThreads.
+
+    Returns
+    -------
+    An object that, used as a context manager, restores the previous
+    limits on exit. Otherwise, the limits remain in force; for example,
+    for the lifetime of a worker process.
+    """
+    if threadpool_limits is not None:
+        return threadpool_limits(limits=numThreads)
+    # Only libraries loaded after this call are limited
+    for variableName in BLAS_ENVIRONMENT_VARIABLES:
+        os.environ[variableName] = str(numThreads)
+    return contextlib.nullcontext()
+
+
+def GetBLASThreads():
+    """Returns a list of (library, number of threads) tuples for the
+    BLAS and OpenMP libraries loaded by this process."""
+    if threadpool_info is None:
+        return [(variableName, os.environ.get(variableName))
+                for variableName in BLAS_ENVIRONMENT_VARIABLES
+                if variableName in os.environ]
+    return [(info.get('internal_api'), info.get('num_threads'))
+            for info in threadpool_info()]
+
+
+def InitialiseWorkerProcess(numBLASThreads, workerTracing=None):
+    """Runs once in each worker process to limit its BLAS threads and,
+    if workerTracing is given, to record its spans in the trace, see
+    Tracing.InitialiseWorkerTracing."""
+    LimitBLASThreads(numBLASThreads)
+    Tracing.InitialiseWorkerTracing(workerTracing)
+
+
+class ResourceManager:
+    def __init__(self, cpuBudget=None, withReports=False,
+                 numberOfFitWorkers=None, numberOfReportWorkers=None):
+        """Creates an instance of the ResourceManager class that divides
+        the CPU budget between the main process, the pool of worker
+        processes fitting data files and, if withReports is True, the
+        pool of worker processes creating PDF reports.
+
+        Input Parameters
+        ----------------
+        cpuBudget - Total number of cores, see GetCPUBudget.
+        withReports - True if PDF reports are created while the
+            data files are fitted.
+        numberOfFitWorkers, numberOfReportWorkers - Optional number of
+            worker processes of each pool, otherwise derived from the
+            CPU budget.
+
+        One core is left to the main process. Each worker process
+        creating reports and each worker process fitting data files
+        is limited to one BLAS thread.  The main process is limited to
+        the cores not used by the report workers when it fits the data
+        files itself, otherwise to one BLAS thread.
+        """
+        self.cpuBudget = GetCPUBudget(cpuBudget)
+        if not withReports:
+            self.numberOfReportWorkers = 0
+        elif numberOfReportWorkers:
+            self.numberOfReportWorkers = numberOfReportWorkers
+        else:
+            self.numberOfReportWorkers = max(1, min(MAX_REPORT_WORKERS,
+                                                    self.cpuBudget//4))
+        self.numberOfFitWorkers = numberOfFitWorkers or \
+            max(1, self.cpuBudget - 1 - self.numberOfReportWorkers)
+        self.reportBLASThreads = 1
+        self.fitBLASThreads = max(1, (self.cpuBudget - self.numberOfReportWorkers)
+                                  //self.numberOfFitWorkers)
+        logger.info('In module ' + __name__
+                    + '. Created an instance of class ResourceManager.')
+
+
+    def getMainBLASThreads(self, isFittingInMainProcess=True) -> int:
+        """Returns the number of BLAS threads of the main process,
+        which depends on whether it fits the data files itself."""
+        if isFittingInMainProcess:
+            return max(1, self.cpuBudget - self.numberOfReportWorkers)
+        return 1
+
+
+    def getFitWorkerInitialiser(self):
+        """Returns the initializer and initargs, for a ProcessPoolExecutor,
+        that limit the BLAS threads of a worker process fitting data files."""
+        return InitialiseWorkerProcess, (self.fitBLASThreads,
+                                         Tracing.GetWorkerTracing())
+
+
+    def getReportWorkerInitialiser(self):
+        """Returns the initializer and initargs, for a ProcessPoolExecutor,
+        that limit the BLAS threads of a worker process creating reports."""
+        return InitialiseWorkerProcess, (self.reportBLASThreads,
+                                         Tracing.GetWorkerTracing())
+
+
+    def getConfiguration(self) -> dict:
+        """Returns the effective configuration as a dictionary."""
+        return {'cpuBudget': self.cpuBudget,
+                'availableCPUs': GetAvailableCPUs(),
+                'numberOfFitWorkers': self.numberOfFitWorkers,
+                'fitBLASThreads': self.fitBLASThreads,
+                'numberOfReportWorkers': self.numberOfReportWorkers,
+                'reportBLASThreads': self.reportBLASThreads,
+                'BLASLibraries': GetBLASThreads()}
+
+
+    def logConfiguration(self):
+        """Writes the effective configuration to the log file."""
+        configuration = self.getConfiguration()
+        logger.info('ResourceManager - CPU budget %s of %s available cores, '
+                    '%s fit workers with %s BLAS threads each, '
+                    '%s report workers with %s BLAS threads each, '
+                    'BLAS libraries of the main process %s',
+                    configuration['cpuBudget'], configuration['availableCPUs'],
+                    configuration['numberOfFitWorkers'], configuration['fitBLASThreads'],
+                    configuration['numberOfReportWorkers'],
+                    configuration['reportBLASThreads'], configuration['BLASLibraries'])
+        return configuration
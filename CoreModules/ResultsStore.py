@@ -0,0 +1,410 @@
+"""
+This class module provides the functionality for the creation
+of a long-format, columnar table of the results from the batch
+processing of time-MR signal data files.
+
+Each row of the table holds the optimum value of one model
+parameter for one data file together with its 95% confidence
+limits, the number of function evaluations made during curve
+fitting, the fit time, the status of the fit and the time, in UTC,
+at which the data file was fitted.
+Unlike the Excel summary, which spreads parameters across
+one worksheet each, this table is intended to be read by
+downstream statistical analysis code.
+
+The table may be saved in one of three formats, chosen by the
+extension of the file name:
+    .parquet - Apache Parquet, requires the pyarrow package.
+    .csv - Comma separated values.
+    .db or .sqlite - SQLite database with a table called 'results'
+          indexed on file, parameter and file with fitted_at.
+
+saveResults replaces any existing table.  appendResults adds the rows
+recorded since it was last called to any existing table, so that the
+results of a watched folder accumulate across sessions.  All the rows
+of one fit of a data file share the same fitted_at time, so when a
+data file is fitted again after it was modified, its current rows are
+those with the latest fitted_at.
+"""
+import csv
+import datetime
+import os
+import sqlite3
+import logging
+import Tracing
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+COLUMN_NAMES = ['file', 'model', 'parameter', 'value', 'lower', 'upper',
+                'nfev', 'fit_time', 'status', 'fitted_at']
+FLOAT_COLUMNS = ['value', 'lower', 'upper', 'fit_time']
+INTEGER_COLUMNS = ['nfev']
+SQLITE_EXTENSIONS = ('.db', '.sqlite')
+SQLITE_TABLE_NAME = 'results'
+
+
+def GetDefaultFileExtension() -> str:
+    """Returns the file extension of the preferred results
+    table format. Parquet is preferred when pyarrow is
+    available, otherwise CSV is used."""
+    if pa is not None:
+        return '.parquet'
+    else:
+        return '.csv'
+
+
+def GetTimestamp() -> str:
+    """Returns the current time in UTC as an ISO 8601 string,
+    the format of the fitted_at column, which sorts in time order."""
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='microseconds')
+
+
+def _toFloat(value) -> float:
+    """Converts value to a float. Values that cannot be converted,
+    such as the empty string used for the confidence limits of a
+    fixed parameter or 'N/A', are stored as NaN."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _toInteger(value):
+    """Converts value to an integer. None is stored if value
+    is not defined, so it is saved as a null, not a number."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _toMaskedIntegers(column) -> np.ma.MaskedArray:
+    """Converts a column of integers to a masked array in which the
+    undefined values, None, empty strings, NaN or the -1 stored by
+    earlier versions of this module, are masked."""
+    values = [_toInteger(value) for value in column]
+    mask = np.array([value is None or value < 0 for value in values], dtype=bool)
+    return np.ma.masked_array([0 if isMasked else value 
+                               for value, isMasked in zip(values, mask)],
+                              mask=mask, dtype=np.int64)
+
+
+class ResultsStore:
+    def __init__(self, fullFilePath):
+        """Creates an instance of the ResultsStore class that
+       holds, in memory, the columns of the results table until
+       saveResults is called.
+
+       Input Parameter
+       ----------------
+       fullFilePath - location where the results table will be stored.
+            Its extension determines the file format.
+       """
+        try:
+            self.fullFilePath = fullFilePath
+            _, extension = os.path.splitext(fullFilePath)
+            self.fileFormat = extension.lower()
+            if self.fileFormat == '.parquet' and pa is None:
+                # Fall back to CSV if pyarrow is not installed
+                self.fullFilePath = os.path.splitext(fullFilePath)[0] + '.csv'
+                self.fileFormat = '.csv'
+                logger.info('ResultsStore - pyarrow not available, ' +
+                            'results will be saved in ' + self.fullFilePath)
+
+            self.columns = {name: [] for name in COLUMN_NAMES}
+            # Number of rows already saved by appendResults
+            self.numSavedRows = 0
+            logger.info('In module ' + __name__
+                    + '. Created an instance of class ResultsStore.')
+        except Exception as e:
+            print('ResultsStore.__init__: ' + str(e))
+            logger.error('ResultsStore.__init__: ' + str(e))
+
+
+    def recordParameterValues(self, fileName, modelName, paramName,
+                              paramValue, paramLower, paramUpper,
+                              nfev=None, fitTime=None, status='OK', fittedAt=None):
+        """During batch processing, records each optimum parameter
+        value (and associated information) resulting from curve
+        fitting in a row of the results table.
+
+        Input Parameters
+        -----------------
+        fileName - Name of the data file currently being processed.
+        modelName - Name of the model used for curve fitting.
+        paramName - Short name of the parameter.
+        paramValue - Value of the parameter resulting from curve fitting.
+        paramLower, paramUpper - Lower and upper 95% confidence interval
+                of the paramValue.
+        nfev - Number of function evaluations made during curve fitting.
+        fitTime - Time in seconds taken by curve fitting.
+        status - String describing the outcome of curve fitting.
+        fittedAt - Time at which the data file was fitted, returned by
+                GetTimestamp and shared by all the rows of the fit.
+                By default, the current time.
+        """
+        try:
+            self.columns['file'].append(str(fileName))
+            self.columns['model'].append(str(modelName))
+            self.columns['parameter'].append(str(paramName))
+            self.columns['value'].append(_toFloat(paramValue))
+            self.columns['lower'].append(_toFloat(paramLower))
+            self.columns['upper'].append(_toFloat(paramUpper))
+            self.columns['nfev'].append(_toInteger(nfev))
+            self.columns['fit_time'].append(_toFloat(fitTime))
+            self.columns['status'].append(str(status))
+            self.columns['fitted_at'].append(fittedAt if fittedAt is not None
+                                             else GetTimestamp())
+        except Exception as e:
+            print('ResultsStore.recordParameterValues when paramater = '
+                  + str(paramName) + str(e))
+            logger.error('ResultsStore.recordParameterValues when paramater = '
+                         + str(paramName) + str(e))
+
+
+    def recordSkippedFiles(self, fileName, failureReason):
+        """Records a row for a CSV data file that had to be skipped
+       during batch processing. The reason it was skipped is
+       stored in the status column.
+
+       Input Parameters
+       ----------------
+       fileName - Name of the skipped file.
+       failureReason - String containing the reason why the
+       file was skipped."""
+        self.recordParameterValues(fileName, '', '', None, None, None,
+                                   status='Skipped - ' + failureReason)
+
+
+    def getNumberOfRows(self) -> int:
+        """Returns the number of rows recorded in the results table."""
+        return len(self.columns['file'])
+
+
+    def _getArrays(self, firstRow=0):
+        """Returns the columns of the results table, from the row
+        firstRow onwards, as a dictionary of NumPy arrays."""
+        arrays = {}
+        for name in COLUMN_NAMES:
+            if name in FLOAT_COLUMNS:
+                arrays[name] = np.array(self.columns[name][firstRow:], dtype=np.float64)
+            elif name in INTEGER_COLUMNS:
+                arrays[name] = _toMaskedIntegers(self.columns[name][firstRow:])
+            else:
+                arrays[name] = np.array(self.columns[name][firstRow:], dtype=object)
+        return arrays
+
+
+    def _getRows(self, firstRow=0):
+        """Returns an iterator over the rows of the results table
+        from the row firstRow onwards."""
+        return zip(*[self.columns[name][firstRow:] for name in COLUMN_NAMES])
+
+
+    def _saveParquet(self, firstRow=0, append=False):
+        # The masked values of the integer columns are saved as nulls
+        table = pa.table({name: pa.array(array.filled(0), mask=array.mask)
+                          if np.ma.isMaskedArray(array) else pa.array(array)
+                          for name, array in self._getArrays(firstRow).items()})
+        if append and os.path.exists(self.fullFilePath):
+            # Parquet files cannot be appended to, so they are rewritten;
+            # columns missing from an older table are filled with nulls
+            table = pa.concat_tables([pq.read_table(self.fullFilePath), table],
+                                     promote_options='default')
+        pq.write_table(table, self.fullFilePath)
+
+
+    def _saveCSV(self, firstRow=0, append=False):
+        writeHeader = not append or not os.path.exists(self.fullFilePath) or \
+            os.path.getsize(self.fullFilePath) == 0
+        if not writeHeader:
+            self._upgradeCSVColumns()
+        with open(self.fullFilePath, 'a' if append else 'w', newline='') as csvfile:
+            writeCSV = csv.writer(csvfile, delimiter=',')
+            if writeHeader:
+                writeCSV.writerow(COLUMN_NAMES)
+            writeCSV.writerows(self._getRows(firstRow))
+
+
+    def _upgradeCSVColumns(self):
+        """Rewrites a CSV results table saved with fewer columns, such as
+        one without the fitted_at column, with the columns of COLUMN_NAMES,
+        leaving the missing values empty, so that rows can be appended."""
+        with open(self.fullFilePath, newline='') as csvfile:
+            readCSV = csv.DictReader(csvfile, delimiter=',')
+            if readCSV.fieldnames == COLUMN_NAMES:
+                return
+            rows = [[row.get(name, '') for name in COLUMN_NAMES] for row in readCSV]
+        with open(self.fullFilePath, 'w', newline='') as csvfile:
+            writeCSV = csv.writer(csvfile, delimiter=',')
+            writeCSV.writerow(COLUMN_NAMES)
+            writeCSV.writerows(rows)
+
+
+    def _saveSQLite(self, firstRow=0):
+        columnDefinitions = []
+        for name in COLUMN_NAMES:
+            if name in FLOAT_COLUMNS:
+                columnDefinitions.append(name + ' REAL')
+            elif name in INTEGER_COLUMNS:
+                columnDefinitions.append(name + ' INTEGER')
+            else:
+                columnDefinitions.append(name + ' TEXT')
+
+        connection = sqlite3.connect(self.fullFilePath)
+        try:
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS ' +
+                    SQLITE_TABLE_NAME + ' (' +
+                    ', '.join(columnDefinitions) + ')')
+                # Tables saved before a column was added are given it
+                existingColumns = [row[1] for row in connection.execute(
+                    'PRAGMA table_info(' + SQLITE_TABLE_NAME + ')')]
+                for name, definition in zip(COLUMN_NAMES, columnDefinitions):
+                    if name not in existingColumns:
+                        connection.execute('ALTER TABLE ' + SQLITE_TABLE_NAME +
+                                           ' ADD COLUMN ' + definition)
+                connection.execute('CREATE INDEX IF NOT EXISTS idx_results_file ON '
+                                   + SQLITE_TABLE_NAME + ' (file)')
+                connection.execute('CREATE INDEX IF NOT EXISTS idx_results_parameter ON '
+                                   + SQLITE_TABLE_NAME + ' (parameter)')
+                connection.execute('CREATE INDEX IF NOT EXISTS idx_results_file_fitted_at ON '
+                                   + SQLITE_TABLE_NAME + ' (file, fitted_at)')
+                connection.executemany('INSERT INTO ' + SQLITE_TABLE_NAME +
+                    ' (' + ', '.join(COLUMN_NAMES) + ')' +
+                    ' VALUES (' + ', '.join(['?']*len(COLUMN_NAMES)) + ')',
+                    self._getRows(firstRow))
+        finally:
+            connection.close()
+
+
+    @Tracing.Traced('saveResults', 'write')
+    def saveResults(self):
+        """Saves the results table at fullFilePath in the
+        format determined by its extension."""
+        try:
+            if self.fileFormat in SQLITE_EXTENSIONS:
+                # A new batch replaces any previous results
+                if os.path.exists(self.fullFilePath):
+                    os.remove(self.fullFilePath)
+                self._saveSQLite()
+            elif self.fileFormat == '.parquet':
+                self._saveParquet()
+            else:
+                self._saveCSV()
+            self.numSavedRows = self.getNumberOfRows()
+            logger.info('In module ' + __name__
+                    + '. saveResults. {} rows saved in {}'
+                    .format(self.getNumberOfRows(), self.fullFilePath))
+        except Exception as e:
+            print('ResultsStore.saveResults: ' + str(e))
+            logger.error('ResultsStore.saveResults: ' + str(e))
+
+
+    @Tracing.Traced('appendResults', 'write')
+    def appendResults(self):
+        """Appends the rows recorded since the last call of 
+        appendResults or saveResults to the results table at
+        fullFilePath, creating it if it does not exist."""
+        try:
+            firstRow = self.numSavedRows
+            if firstRow == self.getNumberOfRows():
+                return
+            if self.fileFormat in SQLITE_EXTENSIONS:
+                self._saveSQLite(firstRow)
+            elif self.fileFormat == '.parquet':
+                self._saveParquet(firstRow, append=True)
+            else:
+                self._saveCSV(firstRow, append=True)
+            self.numSavedRows = self.getNumberOfRows()
+            logger.info('In module ' + __name__
+                    + '. appendResults. {} rows appended to {}'
+                    .format(self.numSavedRows - firstRow, self.fullFilePath))
+        except Exception as e:
+            print('ResultsStore.appendResults: ' + str(e))
+            logger.error('ResultsStore.appendResults: ' + str(e))
+
+
+def _getSavedColumnNames(fullFilePath, extension):
+    """Returns the names of the columns of the results table
+    saved at fullFilePath in the format of its extension."""
+    if extension == '.parquet':
+        return pq.read_schema(fullFilePath).names
+    elif extension in SQLITE_EXTENSIONS:
+        connection = sqlite3.connect(fullFilePath)
+        try:
+            return [row[1] for row in connection.execute(
+                'PRAGMA table_info(' + SQLITE_TABLE_NAME + ')')]
+        finally:
+            connection.close()
+    else:
+        with open(fullFilePath, newline='') as csvfile:
+            return next(csv.reader(csvfile, delimiter=','), [])
+
+
+def LoadResults(fullFilePath, columnNames=None):
+    """Loads a results table saved by the ResultsStore class.
+
+    Input Parameters
+    ----------------
+    fullFilePath - location of the results table.
+        Its extension determines the file format.
+    columnNames - Optional list of the names of the columns to load.
+        By default, all the columns of COLUMN_NAMES held by the table
+        are loaded, so tables saved before a column was added still load.
+
+    Returns
+    -------
+    A dictionary of column name:NumPy array pairs.  The integer
+    column nfev is a masked array, masked where it is not defined,
+    such as for the data files that were skipped.
+    """
+    try:
+        _, extension = os.path.splitext(fullFilePath)
+        extension = extension.lower()
+        if columnNames is None:
+            columnNames = [name for name in COLUMN_NAMES
+                           if name in _getSavedColumnNames(fullFilePath, extension)]
+        if extension == '.parquet':
+            table = pq.read_table(fullFilePath, columns=list(columnNames))
+            return {name: _toMaskedIntegers(table.column(name).to_numpy(zero_copy_only=False))
+                    if name in INTEGER_COLUMNS
+                    else table.column(name).to_numpy(zero_copy_only=False)
+                    for name in table.column_names}
+        elif extension in SQLITE_EXTENSIONS:
+            connection = sqlite3.connect(fullFilePath)
+            try:
+                rows = connection.execute('SELECT ' + ', '.join(columnNames) +
+                                          ' FROM ' + SQLITE_TABLE_NAME).fetchall()
+            finally:
+                connection.close()
+        else:
+            with open(fullFilePath, newline='') as csvfile:
+                readCSV = csv.reader(csvfile, delimiter=',')
+                headers = next(readCSV, None)
+                columnIndices = [headers.index(name) for name in columnNames]
+                rows = [[row[index] for index in columnIndices] 
+                        for row in readCSV]
+
+        columns = list(zip(*rows)) if rows else [()] * len(columnNames)
+        results = {}
+        for name, column in zip(columnNames, columns):
+            if name in FLOAT_COLUMNS:
+                results[name] = np.array(column, dtype=np.float64)
+            elif name in INTEGER_COLUMNS:
+                results[name] = _toMaskedIntegers(column)
+            else:
+                results[name] = np.array(column, dtype=object)
+        return results
+
+    except Exception as e:
+        print('ResultsStore.LoadResults: ' + str(e))
+        logger.error('ResultsStore.LoadResults: ' + str(e))
@@ -0,0 +1,288 @@
+"""
+This class module provides the functionality for recording
+the wall clock and CPU time taken by each stage of the batch
+processing of time-MR signal data files; for example, loading
+and normalising the data, curve fitting, plotting and the
+creation of reports.
+
+For each data file, the times of its stages are recorded in a
+row together with the number of function evaluations (nfev) and
+iterations made by lmfit during curve fitting. Stages of the
+batch as a whole, such as waiting for the PDF reports or saving
+the spreadsheet, are recorded separately.  At the end of the
+batch, the rows may be saved in a CSV file and are summarised
+in an aggregate breakdown of the time spent in each stage.
+
+Usage:
+    objStageTimer = StageTimer()
+    objStageTimer.startFile(fileName)
+    with objStageTimer.stage('load'):
+        ...
+    objStageTimer.recordFitStatistics(fitStatistics)
+    objStageTimer.endFile()
+    with objStageTimer.batchStage('save'):
+        ...
+    print(objStageTimer.formatSummary())
+"""
+import csv
+import time
+import logging
+from contextlib import contextmanager
+import Tracing
+
+logger = logging.getLogger(__name__)
+
+# Names of the stages, in the order of the columns of the timings table.
+# The curve_fit stage excludes the time spent in lmfit, which is
+# recorded in the lmfit stage.
+STAGE_NAMES = ['load', 'normalise', 'plot', 'curve_fit', 'lmfit',
+               'csv_export', 'pdf_report', 'save_fit_results', 'summary']
+FIT_STATISTICS_COLUMNS = ['nfev', 'iterations']
+TIMINGS_FILE_SUFFIX = '_timings.csv'
+
+
+def NewRow(fileName):
+    """Returns an empty row of stage times for the data file, fileName."""
+    return {'file': str(fileName), 'wall': {}, 'cpu': {},
+            'nfev': None, 'iterations': None}
+
+
+@contextmanager
+def TimeRowStage(row, stageName, CPUClock=time.thread_time):
+    """Context manager that adds the wall clock and CPU time of the
+    statements it encloses to the stage, stageName, of row, a row of
+    stage times of a data file. By default, the CPU time of the current
+    thread is measured, for stages run by the threads of BatchPipeline."""
+    startTime = time.perf_counter()
+    startCPUTime = CPUClock()
+    try:
+        with Tracing.Span(stageName, 'stage', file=row['file']):
+            yield
+    finally:
+        row['wall'][stageName] = row['wall'].get(stageName, 0.0) + \
+            time.perf_counter() - startTime
+        row['cpu'][stageName] = row['cpu'].get(stageName, 0.0) + \
+            CPUClock() - startCPUTime
+
+
+class StageTimer:
+    def __init__(self, CPUClock=time.process_time):
+        """Creates an instance of the StageTimer class that holds,
+        in memory, the times of the stages of batch processing.
+
+        Input Parameters
+        ----------------
+        CPUClock - Function returning the CPU time in seconds. The CPU
+            time of the process, by default, or of the current thread, 
+            time.thread_time, when other threads are working in parallel.
+        """
+        self.CPUClock = CPUClock
+        self.rows = []
+        self.currentRow = None
+        self.batchStages = {}
+        self.startTime = time.perf_counter()
+        self.startCPUTime = time.process_time()
+        self.fileSpan = None
+        logger.info('In module ' + __name__
+                    + '. Created an instance of class StageTimer.')
+
+
+    def startFile(self, fileName):
+        """Starts a new row of stage times for the data file, fileName.
+        When tracing is enabled, a span enclosing the stages of the
+        data file is opened."""
+        self.endFile()
+        self.currentRow = NewRow(fileName)
+        self.rows.append(self.currentRow)
+        self.fileSpan = Tracing.Span('file', 'file', file=str(fileName))
+        self.fileSpan.__enter__()
+
+
+    def endFile(self):
+        """Ends the row of stage times of the current data file."""
+        if self.currentRow is not None and self.fileSpan is not None:
+            self.fileSpan.__exit__(None, None, None)
+        self.currentRow = None
+        self.fileSpan = None
+
+
+    def addRow(self, row):
+        """Appends a row of stage times recorded by the StageTimer of
+        a worker process, returned by getLastRow, and makes it the 
+        row of the current data file, so that stages run in this
+        process, such as recording the results, may be added to it."""
+        self.endFile()
+        self.currentRow = row
+        self.rows.append(row)
+
+
+    def resumeLastFile(self):
+        """Makes the row of the last data file current again, so that 
+        further stages may be added to it after endFile was called."""
+        self.endFile()
+        self.currentRow = self.rows[-1] if self.rows else None
+
+
+    def getLastRow(self):
+        """Returns the row of stage times of the last data file, 
+        a dictionary that can be passed to the addRow method of
+        another StageTimer."""
+        return self.rows[-1] if self.rows else None
+
+
+    @contextmanager
+    def stage(self, stageName):
+        """Context manager that adds the wall clock and CPU time of
+        the statements it encloses to the stage, stageName, of the
+        current data file. When tracing is enabled, a span named
+        after the stage is also recorded."""
+        startTime = time.perf_counter()
+        startCPUTime = self.CPUClock()
+        try:
+            with Tracing.Span(stageName, 'stage'):
+                yield
+        finally:
+            self.addStageTime(stageName, time.perf_counter() - startTime,
+                              self.CPUClock() - startCPUTime)
+
+
+    @contextmanager
+    def batchStage(self, stageName):
+        """Context manager that adds the wall clock and CPU time of
+        the statements it encloses to the stage, stageName, of the
+        batch as a whole."""
+        startTime = time.perf_counter()
+        startCPUTime = time.process_time()
+        try:
+            with Tracing.Span(stageName, 'stage'):
+                yield
+        finally:
+            wallTime, CPUTime = self.batchStages.get(stageName, (0.0, 0.0))
+            self.batchStages[stageName] = (
+                wallTime + time.perf_counter() - startTime,
+                CPUTime + time.process_time() - startCPUTime)
+
+
+    def addStageTime(self, stageName, wallTime, CPUTime=None):
+        """Adds wall clock and CPU times in seconds to the stage,
+        stageName, of the current data file. Does nothing if no
+        data file is being processed."""
+        if self.currentRow is None:
+            return
+        self.currentRow['wall'][stageName] = \
+            self.currentRow['wall'].get(stageName, 0.0) + wallTime
+        if CPUTime is not None:
+            self.currentRow['cpu'][stageName] = \
+                self.currentRow['cpu'].get(stageName, 0.0) + CPUTime
+
+
+    def splitStage(self, fromStageName, toStageName, wallTime, CPUTime=None):
+        """Moves time measured within the stage, fromStageName, to the
+        stage, toStageName; for example, the time spent in lmfit
+        during the curve_fit stage."""
+        if self.currentRow is None or wallTime is None:
+            return
+        self.addStageTime(fromStageName, -wallTime,
+                          -CPUTime if CPUTime is not None else None)
+        self.addStageTime(toStageName, wallTime, CPUTime)
+
+
+    def recordFitStatistics(self, fitStatistics):
+        """Records the number of function evaluations and iterations
+        made by lmfit and moves the time spent in lmfit from the
+        curve_fit stage to the lmfit stage of the current data file.
+
+        Input Parameters
+        ----------------
+        fitStatistics - Dictionary of statistics returned by
+            ModelFunctionsHelper.CurveFit.
+        """
+        if self.currentRow is None or not fitStatistics:
+            return
+        self.currentRow['nfev'] = fitStatistics.get('nfev')
+        self.currentRow['iterations'] = fitStatistics.get('iterations')
+        self.splitStage('curve_fit', 'lmfit', fitStatistics.get('fitTime'),
+                        fitStatistics.get('fitCPUTime'))
+
+
+    def getStageNames(self):
+        """Returns the names of the stages recorded for at least one
+        data file, in the order of STAGE_NAMES followed by any others."""
+        recordedNames = []
+        for row in self.rows:
+            for name in row['wall']:
+                if name not in recordedNames:
+                    recordedNames.append(name)
+        return [name for name in STAGE_NAMES if name in recordedNames] + \
+               [name for name in recordedNames if name not in STAGE_NAMES]
+
+
+    def getColumnNames(self):
+        """Returns the column headers of the timings table."""
+        columnNames = ['file']
+        for name in self.getStageNames():
+            columnNames.extend([name + '_wall', name + '_cpu'])
+        return columnNames + ['total_wall', 'total_cpu'] + FIT_STATISTICS_COLUMNS
+
+
+    def getRows(self):
+        """Returns the timings table as a list of rows, one for each
+        data file, in the order of the columns of getColumnNames."""
+        stageNames = self.getStageNames()
+        tableRows = []
+        for row in self.rows:
+            tableRow = [row['file']]
+            for name in stageNames:
+                tableRow.extend([row['wall'].get(name, 0.0), row['cpu'].get(name, 0.0)])
+            tableRow.extend([sum(row['wall'].values()), sum(row['cpu'].values()),
+                             row['nfev'], row['iterations']])
+            tableRows.append(tableRow)
+        return tableRows
+
+
+    def getSummary(self):
+        """Returns the aggregate breakdown of the batch as a list
+        of (stage, total wall time, total CPU time, mean wall time
+        per file, percentage of the batch wall time) tuples. Stages
+        of the batch as a whole have no mean time per file."""
+        batchWallTime = time.perf_counter() - self.startTime
+        numFiles = len(self.rows)
+        summary = []
+        for name in self.getStageNames():
+            wallTime = sum(row['wall'].get(name, 0.0) for row in self.rows)
+            CPUTime = sum(row['cpu'].get(name, 0.0) for row in self.rows)
+            summary.append((name, wallTime, CPUTime, wallTime/numFiles,
+                            100.0*wallTime/batchWallTime))
+        for name, (wallTime, CPUTime) in self.batchStages.items():
+            summary.append((name, wallTime, CPUTime, None,
+                            100.0*wallTime/batchWallTime))
+        summary.append(('batch', batchWallTime, time.process_time() -
+                        self.startCPUTime, batchWallTime/max(numFiles, 1), 100.0))
+        return summary
+
+
+    def formatSummary(self) -> str:
+        """Returns the aggregate breakdown of the batch as a table
+        in a string, for printing at the end of the batch."""
+        lines = ['{:18s} {:>12s} {:>12s} {:>12s} {:>8s}'.format(
+                 'Stage', 'Wall (s)', 'CPU (s)', 'Per file (s)', '% wall')]
+        for name, wallTime, CPUTime, meanWallTime, percentage in self.getSummary():
+            lines.append('{:18s} {:12.3f} {:12.3f} {:>12s} {:8.1f}'.format(
+                name, wallTime, CPUTime,
+                '' if meanWallTime is None else '{:.4f}'.format(meanWallTime),
+                percentage))
+        return '\n'.join(lines)
+
+
+    def saveTimings(self, fullFilePath):
+        """Saves the timings table in a CSV file at fullFilePath."""
+        try:
+            with open(fullFilePath, 'w', newline='') as csvfile:
+                writeCSV = csv.writer(csvfile, delimiter=',')
+                writeCSV.writerow(self.getColumnNames())
+                writeCSV.writerows(self.getRows())
+            logger.info('In module ' + __name__ + '. saveTimings. {} rows saved in {}'
+                        .format(len(self.rows), fullFilePath))
+        except Exception as e:
+            print('StageTimer.saveTimings: ' + str(e))
+            logger.error('StageTimer.saveTimings: ' + str(e))
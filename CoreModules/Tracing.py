@@ -0,0 +1,329 @@
+"""
+This module provides an opt-in tracing mode for finding the hot
+spots of a model fitting session without modifying the code.
+
+When tracing is enabled, nested spans are recorded for the stages of
+batch processing (see StageTimer.py), for curve fitting, for each
+evaluation of a model function, for the functions in MathsTools.py
+such as expconv and the SPGR signal equations, for the calculation
+of confidence limits and for the writing of reports and results.
+Each span records its start time, duration, thread and arguments,
+such as the name of the data file, the model and nfev.  The spans
+are exported as a Chrome trace-event JSON file that can be opened
+locally in a trace viewer, such as chrome://tracing or Perfetto,
+to display a timeline and flame graph of the session.
+
+Independently, cProfile can be run around the curve fitting of each
+data file during batch processing, and its statistics saved in a
+.prof file per data file, named after the data file, for use with
+pstats or a profile viewer such as snakeviz.
+
+Both are enabled by environment variables, so production runs of
+FERRET.py can be traced without changing the code:
+    FERRET_TRACE_FILE - file path and name of the trace JSON file,
+        saved when the application exits.
+    FERRET_PROFILE_FOLDER - folder in which the .prof files are saved.
+or by the --trace and --profile-folder options of BatchProcessor.py.
+
+Worker processes, such as those of the pools fitting data files, record
+their spans when tracing is enabled in the main process: the value of
+GetWorkerTracing is passed to the initialiser of each worker process,
+which calls InitialiseWorkerTracing.  Each worker process saves its
+spans in its own file in a temporary folder, timed from the start of
+the trace in the main process, and SaveTrace merges them into the trace.
+
+When tracing is disabled, a span costs one test of a global flag.
+"""
+import atexit
+import cProfile
+import functools
+import json
+import multiprocessing.util
+import os
+import shutil
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE_ENVIRONMENT_VARIABLE = 'FERRET_TRACE_FILE'
+PROFILE_FOLDER_ENVIRONMENT_VARIABLE = 'FERRET_PROFILE_FOLDER'
+
+_tracingEnabled = False
+_profileFolder = None
+_traceEvents = []
+_traceStartTime = time.perf_counter()
+_traceStartWallTime = time.time()
+_threadState = threading.local()
+# Folder in which the worker processes save their spans, see GetWorkerTracing
+_workerTraceFolder = None
+# File in which this worker process saves its spans, see InitialiseWorkerTracing
+_workerTraceFileName = None
+_workerTraceLock = threading.Lock()
+_lastWorkerFlushTime = 0.0
+# Minimum time in seconds between two saves of the spans of a worker process
+WORKER_FLUSH_INTERVAL = 1.0
+WORKER_TRACE_FILE_PREFIX = 'worker_'
+
+
+def EnableTracing():
+    """Starts recording spans. Any spans already recorded are discarded."""
+    global _tracingEnabled, _traceStartTime, _traceStartWallTime
+    _traceEvents.clear()
+    _traceStartTime = time.perf_counter()
+    _traceStartWallTime = time.time()
+    if _workerTraceFolder is not None:
+        for fileName in os.listdir(_workerTraceFolder):
+            os.remove(os.path.join(_workerTraceFolder, fileName))
+    _tracingEnabled = True
+    logger.info('Tracing.EnableTracing - tracing enabled.')
+
+
+def DisableTracing():
+    """Stops recording spans. The spans already recorded are kept."""
+    global _tracingEnabled
+    _tracingEnabled = False
+
+
+def IsTracingEnabled() -> bool:
+    """Returns True if spans are being recorded."""
+    return _tracingEnabled
+
+
+def SetProfileFolder(folder):
+    """Sets the folder in which the cProfile statistics of the curve
+    fitting of each data file are saved. None disables profiling."""
+    global _profileFolder
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    _profileFolder = folder
+
+
+def GetProfileFolder():
+    """Returns the folder in which the cProfile statistics are saved,
+    None if profiling is disabled."""
+    return _profileFolder
+
+
+def GetWorkerTracing():
+    """Returns the argument of InitialiseWorkerTracing passed to the
+    initialiser of each worker process, so that its spans are merged
+    into the trace of this process, or None if tracing is disabled."""
+    global _workerTraceFolder
+    if not _tracingEnabled:
+        return None
+    if _workerTraceFolder is None:
+        _workerTraceFolder = tempfile.mkdtemp(prefix='FERRET_trace_')
+    return (_workerTraceFolder, _traceStartWallTime)
+
+
+def InitialiseWorkerTracing(workerTracing):
+    """Runs in the initialiser of a worker process. If workerTracing,
+    returned by GetWorkerTracing in the main process, is not None,
+    enables tracing in the worker process. Its spans are timed from the
+    start of the trace in the main process and saved in a file of the
+    folder of worker traces, see FlushWorkerTrace."""
+    global _tracingEnabled, _traceStartTime, _workerTraceFileName
+    if workerTracing is None:
+        return
+    folder, startWallTime = workerTracing
+    _traceEvents.clear()
+    _traceStartTime = time.perf_counter() - (time.time() - startWallTime)
+    _workerTraceFileName = os.path.join(
+        folder, WORKER_TRACE_FILE_PREFIX + '{}.jsonl'.format(os.getpid()))
+    _tracingEnabled = True
+    # Worker processes do not run the atexit functions
+    multiprocessing.util.Finalize(None, FlushWorkerTrace, exitpriority=10)
+
+
+def FlushWorkerTrace():
+    """Appends the spans recorded by this worker process since the last
+    call to its file in the folder of worker traces, one JSON event per
+    line."""
+    global _lastWorkerFlushTime
+    if _workerTraceFileName is None:
+        return
+    with _workerTraceLock:
+        _lastWorkerFlushTime = time.perf_counter()
+        numEvents = len(_traceEvents)
+        if numEvents == 0:
+            return
+        try:
+            with open(_workerTraceFileName, 'a') as jsonFile:
+                for event in _traceEvents[:numEvents]:
+                    jsonFile.write(json.dumps(event) + '\n')
+            del _traceEvents[:numEvents]
+        except Exception as e:
+            print('Tracing.FlushWorkerTrace: ' + str(e))
+            logger.error('Tracing.FlushWorkerTrace: ' + str(e))
+
+
+def _readWorkerTraces():
+    """Returns the list of the spans saved by the worker processes."""
+    events = []
+    if _workerTraceFolder is None or not os.path.isdir(_workerTraceFolder):
+        return events
+    for fileName in sorted(os.listdir(_workerTraceFolder)):
+        if not fileName.startswith(WORKER_TRACE_FILE_PREFIX):
+            continue
+        with open(os.path.join(_workerTraceFolder, fileName)) as jsonFile:
+            events += [json.loads(line) for line in jsonFile if line.strip()]
+    return events
+
+
+def _removeWorkerTraceFolder():
+    """Deletes the folder of worker traces, when the application exits."""
+    global _workerTraceFolder
+    if _workerTraceFolder is not None:
+        shutil.rmtree(_workerTraceFolder, ignore_errors=True)
+        _workerTraceFolder = None
+
+
+def _getOpenSpans():
+    """Returns the stack of spans open in the current thread."""
+    if not hasattr(_threadState, 'openSpans'):
+        _threadState.openSpans = []
+    return _threadState.openSpans
+
+
+class Span:
+    """Context manager that records a span, named name, in the trace
+    when tracing is enabled. The keyword arguments are displayed as
+    the arguments of the span in the trace viewer."""
+    __slots__ = ('name', 'category', 'args', 'startTime')
+
+    def __init__(self, name, category='FERRET', **args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.startTime = None
+
+
+    def __enter__(self):
+        if _tracingEnabled:
+            _getOpenSpans().append(self)
+            self.startTime = time.perf_counter()
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback):
+        if self.startTime is None:
+            return False
+        endTime = time.perf_counter()
+        openSpans = _getOpenSpans()
+        if openSpans and openSpans[-1] is self:
+            openSpans.pop()
+        if excType is not None:
+            self.args['exception'] = repr(excValue)
+        _traceEvents.append({
+            'name': self.name, 'cat': self.category, 'ph': 'X',
+            'ts': (self.startTime - _traceStartTime)*1e6,
+            'dur': (endTime - self.startTime)*1e6,
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': {key: _toJSONValue(value) for key, value in self.args.items()}})
+        if _workerTraceFileName is not None and not openSpans and \
+           endTime - _lastWorkerFlushTime > WORKER_FLUSH_INTERVAL:
+            FlushWorkerTrace()
+        return False
+
+
+def SetSpanArguments(**args):
+    """Adds arguments, such as nfev after curve fitting, to the
+    innermost span open in the current thread."""
+    if _tracingEnabled:
+        openSpans = _getOpenSpans()
+        if openSpans:
+            openSpans[-1].args.update(args)
+
+
+def Traced(name=None, category='FERRET'):
+    """Decorator that records a span for each call of the decorated
+    function when tracing is enabled. By default, the span is named
+    after the function."""
+    def decorator(function):
+        spanName = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _tracingEnabled:
+                return function(*args, **kwargs)
+            with Span(spanName, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def ProfileCall(fileName, function, *args, **kwargs):
+    """Calls function(*args, **kwargs). If a profile folder is set,
+    the call is run under cProfile and its statistics are saved in
+    the profile folder in a file named after the data file, fileName,
+    with the extension .prof.
+
+    Returns
+    -------
+    The value returned by function.
+    """
+    if not _profileFolder:
+        return function(*args, **kwargs)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args, **kwargs)
+    finally:
+        profileFileName = os.path.join(_profileFolder,
+            os.path.splitext(os.path.basename(str(fileName)))[0] + '.prof')
+        try:
+            profile.dump_stats(profileFileName)
+        except Exception as e:
+            print('Tracing.ProfileCall: ' + str(e))
+            logger.error('Tracing.ProfileCall: ' + str(e))
+
+
+def _toJSONValue(value):
+    """Converts the value of a span argument to a type
+    that can be saved in a JSON file."""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def SaveTrace(traceFileName):
+    """Saves the spans recorded so far by this process and its worker
+    processes in a Chrome trace-event JSON file at traceFileName."""
+    try:
+        workerEvents = _readWorkerTraces()
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                     'args': {'name': 'FERRET'}}]
+        metadata += [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+                      'args': {'name': 'FERRET worker'}}
+                     for pid in sorted({event['pid'] for event in workerEvents})]
+        events = _traceEvents + workerEvents
+        with open(traceFileName, 'w') as jsonFile:
+            json.dump({'traceEvents': metadata + events,
+                       'displayTimeUnit': 'ms'}, jsonFile)
+        logger.info('Tracing.SaveTrace - {} spans saved in {}'
+                    .format(len(events), traceFileName))
+    except Exception as e:
+        print('Tracing.SaveTrace: ' + str(e))
+        logger.error('Tracing.SaveTrace: ' + str(e))
+
+
+def ConfigureTracing(traceFileName=None, profileFolder=None):
+    """Enables tracing, if traceFileName is given, and saves the
+    trace in traceFileName when the application exits. Enables the
+    profiling of curve fitting, if profileFolder is given. By default,
+    the values of the environment variables FERRET_TRACE_FILE and
+    FERRET_PROFILE_FOLDER are used."""
+    traceFileName = traceFileName or os.environ.get(TRACE_FILE_ENVIRONMENT_VARIABLE)
+    profileFolder = profileFolder or os.environ.get(PROFILE_FOLDER_ENVIRONMENT_VARIABLE)
+    if traceFileName:
+        EnableTracing()
+        # Functions registered with atexit run last in, first out
+        atexit.register(_removeWorkerTraceFolder)
+        atexit.register(SaveTrace, traceFileName)
+    if profileFolder:
+        SetProfileFolder(profileFolder)
@@ -0,0 +1,96 @@
+"""
+This class module provides the warm start of the curve fitting of a
+batch of data files, see the fitData method of the BatchProcessor class.
+
+Consecutive scans of a cohort usually have similar parameter values, so
+instead of starting the fit of every data file from the same initial
+values, the initial values of the parameters allowed to vary can be
+taken from earlier fits of the batch according to a policy:
+    'none' - The initial values set for the batch, or the defaults.
+    'previous' - The optimum values of the last fit that converged.
+    'median' - The median of the optimum values of all the fits that
+        have converged, a running cohort median.
+Fits that did not converge are not used.  Until a fit has converged,
+and whenever a warm-started fit does not converge, the initial values
+set for the batch are used.
+
+Each process fitting data files has its own WarmStart object, so with
+a pool of worker processes each worker learns from the data files it
+has fitted, which are spread through the batch.  The history is reset
+at the start of each batch, in the main process and in each worker
+process, even when the pool of worker processes is reused, see
+BatchProcessor.processFiles.
+
+Usage:
+    objWarmStart = WarmStart('median')
+    initialValues = objWarmStart.getInitialValues(defaultValues, fixedParameters)
+    ...
+    objWarmStart.recordFit(optimumValues, isConverged)
+"""
+from collections import deque
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WARM_START_POLICIES = ['none', 'previous', 'median']
+# Descriptions of the policies, as on the GUI
+WARM_START_LABELS = {'none': 'Same initial values for every file',
+                     'previous': 'Previous converged fit',
+                     'median': 'Median of converged fits'}
+# Maximum number of converged fits of which the median is taken
+DEFAULT_MAX_HISTORY = 1000
+
+
+class WarmStart:
+    def __init__(self, policy='none', maxHistory=DEFAULT_MAX_HISTORY):
+        """Creates an instance of the WarmStart class choosing the
+        initial values of each fit of a batch.
+
+        Input Parameters
+        ----------------
+        policy - One of WARM_START_POLICIES.
+        maxHistory - Maximum number of the most recent converged fits
+            of which the median is taken.
+        """
+        if policy not in WARM_START_POLICIES:
+            raise ValueError('Unknown warm start policy ' + str(policy))
+        self.policy = policy
+        # Optimum values of the converged fits, most recent last
+        self.convergedValues = deque(maxlen=maxHistory)
+        logger.info('In module ' + __name__ + '. Created an instance of class ' +
+                    'WarmStart with policy ' + policy + '.')
+
+
+    def getInitialValues(self, defaultValues, fixedParameters=None):
+        """Returns the list of initial values of the next fit, or None
+        if defaultValues, the initial values set for the batch, should
+        be used. The parameters fixed according to the list of booleans,
+        fixedParameters, keep their value in defaultValues."""
+        if self.policy == 'none' or not self.convergedValues:
+            return None
+        if self.policy == 'previous':
+            warmValues = self.convergedValues[-1]
+        else:
+            warmValues = np.median(np.array(self.convergedValues), axis=0).tolist()
+        if fixedParameters is None:
+            fixedParameters = [False]*len(defaultValues)
+        return [defaultValue if isFixed else float(warmValue)
+                for defaultValue, warmValue, isFixed
+                in zip(defaultValues, warmValues, fixedParameters)]
+
+
+    def recordFit(self, optimumValues, isConverged):
+        """Records the list of optimum values of a fit, in the order and
+        units of the initial values, if the fit converged."""
+        if self.policy == 'none' or not isConverged:
+            return
+        if not np.all(np.isfinite(optimumValues)):
+            return
+        self.convergedValues.append(list(optimumValues))
+
+
+    def reset(self):
+        """Forgets the fits recorded so far, for example before the
+        next batch."""
+        self.convergedValues.clear()
@@ -41,6 +41,8 @@ class XMLReader:
             self.fullFilePath = ""
             self.tree = None 
             self.root = None 
+            # Warnings already printed and logged
+            self.reportedWarnings = set()
 
             logger.info('In module ' + __name__ + ' Created XML Reader Object')
 
@@ -48,6 +50,18 @@ class XMLReader:
             print('Error in XMLReader.__init__: ' + str(e)) 
             logger.error('Error in XMLReader.__init__: ' + str(e)) 
             
+    def warnOnce(self, warningString):
+        """Prints and logs a warning about the configuration file
+        the first time it occurs. The getter functions are called 
+        for every data file during batch processing, so repeating 
+        the same warning for every file would flood the console and
+        the log file."""
+        if warningString not in self.reportedWarnings:
+            self.reportedWarnings.add(warningString)
+            print(warningString)
+            logger.warning(warningString)
+
+
     def parseConfigFile(self, fullFilePath): 
         """Loads and parses the XML configuration file at fullFilePath.
        After successful parsing, the XML tree and its root node
@@ -111,22 +125,21 @@ class XMLReader:
         contains the logic corresponding to the model
        with a short name in the string variable shortModelName"""
         try:
-            logger.info('XMLReader.getFunctionName called with short model name= ' + shortModelName)
+            logger.debug('XMLReader.getFunctionName called with short model name= ' + shortModelName)
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) +']..function'
                 functionName = self.root.find(xPath)
                 if functionName.text is None:
                     raise ValueNotDefinedInConfigFile
                 else:
-                    logger.info('XMLReader.getFunctionName found function name ' + functionName.text)
+                    logger.debug('XMLReader.getFunctionName found function name ' + functionName.text)
                     return functionName.text
             else:
                 return None
 
         except ValueNotDefinedInConfigFile:
             warningString = 'Error - No function defined for model {}'.format(shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getFunctionName - ' + warningString)
+            self.warnOnce('XMLReader.getFunctionName - ' + warningString)
             return None
         except Exception as e:
             print('Error in XMLReader.getFunctionName when shortModelName ={}: '.format(shortModelName) 
@@ -140,7 +153,7 @@ class XMLReader:
         contains the function corresponding to the model
        with a short name in the string variable shortModelName"""
         try:
-            logger.info('XMLReader.getModuleName called with short model name= ' 
+            logger.debug('XMLReader.getModuleName called with short model name= ' 
                         + shortModelName)
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) +']..module'
@@ -148,7 +161,7 @@ class XMLReader:
                 if moduleName.text is None:
                     raise ValueNotDefinedInConfigFile
                 else:
-                    logger.info('XMLReader.getModuleName found module name ' 
+                    logger.debug('XMLReader.getModuleName found module name ' 
                                 + moduleName.text)
                     return moduleName.text
             else:
@@ -156,8 +169,7 @@ class XMLReader:
 
         except ValueNotDefinedInConfigFile:
             warningString = 'Error - No module defined for model {}'.format(shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getFunctionName - ' + warningString)
+            self.warnOnce('XMLReader.getFunctionName - ' + warningString)
             return None
         except Exception as e:
             print('Error in XMLReader.getModuleName when shortModelName ={}: '.format(shortModelName) 
@@ -173,14 +185,14 @@ class XMLReader:
         in the string variable shortModelName when
         its output is plotted against time."""
         try:
-            logger.info('XMLReader.getYAxisLabel called')
+            logger.debug('XMLReader.getYAxisLabel called')
             
             xPath='./plot/y_axis_label'
             yAxisLabel = self.root.find(xPath)
             if yAxisLabel.text is None:
                 raise ValueNotDefinedInConfigFile
             else:
-                logger.info('XMLReader.getYAxisLabel found Y Axis Label' 
+                logger.debug('XMLReader.getYAxisLabel found Y Axis Label' 
                             + yAxisLabel.text)
                 return yAxisLabel.text
             
@@ -199,23 +211,22 @@ class XMLReader:
         """Returns the name of the image that represents the model
        with a short name in the string variable shortModelName"""
         try:
-            logger.info('XMLReader.getImageName called with short model name= ' + shortModelName)
+            logger.debug('XMLReader.getImageName called with short model name= ' + shortModelName)
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) +']..image'
                 imageName = self.root.find(xPath)
                 if imageName.text is None:
                     raise ValueNotDefinedInConfigFile
                 else:
-                    logger.info('XMLReader.getImageName found image ' + imageName.text)
+                    logger.debug('XMLReader.getImageName found image ' + imageName.text)
                     return imageName.text
             else:
                 return None
 
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - The name of an image describing model {}' \
-                .format(shorModelName) +' is not defined in the configuration file.'
-            print(warningString)
-            logger.info('XMLReader.getImageName - ' + waringString)
+                .format(shortModelName) +' is not defined in the configuration file.'
+            self.warnOnce('XMLReader.getImageName - ' + warningString)
             return None
         except Exception as e:
             print('Error in XMLReader.getImageName when shortModelName ={}: '.format(shortModelName) 
@@ -229,22 +240,21 @@ class XMLReader:
         """Returns the long name of the model
        with a short name in the string variable shortModelName"""
         try:
-            logger.info('XMLReader.getLongModelName called with short model name= ' + shortModelName)
+            logger.debug('XMLReader.getLongModelName called with short model name= ' + shortModelName)
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) +']/long'
                 modelName = self.root.find(xPath)
                 if modelName.text is None:
                     raise ValueNotDefinedInConfigFile
                 else:
-                    logger.info('XMLReader.getLongModelName found long model name ' + \
+                    logger.debug('XMLReader.getLongModelName found long model name ' + \
                         modelName.text)
                     return modelName.text
             else:
                 return None
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - No long name defined for this model in the configuration file'
-            print(warningString)
-            logger.info('XMLReader.getLongModel - '   + NamewarningString)
+            self.warnOnce('XMLReader.getLongModel - ' + warningString)
             return 'No long name defined for this model'
         except Exception as e:
             print('Error in XMLReader.getLongModelName when shortModelName ={}: '.format(shortModelName) 
@@ -258,7 +268,7 @@ class XMLReader:
         """Returns the inlet type (single or dual) of the model
        with a short name in the string variable shortModelName"""
         try:
-            logger.info('XMLReader.getModelInletType called with short model name= ' + shortModelName)
+            logger.debug('XMLReader.getModelInletType called with short model name= ' + shortModelName)
             if len(shortModelName) > 0 and \
                 shortModelName != FIRST_ITEM_MODEL_LIST and \
                 shortModelName != NO_MODELS_DEFINED_IN_CONFIG_FILE:
@@ -267,15 +277,14 @@ class XMLReader:
                 if modelInletType.text is None:
                     raise ValueNotDefinedInConfigFile
                 else:
-                    logger.info('XMLReader.getModelInletType found model inlet type ' + modelInletType.text)
+                    logger.debug('XMLReader.getModelInletType found model inlet type ' + modelInletType.text)
                     return modelInletType.text
             else:
                 return None
 
         except ValueNotDefinedInConfigFile:  
             warningString = 'Error - No model inlet type defined in the config file'
-            print(warningString)
-            logger.info('XMLReader.getModelInletType - ' + warningString)
+            self.warnOnce('XMLReader.getModelInletType - ' + warningString)
             return None
         except Exception as e:
             print('Error in XMLReader.getModelInletType when shortModelName ={}: '.format(shortModelName) 
@@ -289,7 +298,7 @@ class XMLReader:
         """Returns the number of input parameters to the model whose
        short name is stored in the string variable shortModelName."""
         try:
-            logger.info('XMLReader.getNumberOfParameters called with short model name= ' + shortModelName)
+            logger.debug('XMLReader.getNumberOfParameters called with short model name= ' + shortModelName)
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) +']..parameters/parameter'
                 parameters = self.root.findall(xPath)
@@ -303,8 +312,7 @@ class XMLReader:
 
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - No parameters defined when shortModelName = {} and xPath= {}: '.format(shortModelName, xPath) 
-            print(warningString)
-            logger.info('XMLReader.getNumberOfParameters - ' + warningString)
+            self.warnOnce('XMLReader.getNumberOfParameters - ' + warningString)
             return 0
         except Exception as e:
             print('Error in XMLReader.getNumberOfParameters when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -324,7 +332,7 @@ class XMLReader:
         positionNumber - The ordinal position of the parameter in the 
                         model's parameter collection. Numbers from one."""
         try:
-            logger.info('XMLReader.getParameterLabel called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getParameterLabel called with short model name= %s and position=%s ', shortModelName,positionNumber)
             isPercentage = False
             missingShortName = False
             missingLongName = False
@@ -364,8 +372,7 @@ class XMLReader:
                 return isPercentage, fullName
         except CannotFormFullParameterName:
             warningString = 'Warning - Cannot form the full name for parameter at position {}'.format(str(positionNumber))
-            print (warningString)
-            logger.info('XMLReader.getParameterLabel - ' + warningString)
+            self.warnOnce('XMLReader.getParameterLabel - ' + warningString)
             return False, 'Cannot form full parameter name'
         except Exception as e:
             print('Error in XMLReader.getParameterLabel when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -384,7 +391,7 @@ class XMLReader:
         positionNumber - The ordinal position of the parameter in the 
                         model's parameter collection. Numbers from one."""
         try:
-            logger.info('XMLReader.getParameterShortName called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getParameterShortName called with short model name= %s and position=%s ', shortModelName,positionNumber)
             
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) + \
@@ -401,8 +408,7 @@ class XMLReader:
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - No short name defined for the parameter '  + \
                     'at position {} when the model short = {}'.format(positionNumber, shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getParameterShortName - ' + warningString)
+            self.warnOnce('XMLReader.getParameterShortName - ' + warningString)
             return ''
         except Exception as e:
             print('Error in XMLReader.getParameterShortName when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -419,7 +425,7 @@ class XMLReader:
         short name is shortModelName.
         """
         try:
-            logger.info('XMLReader.getParameterDefault called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getParameterDefault called with short model name= %s and position=%s ', shortModelName,positionNumber)
             
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) + \
@@ -436,8 +442,7 @@ class XMLReader:
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - No default value defined for the parameter '  + \
                     'at position {} when the model short = {}'.format(positionNumber, shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getParameterDefault - ' + warningString)
+            self.warnOnce('XMLReader.getParameterDefault - ' + warningString)
             return 0.0
         except Exception as e:
             print('Error in XMLReader.getParameterDefault when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -456,7 +461,7 @@ class XMLReader:
         the parameter value is changed by the value of step.
         """
         try:
-            logger.info('XMLReader.getParameterStep called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getParameterStep called with short model name= %s and position=%s ', shortModelName,positionNumber)
             
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) + \
@@ -473,8 +478,7 @@ class XMLReader:
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - No increment/decrement step value defined for the parameter '  + \
                     'at position {} when the model short = {}'.format(positionNumber, shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getParameterStep - ' + warningString)
+            self.warnOnce('XMLReader.getParameterStep - ' + warningString)
             return 0.0
         except Exception as e:
             print('Error in XMLReader.getParameterStep when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -492,7 +496,7 @@ class XMLReader:
         Parameter values are displayed in a spinbox on the application GUI.
         """
         try:
-            logger.info('XMLReader.getParameterPrecision called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getParameterPrecision called with short model name= %s and position=%s ', shortModelName,positionNumber)
             
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) + \
@@ -509,8 +513,7 @@ class XMLReader:
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - Number of decimal places is not defined for the parameter '  + \
                     'at position {} when the model short = {}'.format(positionNumber, shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getParameterPrecision - ' + warningString)
+            self.warnOnce('XMLReader.getParameterPrecision - ' + warningString)
             return 0
         except Exception as e:
             print('Error in XMLReader.getParameterPrecision when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -529,7 +532,7 @@ class XMLReader:
         spinbox on the application GUI.
         """
         try:
-            logger.info('XMLReader.getMaxParameterDisplayValue called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getMaxParameterDisplayValue called with short model name= %s and position=%s ', shortModelName,positionNumber)
             
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) + \
@@ -544,8 +547,7 @@ class XMLReader:
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - Maximum value allowed in the spinbox for the parameter '  + \
                     'at position {} when the model short = {} is not defined'.format(positionNumber, shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getMaxParameterDisplayValue - ' + warningString)
+            self.warnOnce('XMLReader.getMaxParameterDisplayValue - ' + warningString)
             return None
         except Exception as e:
             print('Error in XMLReader.getMaxParameterDisplayValue when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -564,7 +566,7 @@ class XMLReader:
         spinbox on the application GUI.
         """
         try:
-            logger.info('XMLReader.getMinParameterDisplayValue called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getMinParameterDisplayValue called with short model name= %s and position=%s ', shortModelName,positionNumber)
             
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) + \
@@ -579,8 +581,7 @@ class XMLReader:
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - Minimum value allowed in the spinbox for the parameter '  + \
                     'at position {} when the model short = {} is not defined'.format(positionNumber, shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getMinParameterDisplayValue - ' + warningString)
+            self.warnOnce('XMLReader.getMinParameterDisplayValue - ' + warningString)
             return None
         except Exception as e:
             print('Error in XMLReader.getMinParameterDisplayValue when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -599,7 +600,7 @@ class XMLReader:
         spinbox on the application GUI.
         """
         try:
-            logger.info('XMLReader.getUpperParameterConstraint called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getUpperParameterConstraint called with short model name= %s and position=%s ', shortModelName,positionNumber)
             
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) + \
@@ -614,8 +615,7 @@ class XMLReader:
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - Upper constraint for curve fitting for the parameter '  + \
                     'at position {} when the model short = {} is not defined'.format(positionNumber, shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getUpperParameterConstraint - ' + warningString)
+            self.warnOnce('XMLReader.getUpperParameterConstraint - ' + warningString)
             return None
         except Exception as e:
             print('Error in XMLReader.getUpperParameterConstraint when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -634,7 +634,7 @@ class XMLReader:
         spinbox on the application GUI.
         """
         try:
-            logger.info('XMLReader.getLowerParameterConstraint called with short model name= {} and position={} '.format(shortModelName,positionNumber) )
+            logger.debug('XMLReader.getLowerParameterConstraint called with short model name= %s and position=%s ', shortModelName,positionNumber)
             
             if len(shortModelName) > 0:
                 xPath='./model/name[short=' + chr(34) + shortModelName + chr(34) + \
@@ -649,8 +649,7 @@ class XMLReader:
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - Lower constraint for curve fitting for the parameter '  + \
                     'at position {} when the model short = {} is not defined'.format(positionNumber, shortModelName)
-            print(warningString)
-            logger.info('XMLReader.getLowerParameterConstraint - ' + warningString)
+            self.warnOnce('XMLReader.getLowerParameterConstraint - ' + warningString)
             return None
         except Exception as e:
             print('Error in XMLReader.getLowerParameterConstraint when shortModelName ={} and xPath={}: '.format(shortModelName, xPath) 
@@ -663,7 +662,7 @@ class XMLReader:
     def getDataFileFolder(self)->str:
         """ Returns the path to the folder where the data files are stored"""
         try:
-            logger.info('XMLReader.getDataFileFolder called')
+            logger.debug('XMLReader.getDataFileFolder called')
            
             xPath='./data_file_path'
             dataFileFolder = self.root.find(xPath)
@@ -675,8 +674,7 @@ class XMLReader:
 
         except ValueNotDefinedInConfigFile:
             warningString = 'Warning - Path to folder containing data files is not defined'
-            print(warningString)
-            logger.info('XMLReader.getDataFileFolder - ' + warningString)
+            self.warnOnce('XMLReader.getDataFileFolder - ' + warningString)
             return ''
         except Exception as e:
             print('Error in XMLReader.getDataFileFolder:' 
@@ -690,7 +688,7 @@ class XMLReader:
         """ Returns a string representation of a dictionary of
             model constant name:value pairs."""
         try:
-            logger.info('XMLReader.getStringOfConstants called')
+            logger.debug('XMLReader.getStringOfConstants called')
            
             xPath='./constants/constant'
             collectionConstants = self.root.findall(xPath)
@@ -723,7 +721,7 @@ class XMLReader:
     def getNumBaselineScans(self):
         """ Gets the number of the baseline scans."""
         try:
-            logger.info('XMLReader.getNumBaselineScans called')
+            logger.debug('XMLReader.getNumBaselineScans called')
            
             xPath="./constants/constant[name ='baseline']/value"
             baselineValue = self.root.find(xPath)
@@ -3,9 +3,8 @@ of concentration or MR signal with time according to a tracer kinetic model.
 """
 import MathsTools as tools
 import ExceptionHandling as exceptionHandler
+import PartialEvaluation
 import numpy as np
-from scipy.optimize import fsolve
-from joblib import Parallel, delayed
 import logging
 logger = logging.getLogger(__name__)
 
@@ -41,45 +40,17 @@ def HighFlowSingleInletGadoxetate2DSPGR_Rat(xData2DArray, Ve, Kbh, Khe,
     try:
         exceptionHandler.modelFunctionInfoLogger()
         t = xData2DArray[:,0]
-        Sa = xData2DArray[:,1]
 
-        # Unpack SPGR model constants from 
-        # a string representation of a dictionary
-        # of constants and their values
-        constantsDict = eval(constantsString) 
-        TR, baseline, FA, r1, R10a, R10t = \
-        float(constantsDict['TR']), \
-        int(constantsDict['baseline']),\
-        float(constantsDict['FA']), float(constantsDict['r1']), \
-        float(constantsDict['R10a']), float(constantsDict['R10t']) 
-               
-        
-        # Convert to concentrations
-        # n_jobs set to 1 to turn off parallel processing
-        # because parallel processing caused a segmentation
-        # fault in the compiled version of this application. 
-        # This is not a problem in the uncompiled script
-        R1a = [Parallel(n_jobs=1)(delayed(fsolve)
-           (tools.spgr2d_func, x0=0, 
-            args = (r1, FA, TR, R10a, baseline, Sa[p])) 
-            for p in np.arange(0,len(t)))]
-
-        R1a = np.squeeze(R1a)
-        
-        ca = (R1a - R10a)/r1
-        
-        # Correct for spleen Ve
-        ve_spleen = 0.43
-        ce = ca/ve_spleen
-        
-        if Kbh != 0:
-            Th = (1-Ve)/Kbh
-            ct = Ve*ce + Khe*Th*tools.expconv(Th,t,ce, 'HighFlowSingleInletGadoxetate2DSPGR_Rat')
-        else:
-            ct = Ve*ce + Khe*tools.integrate(ce,t)
+        # Unpack SPGR model constants and convert
+        # the AIF signal to concentrations
+        ratModel = _PrepareRatModel(xData2DArray, constantsString, '2D')
+        ce = ratModel['ce']
+
+        ct = Ve*ce + Khe*_RatLiverConvolution(Ve, Kbh, t, ce, 
+                                              'HighFlowSingleInletGadoxetate2DSPGR_Rat')
         
         # Convert to signal
-        St_rel = tools.spgr2d_func_inv(r1, FA, TR, R10t, ct)
+        St_rel = _RatLiverSignal(ct, ratModel['constants'], '2D')
         
         #Return tissue signal relative to the baseline St/St_baseline
         return(St_rel) 
@@ -115,41 +86,17 @@ def HighFlowSingleInletGadoxetate3DSPGR_Rat(xData2DArray, Ve, Kbh, Khe,
     try:
         exceptionHandler.modelFunctionInfoLogger()
         t = xData2DArray[:,0]
-        Sa = xData2DArray[:,1]
 
-        # Unpack SPGR model constants from 
-        # a string representation of a dictionary
-        # of constants and their values
-        constantsDict = eval(constantsString) 
-        TR, baseline, FA, r1, R10a, R10t = \
-        float(constantsDict['TR']), \
-        int(constantsDict['baseline']),\
-        float(constantsDict['FA']), float(constantsDict['r1']), \
-        float(constantsDict['R10a']), float(constantsDict['R10t']) 
-        
-        
-        # Convert to concentrations
-        # n_jobs set to 1 to turn off parallel processing
-        # because parallel processing caused a segmentation
-        # fault in the compiled version of this application.
-        # This is not a problem in the uncompiled script
-        R1a = [Parallel(n_jobs=1)(delayed(fsolve)
-          (tools.spgr3d_func, x0=0, 
-           args = (FA, TR, R10a, baseline, Sa[p])) 
-           for p in np.arange(0,len(t)))]
-        R1a = np.squeeze(R1a)
-        
-        ca = (R1a - R10a)/r1
-        
-        # Correct for spleen Ve
-        ve_spleen = 0.43
-        ce = ca/ve_spleen
-        Th = (1-Ve)/Kbh
-        ct = Ve*ce + Khe*Th*tools.expconv(Th,t,ce,'HighFlowSingleInletGadoxetate3DSPGR_Rat')
-        
+        # Unpack SPGR model constants and convert
+        # the AIF signal to concentrations
+        ratModel = _PrepareRatModel(xData2DArray, constantsString, '3D')
+        ce = ratModel['ce']
+
+        ct = Ve*ce + Khe*_RatLiverConvolution(Ve, Kbh, t, ce, 
+                                              'HighFlowSingleInletGadoxetate3DSPGR_Rat')
         
         # Convert to signal
-        St_rel = tools.spgr3d_func_inv(r1, FA, TR, R10t, ct)
+        St_rel = _RatLiverSignal(ct, ratModel['constants'], '3D')
         
         return(St_rel) #Returns tissue signal relative to the baseline St/St_baseline
         
@@ -157,6 +104,109 @@ def HighFlowSingleInletGadoxetate3DSPGR_Rat(xData2DArray, Ve, Kbh, Khe,
         exceptionHandler.handleDivByZeroException(zde)
     except Exception as e:
         exceptionHandler.handleGeneralException(e)
+
+
+####################################################################
+####  Intermediates of the MR Signal Rat Models, shared by the model
+####  functions and their staged definitions in STAGED_MODELS
+####################################################################
+def _PrepareRatModel(xData2DArray, constantsString, sequence):
+    """Returns a dictionary holding the time (t), the extracellular 
+    concentration of the spleen AIF (ce) and the dictionary of SPGR 
+    model constants (constants) of the rat models. They only depend 
+    on the data and constants, not on the model parameters.
+    sequence is '2D' or '3D'."""
+    t = xData2DArray[:,0]
+    Sa = xData2DArray[:,1]
+
+    # Unpack SPGR model constants from 
+    # a string representation of a dictionary
+    # of constants and their values
+    constantsDict = eval(constantsString) 
+    constants = {'TR': float(constantsDict['TR']),
+                 'baseline': int(constantsDict['baseline']),
+                 'FA': float(constantsDict['FA']), 
+                 'r1': float(constantsDict['r1']),
+                 'R10a': float(constantsDict['R10a']), 
+                 'R10t': float(constantsDict['R10t'])}
+    TR, baseline, FA, r1, R10a = constants['TR'], constants['baseline'], \
+        constants['FA'], constants['r1'], constants['R10a']
+
+    # Convert to concentrations
+    if sequence == '2D':
+        R1a = tools.spgr2d_func_solve(r1, FA, TR, R10a, baseline, Sa)
+    else:
+        R1a = tools.spgr3d_func_solve(FA, TR, R10a, baseline, Sa)
+    ca = (R1a - R10a)/r1
+
+    # Correct for spleen Ve
+    ve_spleen = 0.43
+    ce = ca/ve_spleen
+    return {'t': t, 'ce': ce, 'constants': constants}
+
+
+def _RatLiverConvolution(Ve, Kbh, t, ce, modelName):
+    """Returns the convolution of ce with the hepatocyte residue
+    function, Th*exp(-t/Th), where Th = (1-Ve)/Kbh."""
+    if Kbh != 0:
+        Th = (1-Ve)/Kbh
+        return Th*tools.expconv(Th, t, ce, modelName)
+    # Limit of the expconv term as Th tends to infinity
+    return tools.integrate(ce, t, 'trapezoidal')
+
+
+def _RatLiverConvolutionBatch(Ve, Kbh, t, ce):
+    """Returns the convolutions of _RatLiverConvolution for the column
+    arrays of values of Ve and Kbh, one row per pair of values."""
+    Ve, Kbh = np.broadcast_arrays(np.ravel(Ve), np.ravel(Kbh))
+    isZero = Kbh == 0
+    Th = (1-Ve)/np.where(isZero, 1.0, Kbh)
+    convolution = Th[:, np.newaxis]*tools.expconv_batch(
+        Th, t, np.broadcast_to(ce, (len(Th), len(ce))))
+    convolution[isZero] = tools.integrate(ce, t, 'trapezoidal')
+    return convolution
+
+
+def _RatLiverSignal(ct, constants, sequence):
+    """Converts the liver concentration, ct, to the MR signal
+    relative to the baseline. sequence is '2D' or '3D'."""
+    if sequence == '2D':
+        return tools.spgr2d_func_inv(constants['r1'], constants['FA'], 
+                                     constants['TR'], constants['R10t'], ct)
+    return tools.spgr3d_func_inv(constants['r1'], constants['FA'], 
+                                 constants['TR'], constants['R10t'], ct)
+
+
+def _StagedRatModel(functionName, sequence):
+    """Returns the StagedModel of a rat model, declaring that the
+    convolution depends on Ve and Kbh and the liver concentration
+    on Ve, Khe and the convolution. The liver concentration and
+    signal are elementwise, so the same functions evaluate a batch."""
+    concentration = lambda Ve, Khe, ce, convolution: Ve*ce + Khe*convolution
+    signal = lambda ct, constants: _RatLiverSignal(ct, constants, sequence)
+    return PartialEvaluation.StagedModel(['Ve', 'Kbh', 'Khe'],
+        lambda xData2DArray, constantsString: 
+            _PrepareRatModel(xData2DArray, constantsString, sequence),
+        [PartialEvaluation.Stage('convolution', ['Ve', 'Kbh', 't', 'ce'],
+            lambda Ve, Kbh, t, ce: _RatLiverConvolution(Ve, Kbh, t, ce, functionName),
+            _RatLiverConvolutionBatch),
+         PartialEvaluation.Stage('ct', ['Ve', 'Khe', 'ce', 'convolution'],
+            concentration, concentration),
+         PartialEvaluation.Stage('St_rel', ['ct', 'constants'], signal, signal)])
+
+
+# Staged definitions of model functions, by function name, used by
+# ModelFunctionsHelper.CurveFit to calculate once per fit the
+# intermediates that do not depend on the parameters allowed to vary.
+# See PartialEvaluation.py. Model functions without a staged definition
+# are evaluated in full at each iteration.
+STAGED_MODELS = {
+    'HighFlowSingleInletGadoxetate2DSPGR_Rat': 
+        _StagedRatModel('HighFlowSingleInletGadoxetate2DSPGR_Rat', '2D'),
+    'HighFlowSingleInletGadoxetate3DSPGR_Rat': 
+        _StagedRatModel('HighFlowSingleInletGadoxetate3DSPGR_Rat', '3D')}
+
+
 ####################################################################
 ####  MR Signal Models 
 ####################################################################
@@ -184,11 +234,9 @@ def DualInletTwoCompartmentGadoxetateAnd2DSPGRModel(xData2DArray, Fa, Ve, Fp, Kb
         Sv_baseline = np.mean(signalVIF[0:int(t0/t[1])-1])
     
         # Convert to concentrations
-        R1a = [Parallel(n_jobs=4)(delayed(fsolve)(spgr2d_func, x0=0, args = (FA, TR, R10a, Sa_baseline, signalAIF[p])) for p in np.arange(0,len(t)))]
-        R1v = [Parallel(n_jobs=4)(delayed(fsolve)(spgr2d_func, x0=0, args = (FA, TR, R10v, Sv_baseline, signalVIF[p])) for p in np.arange(0,len(t)))]
+        R1a = tools.spgr2d_func_solve(r1, FA, TR, R10a, Sa_baseline, signalAIF)
+        R1v = tools.spgr2d_func_solve(r1, FA, TR, R10v, Sv_baseline, signalVIF)
     
-        R1a = np.squeeze(R1a)
-        R1v = np.squeeze(R1v)
 
         concAIF = (R1a - R10a)/r1 
         concVIF = (R1v - R10v)/r1
@@ -247,11 +295,9 @@ def DualInletTwoCompartmentGadoxetateAnd3DSPGRModel(
         Sv_baseline = np.mean(signalVIF[0:int(t0/t[1])-1])
     
         # Convert to concentrations
-        R1a = [Parallel(n_jobs=4)(delayed(fsolve)(spgr3d_func, x0=0, args = (FA, TR, R10a, Sa_baseline, signalAIF[p])) for p in np.arange(0,len(t)))]
-        R1v = [Parallel(n_jobs=4)(delayed(fsolve)(spgr3d_func, x0=0, args = (FA, TR, R10v, Sv_baseline, signalVIF[p])) for p in np.arange(0,len(t)))]
+        R1a = tools.spgr3d_func_solve(FA, TR, R10a, Sa_baseline, signalAIF)
+        R1v = tools.spgr3d_func_solve(FA, TR, R10v, Sv_baseline, signalVIF)
         
-        R1a = np.squeeze(R1a)
-        R1v = np.squeeze(R1v)
 
         concAIF = (R1a - R10a)/r1
         concVIF = (R1v - R10v)/r1
@@ -308,11 +354,9 @@ def HighFlowDualInletTwoCompartmentGadoxetateAnd3DSPGRModel(xData2DArray, Fa, Ve
         Sv_baseline = np.mean(signalVIF[0:int(t0/t[1])-1])
     
         # Convert to concentrations
-        R1a = [Parallel(n_jobs=4)(delayed(fsolve)(spgr3d_func, x0=0, args = (FA, TR, R10a, Sa_baseline, signalAIF[p])) for p in np.arange(0,len(t)))]
-        R1v = [Parallel(n_jobs=4)(delayed(fsolve)(spgr3d_func, x0=0, args = (FA, TR, R10v, Sv_baseline, signalVIF[p])) for p in np.arange(0,len(t)))]
+        R1a = tools.spgr3d_func_solve(FA, TR, R10a, Sa_baseline, signalAIF)
+        R1v = tools.spgr3d_func_solve(FA, TR, R10v, Sv_baseline, signalVIF)
     
-        R1a = np.squeeze(R1a)
-        R1v = np.squeeze(R1v)
 
         concAIF = (R1a - R10a)/r1
         concVIF = (R1v - R10v)/r1
@@ -357,11 +401,9 @@ def HighFlowDualInletTwoCompartmentGadoxetateAnd2DSPGRModel(xData2DArray, Fa, Ve
         Sv_baseline = np.mean(signalVIF[0:int(t0/t[1])-1])
     
         # Convert to concentrations
-        R1a = [Parallel(n_jobs=4)(delayed(fsolve)(spgr2d_func, x0=0, args = (FA, TR, R10a, Sa_baseline, signalAIF[p])) for p in np.arange(0,len(t)))]
-        R1v = [Parallel(n_jobs=4)(delayed(fsolve)(spgr2d_func, x0=0, args = (FA, TR, R10v, Sv_baseline, signalVIF[p])) for p in np.arange(0,len(t)))]
+        R1a = tools.spgr2d_func_solve(r1, FA, TR, R10a, Sa_baseline, signalAIF)
+        R1v = tools.spgr2d_func_solve(r1, FA, TR, R10v, Sv_baseline, signalVIF)
     
-        R1a = np.squeeze(R1a)
-        R1v = np.squeeze(R1v)
 
         concAIF = (R1a - R10a)/r1
         concVIF = (R1v - R10v)/r1
@@ -403,14 +445,13 @@ def HighFlowSingleInletTwoCompartmentGadoxetateAnd2DSPGRModel(xData2DArray, Ve,
         Sa_baseline = np.mean(signalAIF[0:int(t0/t[1])-1])
     
         # Convert to concentrations
-        R1a = [Parallel(n_jobs=4)(delayed(fsolve)(spgr2d_func, x0=0, args = (FA, TR, R10a, Sa_baseline, signalAIF[p])) for p in np.arange(0,len(t)))]
-        R1a = np.squeeze(R1a)
+        R1a = tools.spgr2d_func_solve(r1, FA, TR, R10a, Sa_baseline, signalAIF)
         
         concAIF = (R1a - R10a)/r1
     
         c_if = concAIF
       
-        Th = (1-Ve)/kbh
+        Th = (1-Ve)/Kbh
     
         ce = c_if
         ct = Ve*ce + Khe*Th*tools.expconv(Th, t, ce, funcName)
@@ -445,8 +486,7 @@ def HighFlowSingleInletTwoCompartmentGadoxetateAnd3DSPGRModel(xData2DArray, Ve,
         Sa_baseline = np.mean(signalAIF[0:int(t0/t[1])-1])
     
         # Convert to concentrations
-        R1a = [Parallel(n_jobs=4)(delayed(fsolve)(spgr3d_func, x0=0, args = (FA, TR, R10a, Sa_baseline, signalAIF[p])) for p in np.arange(0,len(t)))]
-        R1a = np.squeeze(R1a)
+        R1a = tools.spgr3d_func_solve(FA, TR, R10a, Sa_baseline, signalAIF)
         
         concAIF = (R1a - R10a)/r1
     
@@ -2,8 +2,6 @@
 import MathsTools as tools
 import ExceptionHandling as exceptionHandler
 import numpy as np
-from scipy.optimize import fsolve
-from joblib import Parallel, delayed
 import logging
 logger = logging.getLogger(__name__)
 
@@ -11,6 +9,12 @@ logger = logging.getLogger(__name__)
 #  are listed in the same order as they are displayed in the GUI 
 #  from top (first) to bottom (last).  The maximum number of
 #  parameters allowed is 5. 
+#
+#  Optionally, to speed up curve fitting when parameters are fixed,
+#  the intermediates of a model function and the parameters on which
+#  they depend may be declared in a StagedModel, see PartialEvaluation.py,
+#  added to a dictionary called STAGED_MODELS under the name of the
+#  model function, as for the rat models in ModelFunctions.py.
 
 ####################################################################
 ####  MR Signal Models 
@@ -60,17 +64,11 @@ def Model_Function_Template(xData2DArray, param1, param2, param3, param4, param5
         float(constantsDict['FA']), float(constantsDict['r1']), \
         float(constantsDict['R10a']), float(constantsDict['R10t']) 
         
-        # Convert AIF MR signals to concentrations
-        # n_jobs set to 1 to turn off parallel processing
-        # because parallel processing caused a segmentation
-        # fault in the compiled version of this application. 
-        # This is not a problem in the uncompiled script
-        R1a = [Parallel(n_jobs=1)(delayed(fsolve)
-           (tools.spgr2d_func, x0=0, 
-            args = (r1, FA, TR, R10a, baseline, signalAIF[p])) 
-            for p in np.arange(0,len(times)))]
-
-        R1a = np.squeeze(R1a)
+        # Convert AIF MR signals to concentrations.
+        # Do not create a pool of worker processes here, the model 
+        # function is called many times during curve fitting. 
+        # Whole data files are fitted in parallel by BatchProcessor.
+        R1a = tools.spgr2d_func_solve(r1, FA, TR, R10a, baseline, signalAIF)
         
         ca = (R1a - R10a)/r1
         
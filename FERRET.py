@@ -158,6 +158,8 @@ __date__ = "Date: 2018/12/12"
 import sys
 import csv
 import os
+import io
+import multiprocessing
 #Add folders CoreModules & Developer/ModelLibrary to the Module Search Path. 
 #path[0] is the current working directory
 sys.path.append(os.path.join(sys.path[0],'CoreModules'))
@@ -190,8 +192,21 @@ import StyleSheet
 #Import PDF report writer class
 from PDFWriter import PDF
 
+from BatchProcessor import BatchProcessor, BatchOutputs
+from ReportGenerator import ReportGenerator
+import ReportGenerator as ReportGeneratorModule
+from ResourceManager import ResourceManager
+import PlotDataExport
+
 from ExcelWriter import ExcelWriter
 
+import ResultsStore
+import StageTimer as StageTimerModule
+import Tracing
+import WarmStart as WarmStartModule
+import LoggingConfig
+from StageTimer import StageTimer
+
 from XMLReader import XMLReader
  
 ########################################
@@ -199,7 +214,6 @@ from XMLReader import XMLReader
 ########################################
 WINDOW_TITLE = 'FERRET - Model-fitting of dynamic contrast-enhanced MRI'
 REPORT_TITLE = 'FERRET - Model-fitting of dynamic contrast-enhanced MRI'
-IMAGE_NAME = 'model.png'
 DEFAULT_REPORT_FILE_PATH_NAME = 'report.pdf'
 DEFAULT_PLOT_DATA_FILE_PATH_NAME = 'plot.csv'
 LOG_FILE_NAME = "TRISTAN.log"
@@ -213,14 +227,10 @@ FERRET_LOGO = 'images\\FERRET_LOGO.png'
 MODEL_DIAGRAM_FOLDER = 'Developer\\ModelDiagrams\\'
 #######################################
 
-#Create and configure the logger
-#First delete the previous log file if there is one
-if os.path.exists(LOG_FILE_NAME):
-   os.remove(LOG_FILE_NAME) 
+#Create the logger. It is configured in the main block below,
+#so that worker processes, which import this module, do not
+#overwrite the log file.
 LOG_FORMAT = "%(levelname)s %(asctime)s - %(message)s"
-logging.basicConfig(filename=LOG_FILE_NAME, 
-                    level=logging.INFO, 
-                    format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 class NavigationToolbar(NavigationToolbar):
@@ -309,9 +319,16 @@ class ModelFittingApp(QWidget):
         
         # Stores optimum parameters from Curve fitting
         self.optimisedParamaterList = [] 
+
+        # Stores statistics describing the last curve fit;
+        # for example, number of function evaluations and fit time.
+        self.fitStatistics = {}
         
         # XML reader object to process XML configuration file
         self.objXMLReader = XMLReader() 
+        # The batch processing engine, which keeps its pool of worker
+        # processes between batches of the same model.
+        self.objBatchProcessor = None
         
         self.ApplyStyleSheet()
        
@@ -659,6 +676,47 @@ class ModelFittingApp(QWidget):
         self.btnBatchProc.clicked.connect(self.BatchProcessAllCSVDataFiles) 
         verticalLayout.addWidget(self.btnBatchProc)
 
+        self.ckbDeferReports = QCheckBox('Defer reports (only save fit results)')
+        self.ckbDeferReports.setToolTip('Batch processing saves the fit results and curves ' +
+            'of each data file in the sub-folder ' + ReportGeneratorModule.FIT_RESULTS_FOLDER +
+            '. Reports are created later from these files.')
+        verticalLayout.addWidget(self.ckbDeferReports)
+
+        self.ckbCohortReport = QCheckBox('Single cohort PDF report')
+        self.ckbCohortReport.setToolTip('Saves the reports of all the data files as pages ' +
+            'of a single PDF file, ' + ReportGeneratorModule.COHORT_REPORT_FILE_NAME + 
+            ', with an index of the data files')
+        verticalLayout.addWidget(self.ckbCohortReport)
+
+        self.ckbConsolidatePlotData = QCheckBox('Save plot data of all files in one file')
+        self.ckbConsolidatePlotData.setToolTip('Saves the plot data of all the data files in ' +
+            'a single columnar file, ' + PlotDataExport.CONSOLIDATED_FILE_NAME + 
+            ', instead of one CSV file per data file')
+        verticalLayout.addWidget(self.ckbConsolidatePlotData)
+
+        self.ckbPlotDataNpz = QCheckBox('Also save plot data in .npz format')
+        self.ckbPlotDataNpz.setToolTip('Saves a compressed binary copy of each plot data CSV file')
+        verticalLayout.addWidget(self.ckbPlotDataNpz)
+
+        warmStartHorizontalLayout = QHBoxLayout()
+        self.lblWarmStart = QLabel('Initial values:')
+        self.cmbWarmStart = QComboBox()
+        for policy in WarmStartModule.WARM_START_POLICIES:
+            self.cmbWarmStart.addItem(WarmStartModule.WARM_START_LABELS[policy], policy)
+        self.cmbWarmStart.setToolTip('Batch processing starts the fit of each data file ' +
+            'from the same initial values, or from those of the previous converged fit ' +
+            'or the median of the converged fits. If a fit started from earlier fits ' +
+            'does not converge, the data file is fitted again from the same initial values.')
+        warmStartHorizontalLayout.addWidget(self.lblWarmStart)
+        warmStartHorizontalLayout.addWidget(self.cmbWarmStart)
+        verticalLayout.addLayout(warmStartHorizontalLayout)
+
+        self.btnCreateReports = QPushButton('Create Reports From Fit Results')
+        self.btnCreateReports.setToolTip('Creates the PDF reports and plot data CSV files ' +
+                                         'of the selected saved fit results')
+        self.btnCreateReports.clicked.connect(self.CreateReportsFromFitResults)
+        verticalLayout.addWidget(self.btnCreateReports)
+
         self.lblBatchProcessing = QLabel("")
         self.lblBatchProcessing.setWordWrap(True)
         verticalLayout.addWidget(self.lblBatchProcessing)
@@ -675,7 +733,7 @@ class ModelFittingApp(QWidget):
                 # A ROI has been selected
                 self.groupBoxModel.show()
                 self.btnSaveReport.show()
-                logger.info("Function DisplayModelFittingGroupBox called. Model group box and Save Report button shown when ROI = {}".format(ROI))
+                logger.info("Function DisplayModelFittingGroupBox called. Model group box and Save Report button shown when ROI = %s", ROI)
             else:
                 self.groupBoxModel.hide()
                 self.cmbAIF.setCurrentIndex(0)
@@ -800,7 +858,7 @@ class ModelFittingApp(QWidget):
                     pixmapModelImage = pixmapModelImage.scaled(pMapWidth, pMapHeight, 
                           QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
                     self.lblModelImage.setPixmap(pixmapModelImage)
-                    logger.info('Image {} displayed.'.format(imageName))
+                    logger.info('Image %s displayed.', imageName)
                     longModelName = self.objXMLReader.getLongModelName(shortModelName)
                     self.lblModelName.setText(longModelName)
                 else:
@@ -857,8 +915,8 @@ class ModelFittingApp(QWidget):
         ------
         paramNumber - Ordinal number of the parameter, takes values 1-5
         """
-        logger.info('Function CurveFitSetConfIntLabel called ' +
-                   'with paramNumber={}'.format(paramNumber))
+        logger.debug('Function CurveFitSetConfIntLabel called with paramNumber=%s',
+                     paramNumber)
         try:
             objSpinBox = getattr(self, 'spinBoxParameter' + str(paramNumber))
             objCheckBox = getattr(self, 'ckbParameter' + str(paramNumber))
@@ -938,12 +996,30 @@ class ModelFittingApp(QWidget):
             logger.error('Error in function ClearOptimumParamaterConfLimitsOnGUI: ' + str(e))
     
 
-    def SaveCSVFile(self, fileName=""):
-        """Saves in CSV format the data in the plot on the GUI """ 
+    def GetPlotDataColumns(self):
+        """Returns a dictionary of role:(name, array of values) pairs 
+        holding the columns of the data in the plot on the GUI. 
+        The roles are time, roi, aif, model and, for dual inlet 
+        models, vif."""
+        ROI = str(self.cmbROI.currentText())
+        AIF = str(self.cmbAIF.currentText())
+        modelName = str(self.cmbModels.currentText())
+        columns = {'time': ('Time (min)', np.asarray(self.signalData['time'], dtype=np.float64)),
+                   'roi': (ROI, np.asarray(self.signalData[ROI], dtype=np.float64)),
+                   'aif': (AIF, np.asarray(self.signalData[AIF], dtype=np.float64))}
+        if self.cmbVIF.isVisible():
+            VIF = str(self.cmbVIF.currentText())
+            columns['vif'] = (VIF, np.asarray(self.signalData[VIF], dtype=np.float64))
+        columns['model'] = (modelName + ' model', np.asarray(self.listModel, dtype=np.float64))
+        return columns
+
+
+    def SaveCSVFile(self, fileName="", saveBinaryCopy=False):
+        """Saves in CSV format the data in the plot on the GUI.
+        If saveBinaryCopy is True, the data is also saved in 
+        a compressed NumPy .npz file with the same name.""" 
         try:
             logger.info('Function SaveCSVFile called.')
-            modelName = str(self.cmbModels.currentText())
-            modelName.replace(" ", "-")
 
             if not fileName:
                 # Ask the user to specify the path & name of the CSV file. The name of the model is suggested as a default file name.
@@ -957,37 +1033,13 @@ class ModelFittingApp(QWidget):
                 logger.info('Function SaveCSVFile - csv file name = ' + 
                             CSVFileName)
             
-                ROI = str(self.cmbROI.currentText())
-                AIF = str(self.cmbAIF.currentText())
-                if self.cmbVIF.isVisible():
-                    VIF = str(self.cmbVIF.currentText())
-                    mustIncludeVIF = True
-                else:
-                    mustIncludeVIF = False
-
-                # If CSVFileName already exists, delete it
-                if os.path.exists(CSVFileName):
-                    os.remove(CSVFileName)
-
-                with open(CSVFileName, 'w',  newline='') as csvfile:
-                    writeCSV = csv.writer(csvfile,  delimiter=',')
-                    if mustIncludeVIF:
-                        # write header row
-                        writeCSV.writerow(['Time (min)', ROI, AIF, VIF, modelName + ' model'])
-                        # Write rows of data
-                        for i, time in enumerate(self.signalData['time']):
-                            writeCSV.writerow([time, self.signalData[ROI][i], self.signalData[AIF][i], self.signalData[VIF][i], self.listModel[i]])
-                    else:
-                        # write header row
-                        writeCSV.writerow(['Time (min)', ROI, AIF, modelName + ' model'])
-                        # Write rows of data
-                        for i, time in enumerate(self.signalData['time']):
-                            writeCSV.writerow([time, self.signalData[ROI][i], self.signalData[AIF][i], self.listModel[i]])
-                    csvfile.close()
+                # Write the columns of plot data in one call
+                plotDataColumns = self.GetPlotDataColumns()
+                PlotDataExport.SavePlotData(CSVFileName, 
+                    [name for name, _ in plotDataColumns.values()],
+                    [values for _, values in plotDataColumns.values()],
+                    saveBinaryCopy)
 
-        except csv.Error:
-            print('CSV Writer error in function SaveCSVFile: file %s, line %d: %s' % (CSVFileName, WriteCSV.line_num, csv.Error))
-            logger.error('CSV Writer error in function SaveCSVFile: file %s, line %d: %s' % (CSVFileName, WriteCSV.line_num, csv.Error))
         except IOError as IOe:
             print ('IOError in function SaveCSVFile: cannot open file ' + CSVFileName + ' or read its data: ' + str(IOe))
             logger.error ('IOError in function SaveCSVFile: cannot open file ' + CSVFileName + ' or read its data; ' + str(IOe))
@@ -995,8 +1047,8 @@ class ModelFittingApp(QWidget):
             print('Runtime error in function SaveCSVFile: ' + str(re))
             logger.error('Runtime error in function SaveCSVFile: ' + str(re))
         except Exception as e:
-            print('Error in function SaveCSVFile: ' + str(e) + ' at line in CSV file ', WriteCSV.line_num)
-            logger.error('Error in function SaveCSVFile: ' + str(e) + ' at line in CSV file ', WriteCSV.line_num)
+            print('Error in function SaveCSVFile: ' + str(e))
+            logger.error('Error in function SaveCSVFile: ' + str(e))
 
     def clearOptimisedParamaterList(self, callingControl: str):
         """Clears results of curve fitting from the GUI 
@@ -1031,14 +1083,14 @@ class ModelFittingApp(QWidget):
                     self.btnSaveCSV.show()
                     self.btnSaveReport.show()
                     self.groupBoxBatchProcessing.show() 
-                    logger.info("Function display_FitModel_SaveCSV_SaveReport_Buttons called when ROI = {} and AIF = {}".format(ROI, AIF))
+                    logger.info("Function display_FitModel_SaveCSV_SaveReport_Buttons called when ROI = %s and AIF = %s", ROI, AIF)
             elif modelInletType == 'dual':
                 if ROI != 'Please Select' and AIF != 'Please Select' and VIF != 'Please Select' :
                     self.btnFitModel.show()
                     self.btnSaveCSV.show()
                     self.btnSaveReport.show()
                     self.groupBoxBatchProcessing.show() 
-                    logger.info("Function display_FitModel_SaveCSV_SaveReport_Buttons called when ROI = {}, AIF = {} & VIF ={}".format(ROI, AIF, VIF)) 
+                    logger.info("Function display_FitModel_SaveCSV_SaveReport_Buttons called when ROI = %s, AIF = %s & VIF =%s", ROI, AIF, VIF) 
         
         except Exception as e:
             print('Error in function display_FitModel_SaveCSV_SaveReport_Buttons: ' + str(e))
@@ -1051,8 +1103,7 @@ class ModelFittingApp(QWidget):
         Converts a % to a decimal fraction if necessary. 
         This value is then appended to the array, initialParametersArray.
         """
-        logger.info('Function GetSpinBoxValue called when paramNumber={} and initialParametersArray={}.'
-                    .format(paramNumber,initialParametersArray))
+        logger.debug('Function GetSpinBoxValue called when paramNumber=%s and initialParametersArray=%s.', paramNumber,initialParametersArray)
         try:
             objSpinBox = getattr(self, 'spinBoxParameter' + str(paramNumber))
             parameter = objSpinBox.value()
@@ -1102,7 +1153,7 @@ class ModelFittingApp(QWidget):
         Sets the value of an individual parameter spinbox.  If necessary
         converts a decimal fraction to a %.
         """
-        logger.info('Function SetParameterSpinBoxValue called.')
+        logger.debug('Function SetParameterSpinBoxValue called.')
         try:
             objSpinBox = getattr(self, 'spinBoxParameter' + 
                                  str(paramNumber))
@@ -1128,7 +1179,7 @@ class ModelFittingApp(QWidget):
             parameterList - Array of optimum model input parameter values.
         """
         try:
-            logger.info('Function SetParameterSpinBoxValues called with parameterList = {}'.format(parameterList))
+            logger.debug('Function SetParameterSpinBoxValues called with parameterList = %s', parameterList)
            
             modelName = str(self.cmbModels.currentText())
             numParams = self.objXMLReader.getNumberOfParameters(modelName)
@@ -1171,8 +1222,7 @@ class ModelFittingApp(QWidget):
                 curve fitting.
         """
         try:
-            logger.info('Function CurveFitCalculate95ConfidenceLimits called: numDataPoints ={}, numParams={}, optimumParams={}, paramCovarianceMatrix={}'
-                        .format(numDataPoints, numParams, optimumParams, paramCovarianceMatrix))
+            logger.debug('Function CurveFitCalculate95ConfidenceLimits called: numDataPoints =%s, numParams=%s, optimumParams=%s, paramCovarianceMatrix=%s', numDataPoints, numParams, optimumParams, paramCovarianceMatrix)
             alpha = 0.05 # 95% confidence interval = 100*(1-alpha)
             originalOptimumParams = optimumParams.copy()
             originalNumParams = numParams
@@ -1210,8 +1260,7 @@ class ModelFittingApp(QWidget):
                 self.optimisedParamaterList[counter].append(numParams)
                 self.optimisedParamaterList[counter].append(lower)
                 self.optimisedParamaterList[counter].append(upper)
-                logger.info('Just added value {}, lower {}, upper {} to self.optimisedParamaterList at position{}'
-                            .format(numParams, lower, upper, counter))
+                logger.debug('Just added value %s, lower %s, upper %s to self.optimisedParamaterList at position%s', numParams, lower, upper, counter)
             
             # Now insert fixed parameters into _optimisedParameterList
             # if there are any.
@@ -1225,10 +1274,9 @@ class ModelFittingApp(QWidget):
                     tempList = [fixedParamValue, lower, upper]
                     # Now add this list to the list of lists 
                     self.optimisedParamaterList.insert(index, tempList)
-                    logger.info('Just added temp list {} to self.optimisedParamaterList at position{}'
-                            .format(tempList, index))
+                    logger.debug('Just added temp list %s to self.optimisedParamaterList at position%s', tempList, index)
             
-            logger.info('Leaving CurveFitCalculate95ConfidenceLimits, self.optimisedParamaterList = {}'.format(self.optimisedParamaterList))
+            logger.debug('Leaving CurveFitCalculate95ConfidenceLimits, self.optimisedParamaterList = %s', self.optimisedParamaterList)
         except RuntimeError as rte:
             print('Runtime Error in function CurveFitCalculate95ConfidenceLimits ' + str(rte))
             logger.error('Runtime Error in function CurveFitCalculate95ConfidenceLimits '  + str(rte))  
@@ -1252,8 +1300,7 @@ class ModelFittingApp(QWidget):
         paramNumber - Number, 1-5, of the parameter.
         """
 
-        logger.info('Function CurveFitGetParameterData called with modelName={} and paramNumber={}.'
-                        .format(modelName, paramNumber))
+        logger.debug('Function CurveFitGetParameterData called with modelName=%s and paramNumber=%s.', modelName, paramNumber)
         try:
             paramShortName =self.objXMLReader.getParameterShortName(modelName, paramNumber)
             isPercentage, _ =self.objXMLReader.getParameterLabel(modelName, paramNumber)
@@ -1327,6 +1374,8 @@ class ModelFittingApp(QWidget):
         stored in the global list self.optimisedParamaterList.
         """
         try:
+            # Assume failure until curve fitting returns 
+            self.fitStatistics = {'status': 'Failed'}
             # Form inputs to the curve fitting function
             paramList = self.CurveFitCollateParameterData()
             constantsString = self.objXMLReader.getStringOfConstants()
@@ -1367,16 +1416,18 @@ class ModelFittingApp(QWidget):
                 raise NoModelInletTypeDefined
 
             QApplication.setOverrideCursor(QCursor(QtCore.Qt.WaitCursor))
-            optimumParamsDict, paramCovarianceMatrix = \
+            optimumParamsDict, paramCovarianceMatrix, fitStatistics = \
                 ModelFunctionsHelper.CurveFit(
                 functionName, moduleName, paramList, arrayTimes, 
                 array_AIF_MR_Signals, array_VIF_MR_Signals, array_ROI_MR_Signals,
                 inletType, constantsString)
             
             self.isCurveFittingDone = True 
+            self.fitStatistics = fitStatistics
+            self.fitStatistics['status'] = 'OK' if fitStatistics['success'] \
+                else 'Not converged - ' + str(fitStatistics['message'])
             QApplication.restoreOverrideCursor()
-            logger.info('ModelFunctionsHelper.CurveFit returned optimum parameters {}'
-                        .format(optimumParamsDict))
+            logger.debug('ModelFunctionsHelper.CurveFit returned optimum parameters %s', optimumParamsDict)
             
             # Display results of curve fitting  
             # (optimum model parameter values) on GUI.
@@ -1391,8 +1442,9 @@ class ModelFittingApp(QWidget):
             numDataPoints = array_ROI_MR_Signals.size
             numParams = len(optimumParamsList)
             if paramCovarianceMatrix.size:
-                self.CurveFitCalculate95ConfidenceLimits(numDataPoints, numParams, 
-                                    optimumParamsList, paramCovarianceMatrix)
+                with Tracing.Span('CurveFitCalculate95ConfidenceLimits', 'fit'):
+                    self.CurveFitCalculate95ConfidenceLimits(numDataPoints, numParams, 
+                                        optimumParamsList, paramCovarianceMatrix)
                 self.CurveFitProcessOptimumParameters()
         
         except NoModelInletTypeDefined:
@@ -1439,8 +1491,7 @@ class ModelFittingApp(QWidget):
                     after curve fitting.  
         """
         try:
-            logger.info('Function GetValuesForEachParameter called when paramNumber={}.'
-                        .format(paramNumber))
+            logger.debug('Function GetValuesForEachParameter called when paramNumber=%s.', paramNumber)
             parameterList = []
             index = paramNumber - 1
             objLabel = getattr(self, 'labelParameter' + str(paramNumber))
@@ -1479,8 +1530,7 @@ class ModelFittingApp(QWidget):
                     into this function. 
        """
         try:
-            logger.info('BuildParameterDictionary called with confidence limits array = {}'
-                        .format(confidenceLimitsArray))
+            logger.debug('BuildParameterDictionary called with confidence limits array = %s', confidenceLimitsArray)
             parameterDictionary = {}
             modelName = str(self.cmbModels.currentText())
             numParams = self.objXMLReader.getNumberOfParameters(modelName)
@@ -1552,9 +1602,10 @@ class ModelFittingApp(QWidget):
                 shortModelName = self.cmbModels.currentText()
                 longModelName = self.objXMLReader.getLongModelName(shortModelName)
 
-                # Save a png of the concentration/time plot for display 
-                # in the PDF report.
-                self.figure.savefig(fname=IMAGE_NAME, dpi=150)  # dpi=150 so as to get a clear image in the PDF report
+                # Save a png of the concentration/time plot in memory 
+                # for display in the PDF report.
+                imageBuffer = io.BytesIO()
+                self.figure.savefig(imageBuffer, format='png', dpi=150)  # dpi=150 so as to get a clear image in the PDF report
                 
                 if self.isCurveFittingDone:
                     parameterDict = self.BuildParameterDictionary(self.optimisedParamaterList)
@@ -1564,12 +1615,10 @@ class ModelFittingApp(QWidget):
                 QApplication.setOverrideCursor(QCursor(QtCore.Qt.WaitCursor))
 
                 pdf.CreateAndSavePDFReport(reportFileName, self.dataFileName, 
-                       longModelName, IMAGE_NAME, parameterDict)
+                       longModelName, imageBuffer.getvalue(), parameterDict)
                 
                 QApplication.restoreOverrideCursor()
 
-                # Delete image file
-                os.remove(IMAGE_NAME)
                 logger.info('PDF Report created called ' + reportFileName)
                 return parameterDict
         except Exception as e:
@@ -1577,6 +1626,42 @@ class ModelFittingApp(QWidget):
             logger.error('Error in function CreatePDFReport: ' + str(e))
 
 
+    def GetPlotCurves(self):
+        """Returns the data plotted on the graph by the function 
+        plotMRSignals, so that the plot can be redrawn away from the GUI;
+        for example, when a PDF report is created in a worker process.
+
+        Returns
+        -------
+            arrayTimes - Array of time points.
+            curves - List of (label, array of values, format string) tuples,
+                one for each curve on the graph.
+        """
+        try:
+            ROI = str(self.cmbROI.currentText())
+            AIF = str(self.cmbAIF.currentText())
+            VIF = str(self.cmbVIF.currentText())
+            modelName = str(self.cmbModels.currentText())
+            arrayTimes = np.array(self.signalData['time'], dtype='float')
+
+            curves = []
+            if AIF != 'Please Select':
+                curves.append((AIF, np.array(self.signalData[AIF], dtype='float'), 'r.-'))
+            if VIF != 'Please Select':
+                curves.append((VIF, np.array(self.signalData[VIF], dtype='float'), 'k.-'))
+            if modelName != 'Select a model' and self.listModel is not None \
+                and len(self.listModel) == len(arrayTimes):
+                curves.append((modelName + ' model', 
+                               np.array(self.listModel, dtype='float'), 'g--'))
+            if ROI != 'Please Select':
+                curves.append((ROI, np.array(self.signalData[ROI], dtype='float'), 'b.-'))
+
+            return arrayTimes, curves
+        except Exception as e:
+            print('Error in function GetPlotCurves: ' + str(e))
+            logger.error('Error in function GetPlotCurves: ' + str(e))
+
+
     def PopulateModelListCombo(self):
         """
         Builds a list of model short names from data in the 
@@ -1624,10 +1709,12 @@ class ModelFittingApp(QWidget):
                 filter="*.xml")
 
             if os.path.exists(fullFilePath):
+                # The batch processing engine describes the old models
+                self.ShutdownBatchProcessor()
                 self.objXMLReader.parseConfigFile(fullFilePath)
                 
                 if self.objXMLReader.hasXMLFileParsedOK:
-                    logger.info('Config file {} loaded'.format(fullFilePath))
+                    logger.info('Config file %s loaded', fullFilePath)
                     
                     folderName, configFileName = \
                         os.path.split(fullFilePath)
@@ -1707,7 +1794,7 @@ class ModelFittingApp(QWidget):
                                QMessageBox.Ok)
                             raise RuntimeError('The first column in the CSV file must contain time data.')    
 
-                    logger.info('CSV data file {} loaded'.format(fullFilePath))
+                    logger.info('CSV data file %s loaded', fullFilePath)
                     
                     folderName = os.path.basename(os.path.dirname(fullFilePath))
                     self.dataFileDirectory, self.dataFileName = os.path.split(fullFilePath)
@@ -1841,7 +1928,7 @@ class ModelFittingApp(QWidget):
             self.figure.set_visible(False)
             self.canvas.draw()
 
-            logger.info('Function ConfigureGUIAfterLoadingData called and the following organ list loaded: {}'.format(organArray))
+            logger.info('Function ConfigureGUIAfterLoadingData called and the following organ list loaded: %s', organArray)
         except RuntimeError as re:
             print('runtime error in function ConfigureGUIAfterLoadingData: ' + str(re) )
             logger.error('runtime error in function ConfigureGUIAfterLoadingData: ' + str(re) )
@@ -1925,8 +2012,7 @@ class ModelFittingApp(QWidget):
         """
         
         try:
-            logger.info('Function populateParameterLabelAndSpinBox called with modelName={}, paramNumber={}'
-                        .format(modelName, paramNumber))
+            logger.info('Function populateParameterLabelAndSpinBox called with modelName=%s, paramNumber=%s', modelName, paramNumber)
             isPercentage, paramName =self.objXMLReader.getParameterLabel(modelName, paramNumber)
             precision = self.objXMLReader.getParameterPrecision(modelName, paramNumber)
             upper = self.objXMLReader.getMaxParameterDisplayValue(modelName, paramNumber)
@@ -2131,7 +2217,7 @@ class ModelFittingApp(QWidget):
         """
         try:
             width, height = pyautogui.size()
-            logger.info('Function GetScreenResolution called. Screen width = {}, height = {}.'.format(width, height))
+            logger.info('Function GetScreenResolution called. Screen width = %s, height = %s.', width, height)
             return width, height
         except Exception as e:
             print('Error in function GetScreenResolution: ' + str(e) )
@@ -2197,7 +2283,7 @@ class ModelFittingApp(QWidget):
             modelFunctionName = self.objXMLReader.getFunctionName(modelName)
             moduleName = self.objXMLReader.getModuleName(modelName)
 
-            logger.info('ModelFunctionsHelper.ModelSelector called when model={}, function ={} & parameter array = {}'. format(modelName, modelFunctionName, parameterArray))        
+            logger.debug('ModelFunctionsHelper.ModelSelector called when model=%s, function =%s & parameter array = %s', modelName, modelFunctionName, parameterArray)        
             
             self.listModel = ModelFunctionsHelper.ModelSelector(
                         modelFunctionName, moduleName,
@@ -2286,9 +2372,8 @@ class ModelFittingApp(QWidget):
             VIF = 'Not Selected'
             VIF = str(self.cmbVIF.currentText())
 
-            logger.info('Function plot called from ' +
-                        nameCallingFunction + 
-                        ' when ROI={}, AIF={} and VIF={}'.format(ROI, AIF, VIF))
+            logger.debug('Function plot called from %s when ROI=%s, AIF=%s and VIF=%s',
+                         nameCallingFunction, ROI, AIF, VIF)
 
             arrayTimes = np.array(self.signalData['time'], dtype='float')
             
@@ -2336,6 +2421,7 @@ class ModelFittingApp(QWidget):
     def ExitApp(self):
         """Closes the Model Fitting application."""
         logger.info("Application closed using the Exit button.")
+        self.ShutdownBatchProcessor()
         sys.exit(0)  
 
 
@@ -2360,6 +2446,12 @@ class ModelFittingApp(QWidget):
         self.spinBoxParameter4.setEnabled(boolEnabled) 
         self.spinBoxParameter5.setEnabled(boolEnabled)
         self.btnBatchProc.setEnabled(boolEnabled)
+        self.ckbDeferReports.setEnabled(boolEnabled)
+        self.ckbCohortReport.setEnabled(boolEnabled)
+        self.ckbConsolidatePlotData.setEnabled(boolEnabled)
+        self.ckbPlotDataNpz.setEnabled(boolEnabled)
+        self.cmbWarmStart.setEnabled(boolEnabled)
+        self.btnCreateReports.setEnabled(boolEnabled)
         self.ckbParameter1.setEnabled(boolEnabled)
         self.ckbParameter2.setEnabled(boolEnabled)
         self.ckbParameter2.setEnabled(boolEnabled)
@@ -2382,7 +2474,33 @@ class ModelFittingApp(QWidget):
        in the folder where the data files are held.  Likewise, a CSV file
        holding the time and concentration data (including the model curve)
        in the is created in another sub-folder in the folder where the 
-       data files are held."""
+       data files are held.
+       
+       If the 'Defer reports' checkbox is checked, only the fit results 
+       and curves of each data file are saved, in a sub-folder called 
+       FitResults.  The PDF reports and plot data CSV files are created 
+       later by the function CreateReportsFromFitResults.
+       
+       If the 'Single cohort PDF report' checkbox is checked, the reports
+       are saved as pages of a single PDF file in the PDFReports folder.
+       
+       The wall clock and CPU time taken by each stage of processing 
+       each data file are recorded, together with the number of function
+       evaluations and iterations made during curve fitting, in the 
+       'Stage timings' worksheet of the Excel spreadsheet and in a CSV 
+       file alongside it. An aggregate breakdown is recorded in the 
+       'Timing summary' worksheet.
+       
+       The data files are processed by the pipeline of the BatchProcessor
+       class, so that reading the next data files, fitting the current
+       ones in its pool of worker processes and writing the output files
+       of the previous ones overlap. The progress bar is updated as each
+       data file is fitted.
+       
+       The fit of each data file starts from the initial values on the
+       GUI, or, according to the 'Initial values' dropdown list, from 
+       those of the previous converged fit or the median of the 
+       converged fits, see WarmStart.py."""
         try:
             
             logger.info('Function BatchProcessAllCSVDataFiles called.')
@@ -2402,12 +2520,16 @@ class ModelFittingApp(QWidget):
             # of plot data and PDF reports
             csvPlotDataFolder = self.dataFileDirectory + '/CSVPlotDataFiles'
             pdfReportFolder = self.dataFileDirectory + '/PDFReports'
-            if not os.path.exists(csvPlotDataFolder):
-                os.makedirs(csvPlotDataFolder)
-                logger.info('BatchProcessAllCSVDataFiles: {} created.'.format(csvPlotDataFolder))
-            if not os.path.exists(pdfReportFolder):
-                os.makedirs(pdfReportFolder)
-                logger.info('BatchProcessAllCSVDataFiles: {} created.'.format(pdfReportFolder))
+            fitResultsFolder = self.dataFileDirectory + '/' + ReportGeneratorModule.FIT_RESULTS_FOLDER
+            deferReports = self.ckbDeferReports.isChecked()
+            if deferReports:
+                outputFolders = [fitResultsFolder]
+            else:
+                outputFolders = [csvPlotDataFolder, pdfReportFolder]
+            for folder in outputFolders:
+                if not os.path.exists(folder):
+                    os.makedirs(folder)
+                    logger.info('BatchProcessAllCSVDataFiles: %s created.', folder)
             
             # Set up progress bar
             self.pbar.show()
@@ -2432,9 +2554,6 @@ class ModelFittingApp(QWidget):
 
             self.toggleEnabled(False)
             QApplication.processEvents()
-            # Counter to show progress of batch processing in 
-            # progress bar.
-            count = 0  
 
             modelName = str(self.cmbModels.currentText())
 
@@ -2442,43 +2561,89 @@ class ModelFittingApp(QWidget):
             objSpreadSheet, boolExcelFileCreatedOK = self.BatchProcessingCreateBatchSummaryExcelSpreadSheet(self.dataFileDirectory)
             
             if boolExcelFileCreatedOK:
+                # Alongside the Excel spreadsheet, create a long-format 
+                # table of results for downstream statistical analysis.
+                objResultsStore = ResultsStore.ResultsStore(
+                    os.path.splitext(objSpreadSheet.fullFilePath)[0] + 
+                    ResultsStore.GetDefaultFileExtension())
+                # Share the cores between curve fitting and the creation 
+                # of the PDF reports, so that the BLAS threads of the 
+                # processes do not oversubscribe the cores.
+                objResourceManager = ResourceManager(withReports=not deferReports)
+                # PDF reports are created by a pool of worker processes
+                # in parallel with curve fitting.
+                numberOfReportWorkers = max(1, objResourceManager.numberOfReportWorkers)
+                if self.ckbCohortReport.isChecked():
+                    objReportGenerator = ReportGenerator(numberOfReportWorkers,
+                                            cohortReportFileName=pdfReportFolder + 
+                                            '/' + ReportGeneratorModule.COHORT_REPORT_FILE_NAME)
+                else:
+                    objReportGenerator = ReportGenerator(numberOfReportWorkers)
+                # Optionally, the plot data of all files is
+                # gathered in a single columnar file.
+                consolidatePlotData = self.ckbConsolidatePlotData.isChecked()
+                objPlotData = PlotDataExport.PlotDataCollection() \
+                    if consolidatePlotData and not deferReports else None
+                objOutputs = BatchOutputs(objResultsStore, objSpreadSheet,
+                    None if deferReports else csvPlotDataFolder, 
+                    self.ckbPlotDataNpz.isChecked(), objPlotData,
+                    None if deferReports else objReportGenerator, pdfReportFolder,
+                    REPORT_TITLE, FERRET_LOGO, fitResultsFolder if deferReports else None)
+                # Record the time taken by each stage of processing each file
+                objStageTimer = StageTimer()
                 QApplication.setOverrideCursor(QCursor(QtCore.Qt.WaitCursor))
-                for file in csvDataFiles:
-                    if boolUseParameterDefaultValues:
-                        self.InitialiseParameterSpinBoxes() #Reset default values
-                    else:
-                        # Reset parameters to values selected by the user before
-                        # the start of batch processing
-                        self.SetParameterSpinBoxValues(initialParameterArray)
-
-                    # Set class instance property dataFileName 
-                    # to name of file in current iteration 
-                    #  this variable used to write datafile 
-                    #  in the PDF report
-                    self.dataFileName = str(file) 
-                    self.statusbar.showMessage('File ' + self.dataFileName + ' loaded.')
-                    count +=1
-                    self.lblBatchProcessing.setText("Processing {}".format(self.dataFileName))
-                    # Load current file
-                    fileLoadedOK, failureReason = self.BatchProcessingLoadDataFile(self.dataFileDirectory + '/' + self.dataFileName)
-                    if not fileLoadedOK:
-                        objSpreadSheet.recordSkippedFiles(self.dataFileName, failureReason)
-                        self.pbar.setValue(count)
-                        continue  # Skip this iteration if problems loading file
-                
-                    self.plotMRSignals('BatchProcessAllCSVDataFiles') #Plot data                
-                    self.CurveFit() # Fit curve to model 
-                    self.SaveCSVFile(csvPlotDataFolder + '/plot' + file) #Save plot data to CSV file               
-                    parameterDict = self.CreatePDFReport(pdfReportFolder + '/' + os.path.splitext(file)[0]) #Save PDF Report                
-                    self.BatchProcessWriteOptimumParamsToSummary(objSpreadSheet, 
-                               self.dataFileName,  modelName, parameterDict)
-                    self.pbar.setValue(count)
+
+                # The data files are read, fitted and written by the stages
+                # of the batch processing engine in parallel, with the curve 
+                # fitting done by its pool of worker processes.
+                objBatchProcessor = self.GetBatchProcessor(modelName)
+                fixedParameters = [getattr(self, 'ckbParameter' + str(paramNumber)).isChecked()
+                                   for paramNumber in range(1, 
+                                   len(objBatchProcessor.parameterNames) + 1)]
+                objBatchProcessor.setInitialValues(
+                    None if boolUseParameterDefaultValues else initialParameterArray,
+                    fixedParameters)
+                objBatchProcessor.setWarmStart(self.cmbWarmStart.currentData())
+
+                def UpdateProgress(numFilesProcessed, fileName):
+                    self.pbar.setValue(numFilesProcessed)
+                    self.lblBatchProcessing.setText("Processed {}".format(fileName))
                     QApplication.processEvents()
 
-                self.lblBatchProcessing.setText("Batch processing complete.")
+                summary = objBatchProcessor.processFolder(self.dataFileDirectory,
+                    objOutputs=objOutputs, objStageTimer=objStageTimer,
+                    progressCallback=UpdateProgress, withReports=not deferReports)
+                logger.info('BatchProcessAllCSVDataFiles: %s of %s files fitted by %s workers',
+                            summary['numFitted'], summary['numFiles'], 
+                            summary['numberOfWorkers'])
+
+                self.lblBatchProcessing.setText("Waiting for PDF reports to be created.")
+                QApplication.processEvents()
+                # PDF reports are rendered by the worker processes, so only 
+                # the time waiting for them to finish is recorded.
+                with objStageTimer.batchStage('pdf_report_wait'):
+                    failedReports = objReportGenerator.shutdown()
+
+                if failedReports:
+                    self.lblBatchProcessing.setText(
+                        "Batch processing complete. {} PDF reports not created."
+                        .format(len(failedReports)))
+                else:
+                    self.lblBatchProcessing.setText("Batch processing complete.")
                 QApplication.restoreOverrideCursor()
                 self.toggleEnabled(True)
+                with objStageTimer.batchStage('save_results'):
+                    objResultsStore.saveResults()
+                    if objPlotData is not None:
+                        objPlotData.saveConsolidatedFile(csvPlotDataFolder + '/' + 
+                            PlotDataExport.CONSOLIDATED_FILE_NAME + 
+                            PlotDataExport.GetConsolidatedFileExtension())
+                objStageTimer.saveTimings(os.path.splitext(objSpreadSheet.fullFilePath)[0] + 
+                                          StageTimerModule.TIMINGS_FILE_SUFFIX)
+                objSpreadSheet.recordStageTimings(objStageTimer)
                 objSpreadSheet.saveSpreadSheet()
+                logger.info('BatchProcessAllCSVDataFiles: time taken by each stage\n%s',
+                            objStageTimer.formatSummary())
 
         except Exception as e:
             print('Error in function BatchProcessAllCSVDataFiles: ' + str(e) )
@@ -2487,6 +2652,74 @@ class ModelFittingApp(QWidget):
             self.toggleEnabled(True)     
 
 
+    def GetBatchProcessor(self, modelName):
+        """Returns the batch processing engine for the model, modelName,
+        and the ROI, AIF and VIF selected on the GUI. The engine of the
+        previous batch, and its pool of worker processes, is reused if
+        they have not changed."""
+        ROI = str(self.cmbROI.currentText())
+        AIF = str(self.cmbAIF.currentText())
+        VIF = str(self.cmbVIF.currentText()) if self.cmbVIF.isVisible() else None
+        curveNames = {'roi': ROI.strip(), 'aif': AIF.strip(),
+                      'vif': VIF.strip() if VIF else None}
+        if self.objBatchProcessor is None or \
+            self.objBatchProcessor.modelName != modelName or \
+            self.objBatchProcessor.curveNames != curveNames:
+            self.ShutdownBatchProcessor()
+            self.objBatchProcessor = BatchProcessor(self.objXMLReader, modelName, 
+                                                    ROI, AIF, VIF)
+        return self.objBatchProcessor
+
+
+    def ShutdownBatchProcessor(self):
+        """Stops the worker processes of the batch processing engine."""
+        if self.objBatchProcessor is not None:
+            self.objBatchProcessor.shutdown()
+            self.objBatchProcessor = None
+
+
+    def CreateReportsFromFitResults(self):
+        """Creates, in parallel, the PDF reports and plot data CSV files
+        of the data files whose fit results were saved by deferred batch
+        processing. The user selects the fit results files, so reports 
+        may be created on demand for a few files or for a whole batch.
+        The reports are saved in the PDFReports and CSVPlotDataFiles 
+        folders alongside the FitResults folder."""
+        try:
+            logger.info('Function CreateReportsFromFitResults called.')
+            defaultFolder = ''
+            if self.dataFileDirectory:
+                defaultFolder = self.dataFileDirectory + '/' + \
+                    ReportGeneratorModule.FIT_RESULTS_FOLDER
+            fitResultsFileNames, _ = QFileDialog.getOpenFileNames(self, 
+                caption='Select fit results files', directory=defaultFolder, 
+                filter='*' + ReportGeneratorModule.FIT_RESULTS_EXTENSION)
+            
+            #Check that the user did not press Cancel on the dialog
+            if fitResultsFileNames:
+                dataFolder = os.path.dirname(os.path.dirname(fitResultsFileNames[0]))
+                self.toggleEnabled(False)
+                QApplication.setOverrideCursor(QCursor(QtCore.Qt.WaitCursor))
+                self.lblBatchProcessing.setText('Creating {} reports.'
+                                                .format(len(fitResultsFileNames)))
+                QApplication.processEvents()
+                failedReports = ReportGeneratorModule.CreateReportsFromFitResults(
+                    fitResultsFileNames, dataFolder + '/PDFReports', 
+                    REPORT_TITLE, FERRET_LOGO, dataFolder + '/CSVPlotDataFiles',
+                    cohortReport=self.ckbCohortReport.isChecked())
+                for reportFileName, errorMessage in failedReports:
+                    print('PDF report {} not created: {}'.format(reportFileName, errorMessage))
+                self.lblBatchProcessing.setText('{} reports created, {} failed.'.format(
+                    len(fitResultsFileNames) - len(failedReports), len(failedReports)))
+                QApplication.restoreOverrideCursor()
+                self.toggleEnabled(True)
+        except Exception as e:
+            print('Error in function CreateReportsFromFitResults: ' + str(e))
+            logger.error('Error in function CreateReportsFromFitResults: ' + str(e))
+            QApplication.restoreOverrideCursor()
+            self.toggleEnabled(True)
+
+
     def BatchProcessingCreateBatchSummaryExcelSpreadSheet(self, 
                                                 pathToFolder):
         """Creates an Excel spreadsheet to hold a summary of model 
@@ -2544,198 +2777,6 @@ class ModelFittingApp(QWidget):
             return None, boolExcelFileCreatedOK
 
 
-    def BatchProcessWriteOptimumParamsToSummary(self, 
-                                                objExcelFile, 
-                                                fileName, 
-                                                modelName, 
-                                                paramDict):
-        """During batch processing of data files, writes 
-        the optimum parameter values resulting from  
-       curve fitting to Excel spreadsheet.
-       
-       Inputs
-       -----
-       objExcelFile - object instanciated from the XMLReader class
-       fileName - Name of the MR Signal data file currently being
-            batch processed.
-       modelName - Name of the model being used for curve fitting.
-       paramDict - Dictionary of optimum parameter values determined
-            by the curve fitting process
-       """
-        try:
-            for paramName, paramList in paramDict.items(): 
-                paramName.replace('\n', '')
-                paramName.replace(',', '')
-                paramName = "'" + paramName + "'"
-                value = str(round(paramList[0],3))
-                lower = paramList[1]
-                upper = paramList[2]
-                objExcelFile.recordParameterValues(fileName, modelName, paramName, value, lower, upper)
-                
-        except Exception as e:
-            print('Error in function BatchProcessWriteOptimumParamsToSummary: ' + str(e))
-            logger.error('Error in function BatchProcessWriteOptimumParamsToSummary: ' + str(e))
-            self.toggleEnabled(True)      
-
-
-    def BatchProcessingLoadDataFile(self, fullFilePath):
-        """ 
-        Loads the contents of a CSV file containing time and concentration data
-        into a dictionary of lists. The key is the name of the organ or 'time' and 
-        the corresponding value is a list of concentrations 
-        (or times when the key is 'time')
-        
-        The following validation is applied to the data file:
-            -The CSV file must contain at least 3 columns of data separated by commas.
-            -The first column in the CSV file must contain time data.
-            -The header of the time column must contain the word 'time'.
-       
-        Input Parameters:
-        ******************
-            fullFilePath - Full file path to a CSV file containing 
-                            time/concentration data    
-        """
-      
-        # clear the dictionary of previous data
-        self.signalData.clear()
-
-        boolFileFormatOK = True
-        boolDataOK = True
-        failureReason = ""
-        
-        try:
-            if os.path.exists(fullFilePath):
-                with open(fullFilePath, newline='') as csvfile:
-                    line = csvfile.readline()
-                    if line.count(',') < (MIN_NUM_COLUMNS_CSV_FILE - 1):
-                        boolFileFormatOK = False
-                        failureReason = "At least 3 columns of data are expected"
-                        errorStr = 'Batch Processing: CSV file {} must acontain at least 3 columns of data separated by commas.'.format(fullFilePath)
-                        logger.info(errorStr)
-                        
-                    # Go back to top of the file
-                    csvfile.seek(0)
-                    readCSV = csv.reader(csvfile, delimiter=',')
-                    # Get column header labels
-                    headers = next(readCSV, None)  # returns the headers or `None` if the input is empty
-                    if headers:
-                        join = ""
-                        firstColumnHeader = headers[0].strip().lower()
-                        if 'time' not in firstColumnHeader:
-                            boolFileFormatOK = False
-                            if len(failureReason) > 0:
-                                join = " and "
-                            failureReason = failureReason + join + \
-                           "First column must contain time data, with the word 'time' as a header"
-                            errorStr = 'Batch Processing: The first column in {} must contain time data.'.format(fullFilePath)
-                            logger.info(errorStr)
-                      
-                        boolDataOK, dataFailureReason = self.BatchProcessingCheckAllInputDataPresent(headers)
-                        if not boolDataOK:
-                            if len(failureReason) > 0:
-                                join = " and "
-                            failureReason = failureReason + join + dataFailureReason
-                            boolFileFormatOK = False
-
-                    if boolFileFormatOK:
-                        # Column headers form the keys in the dictionary called self.signalData
-                        for header in headers:
-                            if 'time' in header:
-                                header ='time'
-                            self.signalData[header.title().lower()]=[]
-                        # Also add a 'model' key to hold a list of concentrations generated by a model
-                        self.signalData['model'] = []
-
-                        # Each key in the dictionary is paired with a 
-                        # list of corresponding concentrations 
-                        # (except the Time key that is paired with a list of times)
-                        for row in readCSV:
-                            colNum=0
-                            for key in self.signalData:
-                                # Iterate over columns in the selected row
-                                if key != 'model':
-                                    if colNum == 0: 
-                                        # time column
-                                        self.signalData['time'].append(float(row[colNum])/60.0)
-                                    else:
-                                        self.signalData[key].append(float(row[colNum]))
-                                    colNum+=1           
-                        logger.info('Batch Processing: CSV data file {} loaded OK'.format(fullFilePath))
-            self.NormaliseSignalData()
-            return boolFileFormatOK, failureReason
-        
-        except csv.Error:
-            boolFileFormatOK = False
-            print('CSV Reader error in function BatchProcessingLoadDataFile: file {}, line {}: error={}'.format(self.dataFileName, readCSV.line_num, csv.Error))
-            logger.error('CSV Reader error in function BatchProcessingLoadDataFile: file {}, line {}: error ={}'.format(self.dataFileName, readCSV.line_num, csv.Error))
-        except IOError:
-            boolFileFormatOK = False
-            print ('IOError in function BatchProcessingLoadDataFile: cannot open file' + self.dataFileName + ' or read its data')
-            logger.error ('IOError in function BatchProcessingLoadDataFile: cannot open file' + self.dataFileName + ' or read its data')
-        except RuntimeError as re:
-            boolFileFormatOK = False
-            print('Runtime error in function BatchProcessingLoadDataFile: ' + str(re))
-            logger.error('Runtime error in function BatchProcessingLoadDataFile: ' + str(re))
-        except Exception as e:
-            boolFileFormatOK = False
-            print('Error in function BatchProcessingLoadDataFile: ' + str(e) + ' at line {} in the CSV file'.format( readCSV.line_num))
-            logger.error('Error in function BatchProcessingLoadDataFile: ' + str(e) + ' at line {} in the CSV file'.format( readCSV.line_num))
-            failureReason = "Error reading CSV file at line {} - {}".format(readCSV.line_num, e)
-        finally:
-            self.toggleEnabled(True)
-            return boolFileFormatOK, failureReason 
-
-    def BatchProcessingCheckAllInputDataPresent(self, headers):
-        """This function checks that the current data file contains
-        data for the ROI, AIF and, if appropriate, the VIF.
-        
-        If data is missing, it returns false and a string indicating 
-        what data is missing.
-
-        Input
-        -----
-        headers - A list of the column headers in the MR signal
-            CSV data file
-        """
-        boolDataOK = True
-        join = ""
-        failureReason = ""
-        try:
-            lowerCaseHeaders = [header.strip().lower() for header in headers]
-
-            # Check ROI data is in the current data file
-            ROI = str(self.cmbROI.currentText().strip().lower())
-            if ROI not in (lowerCaseHeaders):
-                boolDataOK = False
-                failureReason = ROI + " data missing"
-            
-            # Check AIF data is in the current data file
-            AIF = str(self.cmbAIF.currentText().strip().lower())
-            if AIF not in (lowerCaseHeaders):
-                boolDataOK = False
-                if len(failureReason) > 0:
-                    join = " and "
-                failureReason = failureReason + join + AIF + " data missing"
-
-            if self.cmbVIF.isVisible():
-                # Check VIF data is in the current data file
-                VIF = str(self.cmbVIF.currentText().strip().lower())
-                if VIF not in (lowerCaseHeaders):
-                    boolDataOK = False
-                    if len(failureReason) > 0:
-                        join = " and "
-                    failureReason = failureReason + join + VIF + " data missing"
-            
-            return boolDataOK, failureReason
-
-        except Exception as e:
-            boolDataOK = False
-            print('Error in function BatchProcessingCheckAllInputDataPresent: ' + str(e))
-            logger.error('Error in function BatchProcessingCheckAllInputDataPresent: ' + str(e))
-            failureReason = failureReason + " " + str(e)
-            return boolDataOK, failureReason
-            self.toggleEnabled(True)
-
     def BatchProcessingHaveParamsChanged(self) -> bool:
         """Returns True if the user has changed one or more  
         parameter spinbox values from the defaults"""
@@ -2777,6 +2818,15 @@ class ModelFittingApp(QWidget):
             
 
 if __name__ == '__main__':
+    # Required for worker processes in a version 
+    # of this application compiled with PyInstaller.
+    multiprocessing.freeze_support()
+    # Log records are written to a rotating log file by a 
+    # listener thread. The previous log file is overwritten.
+    # Levels may be set per module, see LoggingConfig.py
+    LoggingConfig.ConfigureLogging(LOG_FILE_NAME, logFormat=LOG_FORMAT)
+    # Opt-in tracing and profiling, see Tracing.py
+    Tracing.ConfigureTracing()
     app = QApplication(sys.argv)
     main = ModelFittingApp()
     main.show()